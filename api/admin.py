@@ -1,10 +1,11 @@
 from django.contrib import admin
-from .models import UserProfile, VisualizationRequest, GeneratedImage
+from .models import UserProfile, VisualizationBatch, VisualizationRequest, GeneratedImage
 
 # Basic registration
 admin.site.register(UserProfile)
 
 admin.site.register(VisualizationRequest)
+admin.site.register(VisualizationBatch)
 admin.site.register(GeneratedImage)
 
 # You can customize the admin interface later if needed
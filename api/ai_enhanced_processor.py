@@ -8,9 +8,11 @@ screen visualizations via the ScreenVisualizer pipeline.
 import logging
 import os
 import io
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Tuple
 from PIL import Image
 from django.core.files.base import ContentFile
+from django.utils import timezone
 
 from .ai_services import (
     AIServiceFactory,
@@ -19,7 +21,13 @@ from .ai_services import (
     AIServiceConfig
 )
 from .ai_services.providers.gemini_provider import GeminiProvider
+from .ai_services.utils.performance_utils import performance_tracker
 from .audit.services import AuditService, AuditServiceError
+from .monitoring.production_monitor import production_monitor
+from .monitoring.tracing import pipeline_tracer
+from .services.cost_ledger import ledger_context, get_request_cost
+from .services.descriptor_jobs import describe_upload
+from .tenants import tenant_context
 
 logger = logging.getLogger(__name__)
 
@@ -66,16 +74,57 @@ class AIEnhancedImageProcessor:
         except Exception as e:
             logger.error(f"Error registering Gemini provider: {str(e)}")
 
-    def process_image(self, visualization_request):
+    def process_image(self, visualization_request, queue_wait_seconds=None):
         """
         Process an image using Gemini AI visualization.
 
+        The whole job is recorded as one trace; see api/monitoring/tracing.py.
+        It runs as the request's tenant, whichever thread it is called from.
+
         Args:
             visualization_request: VisualizationRequest instance
+            queue_wait_seconds: Time the job spent queued since it was submitted
+                (or resubmitted, for a regenerate); traced as queue_wait_ms
 
         Returns:
             list: List of generated image instances
         """
+        started = time.perf_counter()
+        run_started_at = timezone.now()
+        with pipeline_tracer.span('visualization.job', request_id=visualization_request.id) as job_span:
+            if queue_wait_seconds is not None:
+                job_span.set_attribute('queue_wait_ms', round(queue_wait_seconds * 1000, 3))
+
+            with tenant_context(visualization_request.tenant_id), ledger_context(request=visualization_request):
+                saved_images = self._process_image(visualization_request)
+            # Only this run: a regenerated request also has its earlier runs' records
+            cost = get_request_cost(visualization_request, since=run_started_at)
+            job_span.set_attribute('status', visualization_request.status)
+            job_span.set_attribute('cost_usd', cost)
+
+        processing_time = time.perf_counter() - started
+        quality_score = 0.0
+        if saved_images:
+            quality_score = (saved_images[0].metadata or {}).get('quality_score') or 0.0
+        success = visualization_request.status == 'complete'
+        production_monitor.record_request_metrics({
+            'success': success,
+            'processing_time': processing_time,
+            'quality_score': quality_score,
+            'cost': cost,
+            'model_used': job_span.attributes.get('provider', 'unknown'),
+            'error_type': None if success else 'pipeline_failed'
+        })
+        if saved_images:
+            performance_tracker.track_request_performance(
+                processing_time=processing_time,
+                cost=cost,
+                quality_score=quality_score
+            )
+        return saved_images
+
+    def _process_image(self, visualization_request):
+        """Run the pipeline for one request and persist its results."""
         try:
             # Mark request as processing
             visualization_request.mark_as_processing()
@@ -83,6 +132,7 @@ class AIEnhancedImageProcessor:
 
             # Load the original image
             original_image = Image.open(visualization_request.original_image.path)
+            self._describe_original(visualization_request, original_image)
             
             # Derive screen_type from categories if available
             screen_type = visualization_request.screen_type # Default
@@ -97,13 +147,15 @@ class AIEnhancedImageProcessor:
             
             logger.info(f"Derived screen_type: {screen_type} from categories: {visualization_request.screen_categories}")
 
-            # Get image generation service (Gemini)
+            # Pick the healthiest image generation provider (see api/ai_services/routing.py)
+            provider_name = ai_service_registry.find_best_provider(AIServiceType.IMAGE_GENERATION)
+            pipeline_tracer.set_on_current('provider', provider_name)
             generation_service = AIServiceFactory.create_image_generation_service(
-                provider_name='gemini'
+                provider_name=provider_name
             )
 
             if not generation_service:
-                raise ValueError("Gemini service not available. Check API key.")
+                raise ValueError("No image generation service available. Check API key.")
 
             # Generate visualization
             # The ScreenVisualizer pipeline handles Cleanse -> Build -> Install -> Check
@@ -112,10 +164,9 @@ class AIEnhancedImageProcessor:
                 visualization_request.update_progress(percent, message)
                 logger.info(f"Progress: {percent}% - {message}")
 
-            # We generate one high-quality variation
+            # One high-quality variation, or one per requested option set
             variation_name = f"{screen_type.lower()}_standard"
-            
-            
+
             # Extract style preferences and scope
             style_preferences = {
                 "opacity": visualization_request.opacity,
@@ -129,14 +180,28 @@ class AIEnhancedImageProcessor:
                 style_preferences["scope"] = visualization_request.scope
                 logger.info(f"Using scope from request: {visualization_request.scope}")
 
+            if visualization_request.variations:
+                style_preferences["variations"] = [
+                    {
+                        "name": variation.get('name'),
+                        "color": variation.get('frame_color'),
+                        "mesh_type": variation.get('mesh_choice'),
+                    }
+                    for variation in visualization_request.variations
+                ]
+                logger.info(f"Rendering {len(visualization_request.variations)} variations from one cleanup")
+
             logger.info("Calling generation_service.generate_screen_visualization...")
-            result = generation_service.generate_screen_visualization(
-                original_image,
-                screen_type,
-                detection_areas=None, # Handled by Gemini
-                style_preferences=style_preferences,
-                progress_callback=progress_callback
-            )
+            with pipeline_tracer.span('generation', provider=provider_name):
+                result = generation_service.generate_screen_visualization(
+                    original_image,
+                    screen_type,
+                    detection_areas=None, # Handled by Gemini
+                    style_preferences=style_preferences,
+                    progress_callback=progress_callback,
+                    job_id=visualization_request.id,
+                    clean_image=self._reused_clean_image(visualization_request)
+                )
             logger.info("Returned from generation_service.generate_screen_visualization")
 
 
@@ -145,37 +210,47 @@ class AIEnhancedImageProcessor:
                 visualization_request.update_progress(90, "Saving results...")
                 
                 # Save the result
-                image_data = result.metadata.get('generated_image_data')
-                clean_image_data = result.metadata.get('clean_image_data')
+                with pipeline_tracer.span('persistence'):
+                    image_data = result.metadata.get('generated_image_data')
+                    clean_image_data = result.metadata.get('clean_image_data')
                 
-                if clean_image_data:
-                    logger.info("Saving clean image...")
-                    # Save clean image to the request
-                    clean_filename = f"clean_{visualization_request.id}.jpg"
-                    if hasattr(visualization_request, 'clean_image'):
-                        visualization_request.clean_image.save(
-                            clean_filename,
-                            ContentFile(clean_image_data),
-                            save=True
+                    if clean_image_data:
+                        logger.info("Saving clean image...")
+                        # Save clean image to the request
+                        clean_filename = f"clean_{visualization_request.id}.jpg"
+                        if hasattr(visualization_request, 'clean_image'):
+                            visualization_request.clean_image.save(
+                                clean_filename,
+                                ContentFile(clean_image_data),
+                                save=True
+                            )
+                        else:
+                            logger.warning("VisualizationRequest has no clean_image field")
+
+                    if result.metadata.get('variations'):
+                        logger.info("Saving generated variations...")
+                        saved_images = self._save_generated_images(
+                            visualization_request,
+                            self._variation_entries(screen_type, result.metadata['variations'])
                         )
-                    else:
-                        logger.warning("VisualizationRequest has no clean_image field")
-
-                if image_data:
-                    logger.info("Saving generated image...")
-                    saved_images = self._save_generated_image(
-                        image_data, 
-                        variation_name, 
-                        visualization_request,
-                        metadata=result.metadata
-                    )
+                        if not saved_images:
+                            raise ValueError("All variations failed to render.")
+                    elif image_data:
+                        logger.info("Saving generated image...")
+                        saved_images = self._save_generated_images(
+                            visualization_request,
+                            [(variation_name, image_data, result.metadata)]
+                        )
+
+                    self._save_dimensional_analysis(visualization_request, result.metadata)
                     
                 # Run security audit on original image
                 logger.info("Running security audit...")
                 visualization_request.update_progress(92, "Analyzing security vulnerabilities...")
                 try:
-                    audit_service = AuditService()
-                    audit_report = audit_service.perform_audit(visualization_request)
+                    with pipeline_tracer.span('audit'):
+                        audit_service = AuditService()
+                        audit_report = audit_service.perform_audit(visualization_request)
                     logger.info(f"Audit complete: {len(audit_report.vulnerabilities)} vulnerabilities found")
                 except AuditServiceError as e:
                     logger.warning(f"Audit failed (non-fatal): {e}")
@@ -186,13 +261,14 @@ class AIEnhancedImageProcessor:
                 try:
                     from .utils.pdf_generator import generate_visualization_pdf
 
-                    pdf_buffer = generate_visualization_pdf(visualization_request)
-                    pdf_filename = f"security_report_{visualization_request.id}.pdf"
-                    visualization_request.generated_pdf.save(
-                        pdf_filename,
-                        ContentFile(pdf_buffer.getvalue()),
-                        save=True
-                    )
+                    with pipeline_tracer.span('pdf'):
+                        pdf_buffer = generate_visualization_pdf(visualization_request)
+                        pdf_filename = f"security_report_{visualization_request.id}.pdf"
+                        visualization_request.generated_pdf.save(
+                            pdf_filename,
+                            ContentFile(pdf_buffer.getvalue()),
+                            save=True
+                        )
                     logger.info(f"PDF generated: {pdf_filename}")
                 except Exception as e:
                     logger.warning(f"PDF generation failed (non-fatal): {e}")
@@ -211,41 +287,89 @@ class AIEnhancedImageProcessor:
             visualization_request.mark_as_failed(error_msg)
             return []
 
-    def _save_generated_image(
+    def _save_dimensional_analysis(self, visualization_request, metadata: Dict[str, Any]):
+        """Store the patio measurements of the result (the first variation that has them)."""
+        candidates = [metadata] + list(metadata.get('variations') or [])
+        analysis = next((c['dimensional_analysis'] for c in candidates if c.get('dimensional_analysis')), None)
+        if analysis is None:
+            return
+        visualization_request.dimensional_analysis = analysis
+        visualization_request.save(update_fields=['dimensional_analysis'])
+        logger.info(f"Dimensional analysis for request {visualization_request.id}: {analysis}")
+
+    def _describe_original(self, visualization_request, original_image):
+        """Store the original's descriptor for similarity lookups; failures don't fail the job."""
+        try:
+            with pipeline_tracer.span('descriptor'):
+                describe_upload(visualization_request, original_image)
+        except Exception as e:
+            logger.warning(f"Descriptor of request {visualization_request.id} failed (non-fatal): {e}")
+
+    def _reused_clean_image(self, visualization_request):
+        """Clean image of the earlier upload this request duplicates, if it can be reused."""
+        duplicate = visualization_request.duplicate_of
+        if duplicate is None or not duplicate.clean_image:
+            return None
+        try:
+            with Image.open(duplicate.clean_image.path) as image:
+                clean_image = image.convert('RGB')
+        except Exception as e:
+            logger.warning(f"Clean image of request {duplicate.id} unavailable, running cleanup: {e}")
+            return None
+        pipeline_tracer.set_on_current('reused_clean_image_from', duplicate.id)
+        return clean_image
+
+    def _variation_entries(self, screen_type: str, variations: List[Dict[str, Any]]) -> List[Tuple[str, bytes, Dict[str, Any]]]:
+        """Turn rendered variations into (name, image data, metadata) entries, skipping failures."""
+        entries = []
+        for index, variation in enumerate(variations, start=1):
+            if not variation.get('generated_image_data'):
+                logger.warning(f"Variation {index} failed: {variation.get('error')}")
+                continue
+            color = (variation.get('options') or {}).get('color') or ''
+            name = variation.get('name') or f"{screen_type.lower()}_{index}_{color.lower().replace(' ', '_')}".rstrip('_')
+            metadata = {**variation, 'variation_index': index}
+            entries.append((name, variation['generated_image_data'], metadata))
+        return entries
+
+    def _save_generated_images(
         self,
-        image_data: bytes,
-        variation: str,
         request,
-        metadata: Dict[str, Any] = None
+        entries: List[Tuple[str, bytes, Dict[str, Any]]]
     ) -> List:
         """
-        Save generated image and create GeneratedImage record.
+        Save generated images and create their GeneratedImage records in one query.
+
+        Args:
+            request: VisualizationRequest the images belong to
+            entries: (variation name, JPEG bytes, metadata) per image
         """
         from .models import GeneratedImage
 
         try:
-            # Create filename
-            filename = f"ai_generated_{request.id}_{variation}.jpg"
-
-            # Create GeneratedImage record
-            generated_image = GeneratedImage(request=request)
-            if metadata:
-                # Filter out binary data from metadata
-                clean_metadata = {
-                    k: v for k, v in metadata.items() 
-                    if not isinstance(v, bytes) and k not in ['generated_image_data', 'clean_image_data']
-                }
-                generated_image.metadata = clean_metadata
-                
-            generated_image.generated_image.save(
-                filename,
-                ContentFile(image_data),
-                save=True
-            )
-
-            logger.info(f"Saved generated image: {filename}")
-            return [generated_image]
+            generated_images = []
+            for variation, image_data, metadata in entries:
+                filename = f"ai_generated_{request.id}_{variation}.jpg"
+
+                generated_image = GeneratedImage(request=request)
+                if metadata:
+                    # Filter out binary data from metadata
+                    generated_image.metadata = {
+                        k: v for k, v in metadata.items()
+                        if not isinstance(v, bytes) and k not in ['generated_image_data', 'clean_image_data', 'variations']
+                    }
+
+                # bulk_create skips GeneratedImage.save(), so fill in what it would extract
+                with Image.open(io.BytesIO(image_data)) as img:
+                    generated_image.image_width, generated_image.image_height = img.size
+                generated_image.file_size = len(image_data)
+                generated_image.generated_image.save(filename, ContentFile(image_data), save=False)
+                generated_images.append(generated_image)
+
+            GeneratedImage.objects.bulk_create(generated_images)
+            logger.info(f"Saved {len(generated_images)} generated images for request {request.id}")
+            return generated_images
 
         except Exception as e:
-            logger.error(f"Error saving generated image: {str(e)}")
+            logger.error(f"Error saving generated images: {str(e)}")
             return []
@@ -0,0 +1,194 @@
+"""
+Circuit Breakers
+----------------
+Per provider/model circuit breakers for AI calls.
+
+A circuit opens after consecutive failed calls, rejects calls immediately
+while open, and after a cool-down lets a single trial call through
+(half-open). A successful trial closes the circuit; a failed one re-opens it.
+A trial that ends without a verdict on provider health (e.g. a rejected
+request) is released so the next call can try, and a trial that never
+reports back is given up on after trial_timeout.
+
+Usage:
+    from api.ai_services.circuit_breaker import circuit_breakers
+
+    breaker = circuit_breakers.get('gemini', model_name)
+    if not breaker.allow_request():
+        raise CircuitOpenError(breaker.name)
+    try:
+        response = call_model()
+        breaker.record_success()
+    except Exception as e:
+        if is_provider_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.release_trial()
+        raise
+"""
+
+import logging
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIMEOUT_SECONDS = 30.0
+
+# A half-open trial call that has not reported back by then is assumed lost
+DEFAULT_TRIAL_TIMEOUT_SECONDS = 180.0
+
+
+class CircuitState(Enum):
+    """State of a circuit breaker."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit is open."""
+    pass
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one provider/model."""
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT_SECONDS,
+                 trial_timeout: float = DEFAULT_TRIAL_TIMEOUT_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.trial_timeout = trial_timeout
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._trial_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go through now. Half-open admits one trial call."""
+        with self._lock:
+            state = self._current_state()
+            if state == CircuitState.CLOSED:
+                return True
+            if state == CircuitState.HALF_OPEN:
+                trial_lost = (self._trial_in_flight
+                              and time.monotonic() - self._trial_started_at >= self.trial_timeout)
+                if not self._trial_in_flight or trial_lost:
+                    if trial_lost:
+                        logger.warning(f"Circuit {self.name} trial call timed out, admitting another")
+                    self._trial_in_flight = True
+                    self._trial_started_at = time.monotonic()
+                    return True
+            return False
+
+    def release_trial(self) -> None:
+        """End a call that says nothing about provider health (e.g. a 4xx) without changing the state."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CircuitState.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state == CircuitState.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if state != CircuitState.OPEN:
+                    logger.warning(
+                        f"Circuit {self.name} opened after {self._consecutive_failures} consecutive failures"
+                    )
+                self._state = CircuitState.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == CircuitState.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'state': state.value,
+                'consecutive_failures': self._consecutive_failures,
+                'retry_in_seconds': retry_in,
+            }
+
+
+class CircuitBreakerRegistry:
+    """Lazily creates and holds one circuit breaker per (provider, model)."""
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 recovery_timeout: float = DEFAULT_RECOVERY_TIMEOUT_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(
+                    f"{provider}/{model}", self.failure_threshold, self.recovery_timeout
+                ))
+        return breaker
+
+    def is_open(self, provider: str, model: Optional[str] = None) -> bool:
+        """
+        Whether calls would be rejected right now.
+
+        With no model, true only when every known circuit of the provider is open.
+        """
+        if model is not None:
+            breaker = self._breakers.get((provider, model))
+            return breaker is not None and breaker.state == CircuitState.OPEN
+        states = [b.state for (name, _), b in list(self._breakers.items()) if name == provider]
+        return bool(states) and all(state == CircuitState.OPEN for state in states)
+
+    def get_provider_status(self, provider: str) -> Dict[str, Dict[str, Any]]:
+        """Status of every circuit of one provider, keyed by model."""
+        return {
+            model: breaker.get_status()
+            for (name, model), breaker in list(self._breakers.items()) if name == provider
+        }
+
+    def reset(self) -> None:
+        """Forget all circuits (mainly for testing)."""
+        with self._lock:
+            self._breakers.clear()
+
+
+# Global circuit breaker registry
+circuit_breakers = CircuitBreakerRegistry()
@@ -97,6 +97,20 @@ class AIServiceConfigManager:
                 self._configs['google_vision'] = config
                 logger.info("Loaded Google Vision config from environment")
 
+            # Gemini configuration (timeout is the default per-call budget for pipeline steps)
+            gemini_key = os.getenv('GOOGLE_API_KEY')
+            if gemini_key:
+                config = AIServiceConfig(
+                    service_name='gemini',
+                    service_type=AIServiceType.IMAGE_GENERATION,
+                    api_key=gemini_key,
+                    model_name=os.getenv('GEMINI_MODEL', 'gemini-3-pro-image-preview'),
+                    max_requests_per_minute=int(os.getenv('GEMINI_MAX_REQUESTS', '60')),
+                    timeout_seconds=int(os.getenv('GEMINI_TIMEOUT', '120'))
+                )
+                self._configs['gemini'] = config
+                logger.info("Loaded Gemini config from environment")
+
             # Anthropic Claude configuration
             anthropic_key = os.getenv('ANTHROPIC_API_KEY')
             if anthropic_key:
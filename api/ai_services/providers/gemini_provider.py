@@ -4,10 +4,15 @@ Gemini AI Provider
 Provider implementation for Google's Gemini AI services.
 """
 
+import io
 import logging
 import os
+import threading
+import time
 from typing import List, Dict, Any, Optional, Tuple
 from PIL import Image
+from google import genai
+from google.genai import types
 
 from ..interfaces import (
     AIServiceProvider,
@@ -20,15 +25,28 @@ from ..interfaces import (
     ScreenAnalysisResult,
     QualityAssessmentResult
 )
+from ..circuit_breaker import circuit_breakers
+from ..routing import model_router
 from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
 
 logger = logging.getLogger(__name__)
 
+# Synthetic health probe: fetch model metadata (no tokens billed), at most once per interval
+PROBE_MODEL = "gemini-2.5-flash"
+PROBE_INTERVAL_SECONDS = 60
+PROBE_TIMEOUT_MS = 5000
+
+
 class GeminiProvider(AIServiceProvider):
     """
     Provider for Google Gemini AI services.
     """
 
+    def __init__(self):
+        self._probe_client = None
+        self._last_probe: Optional[Dict[str, Any]] = None
+        self._probe_lock = threading.Lock()
+
     def get_available_services(self) -> List[AIServiceType]:
         return [
             AIServiceType.IMAGE_GENERATION,
@@ -47,9 +65,65 @@ class GeminiProvider(AIServiceProvider):
         return {
             "name": "Google Gemini",
             "version": "1.0.0",
-            "models": ["gemini-3-pro-image-preview", "gemini-2.0-flash-exp"]
+            "models": ["gemini-3-pro-image-preview", "gemini-2.5-flash-image", "gemini-2.5-flash"]
         }
 
+    def probe(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Cheap synthetic health check against the Gemini API.
+
+        Results are cached for PROBE_INTERVAL_SECONDS unless force is set.
+        """
+        with self._probe_lock:
+            if (not force and self._last_probe
+                    and time.time() - self._last_probe['checked_at'] < PROBE_INTERVAL_SECONDS):
+                return self._last_probe
+
+            started = time.perf_counter()
+            try:
+                if self._probe_client is None:
+                    api_key = os.environ.get("GOOGLE_API_KEY")
+                    if not api_key:
+                        raise ValueError("GOOGLE_API_KEY not set")
+                    self._probe_client = genai.Client(
+                        api_key=api_key, http_options=types.HttpOptions(timeout=PROBE_TIMEOUT_MS)
+                    )
+                self._probe_client.models.get(model=PROBE_MODEL)
+                result = {'ok': True}
+            except Exception as e:
+                logger.warning(f"Gemini health probe failed: {e}")
+                result = {'ok': False, 'error': str(e)}
+
+            result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            result['checked_at'] = time.time()
+            self._last_probe = result
+            return result
+
+    def get_service_health(self) -> Dict[str, Any]:
+        """
+        Health from live call outcomes (circuit breakers, routing stats) plus the probe.
+        """
+        circuits = circuit_breakers.get_provider_status('gemini')
+        probe = self.probe()
+        states = [circuit['state'] for circuit in circuits.values()]
+
+        if not probe['ok'] or (states and all(state == 'open' for state in states)):
+            status = 'unhealthy'
+        elif any(state != 'closed' for state in states) or model_router.is_degraded('gemini'):
+            status = 'degraded'
+        else:
+            status = 'healthy'
+
+        return {
+            'provider_name': 'gemini',
+            'status': status,
+            'circuits': circuits,
+            'routing_stats': model_router.get_stats('gemini'),
+            'probe': probe,
+            'last_check': time.time()
+        }
+
+
 class GeminiImageGenerationService(AIImageGenerationService):
     """
     Image generation service using Gemini.
@@ -58,7 +132,7 @@ class GeminiImageGenerationService(AIImageGenerationService):
     def __init__(self, config: AIServiceConfig):
         super().__init__(config)
         api_key = config.api_key or os.environ.get("GOOGLE_API_KEY")
-        self.visualizer = ScreenVisualizer(api_key=api_key)
+        self.visualizer = ScreenVisualizer(api_key=api_key, timeout_seconds=config.timeout_seconds)
 
     def _validate_config(self) -> None:
         if not self.config.api_key and not os.environ.get("GOOGLE_API_KEY"):
@@ -70,10 +144,14 @@ class GeminiImageGenerationService(AIImageGenerationService):
         screen_type: str,
         detection_areas: List[Tuple[int, int, int, int]] = None,
         style_preferences: Dict[str, Any] = None,
-        progress_callback=None
+        progress_callback=None,
+        job_id: Optional[str] = None,
+        clean_image: Optional[Image.Image] = None
     ) -> AIServiceResult:
         """
         Generate screen visualization using ScreenVisualizer pipeline.
+
+        A clean_image from an earlier upload of the same photo skips cleanup.
         """
         try:
             # Extract style preferences
@@ -112,33 +190,55 @@ class GeminiImageGenerationService(AIImageGenerationService):
                 if not any(scope.values()):
                     scope['windows'] = True
 
+            # Extra option sets share one cleanup; each overrides the base options
+            variation_styles = style_preferences.get('variations') or []
+            variations = [
+                {**options, **{k: v for k, v in style.items() if k in options and v}}
+                for style in variation_styles
+            ] or [options]
+
             # Run the pipeline
-            clean_image, result_image, quality_score, quality_reason = self.visualizer.process_pipeline(
-                original_image, 
+            clean_image, results = self.visualizer.process_variations(
+                original_image,
                 scope=scope,
-                options=options,
-                progress_callback=progress_callback
+                variations=variations,
+                progress_callback=progress_callback,
+                job_id=job_id,
+                clean_image=clean_image
             )
-            
-            # Convert back to bytes for the result
-            import io
-            output = io.BytesIO()
-            result_image.save(output, format='JPEG', quality=85)
-            image_data = output.getvalue()
-
-            # Convert clean image to bytes
-            clean_output = io.BytesIO()
-            clean_image.save(clean_output, format='JPEG', quality=85)
-            clean_image_data = clean_output.getvalue()
-            
+
+            if variation_styles:
+                metadata = {
+                    "clean_image_data": self._to_jpeg(clean_image),
+                    "variations": [
+                        {
+                            "name": style.get('name'),
+                            "options": result['options'],
+                            "generated_image_data": self._to_jpeg(result['image']) if result['image'] else None,
+                            "quality_score": result['score'],
+                            "quality_reason": result['reason'],
+                            "quality_tier": result['quality_tier'],
+                            "refinement_attempts": result['refinement_attempts'],
+                            "dimensional_analysis": result['dimensional_analysis'],
+                            "error": str(result['error']) if result['error'] else None
+                        }
+                        for style, result in zip(variation_styles, results)
+                    ]
+                }
+                return AIServiceResult(success=True, status=ProcessingStatus.COMPLETED, metadata=metadata)
+
+            result = results[0]
             return AIServiceResult(
                 success=True,
                 status=ProcessingStatus.COMPLETED,
                 metadata={
-                    "generated_image_data": image_data,
-                    "clean_image_data": clean_image_data,
-                    "quality_score": quality_score,
-                    "quality_reason": quality_reason
+                    "generated_image_data": self._to_jpeg(result['image']),
+                    "clean_image_data": self._to_jpeg(clean_image),
+                    "quality_score": result['score'],
+                    "quality_reason": result['reason'],
+                    "quality_tier": result['quality_tier'],
+                    "refinement_attempts": result['refinement_attempts'],
+                    "dimensional_analysis": result['dimensional_analysis']
                 }
             )
             
@@ -157,6 +257,13 @@ class GeminiImageGenerationService(AIImageGenerationService):
                 message=f"Unexpected error: {str(e)}"
             )
 
+    @staticmethod
+    def _to_jpeg(image: Image.Image) -> bytes:
+        """Encode a pipeline image for the result metadata."""
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        return output.getvalue()
+
     def enhance_image_quality(
         self,
         image: Image.Image,
@@ -171,6 +278,3 @@ class GeminiImageGenerationService(AIImageGenerationService):
 
     def get_service_status(self) -> Dict[str, Any]:
         return {"status": "active", "provider": "gemini"}
-
-    def get_service_status(self) -> Dict[str, Any]:
-        return {"status": "active", "provider": "gemini"}
@@ -8,6 +8,7 @@ capabilities, allowing for dynamic service discovery and selection.
 import logging
 from typing import Dict, List, Optional, Type
 from .interfaces import AIServiceProvider, AIServiceType, AIServiceConfig
+from .routing import model_router
 
 logger = logging.getLogger(__name__)
 
@@ -161,7 +162,9 @@ class AIServiceRegistry:
                 'provider_name': provider_name,
                 'available_services': provider.get_available_services(),
                 'provider_info': provider.get_provider_info(),
-                'is_available': True
+                'is_available': True,
+                'routing_stats': model_router.get_stats(provider_name),
+                'is_degraded': model_router.is_degraded(provider_name)
             }
             return capabilities
         except Exception as e:
@@ -207,7 +210,8 @@ class AIServiceRegistry:
         
         Args:
             service_type: Type of service needed
-            requirements: Optional requirements for provider selection
+            requirements: Optional requirements for provider selection,
+                e.g. {'optimize_for': 'cost'} or {'optimize_for': 'latency'}
             
         Returns:
             Name of the best provider or None if none found
@@ -218,15 +222,12 @@ class AIServiceRegistry:
             logger.warning(f"No providers available for service type: {service_type}")
             return None
         
-        if not requirements:
-            # Return first available provider if no specific requirements
-            return available_providers[0]
-        
-        # TODO: Implement more sophisticated provider selection logic
-        # based on requirements like cost, speed, quality, etc.
-        
-        # For now, return the first available provider
-        return available_providers[0]
+        # Rank by live health, then by cost or latency if requested
+        optimize_for = (requirements or {}).get('optimize_for')
+        ranked = model_router.rank_providers(available_providers, optimize_for=optimize_for)
+        if ranked[0] != available_providers[0]:
+            logger.info(f"Routing {service_type.value} to '{ranked[0]}' (optimize_for={optimize_for})")
+        return ranked[0]
     
     def clear_registry(self):
         """Clear all registered providers (mainly for testing)."""
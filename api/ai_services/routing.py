@@ -0,0 +1,234 @@
+"""
+Model Routing
+-------------
+Cost- and latency-aware selection of AI providers and models.
+
+The router keeps rolling latency, error-rate and cost statistics per
+(provider, model). Pipeline steps get an ordered list of routes from the
+tenant's model policy. Degraded routes (bad stats or an open circuit breaker)
+move to the back of that list, so a step fails over to the next route when
+its preferred model misbehaves.
+
+Usage:
+    from api.ai_services.routing import model_router
+
+    for route in model_router.get_routes(step_name, step_config, tenant_config):
+        ...
+        model_router.record_outcome(route.provider, route.model, latency, success=True)
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .circuit_breaker import circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+# Outcomes kept per (provider, model), and how long they stay relevant
+WINDOW_SIZE = 50
+WINDOW_SECONDS = 15 * 60
+
+# A route is degraded when, with enough samples, its error rate or median
+# latency crosses these limits
+MIN_SAMPLES = 5
+DEGRADED_ERROR_RATE = 0.5
+DEGRADED_LATENCY_SECONDS = 120.0
+
+# Thinking budget that leaves the amount of thinking to the model (unbounded)
+DYNAMIC_THINKING_BUDGET = -1
+
+# Smallest thinking budget a model accepts, by model name prefix; Pro models
+# cannot turn thinking off
+MIN_THINKING_BUDGETS = {
+    'gemini-2.5-pro': 128,
+    'gemini-3-pro': 128,
+}
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """One provider/model choice for a pipeline step."""
+    provider: str
+    model: str
+    include_thoughts: bool = True
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ModelRoute':
+        return cls(
+            provider=data.get('provider', 'gemini'),
+            model=data['model'],
+            include_thoughts=data.get('include_thoughts', True),
+        )
+
+
+def clamp_thinking_budget(model: str, budget: Optional[int]) -> Optional[int]:
+    """A step's thinking budget raised to what the model accepts (None and dynamic budgets are kept)."""
+    if budget is None or budget < 0:
+        return budget
+    minimum = next((value for prefix, value in MIN_THINKING_BUDGETS.items() if model.startswith(prefix)), 0)
+    if budget < minimum:
+        logger.debug(f"Thinking budget {budget} is below the minimum of {model}; using {minimum}")
+    return max(budget, minimum)
+
+
+class RouteStats:
+    """Rolling window of call outcomes for one (provider, model)."""
+
+    def __init__(self):
+        self.outcomes = deque(maxlen=WINDOW_SIZE)  # (timestamp, latency_s, success)
+        self.costs = deque(maxlen=WINDOW_SIZE)
+
+    def _recent(self, now: float) -> List[Tuple[float, float, bool]]:
+        cutoff = now - WINDOW_SECONDS
+        return [o for o in self.outcomes if o[0] >= cutoff]
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        recent = self._recent(now)
+        latencies = sorted(o[1] for o in recent if o[2])
+        failures = sum(1 for o in recent if not o[2])
+        return {
+            'samples': len(recent),
+            'error_rate': failures / len(recent) if recent else 0.0,
+            'p50_latency': latencies[len(latencies) // 2] if latencies else None,
+            'p95_latency': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+            'avg_cost': sum(self.costs) / len(self.costs) if self.costs else None,
+        }
+
+
+class ThinkingStats:
+    """Rolling window of thinking tokens and latency for one (route, step, thinking budget)."""
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_SIZE)  # (timestamp, thinking_tokens, latency_s)
+
+    def summary(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = now or time.time()
+        recent = [s for s in self.samples if s[0] >= now - WINDOW_SECONDS]
+        return {
+            'samples': len(recent),
+            'avg_thinking_tokens': sum(s[1] for s in recent) / len(recent) if recent else None,
+            'avg_latency': sum(s[2] for s in recent) / len(recent) if recent else None,
+        }
+
+
+class ModelRouter:
+    """Tracks per-route performance and orders routes for each step."""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], RouteStats] = {}
+        # (provider, model, step, thinking budget or None) -> stats
+        self._thinking: Dict[Tuple[str, str, str, Optional[int]], ThinkingStats] = {}
+        self._lock = threading.Lock()
+
+    # =========================================================================
+    # Recording
+    # =========================================================================
+
+    def record_outcome(self, provider: str, model: str, latency_seconds: float, success: bool) -> None:
+        """Record the latency and result of one model call."""
+        with self._lock:
+            stats = self._stats.setdefault((provider, model), RouteStats())
+            stats.outcomes.append((time.time(), latency_seconds, success))
+
+    def record_cost(self, provider: str, model: str, cost: float) -> None:
+        """Record the cost of one model call."""
+        with self._lock:
+            self._stats.setdefault((provider, model), RouteStats()).costs.append(cost)
+
+    def record_thinking(self, provider: str, model: str, step_name: str, budget: Optional[int],
+                        thinking_tokens: int, latency_seconds: float) -> None:
+        """Record the thinking tokens and latency of one call made with a thinking budget (None: unbounded)."""
+        with self._lock:
+            stats = self._thinking.setdefault((provider, model, step_name, budget), ThinkingStats())
+            stats.samples.append((time.time(), thinking_tokens, latency_seconds))
+
+    # =========================================================================
+    # Queries
+    # =========================================================================
+
+    def get_stats(self, provider: str, model: Optional[str] = None) -> Dict[str, Any]:
+        """Get rolling stats for a route, or for all of a provider's models."""
+        with self._lock:
+            if model is not None:
+                stats = self._stats.get((provider, model))
+                return stats.summary() if stats else RouteStats().summary()
+
+            merged = RouteStats()
+            for (name, _), stats in self._stats.items():
+                if name == provider:
+                    merged.outcomes.extend(stats.outcomes)
+                    merged.costs.extend(stats.costs)
+            merged.outcomes = deque(sorted(merged.outcomes), maxlen=WINDOW_SIZE)
+            return merged.summary()
+
+    def get_thinking_stats(self, provider: str, model: str, step_name: str, budget: Optional[int]) -> Dict[str, Any]:
+        """Get rolling thinking stats of a step's calls at one thinking budget (None: unbounded)."""
+        with self._lock:
+            stats = self._thinking.get((provider, model, step_name, budget))
+            return stats.summary() if stats else ThinkingStats().summary()
+
+    def is_degraded(self, provider: str, model: Optional[str] = None) -> bool:
+        """Whether a route (or a whole provider) is currently misbehaving."""
+        if circuit_breakers.is_open(provider, model):
+            return True
+        stats = self.get_stats(provider, model)
+        if stats['samples'] < MIN_SAMPLES:
+            return False
+        if stats['error_rate'] >= DEGRADED_ERROR_RATE:
+            return True
+        return stats['p50_latency'] is not None and stats['p50_latency'] > DEGRADED_LATENCY_SECONDS
+
+    def get_routes(self, step_name: str, step_config: Dict[str, Any], tenant_config=None) -> List[ModelRoute]:
+        """
+        Get the routes to try for a pipeline step, in order.
+
+        Routes come from the step config's 'models' list, else the tenant's
+        model policy for the step type. Healthy routes keep policy order;
+        degraded routes are kept as a last resort.
+        """
+        candidates = step_config.get('models')
+        if not candidates and tenant_config is not None:
+            candidates = tenant_config.get_model_policy().get(step_config.get('type'), [])
+        routes = [ModelRoute.from_dict(c) for c in candidates or []]
+
+        healthy = [r for r in routes if not self.is_degraded(r.provider, r.model)]
+        degraded = [r for r in routes if r not in healthy]
+        if degraded:
+            logger.warning(f"Degraded routes for {step_name}: {[r.model for r in degraded]}")
+        return healthy + degraded
+
+    def rank_providers(self, providers: List[str], optimize_for: Optional[str] = None) -> List[str]:
+        """
+        Order providers by health, then by the requested objective.
+
+        Args:
+            providers: Candidate provider names, in registration order
+            optimize_for: 'cost', 'latency', or None to keep registration order
+        """
+        def sort_key(item):
+            index, provider = item
+            stats = self.get_stats(provider)
+            degraded = self.is_degraded(provider)
+            if optimize_for == 'cost' and stats['avg_cost'] is not None:
+                return (degraded, 0, stats['avg_cost'], index)
+            if optimize_for == 'latency' and stats['p50_latency'] is not None:
+                return (degraded, 0, stats['p50_latency'], index)
+            # Providers without data sort after measured ones for the objective
+            return (degraded, 1 if optimize_for else 0, 0, index)
+
+        return [provider for _, provider in sorted(enumerate(providers), key=sort_key)]
+
+    def reset(self) -> None:
+        """Clear all stats (mainly for testing)."""
+        with self._lock:
+            self._stats.clear()
+            self._thinking.clear()
+
+
+# Global router instance
+model_router = ModelRouter()
@@ -0,0 +1,301 @@
+"""
+Structured Output - Schema-constrained JSON responses from Gemini.
+
+Response types are dataclasses. response_schema() turns one into the JSON
+schema sent with the request (response_mime_type 'application/json'), so the
+model answers with JSON of exactly that shape.
+
+Responses are streamed through a StreamingJSONParser, which checks the JSON
+as it arrives: output that cannot become a single JSON object (prose, a
+markdown fence, mismatched brackets, a second value) raises
+MalformedOutputError at the first bad character, and the stream is closed so
+the rest of the response is not generated. The finished object is validated
+into the dataclass by from_data(); missing or mistyped fields are errors,
+never filled in with defaults.
+
+Usage:
+    from api.ai_services.structured_output import QualityVerdict, generate_structured
+
+    response = generate_structured(client, 'gemini-2.0-flash', [image, prompt], QualityVerdict)
+    response.value.score
+"""
+import json
+import logging
+from dataclasses import dataclass, field, fields, is_dataclass
+from typing import Any, Iterable, List, Optional, Type, TypeVar, get_args, get_origin, get_type_hints
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Longest response accepted before the stream is abandoned as runaway output
+DEFAULT_MAX_CHARS = 32768
+
+_SCALAR_TYPES = {str: 'string', float: 'number', int: 'integer', bool: 'boolean'}
+
+# Field metadata keys copied into the schema and checked on validation
+_CONSTRAINTS = ('enum', 'minimum', 'maximum')
+
+
+class StructuredOutputError(Exception):
+    """A model response that does not match its schema."""
+
+    def __init__(self, message: str, usage_metadata: Any = None):
+        super().__init__(message)
+        # Token usage of the (partial) response, so it can still be billed
+        self.usage_metadata = usage_metadata
+
+
+class MalformedOutputError(StructuredOutputError):
+    """A streamed response that cannot be a single JSON object."""
+
+
+# -- Response types ---------------------------------------------------------
+
+@dataclass
+class QualityVerdict:
+    """Model judgement of a pipeline result."""
+    score: float = field(metadata={'minimum': 0.0, 'maximum': 1.0})
+    reason: str
+
+
+@dataclass
+class Vulnerability:
+    """One security weakness found by the audit."""
+    type: str
+    description: str
+    severity: str = field(metadata={'enum': ('High', 'Medium', 'Low')})
+    location: str
+
+
+@dataclass
+class AuditFindings:
+    """Security audit of a home exterior (see api/audit/prompts.py)."""
+    has_ground_level_access: bool
+    has_concealment: bool
+    has_glass_proximity: bool
+    has_hardware_weakness: bool
+    vulnerabilities: List[Vulnerability]
+    analysis_summary: str
+
+
+# -- Schemas and validation -------------------------------------------------
+
+def response_schema(cls: type) -> dict:
+    """JSON schema of a response dataclass, as accepted by GenerateContentConfig.response_schema."""
+    hints = get_type_hints(cls)
+    names = [f.name for f in fields(cls)]
+    return {
+        'type': 'object',
+        'properties': {f.name: _type_schema(hints[f.name], f.metadata) for f in fields(cls)},
+        'required': names,
+        'propertyOrdering': names,
+    }
+
+
+def _type_schema(annotation, metadata) -> dict:
+    if get_origin(annotation) is list:
+        return {'type': 'array', 'items': _type_schema(get_args(annotation)[0], {})}
+    if is_dataclass(annotation):
+        return response_schema(annotation)
+    schema = {'type': _SCALAR_TYPES[annotation]}
+    for key in _CONSTRAINTS:
+        if key in metadata:
+            value = metadata[key]
+            schema[key] = list(value) if isinstance(value, tuple) else value
+    return schema
+
+
+def from_data(cls: Type[T], data: Any, path: str = '') -> T:
+    """
+    Validate parsed JSON into a response dataclass.
+
+    Raises:
+        StructuredOutputError: A field is missing, of the wrong type or out of range
+    """
+    path = path or cls.__name__
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"{path}: expected an object, got {type(data).__name__}")
+    hints = get_type_hints(cls)
+    values = {}
+    for f in fields(cls):
+        if f.name not in data:
+            raise StructuredOutputError(f"{path}.{f.name}: missing")
+        values[f.name] = _convert(hints[f.name], data[f.name], f.metadata, f"{path}.{f.name}")
+    return cls(**values)
+
+
+def _convert(annotation, value, metadata, path: str):
+    if get_origin(annotation) is list:
+        if not isinstance(value, list):
+            raise StructuredOutputError(f"{path}: expected an array")
+        item_type = get_args(annotation)[0]
+        return [_convert(item_type, item, {}, f"{path}[{i}]") for i, item in enumerate(value)]
+    if is_dataclass(annotation):
+        return from_data(annotation, value, path)
+
+    # bool is an int subclass, so it is never accepted for numbers
+    if annotation is bool:
+        valid = isinstance(value, bool)
+    elif annotation in (int, float):
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+        if valid and annotation is int:
+            valid = float(value).is_integer()
+    else:
+        valid = isinstance(value, annotation)
+    if not valid:
+        raise StructuredOutputError(f"{path}: expected {_SCALAR_TYPES[annotation]}, got {value!r}")
+    value = annotation(value)
+
+    if 'enum' in metadata and value not in metadata['enum']:
+        raise StructuredOutputError(f"{path}: {value!r} is not one of {list(metadata['enum'])}")
+    if 'minimum' in metadata and value < metadata['minimum']:
+        raise StructuredOutputError(f"{path}: {value!r} is below {metadata['minimum']}")
+    if 'maximum' in metadata and value > metadata['maximum']:
+        raise StructuredOutputError(f"{path}: {value!r} is above {metadata['maximum']}")
+    return value
+
+
+# -- Streaming --------------------------------------------------------------
+
+class StreamingJSONParser:
+    """
+    Incremental well-formedness check of one JSON object arriving in chunks.
+
+    Tracks strings and bracket nesting only; values are parsed with the
+    json module once the object is complete.
+    """
+
+    def __init__(self, max_chars: Optional[int] = DEFAULT_MAX_CHARS):
+        self.max_chars = max_chars
+        self.complete = False
+        self._chunks: List[str] = []
+        self._length = 0
+        self._stack: List[str] = []
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._chunks)
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Add a chunk of the response.
+
+        Returns:
+            Whether the object is complete
+
+        Raises:
+            MalformedOutputError: The response cannot be a single JSON object
+        """
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        if self.max_chars is not None and self._length > self.max_chars:
+            raise MalformedOutputError(f"Response exceeded {self.max_chars} characters")
+
+        for offset, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                elif char < ' ':
+                    raise MalformedOutputError("Unescaped control character in a JSON string")
+                continue
+
+            if char.isspace():
+                continue
+            if self.complete:
+                raise MalformedOutputError(f"Unexpected output after the JSON object: {chunk[offset:offset + 40]!r}")
+            if not self._started:
+                if char != '{':
+                    raise MalformedOutputError(f"Response is not a JSON object: {chunk[offset:offset + 40]!r}")
+                self._started = True
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._stack.append('}' if char == '{' else ']')
+            elif char in '}]':
+                if not self._stack or self._stack.pop() != char:
+                    raise MalformedOutputError(f"Mismatched {char!r} in JSON response")
+                self.complete = not self._stack
+            elif not (char.isalnum() or char in ',:+-.'):
+                raise MalformedOutputError(f"Unexpected {char!r} in JSON response")
+        return self.complete
+
+    def result(self) -> Any:
+        """The parsed object; raises MalformedOutputError if it is incomplete or invalid."""
+        if not self.complete:
+            raise MalformedOutputError("Response ended before the JSON object was complete")
+        try:
+            return json.loads(self.text)
+        except json.JSONDecodeError as e:
+            raise MalformedOutputError(f"Invalid JSON in response: {e}") from e
+
+
+@dataclass
+class StructuredResponse:
+    """A validated response, with the raw text and token usage of the stream."""
+    value: Any
+    text: str
+    usage_metadata: Any = None
+
+
+def _chunk_text(chunk) -> str:
+    """Answer text of a streamed chunk, without thought summaries."""
+    candidates = getattr(chunk, 'candidates', None)
+    if not candidates or not candidates[0].content or not candidates[0].content.parts:
+        return ''
+    return ''.join(part.text for part in candidates[0].content.parts if part.text and not part.thought)
+
+
+def read_structured(stream: Iterable, schema: Type[T], max_chars: Optional[int] = DEFAULT_MAX_CHARS) -> StructuredResponse:
+    """
+    Consume a generate_content_stream response into a validated schema instance.
+
+    The stream is closed as soon as the output is found to be malformed.
+
+    Raises:
+        StructuredOutputError: The response is malformed or does not match the schema
+    """
+    parser = StreamingJSONParser(max_chars)
+    usage_metadata = None
+    try:
+        for chunk in stream:
+            usage_metadata = getattr(chunk, 'usage_metadata', None) or usage_metadata
+            parser.feed(_chunk_text(chunk))
+        value = from_data(schema, parser.result())
+    except StructuredOutputError as e:
+        logger.warning(f"Abandoned {schema.__name__} response: {e}")
+        e.usage_metadata = usage_metadata
+        raise
+    finally:
+        close = getattr(stream, 'close', None)
+        if callable(close):
+            close()
+    return StructuredResponse(value=value, text=parser.text, usage_metadata=usage_metadata)
+
+
+def structured_config(schema: type, config: Optional[types.GenerateContentConfig] = None) -> types.GenerateContentConfig:
+    """A request config that constrains the response to a schema's JSON."""
+    update = {'response_mime_type': 'application/json', 'response_schema': response_schema(schema)}
+    if config is None:
+        return types.GenerateContentConfig(**update)
+    return config.model_copy(update=update)
+
+
+def generate_structured(client, model_name: str, contents: List[Any], schema: Type[T],
+                        config: Optional[types.GenerateContentConfig] = None,
+                        max_chars: Optional[int] = DEFAULT_MAX_CHARS) -> StructuredResponse:
+    """Stream a schema-constrained response and validate it (see read_structured)."""
+    stream = client.models.generate_content_stream(
+        model=model_name, contents=contents, config=structured_config(schema, config)
+    )
+    return read_structured(stream, schema, max_chars)
@@ -17,6 +17,9 @@ from .image_utils import (
     validate_image,
     convert_image_to_base64,
     estimate_processing_time,
+    assess_image_quality,
+    check_image_quality,
+    downsample_for_quality,
     calculate_image_quality_score
 )
 
@@ -31,7 +34,9 @@ from .prompt_utils import (
 
 from .performance_utils import (
     PerformanceTracker,
+    performance_tracker,
     calculate_request_cost,
+    calculate_token_cost,
     optimize_api_call_efficiency,
     estimate_processing_time,
     CacheManager
@@ -44,6 +49,9 @@ __all__ = [
     'optimize_image_for_api',
     'validate_image',
     'convert_image_to_base64',
+    'assess_image_quality',
+    'check_image_quality',
+    'downsample_for_quality',
     'calculate_image_quality_score',
     
     # Prompt utilities
@@ -56,7 +64,9 @@ __all__ = [
     
     # Performance utilities
     'PerformanceTracker',
+    'performance_tracker',
     'calculate_request_cost',
+    'calculate_token_cost',
     'optimize_api_call_efficiency',
     'estimate_processing_time',
     'CacheManager'
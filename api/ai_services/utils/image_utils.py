@@ -6,7 +6,7 @@ Extracted from openai_provider.py for better code organization.
 import hashlib
 import io
 import logging
-from typing import Tuple, Optional
+from typing import Dict, Tuple, Optional
 from PIL import Image
 
 logger = logging.getLogger(__name__)
@@ -195,6 +195,93 @@ def estimate_processing_time(image_size: Tuple[int, int], prompt_length: int) ->
         return 30.0  # Default estimate
 
 
+# Quality metrics are computed on a downsample no larger than this (longest side, px)
+QUALITY_SAMPLE_SIZE = 512
+
+# Laplacian variance at which sharpness counts as fully sharp in the quality score
+SHARPNESS_REFERENCE = 500.0
+
+# Default thresholds for check_image_quality
+MIN_SHARPNESS = 15.0
+MIN_BRIGHTNESS = 0.08
+MAX_CLIPPED = 0.6
+
+
+def downsample_for_quality(image: Image.Image) -> Image.Image:
+    """Downsample for quality metrics: cheap integer reduce, then a resize to the sample size."""
+    # reduce() does not support palette, bilevel or 16-bit modes; convert first
+    sample = image if image.mode == 'RGB' else image.convert('RGB')
+    factor = max(1, max(sample.size) // (QUALITY_SAMPLE_SIZE * 2))
+    if factor > 1:
+        sample = sample.reduce(factor)
+    if max(sample.size) > QUALITY_SAMPLE_SIZE:
+        ratio = QUALITY_SAMPLE_SIZE / max(sample.size)
+        sample = sample.resize(
+            (max(1, int(sample.width * ratio)), max(1, int(sample.height * ratio))), Image.Resampling.BILINEAR
+        )
+    return sample
+
+
+def assess_image_quality(image: Image.Image) -> Dict[str, float]:
+    """
+    Compute technical quality metrics on a fixed-size downsample.
+
+    Args:
+        image: PIL Image to assess
+
+    Returns:
+        dict with sharpness (Laplacian variance), brightness (0-1), contrast
+        (grayscale std / 128), clipped (fraction of crushed or blown pixels),
+        color_balance (1.0 = neutral channel means), width and height
+    """
+    import numpy as np
+
+    rgb = np.asarray(downsample_for_quality(image), dtype=np.float32)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4.0 * gray[1:-1, 1:-1])
+    r_mean, g_mean, b_mean = rgb.reshape(-1, 3).mean(axis=0)
+
+    return {
+        'sharpness': float(laplacian.var()) if laplacian.size else 0.0,
+        'brightness': float(gray.mean()) / 255,
+        'contrast': float(gray.std()) / 128,
+        'clipped': float(((gray <= 2) | (gray >= 253)).mean()),
+        'color_balance': 1.0 - float(abs(r_mean - g_mean) + abs(g_mean - b_mean) + abs(r_mean - b_mean)) / (3 * 255),
+        'width': image.width,
+        'height': image.height,
+    }
+
+
+def check_image_quality(
+    image: Image.Image,
+    min_sharpness: float = MIN_SHARPNESS,
+    min_brightness: float = MIN_BRIGHTNESS,
+    max_clipped: float = MAX_CLIPPED
+) -> Tuple[bool, str, Dict[str, float]]:
+    """
+    Fast pre-check that rejects blurry, dark or blown-out images.
+
+    Args:
+        image: PIL Image to check
+        min_sharpness: Minimum Laplacian variance
+        min_brightness: Minimum mean brightness (0-1)
+        max_clipped: Maximum fraction of crushed or blown pixels
+
+    Returns:
+        Tuple of (passed, reason, metrics)
+    """
+    metrics = assess_image_quality(image)
+    if metrics['sharpness'] < min_sharpness:
+        return False, "Image is too blurry. Please upload a sharper photo.", metrics
+    if metrics['brightness'] < min_brightness:
+        return False, "Image is too dark. Please upload a photo taken in better light.", metrics
+    if metrics['clipped'] > max_clipped:
+        return False, "Image is over- or under-exposed. Please upload a better exposed photo.", metrics
+    return True, "", metrics
+
+
 def calculate_image_quality_score(image: Image.Image) -> float:
     """
     Calculate basic image quality score based on technical metrics.
@@ -206,38 +293,11 @@ def calculate_image_quality_score(image: Image.Image) -> float:
         float: Quality score (0.0-1.0)
     """
     try:
-        import numpy as np
-        from PIL import ImageStat, ImageFilter
-        
-        # Convert to grayscale for analysis
-        gray_image = image.convert('L')
-        
-        # Calculate sharpness (edge detection)
-        edges = gray_image.filter(ImageFilter.FIND_EDGES)
-        edge_array = np.array(edges)
-        sharpness = np.var(edge_array) / 10000
-        
-        # Calculate contrast
-        stat = ImageStat.Stat(gray_image)
-        contrast = stat.stddev[0] / 128
-        
-        # Calculate brightness distribution
-        brightness_mean = stat.mean[0] / 255
-        brightness_std = stat.stddev[0] / 255
-        
-        # Color analysis for RGB images
-        if image.mode in ['RGB', 'RGBA']:
-            color_stat = ImageStat.Stat(image)
-            if len(color_stat.mean) >= 3:
-                r_mean, g_mean, b_mean = color_stat.mean[:3]
-                color_balance = 1.0 - (abs(r_mean - g_mean) + abs(g_mean - b_mean) + abs(r_mean - b_mean)) / (3 * 255)
-            else:
-                color_balance = 0.8
-        else:
-            color_balance = 0.8
-        
+        metrics = assess_image_quality(image)
+
         # Combine metrics into overall quality score
-        technical_score = (min(1.0, sharpness) + min(1.0, contrast) + max(0.0, color_balance)) / 3
+        sharpness = metrics['sharpness'] / SHARPNESS_REFERENCE
+        technical_score = (min(1.0, sharpness) + min(1.0, metrics['contrast']) + max(0.0, metrics['color_balance'])) / 3
         
         # Resolution score
         width, height = image.size
@@ -149,6 +149,46 @@ def calculate_request_cost(model: str, prompt_length: int, image_size: Tuple[int
         return 0.040  # Default fallback
 
 
+# Gemini list prices in USD per 1M tokens. Thinking tokens bill at the text
+# output rate; image output tokens have their own rate.
+GEMINI_PRICING = {
+    'gemini-3-pro-image-preview': {'input': 2.00, 'output': 12.00, 'image_output': 120.00},
+    'gemini-2.5-flash-image': {'input': 0.30, 'output': 2.50, 'image_output': 30.00},
+    'gemini-2.5-pro': {'input': 1.25, 'output': 10.00, 'image_output': 0.0},
+    'gemini-2.5-flash': {'input': 0.30, 'output': 2.50, 'image_output': 0.0},
+    'gemini-2.0-flash': {'input': 0.10, 'output': 0.40, 'image_output': 0.0},
+}
+
+DEFAULT_GEMINI_PRICING_MODEL = 'gemini-3-pro-image-preview'
+
+
+def calculate_token_cost(model: str, prompt_tokens: int = 0, output_tokens: int = 0,
+                         thinking_tokens: int = 0, image_output_tokens: int = 0) -> float:
+    """
+    Calculate the cost of a Gemini call from its reported token usage.
+
+    Args:
+        model: Gemini model name
+        prompt_tokens: Input tokens (text and image)
+        output_tokens: Text output tokens, excluding image output tokens
+        thinking_tokens: Thinking tokens
+        image_output_tokens: Image output tokens
+
+    Returns:
+        float: Cost in USD
+    """
+    pricing = GEMINI_PRICING.get(model)
+    if pricing is None:
+        logger.warning(f"No pricing for model {model}, using {DEFAULT_GEMINI_PRICING_MODEL} prices")
+        pricing = GEMINI_PRICING[DEFAULT_GEMINI_PRICING_MODEL]
+
+    return (
+        prompt_tokens * pricing['input']
+        + (output_tokens + thinking_tokens) * pricing['output']
+        + image_output_tokens * pricing['image_output']
+    ) / 1_000_000
+
+
 def optimize_api_call_efficiency(image, prompt: str) -> Dict[str, Any]:
     """
     Optimize API call for efficiency and cost reduction.
@@ -323,3 +363,7 @@ class CacheManager:
         except Exception as e:
             logger.error(f"Cache cleanup failed: {str(e)}")
             return 0
+
+
+# Global tracker fed by the live pipeline (see AIEnhancedImageProcessor.process_image)
+performance_tracker = PerformanceTracker()
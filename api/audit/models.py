@@ -27,6 +27,13 @@ class AuditReport(models.Model):
     # AI Reasoning
     analysis_summary = models.TextField(help_text="AI generated summary of security risks")
     
+    input_digest = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="SHA-256 of the audited image, model and prompt; identical inputs reuse this report"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
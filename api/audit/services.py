@@ -1,18 +1,24 @@
+import hashlib
 import logging
 import os
-import json
-import re
-from typing import Optional, Dict, Any
+import time
+from dataclasses import asdict
+from typing import Optional
 from PIL import Image
 from google import genai
 from google.genai import types
 from django.conf import settings
 
+from api.ai_services.structured_output import AuditFindings, StructuredOutputError, generate_structured
+from api.ai_services.utils.image_utils import optimize_image_for_api
 from .prompts import get_audit_prompt
 from .models import AuditReport
 
 logger = logging.getLogger(__name__)
 
+# Longest side of the audit input when settings.AUDIT sets no MAX_DIMENSION
+DEFAULT_MAX_DIMENSION = 1024
+
 class AuditServiceError(Exception):
     """Base exception for AuditService errors."""
     pass
@@ -27,51 +33,100 @@ class AuditService:
         self.client = genai.Client(api_key=self.api_key)
         self.model_name = "gemini-2.0-flash"  # Fast vision model for security analysis
 
-    def perform_audit(self, visualization_request) -> AuditReport:
+    def perform_audit(self, visualization_request, refresh: bool = False) -> AuditReport:
         """
         Performs a security audit on the original image of the request.
+
+        Audits are cached by the digest of the image file, model and prompt: a
+        byte-identical upload gets a copy of the earlier report without a
+        model call. refresh=True always calls the model and overwrites the
+        request's report.
         """
         try:
-            # Check if audit already exists
-            if hasattr(visualization_request, 'audit_report'):
-                return visualization_request.audit_report
+            if not refresh:
+                # Check if audit already exists
+                if hasattr(visualization_request, 'audit_report'):
+                    return visualization_request.audit_report
+
+                # A re-upload of the same photo gets a copy of the earlier audit
+                duplicate = visualization_request.duplicate_of
+                if duplicate is not None and hasattr(duplicate, 'audit_report'):
+                    logger.info(f"Copying audit of request {duplicate.id} to duplicate {visualization_request.id}")
+                    return self._copy_report(duplicate.audit_report, visualization_request)
 
             original_image_path = visualization_request.original_image.path
             if not os.path.exists(original_image_path):
                 raise AuditServiceError(f"Image file not found: {original_image_path}")
 
+            prompt = get_audit_prompt()
+            max_dimension = self._config().get('MAX_DIMENSION', DEFAULT_MAX_DIMENSION)
+            digest = self._input_digest(original_image_path, prompt, max_dimension)
+
+            if not refresh and self._config().get('CACHE', True):
+                cached = AuditReport.objects.filter(input_digest=digest).order_by('-created_at').first()
+                if cached is not None:
+                    logger.info(f"Audit cache hit for request {visualization_request.id} (report {cached.id})")
+                    return self._copy_report(cached, visualization_request)
+
             with Image.open(original_image_path) as img:
-                # Resize if too large to save tokens/time, though 1.5 Pro handles large images well.
-                # Let's keep original for detail.
-                
-                prompt = get_audit_prompt()
-                result_json = self._call_gemini_json(img, prompt)
-                
-                # Create AuditReport
-                audit_report = AuditReport.objects.create(
-                    request=visualization_request,
-                    has_ground_level_access=result_json.get('has_ground_level_access', False),
-                    has_concealment=result_json.get('has_concealment', False),
-                    has_glass_proximity=result_json.get('has_glass_proximity', False),
-                    has_hardware_weakness=result_json.get('has_hardware_weakness', False),
-                    vulnerabilities=result_json.get('vulnerabilities', []),
-                    analysis_summary=result_json.get('analysis_summary', "Analysis completed.")
-                )
-                
-                return audit_report
+                # The audit reads the scene, not fine detail; a smaller input costs fewer tokens
+                audit_image, _ = optimize_image_for_api(img.convert('RGB'), max_dimension)
+                findings = self._call_gemini_json(audit_image, prompt)
+
+            audit_report, _ = AuditReport.objects.update_or_create(
+                request=visualization_request,
+                defaults={
+                    'has_ground_level_access': findings.has_ground_level_access,
+                    'has_concealment': findings.has_concealment,
+                    'has_glass_proximity': findings.has_glass_proximity,
+                    'has_hardware_weakness': findings.has_hardware_weakness,
+                    'vulnerabilities': [asdict(v) for v in findings.vulnerabilities],
+                    'analysis_summary': findings.analysis_summary,
+                    'input_digest': digest,
+                }
+            )
+            return audit_report
 
         except Exception as e:
             logger.error(f"Audit failed: {e}")
             raise AuditServiceError(f"Audit failed: {e}") from e
 
-    def _call_gemini_json(self, image: Image.Image, prompt: str) -> dict:
+    @staticmethod
+    def _config() -> dict:
+        return getattr(settings, 'AUDIT', {}) or {}
+
+    def _input_digest(self, image_path: str, prompt: str, max_dimension: int) -> str:
+        """SHA-256 of the image file and everything else that shapes the audit."""
+        hasher = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                hasher.update(chunk)
+        hasher.update(f"\0{self.model_name}\0{max_dimension}\0{prompt}".encode('utf-8'))
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _copy_report(report: AuditReport, visualization_request) -> AuditReport:
+        """Copy an audit's findings to another request."""
+        return AuditReport.objects.create(
+            request=visualization_request,
+            has_ground_level_access=report.has_ground_level_access,
+            has_concealment=report.has_concealment,
+            has_glass_proximity=report.has_glass_proximity,
+            has_hardware_weakness=report.has_hardware_weakness,
+            vulnerabilities=report.vulnerabilities,
+            analysis_summary=report.analysis_summary,
+            input_digest=report.input_digest
+        )
+
+    def _call_gemini_json(self, image: Image.Image, prompt: str) -> AuditFindings:
         """
-        Helper method to handle API call for JSON text response.
+        Ask the model for the audit as schema-constrained JSON.
+
+        Raises:
+            AuditServiceError: The call failed or the response did not match AuditFindings
         """
         try:
-            config_args = {
-                "response_modalities": ["TEXT"],
-            }
+            config = types.GenerateContentConfig(response_modalities=["TEXT"])
             
             # Combine image and prompt
             contents = [image, prompt]
@@ -80,43 +135,29 @@ class AuditService:
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    response = self.client.models.generate_content(
-                        model=self.model_name,
-                        contents=contents,
-                        config=types.GenerateContentConfig(**config_args)
-                    )
+                    response = generate_structured(self.client, self.model_name, contents, AuditFindings, config)
                     break
+                except StructuredOutputError as e:
+                    # The partial response is billed too
+                    self._record_usage(e)
+                    raise
                 except Exception as e:
                     if "429" in str(e) and attempt < max_retries - 1:
-                        import time
                         time.sleep(2 * (attempt + 1))
                     else:
                         raise e
-            
-            # Extract text
-            text_response = ""
-            if response.candidates and response.candidates[0].content.parts:
-                for part in response.candidates[0].content.parts:
-                    if part.text:
-                        text_response += part.text
-            
-            # Parse JSON
-            try:
-                # Find JSON block if embedded in markdown
-                json_match = re.search(r'\{.*\}', text_response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    return json.loads(json_str)
-                else:
-                    return json.loads(text_response)
-            except json.JSONDecodeError:
-                logger.warning(f"Failed to parse JSON from AI response: {text_response}")
-                # Fallback structure
-                return {
-                    'has_ground_level_access': False,
-                    'analysis_summary': f"Could not parse AI response. Raw: {text_response[:100]}..."
-                }
+
+            self._record_usage(response)
+            return response.value
 
         except Exception as e:
             logger.error(f"Gemini JSON call failed: {e}")
             raise AuditServiceError(f"Gemini JSON call failed: {e}")
+
+    def _record_usage(self, response):
+        """Record the audit call's token usage and cost in the cost ledger."""
+        if not getattr(response, 'usage_metadata', None):
+            return
+        from api.services.cost_ledger import record_model_usage
+
+        record_model_usage(response.usage_metadata, self.model_name, step_name='audit')
@@ -17,13 +17,17 @@ class AuditViewSet(viewsets.ViewSet):
     def generate(self, request, pk=None):
         """
         Trigger generation of an audit for a specific VisualizationRequest.
+
+        Pass refresh=true to re-run the audit instead of returning the
+        existing or a cached report.
         """
         # pk here is the VisualizationRequest ID
         visualization_request = get_object_or_404(VisualizationRequest, pk=pk, user=request.user)
+        refresh = str(request.data.get('refresh', request.query_params.get('refresh', ''))).lower() in ('1', 'true')
         
         try:
             service = AuditService()
-            audit_report = service.perform_audit(visualization_request)
+            audit_report = service.perform_audit(visualization_request, refresh=refresh)
             serializer = AuditReportSerializer(audit_report)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except AuditServiceError as e:
@@ -13,6 +13,8 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework.exceptions import ValidationError
 from django_ratelimit.exceptions import Ratelimited
 from .models import UserProfile
+from .tenants import get_tenant_config
+from .tenants.middleware import get_tenant_claim
 from .serializers import UserSerializer, UserProfileSerializer
 
 logger = logging.getLogger(__name__)
@@ -43,6 +45,8 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['username'] = user.username
         token['email'] = user.email
         token['is_staff'] = user.is_staff
+        # Tenant of the login request, so later requests resolve to it
+        token[get_tenant_claim()] = get_tenant_config().tenant_id
 
         return token
 
@@ -108,6 +112,7 @@ class DevLoginView(APIView):
 
             # Generate tokens
             refresh = RefreshToken.for_user(user)
+            refresh[get_tenant_claim()] = get_tenant_config().tenant_id
             access_token = refresh.access_token
 
             # Add custom claims
@@ -197,6 +202,7 @@ def register_user(request):
 
         # Generate tokens
         refresh = RefreshToken.for_user(user)
+        refresh[get_tenant_claim()] = get_tenant_config().tenant_id
         access_token = refresh.access_token
 
         # Add custom claims
@@ -0,0 +1,85 @@
+"""
+Compute image descriptors for reference images and uploaded originals.
+
+Rows that already have a descriptor of the current version are skipped, so
+the command can be stopped and re-run to resume.
+
+Usage:
+    python manage.py compute_embeddings
+    python manage.py compute_embeddings --tenant boss --workers 8
+    python manage.py compute_embeddings --originals --limit 10000
+    python manage.py compute_embeddings --rebuild-index
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import ReferenceImage, VisualizationRequest
+from api.services.descriptor_jobs import DEFAULT_BATCH_SIZE, describe_pending
+from api.services.reference_index import reference_index
+
+
+class Command(BaseCommand):
+    help = 'Compute image descriptors for reference images (and uploaded originals) and index them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tenant',
+            type=str,
+            help='Only describe this tenant\'s images'
+        )
+        parser.add_argument(
+            '--originals',
+            action='store_true',
+            help='Also describe the original images of visualization requests'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Images described and saved together (default {DEFAULT_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Worker processes (default: CPU count)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many images per model'
+        )
+        parser.add_argument(
+            '--rebuild-index',
+            action='store_true',
+            help='Rewrite the reference indexes from stored descriptors afterwards'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        models = [ReferenceImage] + ([VisualizationRequest] if options['originals'] else [])
+        for model in models:
+            name = model._meta.verbose_name_plural
+
+            def progress(described, failed):
+                self.stdout.write(f'  {name}: {described} described, {failed} failed')
+
+            totals = describe_pending(
+                model,
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                tenant_id=options['tenant'],
+                limit=options['limit'],
+                progress=progress,
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"{name}: {totals['described']} described, {totals['failed']} failed")
+            )
+
+        if options['rebuild_index']:
+            tenants = [options['tenant']] if options['tenant'] else (
+                ReferenceImage.objects.order_by('tenant_id').values_list('tenant_id', flat=True).distinct()
+            )
+            for tenant_id in tenants:
+                count = reference_index.build(tenant_id)
+                self.stdout.write(self.style.SUCCESS(f'Rebuilt {tenant_id} reference index ({count} references)'))
@@ -12,6 +12,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 
 from api.models import TenantConfig
+from api.tenants.snapshot import invalidate_snapshots
 
 
 class Command(BaseCommand):
@@ -101,6 +102,9 @@ class Command(BaseCommand):
             tenant_config.branding = config_data.get('branding', {})
             tenant_config.config_version += 1
             tenant_config.save()
+
+        # Other processes pick the new version up on their next version check
+        invalidate_snapshots()
         
         action = 'Created' if created else 'Updated'
         self.stdout.write(
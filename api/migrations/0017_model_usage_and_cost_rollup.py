@@ -0,0 +1,115 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0016_sync_choices_with_tenant_config"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CostRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tenant_id", models.CharField(db_index=True, max_length=50)),
+                ("hour", models.DateTimeField(help_text="Start of the hour (UTC)")),
+                ("model_name", models.CharField(max_length=100)),
+                ("call_count", models.PositiveIntegerField(default=0)),
+                ("prompt_tokens", models.PositiveBigIntegerField(default=0)),
+                ("thinking_tokens", models.PositiveBigIntegerField(default=0)),
+                ("output_tokens", models.PositiveBigIntegerField(default=0)),
+                ("image_output_tokens", models.PositiveBigIntegerField(default=0)),
+                (
+                    "cost_usd",
+                    models.DecimalField(decimal_places=6, default=0, max_digits=14),
+                ),
+            ],
+            options={
+                "verbose_name": "Cost Rollup",
+                "verbose_name_plural": "Cost Rollups",
+                "ordering": ["-hour"],
+                "unique_together": {("tenant_id", "hour", "model_name")},
+            },
+        ),
+        migrations.CreateModel(
+            name="ModelUsageRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "tenant_id",
+                    models.CharField(
+                        db_index=True,
+                        help_text="Tenant this call is billed to",
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "step_name",
+                    models.CharField(
+                        help_text="Pipeline step or service (e.g., 'cleanup', 'quality_check', 'audit')",
+                        max_length=50,
+                    ),
+                ),
+                ("provider", models.CharField(default="gemini", max_length=50)),
+                ("model_name", models.CharField(max_length=100)),
+                ("prompt_tokens", models.PositiveIntegerField(default=0)),
+                ("thinking_tokens", models.PositiveIntegerField(default=0)),
+                (
+                    "output_tokens",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Text output tokens, excluding image output tokens",
+                    ),
+                ),
+                ("image_output_tokens", models.PositiveIntegerField(default=0)),
+                ("total_tokens", models.PositiveIntegerField(default=0)),
+                (
+                    "cost_usd",
+                    models.DecimalField(decimal_places=6, default=0, max_digits=12),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "request",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Visualization request this call was made for",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="usage_records",
+                        to="api.visualizationrequest",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Model Usage Record",
+                "verbose_name_plural": "Model Usage Records",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["tenant_id", "-created_at"],
+                        name="api_modelus_tenant__3a995d_idx",
+                    )
+                ],
+            },
+        ),
+    ]
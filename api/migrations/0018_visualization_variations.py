@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0017_model_usage_and_cost_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="variations",
+            field=models.JSONField(
+                blank=True,
+                default=list,
+                help_text="Extra option sets rendered from one cleanup, e.g. [{'frame_color': 'white'}]",
+            ),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0018_visualization_variations"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VisualizationBatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        blank=True,
+                        help_text="Optional label, e.g. the portfolio name",
+                        max_length=200,
+                    ),
+                ),
+                (
+                    "total_count",
+                    models.PositiveIntegerField(
+                        default=0, help_text="Number of requests in the batch"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        help_text="User who submitted the batch",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="visualization_batches",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Visualization Batch",
+                "verbose_name_plural": "Visualization Batches",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="batch",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Batch this request was submitted in, if any",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="requests",
+                to="api.visualizationbatch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="visualizationbatch",
+            index=models.Index(
+                fields=["user", "-created_at"], name="api_visuali_user_id_2308bc_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:52
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0019_visualization_batch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="tenant_id",
+            field=models.CharField(
+                db_index=True,
+                default=api.models.get_current_tenant_id,
+                help_text="Tenant the request was made under",
+                max_length=50,
+            ),
+        ),
+    ]
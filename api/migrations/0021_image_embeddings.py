@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0020_visualization_request_tenant"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="referenceimage",
+            name="embedding_version",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="DESCRIPTOR_VERSION the embedding was computed with",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="embedding",
+            field=models.JSONField(
+                blank=True,
+                help_text="Descriptor of the original image (api/visualizer/descriptors.py)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="embedding_version",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="DESCRIPTOR_VERSION the embedding was computed with",
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="referenceimage",
+            name="embedding",
+            field=models.JSONField(
+                blank=True,
+                help_text="Image descriptor for similarity matching (api/visualizer/descriptors.py)",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0021_image_embeddings"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="duplicate_of",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Earlier upload of the same photo whose clean image and audit are reused",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="duplicates",
+                to="api.visualizationrequest",
+            ),
+        ),
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="phash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="Perceptual hash of the original image (api/visualizer/descriptors.py)",
+                max_length=16,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0022_visualization_request_duplicates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="auditreport",
+            name="input_digest",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="SHA-256 of the audited image, model and prompt; identical inputs reuse this report",
+                max_length=64,
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0023_auditreport_input_digest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="visualizationrequest",
+            name="dimensional_analysis",
+            field=models.JSONField(
+                blank=True,
+                help_text="Patio measurements stated by the model: opening_width_ft, mullion_count, mullion_positions_ft",
+                null=True,
+            ),
+        ),
+    ]
@@ -17,6 +17,11 @@ def get_frame_color_choices():
     return get_tenant_config().get_frame_color_choices()
 
 
+def get_current_tenant_id():
+    """Tenant of the current request, the default for new requests."""
+    return get_tenant_config().tenant_id
+
+
 def validate_image_size(image):
     """Validate that uploaded image is not too large."""
     max_size = 10 * 1024 * 1024  # 10MB
@@ -119,6 +124,62 @@ class UserProfile(models.Model):
 
 
 
+class VisualizationBatch(models.Model):
+    """A group of visualization requests submitted together (e.g. a property portfolio)."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='visualization_batches',
+        help_text="User who submitted the batch"
+    )
+    name = models.CharField(
+        max_length=200,
+        blank=True,
+        help_text="Optional label, e.g. the portfolio name"
+    )
+    total_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of requests in the batch"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Visualization Batch"
+        verbose_name_plural = "Visualization Batches"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Batch {self.id} by {self.user.username} ({self.total_count} requests)"
+
+    def get_progress(self):
+        """Aggregate status counts and overall progress of the batch's requests, in one query."""
+        counts = self.requests.aggregate(
+            pending=models.Count('id', filter=models.Q(status='pending')),
+            processing=models.Count('id', filter=models.Q(status='processing')),
+            complete=models.Count('id', filter=models.Q(status='complete')),
+            failed=models.Count('id', filter=models.Q(status='failed')),
+            # Failed requests are finished, so they count as done
+            progress=models.Sum(
+                models.Case(
+                    models.When(status='failed', then=models.Value(100)),
+                    default=models.F('progress_percentage'),
+                    output_field=models.PositiveIntegerField(),
+                )
+            ),
+        )
+        progress = counts.pop('progress') or 0
+        return {
+            'total': self.total_count,
+            **counts,
+            'progress_percentage': round(progress / self.total_count) if self.total_count else 100,
+            'is_finished': counts['complete'] + counts['failed'] >= self.total_count,
+        }
+
+
 class VisualizationRequestManager(models.Manager):
     """Custom manager for VisualizationRequest model."""
 
@@ -164,6 +225,20 @@ class VisualizationRequest(models.Model):
         related_name='visualization_requests',
         help_text="User who made the request"
     )
+    batch = models.ForeignKey(
+        VisualizationBatch,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='requests',
+        help_text="Batch this request was submitted in, if any"
+    )
+    tenant_id = models.CharField(
+        max_length=50,
+        default=get_current_tenant_id,
+        db_index=True,
+        help_text="Tenant the request was made under"
+    )
     original_image = models.ImageField(
         upload_to=upload_to_originals,
         validators=[
@@ -179,6 +254,30 @@ class VisualizationRequest(models.Model):
         blank=True,
         help_text="Intermediate cleaned image (Step 1)"
     )
+    phash = models.CharField(
+        max_length=16,
+        blank=True,
+        db_index=True,
+        help_text="Perceptual hash of the original image (api/visualizer/descriptors.py)"
+    )
+    duplicate_of = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='duplicates',
+        help_text="Earlier upload of the same photo whose clean image and audit are reused"
+    )
+    embedding = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Descriptor of the original image (api/visualizer/descriptors.py)"
+    )
+    embedding_version = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text="DESCRIPTOR_VERSION the embedding was computed with"
+    )
     SCREEN_TYPE_CHOICES = [
         ('window_fixed', 'Fixed Security Window (Surface Mount)'),
         ('door_single', 'Hinged Security Door (Single)'),
@@ -246,6 +345,11 @@ class VisualizationRequest(models.Model):
         blank=True,
         help_text="Sales scope (hasPatio, hasWindows, hasDoors, doorType)"
     )
+    variations = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Extra option sets rendered from one cleanup, e.g. [{'frame_color': 'white'}]"
+    )
 
     # Opening counts for pricing
     window_count = models.PositiveIntegerField(
@@ -271,6 +375,11 @@ class VisualizationRequest(models.Model):
         default=False,
         help_text="Include patio enclosure"
     )
+    dimensional_analysis = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Patio measurements stated by the model: opening_width_ft, mullion_count, mullion_positions_ft"
+    )
 
     # Legacy fields - kept for compatibility but deprecated
     screen_type = models.CharField(
@@ -728,7 +837,12 @@ class ReferenceImage(models.Model):
     embedding = models.JSONField(
         null=True,
         blank=True,
-        help_text="AI embedding vector for similarity matching (future use)"
+        help_text="Image descriptor for similarity matching (api/visualizer/descriptors.py)"
+    )
+    embedding_version = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text="DESCRIPTOR_VERSION the embedding was computed with"
     )
     uploaded_by = models.ForeignKey(
         User,
@@ -753,3 +867,79 @@ class ReferenceImage(models.Model):
         super().save(*args, **kwargs)
         # Thumbnail generation can be added here or in a signal
 
+
+
+class ModelUsageRecord(models.Model):
+    """
+    Token usage and cost of a single AI model call.
+
+    Written by api.services.cost_ledger for every Gemini response, linked to
+    the visualization request (when there is one) and the tenant.
+    """
+    request = models.ForeignKey(
+        VisualizationRequest,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='usage_records',
+        help_text="Visualization request this call was made for"
+    )
+    tenant_id = models.CharField(
+        max_length=50,
+        db_index=True,
+        help_text="Tenant this call is billed to"
+    )
+    step_name = models.CharField(
+        max_length=50,
+        help_text="Pipeline step or service (e.g., 'cleanup', 'quality_check', 'audit')"
+    )
+    provider = models.CharField(max_length=50, default='gemini')
+    model_name = models.CharField(max_length=100)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    thinking_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(
+        default=0,
+        help_text="Text output tokens, excluding image output tokens"
+    )
+    image_output_tokens = models.PositiveIntegerField(default=0)
+    total_tokens = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Model Usage Record"
+        verbose_name_plural = "Model Usage Records"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['tenant_id', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.tenant_id}/{self.step_name} {self.model_name} ${self.cost_usd}"
+
+
+class CostRollup(models.Model):
+    """
+    Hourly usage and cost totals per tenant and model.
+
+    Incremented in place as each ModelUsageRecord is written, so reporting
+    never has to aggregate raw usage records.
+    """
+    tenant_id = models.CharField(max_length=50, db_index=True)
+    hour = models.DateTimeField(help_text="Start of the hour (UTC)")
+    model_name = models.CharField(max_length=100)
+    call_count = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    thinking_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    image_output_tokens = models.PositiveBigIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+
+    class Meta:
+        verbose_name = "Cost Rollup"
+        verbose_name_plural = "Cost Rollups"
+        unique_together = ['tenant_id', 'hour', 'model_name']
+        ordering = ['-hour']
+
+    def __str__(self):
+        return f"{self.tenant_id} {self.hour:%Y-%m-%d %H:00} {self.model_name} ${self.cost_usd}"
@@ -1,24 +1,271 @@
 """
 Production Monitoring System
 Comprehensive monitoring and alerting for the homescreen AI services
+
+Metrics are kept in fixed-memory structures: a ring of per-minute buckets
+covering the last 24 hours, log-bucketed latency histograms, and labelled
+counters. Recording and health checks never scan request history.
+
+With settings.PRODUCTION_MONITOR['SHARED_DIR'] set, each process periodically
+writes a snapshot of its state to that directory, and reads (health checks,
+the /metrics endpoint) merge the snapshots of every worker. The other
+workers' snapshots are read at most once per FLUSH_INTERVAL_SECONDS, and a
+read only sums the window it reports on, so health checks do bounded work
+however often they are polled.
 """
 
+import bisect
+import json
 import logging
+import os
+import threading
 import time
-import json
-from typing import Dict, Any, List, Optional
+from collections import deque
 from datetime import datetime, timedelta
-from pathlib import Path
-import os
+from typing import Dict, Any, List, Optional
+
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
+# One ring slot per minute for the last 24 hours
+RING_MINUTES = 24 * 60
+
+# Latency histogram bucket upper bounds in seconds: 50ms .. ~1.3h, ~19% apart
+LATENCY_BUCKETS = [round(0.05 * 2 ** (i / 4), 4) for i in range(66)]
+
+QUALITY_BANDS = (
+    ('excellent', 0.85),
+    ('good', 0.75),
+    ('fair', 0.65),
+    ('poor', 0.0),
+)
+
+DEFAULT_MONITOR_SETTINGS = {
+    'SHARED_DIR': None,
+    'FLUSH_INTERVAL_SECONDS': 5.0,
+    'SNAPSHOT_RETENTION_SECONDS': RING_MINUTES * 60,
+    # /metrics access (api/views_metrics.py); with neither set, it is refused
+    'AUTH_TOKEN': '',
+    'ALLOWED_IPS': [],
+}
+
+
+def get_monitor_settings() -> Dict[str, Any]:
+    """Merge settings.PRODUCTION_MONITOR over the defaults."""
+    merged = dict(DEFAULT_MONITOR_SETTINGS)
+    merged.update(getattr(settings, 'PRODUCTION_MONITOR', {}) or {})
+    return merged
+
+
+def _quality_band(score: float) -> str:
+    for band, floor in QUALITY_BANDS:
+        if score >= floor:
+            return band
+    return 'poor'
+
+
+class LatencyHistogram:
+    """Fixed-size histogram with log-spaced buckets (HDR-style relative precision)."""
+
+    def __init__(self, counts: Optional[List[int]] = None, total: float = 0.0):
+        self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = total
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+        self.sum += other.sum
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (0 < q <= 1)."""
+        return percentile_from_counts(self.counts, q)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'counts': self.counts, 'sum': self.sum}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        return cls(data.get('counts'), data.get('sum', 0.0))
+
+
+def percentile_from_counts(counts, q: float) -> float:
+    total = sum(counts.values()) if isinstance(counts, dict) else sum(counts)
+    if total == 0:
+        return 0.0
+    items = sorted(counts.items()) if isinstance(counts, dict) else enumerate(counts)
+    rank = q * total
+    seen = 0
+    for index, value in items:
+        seen += value
+        if seen >= rank:
+            return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else float('inf')
+    return float('inf')
+
+
+class MinuteBucket:
+    """Aggregates for all requests recorded in one wall-clock minute."""
+
+    __slots__ = (
+        'minute', 'requests', 'successes', 'cache_hits', 'processing_time',
+        'quality_sum', 'quality_count', 'cost', 'quality_bands', 'latency',
+    )
+
+    def __init__(self, minute: int):
+        self.minute = minute
+        self.requests = 0
+        self.successes = 0
+        self.cache_hits = 0
+        self.processing_time = 0.0
+        self.quality_sum = 0.0
+        self.quality_count = 0
+        self.cost = 0.0
+        self.quality_bands: Dict[str, int] = {}
+        self.latency: Dict[int, int] = {}  # Sparse histogram: bucket index -> count
+
+    def add(self, metrics: Dict[str, Any]) -> None:
+        self.requests += 1
+        self.successes += 1 if metrics['success'] else 0
+        self.cache_hits += 1 if metrics['cache_hit'] else 0
+        self.processing_time += metrics['processing_time']
+        self.cost += metrics['cost']
+        if metrics['quality_score'] > 0:
+            self.quality_sum += metrics['quality_score']
+            self.quality_count += 1
+            band = _quality_band(metrics['quality_score'])
+            self.quality_bands[band] = self.quality_bands.get(band, 0) + 1
+        index = bisect.bisect_left(LATENCY_BUCKETS, metrics['processing_time'])
+        self.latency[index] = self.latency.get(index, 0) + 1
+
+    def merge(self, other: 'MinuteBucket') -> None:
+        self.requests += other.requests
+        self.successes += other.successes
+        self.cache_hits += other.cache_hits
+        self.processing_time += other.processing_time
+        self.quality_sum += other.quality_sum
+        self.quality_count += other.quality_count
+        self.cost += other.cost
+        for band, value in other.quality_bands.items():
+            self.quality_bands[band] = self.quality_bands.get(band, 0) + value
+        for index, value in other.latency.items():
+            self.latency[index] = self.latency.get(index, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['latency'] = {str(k): v for k, v in self.latency.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MinuteBucket':
+        bucket = cls(data['minute'])
+        for name in cls.__slots__:
+            if name not in ('minute', 'latency') and name in data:
+                setattr(bucket, name, data[name])
+        bucket.latency = {int(k): v for k, v in data.get('latency', {}).items()}
+        return bucket
+
+
+class MetricsState:
+    """All metrics of one process (or the merge of several)."""
+
+    def __init__(self):
+        self.ring: List[Optional[MinuteBucket]] = [None] * RING_MINUTES
+        self.counters: Dict[str, float] = {}
+        self.latency = LatencyHistogram()
+        self.step_latency: Dict[str, LatencyHistogram] = {}
+        self.last_request_at: Optional[float] = None
+
+    def bucket_for(self, minute: int) -> MinuteBucket:
+        slot = minute % RING_MINUTES
+        bucket = self.ring[slot]
+        if bucket is None or bucket.minute != minute:
+            bucket = MinuteBucket(minute)
+            self.ring[slot] = bucket
+        return bucket
+
+    def window(self, minutes: int, now: Optional[float] = None) -> MinuteBucket:
+        """Sum the buckets for the last `minutes` minutes (bounded work)."""
+        current = int((now or time.time()) // 60)
+        total = MinuteBucket(current)
+        for minute in range(current - min(minutes, RING_MINUTES) + 1, current + 1):
+            bucket = self.ring[minute % RING_MINUTES]
+            if bucket is not None and bucket.minute == minute:
+                total.merge(bucket)
+        return total
+
+    def increment(self, key: str, value: float = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def merge(self, other: 'MetricsState') -> None:
+        for bucket in other.ring:
+            if bucket is not None:
+                self.bucket_for(bucket.minute).merge(bucket)
+        self.merge_totals(other)
+
+    def merge_totals(self, other: 'MetricsState') -> None:
+        """Merge the counters and histograms, but not the per-minute ring."""
+        for key, value in other.counters.items():
+            self.increment(key, value)
+        self.latency.merge(other.latency)
+        for step, histogram in other.step_latency.items():
+            self.step_latency.setdefault(step, LatencyHistogram()).merge(histogram)
+        if other.last_request_at and (not self.last_request_at or other.last_request_at > self.last_request_at):
+            self.last_request_at = other.last_request_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'ring': [b.to_dict() for b in self.ring if b is not None],
+            'counters': self.counters,
+            'latency': self.latency.to_dict(),
+            'step_latency': {step: h.to_dict() for step, h in self.step_latency.items()},
+            'last_request_at': self.last_request_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MetricsState':
+        state = cls()
+        for bucket_data in data.get('ring', []):
+            bucket = MinuteBucket.from_dict(bucket_data)
+            state.ring[bucket.minute % RING_MINUTES] = bucket
+        state.counters = dict(data.get('counters', {}))
+        state.latency = LatencyHistogram.from_dict(data.get('latency', {}))
+        state.step_latency = {
+            step: LatencyHistogram.from_dict(h) for step, h in data.get('step_latency', {}).items()
+        }
+        state.last_request_at = data.get('last_request_at')
+        return state
+
+
+def _counter_key(name: str, **labels) -> str:
+    if not labels:
+        return name
+    rendered = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f'{name}{{{rendered}}}'
+
+
 class ProductionMonitor:
     """Production monitoring and alerting system."""
-    
-    def __init__(self):
-        self.metrics_history = []
-        self.alerts = []
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None):
+        self._options = options
+        self._state = MetricsState()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_flush = 0.0
+        self._flush_timer: Optional[threading.Timer] = None
+        # Merged snapshots of the other workers, reread at most once per flush interval
+        self._peers = MetricsState()
+        self._peers_read_at: Optional[float] = None
+        self._peers_lock = threading.Lock()
+        self.alerts = deque(maxlen=100)
         self.monitoring_enabled = True
         self.alert_thresholds = {
             'error_rate': 0.05,  # 5% error rate threshold
@@ -27,96 +274,121 @@ class ProductionMonitor:
             'cache_hit_rate': 0.30,  # Minimum cache hit rate threshold
             'cost_per_hour': 10.0  # Maximum cost per hour threshold
         }
-        
+
+    @property
+    def options(self) -> Dict[str, Any]:
+        if self._options is None:
+            return get_monitor_settings()
+        return self._options
+
+    # =========================================================================
+    # Recording
+    # =========================================================================
+
     def record_request_metrics(self, metrics: Dict[str, Any]):
         """Record metrics for a single request."""
+        if not self.monitoring_enabled:
+            return
         try:
-            timestamp = datetime.now()
-            
+            now = time.time()
+
             request_metrics = {
-                'timestamp': timestamp.isoformat(),
+                'timestamp': datetime.fromtimestamp(now).isoformat(),
                 'success': metrics.get('success', False),
                 'processing_time': metrics.get('processing_time', 0.0),
-                'quality_score': metrics.get('quality_score', 0.0),
-                'cost': metrics.get('cost', 0.0),
+                'quality_score': metrics.get('quality_score', 0.0) or 0.0,
+                'cost': metrics.get('cost', 0.0) or 0.0,
                 'cache_hit': metrics.get('cache_hit', False),
                 'model_used': metrics.get('model_used', 'unknown'),
                 'error_type': metrics.get('error_type', None)
             }
-            
-            self.metrics_history.append(request_metrics)
-            
-            # Keep only last 1000 entries to prevent memory issues
-            if len(self.metrics_history) > 1000:
-                self.metrics_history = self.metrics_history[-1000:]
-            
+
+            outcome = 'success' if request_metrics['success'] else 'failure'
+            with self._lock:
+                self._state.bucket_for(int(now // 60)).add(request_metrics)
+                self._state.latency.record(request_metrics['processing_time'])
+                self._state.increment(_counter_key(
+                    'requests_total', model=request_metrics['model_used'], outcome=outcome
+                ))
+                if request_metrics['cache_hit']:
+                    self._state.increment('cache_hits_total')
+                self._state.increment('cost_usd_total', request_metrics['cost'])
+                if request_metrics['error_type']:
+                    self._state.increment(_counter_key('errors_total', error_type=request_metrics['error_type']))
+                self._state.last_request_at = now
+                self._dirty = True
+
             # Check for alerts
             self._check_alerts(request_metrics)
-            
+            self._maybe_flush()
+
         except Exception as e:
             logger.error(f"Failed to record request metrics: {str(e)}")
-    
+
+    def record_step_latency(self, step_name: str, seconds: float):
+        """Record the duration of one pipeline step."""
+        if not self.monitoring_enabled:
+            return
+        with self._lock:
+            self._state.step_latency.setdefault(step_name, LatencyHistogram()).record(seconds)
+            self._dirty = True
+        self._maybe_flush()
+
+    # =========================================================================
+    # Reading
+    # =========================================================================
+
     def get_system_health(self) -> Dict[str, Any]:
         """Get current system health status."""
         try:
-            if not self.metrics_history:
+            # Analyze recent metrics (last hour)
+            recent, last_request_at = self._window(60)
+            if last_request_at is None:
                 return {
                     'status': 'unknown',
                     'message': 'No metrics available',
                     'last_updated': datetime.now().isoformat()
                 }
-            
-            # Analyze recent metrics (last hour)
-            recent_cutoff = datetime.now() - timedelta(hours=1)
-            recent_metrics = [
-                m for m in self.metrics_history 
-                if datetime.fromisoformat(m['timestamp']) > recent_cutoff
-            ]
-            
-            if not recent_metrics:
+
+            if not recent.requests:
                 return {
                     'status': 'stale',
                     'message': 'No recent activity',
-                    'last_updated': self.metrics_history[-1]['timestamp']
+                    'last_updated': datetime.fromtimestamp(last_request_at).isoformat()
                 }
-            
+
             # Calculate health metrics
-            total_requests = len(recent_metrics)
-            successful_requests = sum(1 for m in recent_metrics if m['success'])
-            error_rate = (total_requests - successful_requests) / total_requests if total_requests > 0 else 0
-            
-            avg_response_time = sum(m['processing_time'] for m in recent_metrics) / total_requests if total_requests > 0 else 0
-            avg_quality = sum(m['quality_score'] for m in recent_metrics if m['quality_score'] > 0) / max(1, sum(1 for m in recent_metrics if m['quality_score'] > 0))
-            
-            cache_hits = sum(1 for m in recent_metrics if m['cache_hit'])
-            cache_hit_rate = cache_hits / total_requests if total_requests > 0 else 0
-            
-            total_cost = sum(m['cost'] for m in recent_metrics)
-            
+            total_requests = recent.requests
+            error_rate = (total_requests - recent.successes) / total_requests
+            avg_response_time = recent.processing_time / total_requests
+            avg_quality = recent.quality_sum / max(1, recent.quality_count)
+            cache_hit_rate = recent.cache_hits / total_requests
+            total_cost = recent.cost
+
             # Determine overall status
             status = 'healthy'
             issues = []
-            
+
             if error_rate > self.alert_thresholds['error_rate']:
                 status = 'degraded'
                 issues.append(f"High error rate: {error_rate:.1%}")
-            
+
             if avg_response_time > self.alert_thresholds['response_time']:
                 status = 'degraded'
                 issues.append(f"Slow response time: {avg_response_time:.1f}s")
-            
+
             if avg_quality < self.alert_thresholds['quality_score']:
                 status = 'degraded'
                 issues.append(f"Low quality score: {avg_quality:.3f}")
-            
+
             if cache_hit_rate < self.alert_thresholds['cache_hit_rate']:
                 status = 'warning'
                 issues.append(f"Low cache hit rate: {cache_hit_rate:.1%}")
-            
+
             if total_cost > self.alert_thresholds['cost_per_hour']:
                 status = 'warning'
                 issues.append(f"High cost: ${total_cost:.2f}/hour")
-            
+
             return {
                 'status': status,
                 'message': '; '.join(issues) if issues else 'All systems operational',
@@ -124,13 +396,14 @@ class ProductionMonitor:
                     'total_requests': total_requests,
                     'error_rate': error_rate,
                     'avg_response_time': avg_response_time,
+                    'p95_response_time': percentile_from_counts(recent.latency, 0.95),
                     'avg_quality_score': avg_quality,
                     'cache_hit_rate': cache_hit_rate,
                     'total_cost_per_hour': total_cost
                 },
                 'last_updated': datetime.now().isoformat()
             }
-            
+
         except Exception as e:
             logger.error(f"Failed to get system health: {str(e)}")
             return {
@@ -138,12 +411,12 @@ class ProductionMonitor:
                 'message': f'Health check failed: {str(e)}',
                 'last_updated': datetime.now().isoformat()
             }
-    
+
     def _check_alerts(self, metrics: Dict[str, Any]):
         """Check if metrics trigger any alerts."""
         try:
             alerts_triggered = []
-            
+
             # Error rate alert
             if not metrics['success']:
                 alerts_triggered.append({
@@ -152,7 +425,7 @@ class ProductionMonitor:
                     'severity': 'high',
                     'timestamp': metrics['timestamp']
                 })
-            
+
             # Response time alert
             if metrics['processing_time'] > self.alert_thresholds['response_time']:
                 alerts_triggered.append({
@@ -161,7 +434,7 @@ class ProductionMonitor:
                     'severity': 'medium',
                     'timestamp': metrics['timestamp']
                 })
-            
+
             # Quality alert
             if metrics['quality_score'] > 0 and metrics['quality_score'] < self.alert_thresholds['quality_score']:
                 alerts_triggered.append({
@@ -170,7 +443,7 @@ class ProductionMonitor:
                     'severity': 'medium',
                     'timestamp': metrics['timestamp']
                 })
-            
+
             # Cost alert
             if metrics['cost'] > 1.0:  # Alert for unusually high single request cost
                 alerts_triggered.append({
@@ -179,113 +452,266 @@ class ProductionMonitor:
                     'severity': 'low',
                     'timestamp': metrics['timestamp']
                 })
-            
-            # Add alerts to history
+
+            # Add alerts to history (the deque keeps only the last 100)
             self.alerts.extend(alerts_triggered)
-            
-            # Keep only last 100 alerts
-            if len(self.alerts) > 100:
-                self.alerts = self.alerts[-100:]
-            
+
             # Log critical alerts
             for alert in alerts_triggered:
                 if alert['severity'] == 'high':
                     logger.error(f"ALERT: {alert['message']}")
                 elif alert['severity'] == 'medium':
                     logger.warning(f"ALERT: {alert['message']}")
-                
+
         except Exception as e:
             logger.error(f"Alert checking failed: {str(e)}")
-    
+
     def get_quality_metrics_dashboard(self) -> Dict[str, Any]:
         """Get quality metrics for dashboard display."""
         try:
-            if not self.metrics_history:
-                return {'error': 'No metrics available'}
-            
             # Last 24 hours of data
-            cutoff = datetime.now() - timedelta(hours=24)
-            recent_metrics = [
-                m for m in self.metrics_history 
-                if datetime.fromisoformat(m['timestamp']) > cutoff
-            ]
-            
-            if not recent_metrics:
+            recent, last_request_at = self._window(RING_MINUTES)
+            if last_request_at is None:
+                return {'error': 'No metrics available'}
+
+            if not recent.requests:
                 return {'error': 'No recent metrics available'}
-            
-            # Quality distribution
-            quality_scores = [m['quality_score'] for m in recent_metrics if m['quality_score'] > 0]
-            
-            quality_distribution = {
-                'excellent': sum(1 for q in quality_scores if q >= 0.85),
-                'good': sum(1 for q in quality_scores if 0.75 <= q < 0.85),
-                'fair': sum(1 for q in quality_scores if 0.65 <= q < 0.75),
-                'poor': sum(1 for q in quality_scores if q < 0.65)
-            }
-            
-            # Performance metrics
-            processing_times = [m['processing_time'] for m in recent_metrics]
-            costs = [m['cost'] for m in recent_metrics]
-            
+
+            quality_distribution = {band: recent.quality_bands.get(band, 0) for band, _ in QUALITY_BANDS}
+
             return {
-                'total_requests': len(recent_metrics),
-                'successful_requests': sum(1 for m in recent_metrics if m['success']),
+                'total_requests': recent.requests,
+                'successful_requests': recent.successes,
                 'quality_distribution': quality_distribution,
-                'average_quality': sum(quality_scores) / len(quality_scores) if quality_scores else 0,
-                'average_processing_time': sum(processing_times) / len(processing_times) if processing_times else 0,
-                'total_cost': sum(costs),
-                'cache_hit_rate': sum(1 for m in recent_metrics if m['cache_hit']) / len(recent_metrics) if recent_metrics else 0,
+                'average_quality': recent.quality_sum / recent.quality_count if recent.quality_count else 0,
+                'average_processing_time': recent.processing_time / recent.requests,
+                'p50_processing_time': percentile_from_counts(recent.latency, 0.50),
+                'p95_processing_time': percentile_from_counts(recent.latency, 0.95),
+                'total_cost': recent.cost,
+                'cache_hit_rate': recent.cache_hits / recent.requests,
                 'last_updated': datetime.now().isoformat()
             }
-            
+
         except Exception as e:
             logger.error(f"Dashboard metrics failed: {str(e)}")
             return {'error': f'Dashboard metrics failed: {str(e)}'}
-    
+
     def export_metrics(self, filepath: str = None) -> str:
         """Export metrics to JSON file."""
         try:
             if not filepath:
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 filepath = f"metrics_export_{timestamp}.json"
-            
+
+            alerts = list(self.alerts)
             export_data = {
                 'export_timestamp': datetime.now().isoformat(),
-                'total_metrics': len(self.metrics_history),
-                'total_alerts': len(self.alerts),
-                'metrics_history': self.metrics_history,
-                'alerts': self.alerts,
+                'total_alerts': len(alerts),
+                'metrics': self.collect().to_dict(),
+                'alerts': alerts,
                 'alert_thresholds': self.alert_thresholds
             }
-            
+
             with open(filepath, 'w') as f:
                 json.dump(export_data, f, indent=2)
-            
+
             logger.info(f"Metrics exported to {filepath}")
             return filepath
-            
+
         except Exception as e:
             logger.error(f"Metrics export failed: {str(e)}")
             raise
-    
+
     def get_recent_alerts(self, hours: int = 24) -> List[Dict[str, Any]]:
         """Get recent alerts within specified hours."""
         try:
-            cutoff = datetime.now() - timedelta(hours=hours)
-            
-            recent_alerts = [
-                alert for alert in self.alerts
-                if datetime.fromisoformat(alert['timestamp']) > cutoff
-            ]
-            
+            cutoff = (datetime.now() - timedelta(hours=hours)).isoformat()
+
+            # ISO timestamps sort lexicographically, so no parsing is needed
+            recent_alerts = [alert for alert in self.alerts if alert['timestamp'] > cutoff]
+
             # Sort by timestamp (newest first)
             recent_alerts.sort(key=lambda x: x['timestamp'], reverse=True)
-            
+
             return recent_alerts
-            
+
         except Exception as e:
             logger.error(f"Failed to get recent alerts: {str(e)}")
             return []
 
+    def export_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        state = self._totals()
+        recent, _ = self._window(60)
+        lines = []
+
+        def family(name: str, metric_type: str, help_text: str):
+            lines.append(f"# HELP visualizer_{name} {help_text}")
+            lines.append(f"# TYPE visualizer_{name} {metric_type}")
+
+        def histogram(name: str, hist: LatencyHistogram, labels: str = ''):
+            cumulative = 0
+            for bound, value in zip(LATENCY_BUCKETS, hist.counts):
+                cumulative += value
+                lines.append(f'visualizer_{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            lines.append(f'visualizer_{name}_bucket{{{labels}le="+Inf"}} {hist.count}')
+            suffix = f'{{{labels.rstrip(",")}}}' if labels else ''
+            lines.append(f'visualizer_{name}_sum{suffix} {hist.sum}')
+            lines.append(f'visualizer_{name}_count{suffix} {hist.count}')
+
+        # (name, help, labelled) - unlabelled counters are always emitted, starting at 0
+        counters = (
+            ('requests_total', 'Visualization requests processed.', True),
+            ('errors_total', 'Failed visualization requests by error type.', True),
+            ('cache_hits_total', 'Visualization requests served from cache.', False),
+            ('cost_usd_total', 'Estimated AI spend in USD.', False),
+        )
+        for name, help_text, labelled in counters:
+            family(name, 'counter', help_text)
+            if labelled:
+                samples = sorted(
+                    (key, value) for key, value in state.counters.items() if key.startswith(name + '{')
+                )
+            else:
+                samples = [(name, state.counters.get(name, 0))]
+            for key, value in samples:
+                lines.append(f"visualizer_{key} {value}")
+
+        family('request_duration_seconds', 'histogram', 'End-to-end visualization job duration.')
+        histogram('request_duration_seconds', state.latency)
+
+        family('step_duration_seconds', 'histogram', 'Pipeline step duration.')
+        for step, hist in sorted(state.step_latency.items()):
+            histogram('step_duration_seconds', hist, labels=f'step="{step}",')
+
+        error_rate = (recent.requests - recent.successes) / recent.requests if recent.requests else 0.0
+        gauges = (
+            ('requests_last_hour', 'Requests recorded in the last hour.', recent.requests),
+            ('error_rate_last_hour', 'Failed request ratio over the last hour.', error_rate),
+            ('quality_score_last_hour', 'Average quality score over the last hour.',
+             recent.quality_sum / recent.quality_count if recent.quality_count else 0.0),
+            ('cost_usd_last_hour', 'AI spend in USD over the last hour.', recent.cost),
+        )
+        for name, help_text, value in gauges:
+            family(name, 'gauge', help_text)
+            lines.append(f"visualizer_{name} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+    # =========================================================================
+    # Multi-process aggregation
+    # =========================================================================
+
+    def collect(self) -> MetricsState:
+        """Get a full copy of the metrics of all worker processes (or just this one without SHARED_DIR)."""
+        peers = self._peer_state()
+        merged = MetricsState()
+        with self._lock:
+            merged.merge(self._state)
+        merged.merge(peers)
+        return merged
+
+    def _window(self, minutes: int):
+        """Aggregate of the last `minutes` minutes over all workers, and the latest request time."""
+        peers = self._peer_state()
+        with self._lock:
+            recent = self._state.window(minutes)
+            last_request_at = self._state.last_request_at
+        recent.merge(peers.window(minutes))
+        if peers.last_request_at and (not last_request_at or peers.last_request_at > last_request_at):
+            last_request_at = peers.last_request_at
+        return recent, last_request_at
+
+    def _totals(self) -> MetricsState:
+        """Counters and histograms over all workers, without the per-minute ring."""
+        totals = MetricsState()
+        with self._lock:
+            totals.merge_totals(self._state)
+        totals.merge_totals(self._peer_state())
+        return totals
+
+    def _peer_state(self) -> MetricsState:
+        """
+        Merged snapshots of the other worker processes.
+
+        The shared directory is read at most once per FLUSH_INTERVAL_SECONDS
+        (snapshots change no more often than that); in between the cached
+        merge is returned. The returned state must not be modified.
+        """
+        shared_dir = self.options.get('SHARED_DIR')
+        if not shared_dir:
+            return MetricsState()
+
+        interval = self.options.get('FLUSH_INTERVAL_SECONDS', 5.0)
+        with self._peers_lock:
+            if self._peers_read_at is not None and time.monotonic() - self._peers_read_at < interval:
+                return self._peers
+            self._peers = self._read_peer_snapshots(shared_dir)
+            self._peers_read_at = time.monotonic()
+            return self._peers
+
+    def _read_peer_snapshots(self, shared_dir: str) -> MetricsState:
+        merged = MetricsState()
+        own_snapshot = f"monitor_{os.getpid()}.json"
+        retention = self.options.get('SNAPSHOT_RETENTION_SECONDS', RING_MINUTES * 60)
+        now = time.time()
+        try:
+            entries = list(os.scandir(shared_dir))
+        except FileNotFoundError:
+            return merged
+
+        for entry in entries:
+            if not entry.name.startswith('monitor_') or not entry.name.endswith('.json'):
+                continue
+            try:
+                if now - entry.stat().st_mtime > retention:
+                    os.remove(entry.path)
+                    continue
+                if entry.name == own_snapshot:
+                    continue
+                with open(entry.path) as f:
+                    merged.merge(MetricsState.from_dict(json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics snapshot {entry.path}: {e}")
+        return merged
+
+    def flush(self) -> None:
+        """Write this process's snapshot to the shared directory."""
+        shared_dir = self.options.get('SHARED_DIR')
+        if not shared_dir:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = json.dumps(self._state.to_dict())
+            self._dirty = False
+            self._last_flush = time.monotonic()
+
+        try:
+            os.makedirs(shared_dir, exist_ok=True)
+            path = os.path.join(shared_dir, f"monitor_{os.getpid()}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to write metrics snapshot: {e}")
+
+    def _maybe_flush(self) -> None:
+        """Flush now, or schedule one flush at the end of the throttle interval."""
+        if not self.options.get('SHARED_DIR'):
+            return
+        interval = self.options.get('FLUSH_INTERVAL_SECONDS', 5.0)
+        remaining = self._last_flush + interval - time.monotonic()
+        if remaining <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._flush_timer is not None and self._flush_timer.is_alive():
+                return
+            self._flush_timer = threading.Timer(remaining, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
 # Global monitor instance
 production_monitor = ProductionMonitor()
@@ -0,0 +1,420 @@
+"""
+Pipeline Tracing
+Structured per-job and per-step spans for the visualization pipeline.
+
+Spans are opened with a context manager, nest automatically through a
+context variable, and are exported as one batch when the root span of a
+trace closes.
+
+Usage:
+    from api.monitoring.tracing import pipeline_tracer
+
+    with pipeline_tracer.span('pipeline.step', step='cleanup') as span:
+        ...
+        span.set_attribute('tokens.total', 1234)
+
+    # Attach data to whatever span is currently open
+    pipeline_tracer.add_to_current('retries', 1)
+"""
+
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Traces waiting for a background sink; more are dropped (see QueuedSpanSink)
+DEFAULT_EXPORT_QUEUE_SIZE = 256
+
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar(
+    'pipeline_current_span', default=None
+)
+
+
+@dataclass
+class Span:
+    """A single timed unit of work within a trace."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time: float = field(default_factory=time.time)
+    end_time: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = 'ok'
+    error: Optional[str] = None
+
+    def __post_init__(self):
+        self._start_perf = time.perf_counter()
+        self._duration: Optional[float] = None
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        if self._duration is None:
+            return None
+        return self._duration * 1000
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add(self, key: str, delta: float) -> None:
+        """Increment a numeric attribute."""
+        self.attributes[key] = self.attributes.get(key, 0) + delta
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self._duration = time.perf_counter() - self._start_perf
+        self.end_time = self.start_time + self._duration
+        if error is not None:
+            self.status = 'error'
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'duration_ms': round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+# =============================================================================
+# Sinks
+# =============================================================================
+
+class SpanSink(ABC):
+    """Destination for finished traces."""
+
+    @abstractmethod
+    def export(self, spans: List[Span]) -> None:
+        """Export all spans of one finished trace."""
+        pass
+
+
+class NullSpanSink(SpanSink):
+    """Discards spans (tracing disabled)."""
+
+    def export(self, spans: List[Span]) -> None:
+        return None
+
+
+class InMemorySpanSink(SpanSink):
+    """Keeps exported spans in memory (for tests and debugging)."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, spans: List[Span]) -> None:
+        self.spans.extend(spans)
+
+
+class LogSpanSink(SpanSink):
+    """Logs each finished trace as one JSON line, through the configured logging handlers."""
+
+    def __init__(self, logger_name: str = 'api.monitoring.traces'):
+        self._logger = logging.getLogger(logger_name)
+
+    def export(self, spans: List[Span]) -> None:
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info(json.dumps([span.to_dict() for span in spans], default=str))
+
+
+class QueuedSpanSink(SpanSink):
+    """
+    Base for sinks that deliver traces on one daemon thread.
+
+    Traces wait in a bounded queue. When it is full (a slow disk or an
+    unreachable collector), new traces are dropped and counted in
+    dropped_count rather than piling up in memory or blocking the pipeline.
+    """
+
+    thread_name = 'trace-export'
+
+    def __init__(self, max_queue_size: int = DEFAULT_EXPORT_QUEUE_SIZE):
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.dropped_count = 0
+
+    def export(self, spans: List[Span]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped_count += 1
+            logger.warning(f"Trace export queue full, dropping trace {spans[0].trace_id if spans else ''}")
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until all queued traces are delivered (for tests and shutdown)."""
+        if timeout is None:
+            self._queue.join()
+            return
+
+        # Queue.join() has no timeout, so poll unfinished_tasks instead
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def deliver(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            spans = self._queue.get()
+            try:
+                self.deliver(spans)
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+            finally:
+                self._queue.task_done()
+
+
+class FileSpanSink(QueuedSpanSink):
+    """
+    Appends spans to a local JSON-lines file, one span per line.
+
+    Writes run on a background thread, and the file is rotated to
+    path.1 ... path.<backup_count> once it passes max_bytes.
+    """
+
+    thread_name = 'trace-file'
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 3,
+                 max_queue_size: int = DEFAULT_EXPORT_QUEUE_SIZE):
+        super().__init__(max_queue_size)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    def deliver(self, spans: List[Span]) -> None:
+        self._write(''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in spans))
+
+    def _write(self, lines: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a') as f:
+                f.write(lines)
+        except OSError as e:
+            logger.warning(f"Trace file write failed: {e}")
+
+    def _rotate(self) -> None:
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+class OTLPSpanSink(QueuedSpanSink):
+    """
+    Posts spans to an OTLP/HTTP collector using the JSON encoding.
+
+    Exports run on a background thread so a slow collector never adds
+    latency to the pipeline.
+    """
+
+    thread_name = 'otlp-export'
+
+    def __init__(self, endpoint: str, service_name: str = 'visualizer', headers: Dict[str, str] = None,
+                 timeout_seconds: float = 5.0, max_queue_size: int = DEFAULT_EXPORT_QUEUE_SIZE):
+        super().__init__(max_queue_size)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.timeout_seconds = timeout_seconds
+
+    def deliver(self, spans: List[Span]) -> None:
+        self._post(self.build_payload(spans))
+
+    def _post(self, payload: Dict[str, Any]) -> None:
+        try:
+            import requests
+            response = requests.post(
+                self.endpoint, json=payload, headers=self.headers, timeout=self.timeout_seconds
+            )
+            if response.status_code >= 400:
+                logger.warning(f"OTLP export rejected: HTTP {response.status_code}")
+        except Exception as e:
+            logger.warning(f"OTLP export failed: {e}")
+
+    def build_payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [_otlp_attribute('service.name', self.service_name)]},
+                'scopeSpans': [{
+                    'scope': {'name': 'api.monitoring.tracing'},
+                    'spans': [self._otlp_span(span) for span in spans],
+                }],
+            }]
+        }
+
+    @staticmethod
+    def _otlp_span(span: Span) -> Dict[str, Any]:
+        otlp_span = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(int(span.start_time * 1e9)),
+            'endTimeUnixNano': str(int((span.end_time or span.start_time) * 1e9)),
+            'attributes': [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+            'status': {'code': 2 if span.status == 'error' else 1},
+        }
+        if span.parent_id:
+            otlp_span['parentSpanId'] = span.parent_id
+        if span.error:
+            otlp_span['status']['message'] = span.error
+        return otlp_span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+# =============================================================================
+# Tracer
+# =============================================================================
+
+class PipelineTracer:
+    """Creates spans and exports each trace when its root span closes."""
+
+    def __init__(self, sink: Optional[SpanSink] = None):
+        self._sink = sink
+        self._lock = threading.Lock()
+        self._open_traces: Dict[str, List[Span]] = {}
+
+    @property
+    def sink(self) -> SpanSink:
+        if self._sink is None:
+            self._sink = build_sink_from_settings()
+        return self._sink
+
+    def set_sink(self, sink: SpanSink) -> None:
+        self._sink = sink
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            attributes=dict(attributes),
+        )
+        if parent is None:
+            with self._lock:
+                self._open_traces[span.trace_id] = []
+
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish(error)
+            self._record(span, is_root=parent is None)
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def set_on_current(self, key: str, value: Any) -> None:
+        """Set an attribute on the open span, if any."""
+        span = _current_span.get()
+        if span is not None:
+            span.set_attribute(key, value)
+
+    def add_to_current(self, key: str, delta: float) -> None:
+        """Increment an attribute on the open span, if any."""
+        span = _current_span.get()
+        if span is not None:
+            span.add(key, delta)
+
+    def _record(self, span: Span, is_root: bool) -> None:
+        with self._lock:
+            spans = self._open_traces.get(span.trace_id)
+            if spans is None:
+                return
+            spans.append(span)
+            if not is_root:
+                return
+            del self._open_traces[span.trace_id]
+
+        try:
+            self.sink.export(spans)
+        except Exception as e:
+            logger.warning(f"Failed to export trace {span.trace_id}: {e}")
+
+
+def build_sink_from_settings() -> SpanSink:
+    """Build the span sink configured in settings.PIPELINE_TRACING."""
+    config = getattr(settings, 'PIPELINE_TRACING', {}) or {}
+    sink_type = config.get('SINK', 'none')
+
+    if sink_type == 'log':
+        return LogSpanSink()
+    if sink_type == 'file':
+        path = config.get('FILE_PATH') or os.path.join(str(settings.BASE_DIR), 'logs', 'pipeline_traces.jsonl')
+        return FileSpanSink(
+            str(path),
+            max_bytes=config.get('FILE_MAX_BYTES', 50 * 1024 * 1024),
+            backup_count=config.get('FILE_BACKUP_COUNT', 3),
+            max_queue_size=config.get('EXPORT_QUEUE_SIZE', DEFAULT_EXPORT_QUEUE_SIZE),
+        )
+    if sink_type == 'otlp':
+        endpoint = config.get('OTLP_ENDPOINT')
+        if not endpoint:
+            logger.warning("PIPELINE_TRACING SINK is 'otlp' but OTLP_ENDPOINT is not set; tracing disabled")
+            return NullSpanSink()
+        return OTLPSpanSink(
+            endpoint,
+            service_name=config.get('SERVICE_NAME', 'visualizer'),
+            headers=config.get('OTLP_HEADERS'),
+            max_queue_size=config.get('EXPORT_QUEUE_SIZE', DEFAULT_EXPORT_QUEUE_SIZE),
+        )
+    return NullSpanSink()
+
+
+# Global tracer instance
+pipeline_tracer = PipelineTracer()
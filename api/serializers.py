@@ -1,12 +1,21 @@
+import os
+import re
+
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
 from PIL import Image
 import io
-from .models import VisualizationRequest, GeneratedImage, UserProfile
+from .models import VisualizationBatch, VisualizationRequest, GeneratedImage, UserProfile
 from api.tenants import get_tenant_config
 
+# Variation names end up in generated filenames
+VARIATION_NAME_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,40}')
+
 
 class UserProfileSerializer(serializers.ModelSerializer):
     """Serializer for user profile information."""
@@ -160,17 +169,18 @@ class VisualizationRequestDetailSerializer(serializers.ModelSerializer):
             'id', 'user', 'original_image_url', 'clean_image_url', 'screen_type_display',
             'status', 'created_at', 'updated_at', 'task_id', 'results',
             'processing_started_at', 'processing_completed_at', 'processing_duration',
-            'error_message', 'progress_percentage', 'status_message',
+            'error_message', 'progress_percentage', 'status_message', 'duplicate_of',
+            'dimensional_analysis',
             # Write-only fields for creation
             'original_image', 'screen_type', 'opacity', 'color',
             'screen_categories', 'mesh_choice', 'frame_color', 'mesh_color', 'scope',
-            'window_count', 'door_count', 'door_type', 'patio_enclosure'
+            'variations', 'window_count', 'door_count', 'door_type', 'patio_enclosure'
         ]
         read_only_fields = [
             'id', 'user', 'status', 'created_at', 'updated_at', 'task_id',
             'results', 'original_image_url', 'clean_image_url', 'screen_type_display',
             'processing_started_at', 'processing_completed_at', 'error_message',
-            'progress_percentage', 'status_message'
+            'progress_percentage', 'status_message', 'duplicate_of', 'dimensional_analysis'
         ]
         extra_kwargs = {
             'original_image': {
@@ -208,8 +218,8 @@ class VisualizationRequestDetailSerializer(serializers.ModelSerializer):
 
         # Validate image dimensions and format
         try:
-            # For InMemoryUploadedFile, we need to read the content
-            if isinstance(value, (InMemoryUploadedFile, TemporaryUploadedFile)):
+            # Uploads, and stored files opened for batch manifests, need their content read
+            if isinstance(value, File):
                 image = Image.open(value)
 
                 # Check dimensions
@@ -256,17 +266,28 @@ class VisualizationRequestDetailSerializer(serializers.ModelSerializer):
 class VisualizationRequestCreateSerializer(serializers.ModelSerializer):
     """Simplified serializer for creating requests."""
 
+    reuse_duplicate = serializers.BooleanField(
+        write_only=True,
+        required=False,
+        allow_null=True,
+        default=None,
+        help_text="Reuse the cleanup and audit of an earlier upload of the same photo "
+                  "(defaults to DUPLICATE_DETECTION['AUTO_REUSE'])"
+    )
+
     class Meta:
         model = VisualizationRequest
         fields = ['id', 'original_image', 'screen_type', 'opacity', 'color',
                   'screen_categories', 'mesh_choice', 'frame_color', 'mesh_color', 'scope',
-                  'window_count', 'door_count', 'door_type', 'patio_enclosure',
+                  'variations', 'window_count', 'door_count', 'door_type', 'patio_enclosure',
+                  'reuse_duplicate', 'duplicate_of',
                   'status', 'progress_percentage', 'status_message', 'created_at']
-        read_only_fields = ['id', 'status', 'progress_percentage', 'status_message', 'created_at']
+        read_only_fields = ['id', 'duplicate_of', 'status', 'progress_percentage', 'status_message', 'created_at']
         extra_kwargs = {
             'original_image': {'required': True},
             'screen_type': {'required': False, 'allow_null': True},
-            'scope': {'required': False}
+            'scope': {'required': False},
+            'variations': {'required': False}
         }
 
     def validate_original_image(self, value):
@@ -275,11 +296,16 @@ class VisualizationRequestCreateSerializer(serializers.ModelSerializer):
         detail_serializer = VisualizationRequestDetailSerializer()
         return detail_serializer.validate_original_image(value)
 
+    def _get_tenant_config(self):
+        """Tenant of the request being validated (the current tenant outside a request)."""
+        request = self.context.get('request')
+        return getattr(request, 'tenant', None) or get_tenant_config()
+
     def validate_mesh_choice(self, value):
         """Validate mesh choice against tenant config."""
-        config = get_tenant_config()
-        valid_choices = [c[0] for c in config.get_mesh_choices()]
-        if value not in valid_choices:
+        snapshot = self._get_tenant_config().snapshot
+        if not snapshot.is_valid_choice('mesh_type', value):
+            valid_choices = [c[0] for c in snapshot.get_options('mesh_type')]
             raise serializers.ValidationError(
                 f"Invalid mesh choice. Valid options: {valid_choices}"
             )
@@ -287,14 +313,206 @@ class VisualizationRequestCreateSerializer(serializers.ModelSerializer):
     
     def validate_frame_color(self, value):
         """Validate frame color against tenant config."""
-        config = get_tenant_config()
-        valid_choices = [c[0] for c in config.get_frame_color_choices()]
-        if value not in valid_choices:
+        snapshot = self._get_tenant_config().snapshot
+        if not snapshot.is_valid_choice('frame_color', value):
+            valid_choices = [c[0] for c in snapshot.get_options('frame_color')]
             raise serializers.ValidationError(
                 f"Invalid frame color. Valid options: {valid_choices}"
             )
         return value
 
+    def validate_variations(self, value):
+        """Validate variation option sets against tenant config."""
+        if not value:
+            return []
+        if not isinstance(value, list) or not all(isinstance(v, dict) for v in value):
+            raise serializers.ValidationError("Variations must be a list of option objects.")
+
+        config = self._get_tenant_config()
+        max_variations = config.get_max_variations()
+        if len(value) > max_variations:
+            raise serializers.ValidationError(f"At most {max_variations} variations are allowed.")
+
+        snapshot = config.snapshot
+        categories = {'frame_color': 'frame_color', 'mesh_choice': 'mesh_type'}
+        for variation in value:
+            unknown = set(variation) - {'name', 'frame_color', 'mesh_choice'}
+            if unknown:
+                raise serializers.ValidationError(f"Unknown variation options: {sorted(unknown)}")
+            if 'name' in variation and not (
+                isinstance(variation['name'], str) and VARIATION_NAME_PATTERN.fullmatch(variation['name'])
+            ):
+                raise serializers.ValidationError(
+                    "Variation names must be 1-40 letters, digits, underscores or hyphens."
+                )
+            for key, category in categories.items():
+                if key in variation and not snapshot.is_valid_choice(category, variation[key]):
+                    choices = [c[0] for c in snapshot.get_options(category)]
+                    raise serializers.ValidationError(
+                        f"Invalid {key} in variation. Valid options: {choices}"
+                    )
+        return value
+
+
+class BatchItemSerializer(VisualizationRequestCreateSerializer):
+    """One request of a batch: an uploaded image or the storage key of a pre-uploaded one."""
+    storage_key = serializers.CharField(required=False, write_only=True)
+    # Batches run in full; duplicates are only detected for single uploads
+    reuse_duplicate = None
+
+    class Meta(VisualizationRequestCreateSerializer.Meta):
+        fields = [
+            field for field in VisualizationRequestCreateSerializer.Meta.fields if field != 'reuse_duplicate'
+        ] + ['storage_key']
+        extra_kwargs = {
+            **VisualizationRequestCreateSerializer.Meta.extra_kwargs,
+            'original_image': {'required': False},
+        }
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if bool(attrs.get('original_image')) == bool(attrs.get('storage_key')):
+            raise serializers.ValidationError("Provide exactly one of an uploaded image or a storage_key.")
+        return attrs
+
+
+class VisualizationBatchSerializer(serializers.ModelSerializer):
+    """Batch with aggregate progress of its requests."""
+    progress = serializers.SerializerMethodField()
+    request_ids = serializers.SerializerMethodField()
+
+    class Meta:
+        model = VisualizationBatch
+        fields = ['id', 'name', 'total_count', 'created_at', 'progress', 'request_ids']
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        return obj.get_progress()
+
+    def get_request_ids(self, obj):
+        return list(obj.requests.order_by('id').values_list('id', flat=True))
+
+
+class VisualizationBatchCreateSerializer(serializers.Serializer):
+    """
+    Bulk submission of visualization requests.
+
+    Accepts a multipart upload ('images', one file per request) and/or a
+    manifest of items with the storage_key of an already uploaded image.
+    'defaults' holds request options shared by every item; each item may
+    override them. Items without a storage_key take the uploaded images in
+    order. All items are validated in one pass, and errors are reported per
+    item index.
+    """
+    name = serializers.CharField(required=False, allow_blank=True, max_length=200)
+    defaults = serializers.JSONField(required=False)
+    items = serializers.JSONField(required=False)
+    images = serializers.ListField(child=serializers.FileField(), required=False)
+
+    def validate(self, attrs):
+        defaults = attrs.get('defaults') or {}
+        items = attrs.get('items')
+        images = list(attrs.get('images') or [])
+        if not isinstance(defaults, dict):
+            raise serializers.ValidationError({'defaults': "Defaults must be an object of request options."})
+        if items is None:
+            items = [{} for _ in images]
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise serializers.ValidationError({'items': "Items must be a list of objects."})
+        if not items:
+            raise serializers.ValidationError("A batch needs at least one image or manifest item.")
+
+        max_size = self._dispatch_settings().get('MAX_BATCH_SIZE', 1000)
+        if len(items) > max_size:
+            raise serializers.ValidationError(f"At most {max_size} requests are allowed per batch.")
+
+        uploads = [item for item in items if 'storage_key' not in item]
+        if len(uploads) != len(images):
+            raise serializers.ValidationError(
+                f"{len(uploads)} items need an uploaded image but {len(images)} images were sent."
+            )
+        uploaded = iter(images)
+        data = [
+            {**defaults, **item, **({} if 'storage_key' in item else {'original_image': next(uploaded)})}
+            for item in items
+        ]
+
+        item_serializer = BatchItemSerializer(data=data, many=True, context=self.context)
+        if not item_serializer.is_valid():
+            errors = item_serializer.errors
+            if isinstance(errors, list):
+                # DRF before LIST_SERIALIZER_ERRORS_AS_DICT: one entry per item, empty when valid
+                errors = {index: item_errors for index, item_errors in enumerate(errors) if item_errors}
+            raise serializers.ValidationError({'items': errors})
+        validated_items = item_serializer.validated_data
+        self._validate_storage_keys(validated_items)
+
+        attrs['items'] = validated_items
+        return attrs
+
+    def _validate_storage_keys(self, items):
+        """
+        Keys must sit under the user's manifest prefix and exist (one listing
+        per directory), and the stored file must pass the same image checks
+        as an upload.
+        """
+        user = self.context['request'].user
+        prefix = self._dispatch_settings().get('MANIFEST_PREFIX', 'batch_uploads/{user_id}/').format(user_id=user.id)
+        allowed_extensions = ('.jpg', '.jpeg', '.png', '.webp')
+
+        image_validator = VisualizationRequestDetailSerializer()
+        errors = {}
+        listings = {}
+        for index, item in enumerate(items):
+            key = item.get('storage_key')
+            if not key:
+                continue
+            normalized = os.path.normpath(key)
+            if not normalized.startswith(prefix) or normalized != key:
+                errors[index] = {'storage_key': [f"Storage keys must be under {prefix}"]}
+                continue
+            if not key.lower().endswith(allowed_extensions):
+                errors[index] = {'storage_key': ["Unsupported file type."]}
+                continue
+            directory, filename = os.path.split(key)
+            if directory not in listings:
+                try:
+                    listings[directory] = set(default_storage.listdir(directory)[1])
+                except (FileNotFoundError, OSError):
+                    listings[directory] = set()
+            if filename not in listings[directory]:
+                errors[index] = {'storage_key': ["File not found in storage."]}
+                continue
+            try:
+                with default_storage.open(key, 'rb') as stored:
+                    image_validator.validate_original_image(stored)
+            except ValidationError as e:
+                errors[index] = {'storage_key': e.detail}
+        if errors:
+            raise serializers.ValidationError({'items': errors})
+
+    @staticmethod
+    def _dispatch_settings():
+        return getattr(settings, 'JOB_DISPATCH', {}) or {}
+
+    @transaction.atomic
+    def create(self, validated_data):
+        user = self.context['request'].user
+        items = validated_data['items']
+        batch = VisualizationBatch.objects.create(
+            user=user, name=validated_data.get('name', ''), total_count=len(items)
+        )
+
+        requests = []
+        for item in items:
+            storage_key = item.pop('storage_key', None)
+            if storage_key:
+                item['original_image'] = storage_key
+            requests.append(VisualizationRequest(user=user, batch=batch, status='pending', **item))
+        # Uploaded files are written to storage as each row is prepared for insert
+        VisualizationRequest.objects.bulk_create(requests, batch_size=200)
+        return batch
+
 
 class LeadSerializer(serializers.ModelSerializer):
     """Serializer for lead capture."""
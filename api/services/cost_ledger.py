@@ -0,0 +1,179 @@
+"""
+Cost Ledger - Records token usage and cost of every AI model call.
+
+Each call is written as a ModelUsageRecord and added to the hourly
+CostRollup for its tenant and model with F() increments.
+
+Usage:
+    from api.services.cost_ledger import ledger_context, record_model_usage
+
+    with ledger_context(request=visualization_request):
+        ...
+        record_model_usage(response.usage_metadata, model_name, step_name='cleanup')
+"""
+import contextvars
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from api.ai_services.utils.performance_utils import calculate_token_cost
+from api.models import CostRollup, ModelUsageRecord
+from api.tenants import get_tenant_config
+
+logger = logging.getLogger(__name__)
+
+_current_request: contextvars.ContextVar = contextvars.ContextVar('cost_ledger_request', default=None)
+
+
+@contextmanager
+def ledger_context(request=None):
+    """Attribute usage recorded inside this block to a VisualizationRequest."""
+    token = _current_request.set(request)
+    try:
+        yield
+    finally:
+        _current_request.reset(token)
+
+
+def extract_usage(usage_metadata: Any) -> Dict[str, int]:
+    """
+    Split Gemini usage_metadata into billable token counts.
+
+    candidates_token_count covers all output; image output tokens are
+    reported per modality and are separated out here.
+    """
+    if not usage_metadata:
+        return {'prompt_tokens': 0, 'thinking_tokens': 0, 'output_tokens': 0,
+                'image_output_tokens': 0, 'total_tokens': 0}
+
+    candidates_tokens = getattr(usage_metadata, 'candidates_token_count', 0) or 0
+    image_output_tokens = 0
+    for detail in getattr(usage_metadata, 'candidates_tokens_details', None) or []:
+        modality = getattr(detail, 'modality', None)
+        modality_name = getattr(modality, 'value', modality)
+        if modality_name == 'IMAGE':
+            image_output_tokens += getattr(detail, 'token_count', 0) or 0
+
+    return {
+        'prompt_tokens': getattr(usage_metadata, 'prompt_token_count', 0) or 0,
+        'thinking_tokens': getattr(usage_metadata, 'thoughts_token_count', 0) or 0,
+        'output_tokens': max(0, candidates_tokens - image_output_tokens),
+        'image_output_tokens': image_output_tokens,
+        'total_tokens': getattr(usage_metadata, 'total_token_count', 0) or 0,
+    }
+
+
+def record_model_usage(
+    usage_metadata: Any,
+    model_name: str,
+    step_name: str,
+    request=None,
+    tenant_id: Optional[str] = None,
+    provider: str = 'gemini'
+) -> Optional[ModelUsageRecord]:
+    """
+    Record one model call in the ledger and its hourly rollup.
+
+    Never raises: a ledger failure must not fail the pipeline.
+
+    Args:
+        usage_metadata: usage_metadata from the Gemini response
+        model_name: Model that served the call
+        step_name: Pipeline step or service name
+        request: VisualizationRequest (defaults to the active ledger_context)
+        tenant_id: Tenant ID (defaults to the active tenant)
+        provider: AI provider name
+
+    Returns:
+        The created ModelUsageRecord, or None on failure
+    """
+    try:
+        usage = extract_usage(usage_metadata)
+        request = request if request is not None else _current_request.get()
+        tenant_id = tenant_id or get_tenant_config().tenant_id
+        cost = Decimal(str(round(calculate_token_cost(
+            model_name,
+            prompt_tokens=usage['prompt_tokens'],
+            output_tokens=usage['output_tokens'],
+            thinking_tokens=usage['thinking_tokens'],
+            image_output_tokens=usage['image_output_tokens'],
+        ), 6)))
+
+        with transaction.atomic():
+            record = ModelUsageRecord.objects.create(
+                request=request,
+                tenant_id=tenant_id,
+                step_name=step_name,
+                provider=provider,
+                model_name=model_name,
+                cost_usd=cost,
+                **usage
+            )
+            _add_to_rollup(record)
+
+        logger.info(f"Cost [{tenant_id}/{step_name}] {model_name}: ${cost} ({usage['total_tokens']} tokens)")
+        return record
+
+    except Exception as e:
+        logger.error(f"Failed to record model usage for {step_name}: {e}")
+        return None
+
+
+def _add_to_rollup(record: ModelUsageRecord) -> None:
+    hour = record.created_at.replace(minute=0, second=0, microsecond=0)
+    lookup = {'tenant_id': record.tenant_id, 'hour': hour, 'model_name': record.model_name}
+    increments = {
+        'call_count': F('call_count') + 1,
+        'prompt_tokens': F('prompt_tokens') + record.prompt_tokens,
+        'thinking_tokens': F('thinking_tokens') + record.thinking_tokens,
+        'output_tokens': F('output_tokens') + record.output_tokens,
+        'image_output_tokens': F('image_output_tokens') + record.image_output_tokens,
+        'cost_usd': F('cost_usd') + record.cost_usd,
+    }
+
+    if CostRollup.objects.filter(**lookup).update(**increments):
+        return
+    try:
+        # Savepoint so a concurrent insert doesn't break the outer transaction
+        with transaction.atomic():
+            CostRollup.objects.create(
+                call_count=1,
+                prompt_tokens=record.prompt_tokens,
+                thinking_tokens=record.thinking_tokens,
+                output_tokens=record.output_tokens,
+                image_output_tokens=record.image_output_tokens,
+                cost_usd=record.cost_usd,
+                **lookup
+            )
+    except IntegrityError:
+        CostRollup.objects.filter(**lookup).update(**increments)
+
+
+def get_request_cost(request, since=None) -> float:
+    """
+    Total recorded cost of a visualization request in USD.
+
+    A regenerated request keeps the records of its earlier runs; pass the
+    start of a run as since to cost that run alone.
+    """
+    records = request.usage_records.all()
+    if since is not None:
+        records = records.filter(created_at__gte=since)
+    total = records.aggregate(total=Sum('cost_usd'))['total']
+    return float(total or 0)
+
+
+def get_tenant_cost(tenant_id: str, since=None) -> float:
+    """Total cost of a tenant since a datetime (default: the last hour) from the rollups."""
+    since = since or timezone.now() - timedelta(hours=1)
+    hour = since.replace(minute=0, second=0, microsecond=0)
+    total = CostRollup.objects.filter(tenant_id=tenant_id, hour__gte=hour).aggregate(
+        total=Sum('cost_usd')
+    )['total']
+    return float(total or 0)
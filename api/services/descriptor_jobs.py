@@ -0,0 +1,145 @@
+"""
+Descriptor Jobs - Compute image descriptors for reference images and uploads.
+
+Descriptors (api/visualizer/descriptors.py) are computed on CPU in batches
+across a process pool and stored on the row with the DESCRIPTOR_VERSION
+they were made with. Reference image descriptors are written through to the
+tenant's reference index (api/services/reference_index.py).
+
+Rows whose embedding_version is not the current DESCRIPTOR_VERSION are
+pending, so an interrupted run resumes where it left off and a new
+descriptor recipe recomputes everything.
+
+Usage:
+    from api.services.descriptor_jobs import describe_pending, describe_upload
+
+    describe_pending(ReferenceImage, batch_size=256, workers=8)
+    describe_upload(visualization_request, original_image)  # pipeline stage
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image
+
+from api.services.reference_index import reference_index
+from api.visualizer.descriptors import DESCRIPTOR_VERSION, compute_descriptor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 128
+
+# Image field each model's descriptor is computed from
+IMAGE_FIELDS = {
+    'ReferenceImage': 'image',
+    'VisualizationRequest': 'original_image',
+}
+
+
+def describe_file(path: str) -> Optional[List[float]]:
+    """Descriptor of an image file, or None if it cannot be read. Runs in pool workers."""
+    try:
+        with Image.open(path) as image:
+            return compute_descriptor(image.convert('RGB')).tolist()
+    except Exception as e:
+        logger.warning(f"Could not describe {path}: {e}")
+        return None
+
+
+def pending(model, tenant_id: Optional[str] = None):
+    """Rows of a model without a descriptor of the current version, oldest first."""
+    queryset = model.objects.exclude(embedding_version=DESCRIPTOR_VERSION)
+    if tenant_id:
+        queryset = queryset.filter(tenant_id=tenant_id)
+    return queryset.order_by('id')
+
+
+def describe_pending(model, batch_size: int = DEFAULT_BATCH_SIZE, workers: Optional[int] = None,
+                     tenant_id: Optional[str] = None, limit: Optional[int] = None,
+                     progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Compute descriptors for a model's pending rows.
+
+    Each batch is saved (and indexed) before the next one starts, so a run
+    can be interrupted at any point. Unreadable images are skipped and
+    retried on the next run.
+
+    Args:
+        model: ReferenceImage or VisualizationRequest
+        batch_size: Rows loaded, described and saved together
+        workers: Worker processes (defaults to the CPU count; 1 describes in-process)
+        tenant_id: Only describe this tenant's rows
+        limit: Stop after this many rows
+        progress: Called with (rows done, rows failed) after each batch
+
+    Returns:
+        {'described': ..., 'failed': ...}
+    """
+    field = IMAGE_FIELDS[model.__name__]
+    workers = workers or os.cpu_count() or 1
+    totals = {'described': 0, 'failed': 0}
+    last_id = 0
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while limit is None or totals['described'] + totals['failed'] < limit:
+            size = batch_size if limit is None else min(batch_size, limit - totals['described'] - totals['failed'])
+            # Keyset pagination: skipped rows are not fetched again in this run
+            rows = list(pending(model, tenant_id).filter(id__gt=last_id)[:size])
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            paths = [getattr(row, field).path for row in rows]
+            if pool is None:
+                descriptors = [describe_file(path) for path in paths]
+            else:
+                descriptors = list(pool.map(describe_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+            described = []
+            for row, descriptor in zip(rows, descriptors):
+                if descriptor is not None:
+                    row.embedding = descriptor
+                    row.embedding_version = DESCRIPTOR_VERSION
+                    described.append(row)
+            model.objects.bulk_update(described, ['embedding', 'embedding_version'])
+            if field == 'image':
+                _index_references(described)
+
+            totals['described'] += len(described)
+            totals['failed'] += len(rows) - len(described)
+            if progress:
+                progress(totals['described'], totals['failed'])
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    logger.info(f"Described {totals['described']} {model.__name__} rows ({totals['failed']} failed)")
+    return totals
+
+
+def _index_references(references):
+    """Append described references to their tenants' reference indexes."""
+    by_tenant = {}
+    for reference in references:
+        by_tenant.setdefault(reference.tenant_id, []).append(
+            (reference.id, reference.category, reference.option_value, reference.embedding)
+        )
+    for tenant_id, entries in by_tenant.items():
+        reference_index.add(tenant_id, entries)
+
+
+def describe_upload(visualization_request, image: Image.Image) -> bool:
+    """
+    Store the descriptor of a request's original image, unless it has a current one.
+
+    Returns:
+        True if a descriptor was computed
+    """
+    if visualization_request.embedding_version == DESCRIPTOR_VERSION:
+        return False
+    visualization_request.embedding = compute_descriptor(image.convert('RGB')).tolist()
+    visualization_request.embedding_version = DESCRIPTOR_VERSION
+    visualization_request.save(update_fields=['embedding', 'embedding_version'])
+    return True
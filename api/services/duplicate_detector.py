@@ -0,0 +1,148 @@
+"""
+Duplicate Detector - Spot re-uploads of the same house photo.
+
+Every upload gets a perceptual hash (api/visualizer/descriptors.py). A new
+upload whose hash is within DUPLICATE_DETECTION['MAX_DISTANCE'] bits of an
+earlier upload by the same user under the same tenant is a near-duplicate:
+the same photo resized, recompressed or lightly cropped.
+
+The hash is only a 64-bit grayscale summary, so before a match is used the
+two images must also have the same aspect ratio (within
+MAX_ASPECT_DIFFERENCE) and descriptors at least MIN_SIMILARITY apart by
+cosine; a repainted house or a differently framed shot is not reused.
+
+When reuse is on (DUPLICATE_DETECTION['AUTO_REUSE'], or the client asks for
+it per upload), the request is linked to the earlier one through
+duplicate_of. Processing then starts from that request's clean image and
+copies its audit, skipping cleanup and the audit model call.
+
+Usage:
+    from api.services.duplicate_detector import detect_duplicate
+
+    original = detect_duplicate(visualization_request)
+"""
+import logging
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from api.visualizer.descriptors import DESCRIPTOR_VERSION, compute_descriptor, hash_distance, perceptual_hash
+
+logger = logging.getLogger(__name__)
+
+# Hashes at most this many bits apart are near-duplicates
+DEFAULT_MAX_DISTANCE = 6
+
+# Earlier uploads of a user compared against, most recent first
+DEFAULT_LOOKBACK = 500
+
+# A matched upload is only used if its descriptor is at least this similar (cosine)
+DEFAULT_MIN_SIMILARITY = 0.95
+
+# ... and its aspect ratio differs by at most this fraction
+DEFAULT_MAX_ASPECT_DIFFERENCE = 0.03
+
+
+def _config() -> dict:
+    return getattr(settings, 'DUPLICATE_DETECTION', {}) or {}
+
+
+def find_duplicate(visualization_request):
+    """
+    Closest earlier upload of the same user and tenant that has a clean image.
+
+    Returns:
+        VisualizationRequest, or None if no upload is within MAX_DISTANCE
+    """
+    from api.models import VisualizationRequest
+
+    if not visualization_request.phash:
+        return None
+
+    config = _config()
+    candidates = list(
+        VisualizationRequest.objects
+        .filter(user_id=visualization_request.user_id, tenant_id=visualization_request.tenant_id)
+        .exclude(id=visualization_request.id)
+        .exclude(phash='')
+        .exclude(clean_image='')
+        .exclude(clean_image__isnull=True)
+        .order_by('-created_at')
+        .values_list('id', 'phash')[:config.get('LOOKBACK', DEFAULT_LOOKBACK)]
+    )
+    if not candidates:
+        return None
+
+    # Closest hash wins; ties go to the most recent upload
+    best_id, best_hash = min(candidates, key=lambda c: hash_distance(visualization_request.phash, c[1]))
+    distance = hash_distance(visualization_request.phash, best_hash)
+    if distance > config.get('MAX_DISTANCE', DEFAULT_MAX_DISTANCE):
+        return None
+    logger.info(f"Request {visualization_request.id} is a near-duplicate of {best_id} ({distance} bits apart)")
+    return VisualizationRequest.objects.get(id=best_id)
+
+
+def confirm_duplicate(image: Image.Image, duplicate) -> bool:
+    """
+    Check that a hash match is the same photo: same aspect ratio and a close descriptor.
+
+    Args:
+        image: The new upload
+        duplicate: Earlier VisualizationRequest returned by find_duplicate
+    """
+    config = _config()
+    max_aspect_difference = config.get('MAX_ASPECT_DIFFERENCE', DEFAULT_MAX_ASPECT_DIFFERENCE)
+    with Image.open(duplicate.original_image.path) as earlier:
+        aspect, earlier_aspect = image.width / image.height, earlier.width / earlier.height
+        if abs(aspect - earlier_aspect) / earlier_aspect > max_aspect_difference:
+            logger.info(f"Hash match {duplicate.id} rejected: aspect ratio {aspect:.3f} vs {earlier_aspect:.3f}")
+            return False
+        if duplicate.embedding_version == DESCRIPTOR_VERSION and duplicate.embedding:
+            earlier_descriptor = np.asarray(duplicate.embedding, dtype=np.float32)
+        else:
+            earlier_descriptor = compute_descriptor(earlier)
+
+    similarity = float(compute_descriptor(image) @ earlier_descriptor)
+    if similarity < config.get('MIN_SIMILARITY', DEFAULT_MIN_SIMILARITY):
+        logger.info(f"Hash match {duplicate.id} rejected: descriptor similarity {similarity:.3f}")
+        return False
+    return True
+
+
+def detect_duplicate(visualization_request, reuse: Optional[bool] = None):
+    """
+    Hash a new upload and link it to an earlier upload of the same photo.
+
+    A hash match counts only if confirm_duplicate() agrees.
+
+    Failures are logged and leave the request to be processed in full.
+
+    Args:
+        visualization_request: Newly created VisualizationRequest
+        reuse: Link the duplicate for reuse (defaults to DUPLICATE_DETECTION['AUTO_REUSE'])
+
+    Returns:
+        The earlier VisualizationRequest, or None
+    """
+    config = _config()
+    if not config.get('ENABLED', True):
+        return None
+
+    try:
+        with Image.open(visualization_request.original_image.path) as image:
+            visualization_request.phash = perceptual_hash(image)
+            duplicate = find_duplicate(visualization_request)
+            if duplicate is not None and not confirm_duplicate(image, duplicate):
+                duplicate = None
+    except Exception as e:
+        logger.warning(f"Duplicate detection failed for request {visualization_request.id} (non-fatal): {e}")
+        return None
+
+    update_fields = ['phash']
+    if duplicate is not None and (config.get('AUTO_REUSE', True) if reuse is None else reuse):
+        visualization_request.duplicate_of = duplicate
+        update_fields.append('duplicate_of')
+    visualization_request.save(update_fields=update_fields)
+    return duplicate
@@ -0,0 +1,150 @@
+"""
+Job Dispatcher - Runs visualization jobs on a fixed pool of background workers.
+
+The order in which queued jobs run is decided by the FairScheduler
+(api/services/scheduler.py): interactive requests ahead of bulk batches, and
+weighted fair shares across tenants and users, within each tenant's
+concurrency cap and spend budget. Tenant policies and spend are refreshed
+outside the dispatcher lock, so no config or database read happens while
+it is held.
+
+Each process has its own dispatcher: MAX_WORKERS and the tenants'
+MAX_CONCURRENT caps apply per process, so the effective limits are those
+values times the number of processes (e.g. gunicorn workers).
+
+Usage:
+    from api.services.job_dispatcher import job_dispatcher
+
+    job_dispatcher.submit(visualization_request.id, user_id=user.id)
+    job_dispatcher.submit_many(request_ids, user_id=user.id)  # bulk lane
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from api.services.scheduler import BULK, INTERACTIVE, FairScheduler, Job
+
+logger = logging.getLogger(__name__)
+
+# Workers when settings.JOB_DISPATCH sets no MAX_WORKERS
+DEFAULT_MAX_WORKERS = 4
+
+# Idle workers re-check the queue this often (seconds), e.g. for budgets that reset
+RECHECK_SECONDS = 30
+
+
+def run_visualization_job(request_id: int, queue_wait_seconds: Optional[float] = None):
+    """
+    Process one VisualizationRequest, marking it failed if processing raises.
+
+    queue_wait_seconds is how long the job waited in the dispatcher queue.
+    """
+    from api.ai_enhanced_processor import AIEnhancedImageProcessor
+    from api.models import VisualizationRequest
+
+    instance = VisualizationRequest.objects.get(id=request_id)
+    try:
+        generated_images = AIEnhancedImageProcessor().process_image(instance, queue_wait_seconds=queue_wait_seconds)
+        logger.info(f"Successfully processed request {request_id}, generated {len(generated_images)} images")
+    except Exception as e:
+        logger.error(f"Error in AI processing for request {request_id}: {str(e)}")
+        instance.mark_as_failed(str(e))
+
+
+class JobDispatcher:
+    """Fair-scheduled job queue, drained by daemon worker threads."""
+
+    def __init__(self, runner: Optional[Callable[[int], None]] = None, max_workers: Optional[int] = None,
+                 scheduler: Optional[FairScheduler] = None):
+        """
+        Args:
+            runner: Called with each request ID and queue_wait_seconds (defaults to run_visualization_job)
+            max_workers: Worker threads (defaults to settings.JOB_DISPATCH['MAX_WORKERS'])
+            scheduler: Queue ordering (defaults to a FairScheduler with tenant policies)
+        """
+        self._runner = runner or run_visualization_job
+        self._max_workers = max_workers
+        self._scheduler = scheduler or FairScheduler()
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._active = 0
+
+    @property
+    def max_workers(self) -> int:
+        if self._max_workers is not None:
+            return self._max_workers
+        return (getattr(settings, 'JOB_DISPATCH', {}) or {}).get('MAX_WORKERS', DEFAULT_MAX_WORKERS)
+
+    def submit(self, request_id: int, user_id: int, tenant_id: Optional[str] = None, lane: str = INTERACTIVE):
+        """Queue one request, in the interactive lane by default."""
+        self.submit_many([request_id], user_id, tenant_id=tenant_id, lane=lane)
+
+    def submit_many(self, request_ids: Iterable[int], user_id: int, tenant_id: Optional[str] = None,
+                    lane: str = BULK):
+        """Queue requests of one user, in the bulk lane by default."""
+        if tenant_id is None:
+            from api.tenants import get_tenant_config
+            tenant_id = get_tenant_config().tenant_id
+
+        jobs = [Job(request_id, user_id, tenant_id, lane) for request_id in request_ids]
+        if not jobs:
+            return
+        self._scheduler.refresh([tenant_id])
+        with self._condition:
+            for job in jobs:
+                self._scheduler.push(job)
+            self._condition.notify(len(jobs))
+        self._ensure_workers()
+        logger.info(f"Queued {len(jobs)} {lane} job(s) for tenant {tenant_id}, user {user_id}")
+
+    def _ensure_workers(self):
+        with self._condition:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self._work, name=f"job-dispatcher-{len(self._workers)}", daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                tenant_ids = self._scheduler.tenant_ids()
+            # Policies and spend are read here, not under the lock
+            self._scheduler.refresh(tenant_ids)
+            with self._condition:
+                job = self._scheduler.pop()
+                if job is None:
+                    self._condition.wait(RECHECK_SECONDS)
+                    continue
+                self._active += 1
+            try:
+                self._runner(job.request_id, queue_wait_seconds=time.monotonic() - job.enqueued_at)
+            except Exception as e:
+                logger.error(f"Job for request {job.request_id} failed: {e}")
+            finally:
+                # Each worker thread holds its own DB connection
+                connections.close_all()
+                with self._condition:
+                    self._active -= 1
+                    self._scheduler.finish(job)
+                    # A freed tenant slot may let another worker start a job
+                    self._condition.notify_all()
+
+    def get_status(self) -> Dict[str, object]:
+        """Queued and running jobs per tenant, plus active and total worker counts."""
+        with self._condition:
+            return {
+                'tenants': self._scheduler.get_status(),
+                'active': self._active,
+                'workers': len(self._workers),
+            }
+
+
+# Global instance
+job_dispatcher = JobDispatcher()
@@ -109,6 +109,7 @@ def quality_check_handler(
     Returns:
         - score: Quality score 0-1
         - reason: Explanation string
+        - quality_tier: 'local', 'model' or 'local_fallback' (which check decided)
     """
     visualizer = context['visualizer']
     clean_image = context.get('clean_image', context['image'])
@@ -118,17 +119,15 @@ def quality_check_handler(
     
     quality_prompt = prompts.get_quality_check_prompt(scope)
     
-    # Pass both clean (reference) and current (final) images
-    quality_result = visualizer._call_gemini_json(
-        [clean_image, current_image],
-        quality_prompt
+    # Local metrics first; the model is only asked when they are inconclusive
+    quality_result = visualizer._check_quality(
+        clean_image, current_image, quality_prompt, step_name=step_name, step_config=step_config
     )
-    
-    score = quality_result.get('score', 0.95)
-    reason = quality_result.get('reason', 'AI quality check completed.')
-    
-    logger.info(f"Quality Check: Score={score}, Reason={reason}")
-    return {'score': score, 'reason': reason}
+    score = quality_result['score']
+    reason = quality_result['reason']
+
+    logger.info(f"Quality Check ({quality_result['tier']}): Score={score}, Reason={reason}")
+    return {'score': score, 'reason': reason, 'quality_tier': quality_result['tier']}
 
 
 # Registry mapping step types to handlers
@@ -0,0 +1,244 @@
+"""
+Reference Index - Nearest-neighbour search over ReferenceImage descriptors.
+
+Each tenant's index is two files in REFERENCE_INDEX['DIR']:
+
+    {tenant_id}.f32   float32 matrix, one unit-length descriptor per row
+    {tenant_id}.json  row metadata: reference IDs, categories, option values,
+                      descriptor dim and version
+
+The matrix is memory-mapped and searched by brute force: one matrix-vector
+product gives the cosine similarity to every reference, and argpartition
+picks the top k. For tens of thousands of references this takes a few
+milliseconds and is exact, so no partitioning is needed.
+
+build() writes the index from ReferenceImage.embedding; add() appends rows
+as new descriptors are computed. Readers notice a rewritten or appended
+index by its modification time and map it again.
+
+Usage:
+    from api.services.reference_index import reference_index
+
+    matches = reference_index.search('boss', compute_descriptor(photo), k=3)
+    matches[0].reference_id, matches[0].score
+"""
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from api.visualizer.descriptors import DESCRIPTOR_DIM, DESCRIPTOR_VERSION
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ReferenceMatch:
+    """One search hit."""
+    reference_id: int
+    score: float
+    category: str
+    option_value: str
+
+
+@dataclass
+class _LoadedIndex:
+    vectors: np.ndarray
+    ids: np.ndarray
+    categories: np.ndarray
+    option_values: List[str]
+    mtime: Tuple[float, float]
+
+
+def _index_dir() -> str:
+    config = getattr(settings, 'REFERENCE_INDEX', {}) or {}
+    return config.get('DIR') or os.path.join(settings.MEDIA_ROOT, 'reference_index')
+
+
+class ReferenceIndex:
+    """Per-tenant memory-mapped descriptor matrices."""
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Args:
+            directory: Where index files live (defaults to settings.REFERENCE_INDEX['DIR'])
+        """
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._loaded: Dict[str, _LoadedIndex] = {}
+
+    @property
+    def directory(self) -> str:
+        return self._directory or _index_dir()
+
+    def _paths(self, tenant_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, tenant_id)
+        return f"{base}.f32", f"{base}.json"
+
+    # -- Writing -----------------------------------------------------------
+
+    def build(self, tenant_id: str) -> int:
+        """
+        Rewrite a tenant's index from the descriptors stored on its ReferenceImages.
+
+        Returns:
+            Number of indexed references
+        """
+        from api.models import ReferenceImage
+
+        rows = ReferenceImage.objects.filter(tenant_id=tenant_id, embedding_version=DESCRIPTOR_VERSION).values_list(
+            'id', 'category', 'option_value', 'embedding'
+        )
+        entries = [
+            (reference_id, category, option_value, embedding)
+            for reference_id, category, option_value, embedding in rows
+            if isinstance(embedding, list) and len(embedding) == DESCRIPTOR_DIM
+        ]
+        vectors = np.asarray([entry[3] for entry in entries], dtype=np.float32).reshape(-1, DESCRIPTOR_DIM)
+        self._write(tenant_id, vectors, [entry[:3] for entry in entries])
+        logger.info(f"Built reference index for {tenant_id}: {len(entries)} references")
+        return len(entries)
+
+    def add(self, tenant_id: str, entries: Iterable[Tuple[int, str, str, Sequence[float]]]) -> int:
+        """
+        Append (reference_id, category, option_value, descriptor) rows to a tenant's index.
+
+        A reference already in the index is not added again; build() replaces
+        changed descriptors. Returns the number of rows added.
+        """
+        vector_path, meta_path = self._paths(tenant_id)
+        with self._lock:
+            meta = self._read_meta(meta_path) if os.path.exists(vector_path) else None
+            # A missing or outdated index is started over
+            fresh = meta is None
+            if fresh:
+                meta = {'version': DESCRIPTOR_VERSION, 'dim': DESCRIPTOR_DIM, 'ids': [], 'categories': [], 'options': []}
+            known = set(meta['ids'])
+            new = [entry for entry in entries if entry[0] not in known]
+            if not new:
+                return 0
+
+            vectors = np.asarray([entry[3] for entry in new], dtype=np.float32).reshape(-1, DESCRIPTOR_DIM)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(vector_path, 'wb' if fresh else 'ab') as f:
+                f.write(vectors.tobytes())
+            meta['ids'] += [entry[0] for entry in new]
+            meta['categories'] += [entry[1] for entry in new]
+            meta['options'] += [entry[2] for entry in new]
+            self._write_meta(meta_path, meta)
+        return len(new)
+
+    def _write(self, tenant_id: str, vectors: np.ndarray, entries: List[Tuple[int, str, str]]):
+        vector_path, meta_path = self._paths(tenant_id)
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            # Write both files aside, then swap them in
+            with open(f"{vector_path}.tmp", 'wb') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            meta = {
+                'version': DESCRIPTOR_VERSION,
+                'dim': DESCRIPTOR_DIM,
+                'ids': [entry[0] for entry in entries],
+                'categories': [entry[1] for entry in entries],
+                'options': [entry[2] for entry in entries],
+            }
+            os.replace(f"{vector_path}.tmp", vector_path)
+            self._write_meta(meta_path, meta)
+
+    @staticmethod
+    def _write_meta(meta_path: str, meta: dict):
+        with open(f"{meta_path}.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    @staticmethod
+    def _read_meta(meta_path: str) -> Optional[dict]:
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get('version') != DESCRIPTOR_VERSION or meta.get('dim') != DESCRIPTOR_DIM:
+            logger.warning(f"Ignoring reference index {meta_path}: built with another descriptor version")
+            return None
+        return meta
+
+    # -- Reading -----------------------------------------------------------
+
+    def _load(self, tenant_id: str) -> Optional[_LoadedIndex]:
+        vector_path, meta_path = self._paths(tenant_id)
+        try:
+            mtime = (os.path.getmtime(vector_path), os.path.getmtime(meta_path))
+        except OSError:
+            return None
+
+        loaded = self._loaded.get(tenant_id)
+        if loaded is not None and loaded.mtime == mtime:
+            return loaded
+
+        with self._lock:
+            meta = self._read_meta(meta_path)
+            if meta is None:
+                return None
+            count = len(meta['ids'])
+            if count == 0:
+                vectors = np.empty((0, DESCRIPTOR_DIM), dtype=np.float32)
+            else:
+                # Rows appended after the metadata was read are picked up on the next load
+                vectors = np.memmap(vector_path, dtype=np.float32, mode='r', shape=(count, DESCRIPTOR_DIM))
+            loaded = self._loaded[tenant_id] = _LoadedIndex(
+                vectors=vectors,
+                ids=np.asarray(meta['ids'], dtype=np.int64),
+                categories=np.asarray(meta['categories']),
+                option_values=meta['options'],
+                mtime=mtime,
+            )
+        return loaded
+
+    def size(self, tenant_id: str) -> int:
+        loaded = self._load(tenant_id)
+        return 0 if loaded is None else len(loaded.ids)
+
+    def search(self, tenant_id: str, descriptor: Sequence[float], k: int = 5,
+               category: Optional[str] = None) -> List[ReferenceMatch]:
+        """
+        Most similar references of a tenant, best first.
+
+        Args:
+            tenant_id: Tenant whose references to search
+            descriptor: Query descriptor (api/visualizer/descriptors.py)
+            k: Number of matches to return
+            category: Only consider references of this category
+
+        Returns:
+            Up to k ReferenceMatch, empty if the tenant has no index
+        """
+        loaded = self._load(tenant_id)
+        if loaded is None or not len(loaded.ids) or k <= 0:
+            return []
+
+        scores = loaded.vectors @ np.asarray(descriptor, dtype=np.float32)
+        if category is not None:
+            scores = np.where(loaded.categories == category, scores, -np.inf)
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            ReferenceMatch(
+                reference_id=int(loaded.ids[row]),
+                score=float(scores[row]),
+                category=str(loaded.categories[row]),
+                option_value=loaded.option_values[row],
+            )
+            for row in top if np.isfinite(scores[row])
+        ]
+
+
+# Global instance
+reference_index = ReferenceIndex()
@@ -0,0 +1,234 @@
+"""
+Scheduler - Weighted fair queuing of visualization jobs across tenants and users.
+
+Jobs wait in two priority lanes. Interactive jobs (single photo requests)
+are always taken before bulk jobs (batches). Within a lane, the tenant with
+the lowest virtual time goes next, and a tenant's virtual time advances by
+1 / weight per job, so tenants share the workers in proportion to their
+weights. Users within a tenant share the tenant's turns the same way.
+
+A tenant whose concurrency cap is reached, or whose Gemini spend for the
+day has passed its budget, is skipped; its jobs wait until a slot frees up
+or the budget resets.
+
+Policies come from the tenant config (get_scheduling_policy):
+    WEIGHT            relative share when tenants compete (default 1)
+    MAX_CONCURRENT    jobs running at once in this process (default: no cap
+                      beyond the pool)
+    DAILY_BUDGET_USD  spend per UTC day after which jobs wait (default: none)
+
+Every process (e.g. each gunicorn worker) runs its own dispatcher and
+scheduler, so MAX_CONCURRENT is a per-process cap: a tenant can run up to
+MAX_CONCURRENT x the number of processes jobs at once.
+
+The scheduler is not thread-safe; JobDispatcher calls it under its lock.
+The exception is refresh(), which reads tenant configs and the cost
+rollups and is meant to run outside that lock; pop() then only reads what
+refresh() cached.
+
+Usage:
+    from api.services.scheduler import FairScheduler, Job, INTERACTIVE
+
+    scheduler = FairScheduler()
+    scheduler.push(Job(request_id=1, user_id=7, tenant_id='boss', lane=INTERACTIVE))
+    job = scheduler.pop()
+    ...
+    scheduler.finish(job)
+"""
+import logging
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+LANES = (INTERACTIVE, BULK)
+
+DEFAULT_POLICY = {
+    'WEIGHT': 1.0,
+    'MAX_CONCURRENT': None,
+    'DAILY_BUDGET_USD': None,
+}
+
+# How long a tenant's policy and spend are cached before refresh() loads them again
+POLICY_CACHE_SECONDS = 60
+SPEND_CACHE_SECONDS = 60
+
+
+@dataclass
+class Job:
+    """One queued visualization request."""
+    request_id: int
+    user_id: int
+    tenant_id: str
+    lane: str = INTERACTIVE
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _UserQueue:
+    virtual_time: float = 0.0
+    lanes: Dict[str, Deque[Job]] = field(default_factory=lambda: {lane: deque() for lane in LANES})
+
+
+@dataclass
+class _TenantQueue:
+    virtual_time: float = 0.0
+    # Virtual time of the last user served, for users that become backlogged
+    user_clock: float = 0.0
+    active: int = 0
+    users: 'OrderedDict[int, _UserQueue]' = field(default_factory=OrderedDict)
+
+    def queued(self, lane: Optional[str] = None) -> int:
+        lanes = [lane] if lane else LANES
+        return sum(len(user.lanes[name]) for user in self.users.values() for name in lanes)
+
+
+def get_tenant_policy(tenant_id: str) -> Dict[str, Any]:
+    """Scheduling policy of a tenant: DEFAULT_POLICY with the tenant's overrides."""
+    from api.tenants import get_tenant_config
+
+    return {**DEFAULT_POLICY, **(get_tenant_config(tenant_id).get_scheduling_policy() or {})}
+
+
+def get_tenant_spend_today(tenant_id: str) -> float:
+    """Gemini spend of a tenant since the start of the UTC day (USD)."""
+    from api.services.cost_ledger import get_tenant_cost
+
+    midnight = datetime.now(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return get_tenant_cost(tenant_id, since=midnight)
+
+
+class FairScheduler:
+    """Two-lane weighted fair queue over tenants, then users."""
+
+    def __init__(self, policy_for: Optional[Callable[[str], Dict[str, Any]]] = None,
+                 spend_for: Optional[Callable[[str], float]] = None):
+        """
+        Args:
+            policy_for: tenant_id -> policy dict (defaults to get_tenant_policy)
+            spend_for: tenant_id -> spend today in USD (defaults to get_tenant_spend_today)
+        """
+        self._policy_for = policy_for or get_tenant_policy
+        self._spend_for = spend_for or get_tenant_spend_today
+        self._tenants: 'OrderedDict[str, _TenantQueue]' = OrderedDict()
+        # Virtual time of the last tenant served, for tenants that become backlogged
+        self._clock = 0.0
+        # tenant_id -> (value, monotonic time loaded), filled by refresh()
+        self._policy_cache: Dict[str, tuple] = {}
+        self._spend_cache: Dict[str, tuple] = {}
+
+    def tenant_ids(self) -> List[str]:
+        """Tenants with queued or running jobs."""
+        return list(self._tenants)
+
+    def refresh(self, tenant_ids: Iterable[str]):
+        """
+        Load the policy and (for tenants with a budget) the spend of tenants
+        whose cached values are missing or stale.
+
+        Safe to call without the dispatcher lock, and meant to be: it reads
+        tenant configs and aggregates the cost rollups.
+        """
+        now = time.monotonic()
+        for tenant_id in tenant_ids:
+            cached = self._policy_cache.get(tenant_id)
+            if cached is None or now - cached[1] > POLICY_CACHE_SECONDS:
+                self._policy_cache[tenant_id] = (self._policy_for(tenant_id), now)
+            budget = self._policy_cache[tenant_id][0].get('DAILY_BUDGET_USD')
+            cached = self._spend_cache.get(tenant_id)
+            if budget is not None and (cached is None or now - cached[1] > SPEND_CACHE_SECONDS):
+                self._spend_cache[tenant_id] = (self._load_spend(tenant_id, budget), now)
+
+    def push(self, job: Job):
+        """Queue a job in its tenant, user and lane."""
+        tenant = self._tenants.setdefault(job.tenant_id, _TenantQueue())
+        if not tenant.queued():
+            # An idle tenant rejoins at the current virtual time instead of with saved-up credit
+            tenant.virtual_time = max(tenant.virtual_time, self._clock)
+        user = tenant.users.get(job.user_id)
+        if user is None:
+            user = tenant.users[job.user_id] = _UserQueue(virtual_time=tenant.user_clock)
+        user.lanes[job.lane].append(job)
+
+    def pop(self) -> Optional[Job]:
+        """Take the next job to run, or None if no tenant with queued jobs may start one now."""
+        for lane in LANES:
+            candidates = [
+                (tenant_id, tenant) for tenant_id, tenant in self._tenants.items()
+                if tenant.queued(lane) and self._may_start(tenant_id, tenant)
+            ]
+            if not candidates:
+                continue
+            tenant_id, tenant = min(candidates, key=lambda candidate: candidate[1].virtual_time)
+            user_id, user = min(
+                ((user_id, user) for user_id, user in tenant.users.items() if user.lanes[lane]),
+                key=lambda candidate: candidate[1].virtual_time
+            )
+
+            job = user.lanes[lane].popleft()
+            weight = max(float(self._policy(tenant_id).get('WEIGHT') or 1.0), 0.01)
+            self._clock = tenant.virtual_time
+            tenant.virtual_time += 1.0 / weight
+            tenant.user_clock = user.virtual_time
+            user.virtual_time += 1.0
+            tenant.active += 1
+            if not any(user.lanes.values()):
+                del tenant.users[user_id]
+            return job
+        return None
+
+    def finish(self, job: Job):
+        """Release the tenant's concurrency slot held by a popped job."""
+        tenant = self._tenants.get(job.tenant_id)
+        if tenant is not None:
+            tenant.active = max(0, tenant.active - 1)
+
+    def _may_start(self, tenant_id: str, tenant: _TenantQueue) -> bool:
+        policy = self._policy(tenant_id)
+        max_concurrent = policy.get('MAX_CONCURRENT')
+        if max_concurrent is not None and tenant.active >= max_concurrent:
+            return False
+        budget = policy.get('DAILY_BUDGET_USD')
+        if budget is not None and self._spend(tenant_id, budget) >= budget:
+            return False
+        return True
+
+    def _policy(self, tenant_id: str) -> Dict[str, Any]:
+        """Cached policy; loaded here only if refresh() has not seen the tenant yet."""
+        cached = self._policy_cache.get(tenant_id)
+        if cached is None:
+            cached = self._policy_cache[tenant_id] = (self._policy_for(tenant_id), time.monotonic())
+        return cached[0]
+
+    def _spend(self, tenant_id: str, budget: float) -> float:
+        """Cached spend; loaded here only if refresh() has not seen the tenant yet."""
+        cached = self._spend_cache.get(tenant_id)
+        if cached is None:
+            cached = self._spend_cache[tenant_id] = (self._load_spend(tenant_id, budget), time.monotonic())
+        return cached[0]
+
+    def _load_spend(self, tenant_id: str, budget: float) -> float:
+        try:
+            spend = self._spend_for(tenant_id)
+        except Exception as e:
+            # Without spend data the budget cannot be enforced; do not stall the tenant
+            logger.error(f"Could not read spend for tenant {tenant_id}: {e}")
+            return 0.0
+        if spend >= budget:
+            logger.warning(f"Tenant {tenant_id} reached its daily budget (${spend:.2f}); jobs will wait")
+        return spend
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        """Queued jobs per lane and running jobs, per tenant."""
+        return {
+            tenant_id: {
+                'queued': {lane: tenant.queued(lane) for lane in LANES},
+                'active': tenant.active,
+            }
+            for tenant_id, tenant in self._tenants.items()
+        }
@@ -1,13 +1,23 @@
 """
 Tenant Registry - Central point for tenant configuration resolution.
 
+The tenant of the current request is held in a context variable, set by
+TenantMiddleware (api/tenants/middleware.py) for web requests and by
+tenant_context() for background jobs. settings.ACTIVE_TENANT is only the
+fallback when nothing has been resolved.
+
 Usage:
-    from api.tenants import get_tenant_config, get_tenant_prompts
+    from api.tenants import get_tenant_config, get_tenant_prompts, tenant_context
     
-    config = get_tenant_config()  # Returns active tenant config
-    prompts = get_tenant_prompts()  # Returns active tenant prompts module
+    config = get_tenant_config()  # Returns the current request's tenant config
+    prompts = get_tenant_prompts()  # Returns the current tenant's prompts module
+
+    with tenant_context('pools'):
+        config = get_tenant_config()  # PoolsTenantConfig
 """
+import contextvars
 import logging
+from contextlib import contextmanager
 from typing import Optional, Dict
 from django.conf import settings
 
@@ -22,9 +32,14 @@ logger = logging.getLogger(__name__)
 # Registry of all available tenants
 _TENANT_REGISTRY: Dict[str, BaseTenantConfig] = {}
 
-# Cached active tenant
+# Cached fallback tenant (settings.ACTIVE_TENANT)
 _active_tenant: Optional[BaseTenantConfig] = None
 
+# Tenant resolved for the current request or job
+_current_tenant: contextvars.ContextVar[Optional[BaseTenantConfig]] = contextvars.ContextVar(
+    'current_tenant', default=None
+)
+
 
 def register_tenant(config: BaseTenantConfig) -> None:
     """Register a tenant configuration."""
@@ -37,7 +52,8 @@ def get_tenant_config(tenant_id: Optional[str] = None) -> BaseTenantConfig:
     Get tenant configuration.
     
     Args:
-        tenant_id: Specific tenant ID, or None for active/default tenant
+        tenant_id: Specific tenant ID, or None for the current request's tenant
+                   (falling back to settings.ACTIVE_TENANT)
         
     Returns:
         BaseTenantConfig instance
@@ -45,13 +61,22 @@ def get_tenant_config(tenant_id: Optional[str] = None) -> BaseTenantConfig:
     Raises:
         ValueError: If tenant not found
     """
-    global _active_tenant
-    
     if tenant_id:
         if tenant_id not in _TENANT_REGISTRY:
             raise ValueError(f"Unknown tenant: {tenant_id}")
         return _TENANT_REGISTRY[tenant_id]
-    
+
+    current = _current_tenant.get()
+    if current:
+        return current
+
+    return get_default_tenant_config()
+
+
+def get_default_tenant_config() -> BaseTenantConfig:
+    """The fallback tenant (settings.ACTIVE_TENANT), whatever the current request's tenant is."""
+    global _active_tenant
+
     # Return cached active tenant
     if _active_tenant:
         return _active_tenant
@@ -67,6 +92,28 @@ def get_tenant_config(tenant_id: Optional[str] = None) -> BaseTenantConfig:
     return _active_tenant
 
 
+@contextmanager
+def tenant_context(tenant_id: Optional[str]):
+    """
+    Make a tenant current for the enclosed block.
+
+    Threads started with contextvars.copy_context() inherit it. A falsy
+    tenant_id leaves the current tenant unchanged.
+
+    Raises:
+        ValueError: If tenant not found
+    """
+    if not tenant_id:
+        yield get_tenant_config()
+        return
+    config = get_tenant_config(tenant_id)
+    token = _current_tenant.set(config)
+    try:
+        yield config
+    finally:
+        _current_tenant.reset(token)
+
+
 def get_tenant_prompts(tenant_id: Optional[str] = None):
     """Get prompts module for tenant."""
     config = get_tenant_config(tenant_id)
@@ -79,9 +126,13 @@ def get_all_tenants() -> Dict[str, BaseTenantConfig]:
 
 
 def clear_cache() -> None:
-    """Clear cached active tenant (for testing)."""
+    """Clear cached active tenant and compiled snapshots (for testing)."""
+    from .snapshot import invalidate_snapshots
+
     global _active_tenant
     _active_tenant = None
+    _current_tenant.set(None)
+    invalidate_snapshots()
 
 
 # Auto-register tenants on module load
@@ -1,7 +1,7 @@
 """Abstract base class for tenant configurations."""
 import warnings
 from abc import ABC, abstractmethod
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
 
 
 class BaseTenantConfig(ABC):
@@ -52,11 +52,22 @@ class BaseTenantConfig(ABC):
         Returns list of (value, label) tuples for backwards compatibility
         with legacy choice methods.
         """
-        for category in self.get_product_schema():
-            if category.get('key') == category_key:
-                options = category.get('options', [])
-                return [(opt['value'], opt['label']) for opt in options]
-        return []
+        return list(self.snapshot.get_options(category_key))
+
+    def is_valid_choice(self, category_key: str, value: str) -> bool:
+        """Whether value is an option of a product schema category."""
+        return self.snapshot.is_valid_choice(category_key, value)
+
+    @property
+    def snapshot(self):
+        """
+        Compiled, read-only view of this config merged with its TenantConfig row.
+
+        Runtime lookups (steps, options, valid choices) should go through the
+        snapshot; see api/tenants/snapshot.py.
+        """
+        from .snapshot import get_snapshot
+        return get_snapshot(self)
     
     # =========================================================================
     # DEPRECATED: Legacy choice methods - use get_product_schema() instead
@@ -141,5 +152,92 @@ class BaseTenantConfig(ABC):
             - scope_key: (for insertion) e.g. 'patio'
             - progress_weight: (optional) int 0-100
             - description: (optional) for progress updates
+            - timeout_seconds: (optional) time budget per model call
+            - hedge: (optional) race a second request once a call passes p95 latency
+            - escalate: (optional, quality_check) 'auto', 'always' or 'never' call the model
+            - quality_thresholds: (optional, quality_check) overrides for the local thresholds
+            - reference_category: (optional, insertion) only attach reference photos of this category
+            - stream: (optional) stream the edit response (default settings.GEMINI_STREAMING['ENABLED'])
+            - thinking_budget: (optional) cap on thinking tokens per edit call, 0 for no thinking
+              (raised to the model's minimum on models that always think, e.g. Pro)
+            - include_thoughts: (optional) return thought summaries for the thinking log (default True)
+            - dimensional_analysis: (optional, insertion) parse the opening measurements the prompt asks for
         """
         pass
+
+    # =========================================================================
+    # Operational settings - optional overrides
+    # =========================================================================
+
+    def get_debug_artifact_sample_rate(self) -> Optional[float]:
+        """
+        Fraction of jobs (0.0-1.0) that write pipeline debug artifacts.
+
+        Returns None to use settings.DEBUG_ARTIFACTS['SAMPLE_RATE'].
+        """
+        return None
+
+    def get_job_sla_seconds(self) -> Optional[float]:
+        """
+        End-to-end time budget for one visualization pipeline run.
+
+        Returns None to use settings.PIPELINE_DEADLINES['JOB_SLA_SECONDS'].
+        """
+        return None
+
+    def get_quality_gate(self) -> Optional[Dict[str, Any]]:
+        """
+        Overrides for the upload quality gate run before any model call.
+
+        Keys as in settings.QUALITY_GATE (ENABLED, MIN_SHARPNESS,
+        MIN_BRIGHTNESS, MAX_CLIPPED). Returns None to use settings.
+        """
+        return None
+
+    def get_refinement_policy(self) -> Optional[Dict[str, Any]]:
+        """
+        Overrides for quality recovery of low scoring results.
+
+        Keys as in settings.QUALITY_REFINEMENT (ENABLED, MIN_SCORE,
+        TARGET_SCORE, MAX_ATTEMPTS, MAX_EXTRA_CALLS). Returns None to use
+        settings.
+        """
+        return None
+
+    def get_scheduling_policy(self) -> Optional[Dict[str, Any]]:
+        """
+        Share of the background job workers for this tenant.
+
+        Keys: WEIGHT (relative share when tenants compete), MAX_CONCURRENT
+        (jobs running at once per process, so times the gunicorn worker
+        count overall) and DAILY_BUDGET_USD (Gemini spend per UTC
+        day after which jobs wait). Returns None for the defaults in
+        api/services/scheduler.py.
+        """
+        return None
+
+    def get_max_variations(self) -> int:
+        """Maximum option sets (variations) one visualization request may carry."""
+        return 6
+
+    def get_model_policy(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Ordered model routes per pipeline step type, used by the model router.
+
+        The first healthy route is used; later routes are failovers. A step
+        config can override this with its own 'models' list.
+        """
+        return {
+            'cleanup': [
+                {'provider': 'gemini', 'model': 'gemini-2.5-flash-image', 'include_thoughts': False},
+                {'provider': 'gemini', 'model': 'gemini-3-pro-image-preview'},
+            ],
+            'insertion': [
+                {'provider': 'gemini', 'model': 'gemini-3-pro-image-preview'},
+                {'provider': 'gemini', 'model': 'gemini-2.5-flash-image', 'include_thoughts': False},
+            ],
+            'quality_check': [
+                {'provider': 'gemini', 'model': 'gemini-2.5-flash'},
+                {'provider': 'gemini', 'model': 'gemini-3-pro-image-preview'},
+            ],
+        }
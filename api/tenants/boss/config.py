@@ -37,11 +37,11 @@ class BossTenantConfig(BaseTenantConfig):
                 "type": "select",
                 "required": True,
                 "options": [
-                    {"value": "black", "label": "Black"},
-                    {"value": "dark_bronze", "label": "Dark Bronze"},
-                    {"value": "stucco", "label": "Stucco"},
-                    {"value": "white", "label": "White"},
-                    {"value": "almond", "label": "Almond"},
+                    {"value": "black", "label": "Black", "hex": "#1c1c1c"},
+                    {"value": "dark_bronze", "label": "Dark Bronze", "hex": "#3d3128"},
+                    {"value": "stucco", "label": "Stucco", "hex": "#c9b99b"},
+                    {"value": "white", "label": "White", "hex": "#f1f1ef"},
+                    {"value": "almond", "label": "Almond", "hex": "#e4d9c1"},
                 ]
             },
             {
@@ -50,9 +50,9 @@ class BossTenantConfig(BaseTenantConfig):
                 "type": "select",
                 "required": True,
                 "options": [
-                    {"value": "black", "label": "Black (Recommended)"},
-                    {"value": "stucco", "label": "Stucco"},
-                    {"value": "bronze", "label": "Bronze"},
+                    {"value": "black", "label": "Black (Recommended)", "hex": "#1c1c1c"},
+                    {"value": "stucco", "label": "Stucco", "hex": "#c9b99b"},
+                    {"value": "bronze", "label": "Bronze", "hex": "#5a4632"},
                 ]
             },
         ]
@@ -70,20 +70,29 @@ class BossTenantConfig(BaseTenantConfig):
             'cleanup': {
                 'type': 'cleanup',
                 'description': 'Cleaning',
-                'progress_weight': 30
+                'timeout_seconds': 90,
+                'progress_weight': 30,
+                # Object removal needs no reasoning
+                'thinking_budget': 0,
+                'include_thoughts': False
             },
             'patio': {
                 'type': 'insertion',
                 'feature_name': 'patio enclosure',
                 'scope_key': 'patio',
                 'description': 'Building Patio',
-                'progress_weight': 50
+                'timeout_seconds': 120,
+                'progress_weight': 50,
+                # Enough for the dimensional analysis in the patio prompt
+                'thinking_budget': 4096,
+                'dimensional_analysis': True
             },
             'windows': {
                 'type': 'insertion',
                 'feature_name': 'windows',
                 'scope_key': 'windows',
                 'description': 'Building Windows',
+                'timeout_seconds': 120,
                 'progress_weight': 60
             },
             'doors': {
@@ -91,11 +100,13 @@ class BossTenantConfig(BaseTenantConfig):
                 'feature_name': 'entry doors',
                 'scope_key': 'doors',
                 'description': 'Building Doors',
+                'timeout_seconds': 120,
                 'progress_weight': 70
             },
             'quality_check': {
                 'type': 'quality_check',
                 'description': 'Checking Quality',
+                'timeout_seconds': 45,
                 'progress_weight': 90
             }
         }
@@ -0,0 +1,115 @@
+"""
+Tenant Middleware - Resolves the tenant of each request.
+
+The first of these that names a registered tenant wins:
+    1. API key        X-API-Key header, looked up in TENANT_RESOLUTION['API_KEYS']
+    2. JWT claim      TENANT_RESOLUTION['JWT_CLAIM'] of a valid Bearer access token
+    3. Host header    looked up in TENANT_RESOLUTION['HOSTS']
+Otherwise settings.ACTIVE_TENANT applies. Publicly cached documents (see
+api/views_config.py) use resolve_public_tenant_id(), which skips the JWT.
+
+The tenant is made current (see api.tenants.tenant_context) for the rest of
+the request, so get_tenant_config() in views, serializers, prompts and the
+PDF generator returns it, and is also set as request.tenant.
+"""
+import logging
+from typing import Optional
+
+from django.conf import settings
+
+from . import get_all_tenants, tenant_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JWT_CLAIM = 'tenant'
+
+# Request headers resolve_public_tenant_id() reads
+PUBLIC_TENANT_HEADERS = ('Host', 'X-API-Key')
+
+
+def _resolution_settings() -> dict:
+    return getattr(settings, 'TENANT_RESOLUTION', {}) or {}
+
+
+def get_tenant_claim() -> str:
+    """Name of the JWT claim that carries the tenant ID."""
+    return _resolution_settings().get('JWT_CLAIM') or DEFAULT_JWT_CLAIM
+
+
+def _tenant_from_api_key(request) -> Optional[str]:
+    api_key = request.META.get('HTTP_X_API_KEY')
+    if not api_key:
+        return None
+    return (_resolution_settings().get('API_KEYS') or {}).get(api_key)
+
+
+def _tenant_from_jwt(request) -> Optional[str]:
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    parts = header.split()
+    if len(parts) != 2 or parts[0] != 'Bearer':
+        return None
+
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    try:
+        token = AccessToken(parts[1])
+    except TokenError:
+        # Authentication rejects the token later; it names no tenant
+        return None
+    return token.get(get_tenant_claim())
+
+
+def _tenant_from_host(request) -> Optional[str]:
+    hosts = _resolution_settings().get('HOSTS') or {}
+    if not hosts:
+        return None
+    host = request.META.get('HTTP_HOST', '').rsplit(':', 1)[0].lower()
+    return hosts.get(host)
+
+
+def resolve_tenant_id(request) -> Optional[str]:
+    """
+    Tenant ID named by the request's API key, JWT claim or host.
+
+    Returns:
+        Registered tenant ID, or None to use the default tenant
+    """
+    return _resolve(request, (_tenant_from_api_key, _tenant_from_jwt, _tenant_from_host))
+
+
+def resolve_public_tenant_id(request) -> Optional[str]:
+    """
+    Tenant ID named by the request's API key or host, ignoring any JWT.
+
+    For shared-cacheable responses, which may only depend on the headers
+    they vary on (PUBLIC_TENANT_HEADERS).
+
+    Returns:
+        Registered tenant ID, or None to use the default tenant
+    """
+    return _resolve(request, (_tenant_from_api_key, _tenant_from_host))
+
+
+def _resolve(request, sources) -> Optional[str]:
+    registered = get_all_tenants()
+    for source in sources:
+        tenant_id = source(request)
+        if not tenant_id:
+            continue
+        if tenant_id in registered:
+            return tenant_id
+        logger.warning(f"Ignoring unknown tenant '{tenant_id}' from {source.__name__}")
+    return None
+
+
+class TenantMiddleware:
+    """Makes the resolved tenant current for the duration of each request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with tenant_context(resolve_tenant_id(request)) as config:
+            request.tenant = config
+            return self.get_response(request)
@@ -0,0 +1,237 @@
+"""
+Tenant Snapshots - Compiled, immutable tenant configuration for runtime lookups.
+
+A snapshot merges a tenant's code config (api/tenants/{tenant}/config.py)
+with its TenantConfig row (written by `manage.py sync_tenant_config`), and
+indexes it once: step configs by name, options by category and the set of
+valid values per category, so lookups are O(1).
+
+Snapshots are cached per process. Each process re-reads the TenantConfig
+version stamps at most every TENANT_CONFIG['RELOAD_SECONDS'] and recompiles
+a tenant whose row changed, so a sync reaches every worker without a
+redeploy. Without a row (or without a database) the code config is used,
+with config_version 0.
+
+Usage:
+    from api.tenants import get_tenant_config
+
+    snapshot = get_tenant_config().snapshot
+    snapshot.get_step_config('windows')
+    snapshot.is_valid_choice('frame_color', 'black')
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Mapping, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds between version checks when settings.TENANT_CONFIG sets no RELOAD_SECONDS
+DEFAULT_RELOAD_SECONDS = 5
+
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+
+def _freeze(value: Any) -> Any:
+    """Read-only copy of JSON-like data: dicts become mapping proxies, lists tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@dataclass(frozen=True)
+class TenantSnapshot:
+    """One compiled version of a tenant's configuration."""
+    tenant_id: str
+    display_name: str
+    config_version: int
+    product_schema: Tuple[Mapping[str, Any], ...]
+    pipeline_steps: Tuple[str, ...]
+    step_configs: Mapping[str, Mapping[str, Any]]
+    branding: Mapping[str, Any]
+    # Derived indexes
+    categories: Mapping[str, Mapping[str, Any]]
+    options: Mapping[str, Tuple[Tuple[str, str], ...]]
+    valid_choices: Mapping[str, FrozenSet[str]]
+    # Row stamp the snapshot was compiled from; None for code-only snapshots
+    stamp: Optional[Tuple[Any, ...]] = None
+
+    def get_step_config(self, step_name: str) -> Mapping[str, Any]:
+        return self.step_configs.get(step_name, _EMPTY)
+
+    def get_category(self, category_key: str) -> Optional[Mapping[str, Any]]:
+        return self.categories.get(category_key)
+
+    def get_options(self, category_key: str) -> Tuple[Tuple[str, str], ...]:
+        """(value, label) pairs of a product schema category."""
+        return self.options.get(category_key, ())
+
+    def is_valid_choice(self, category_key: str, value: str) -> bool:
+        return value in self.valid_choices.get(category_key, frozenset())
+
+
+def compile_snapshot(config, row=None) -> TenantSnapshot:
+    """
+    Compile a tenant's code config, overridden by its TenantConfig row if given.
+
+    Args:
+        config: BaseTenantConfig of the tenant
+        row: TenantConfig instance; its step configs are merged per step over the code ones
+    """
+    pipeline_steps = list(row.pipeline_steps) if row and row.pipeline_steps else config.get_pipeline_steps()
+    product_schema = row.product_categories if row and row.product_categories else config.get_product_schema()
+
+    row_steps = (row.step_configs or {}) if row else {}
+    step_configs = {
+        name: {**config.get_step_config(name), **(row_steps.get(name) or {})}
+        for name in dict.fromkeys([*pipeline_steps, *row_steps])
+    }
+
+    categories = {category['key']: category for category in product_schema if category.get('key')}
+    options = {
+        key: tuple((option['value'], option['label']) for option in category.get('options', []))
+        for key, category in categories.items()
+    }
+
+    return TenantSnapshot(
+        tenant_id=config.tenant_id,
+        display_name=(row.display_name if row and row.display_name else config.display_name),
+        config_version=row.config_version if row else 0,
+        product_schema=_freeze(product_schema),
+        pipeline_steps=tuple(pipeline_steps),
+        step_configs=_freeze(step_configs),
+        branding=_freeze((row.branding or {}) if row else {}),
+        categories=_freeze(categories),
+        options=MappingProxyType(options),
+        valid_choices=MappingProxyType({key: frozenset(value for value, _ in pairs) for key, pairs in options.items()}),
+        stamp=_row_stamp(row) if row else None,
+    )
+
+
+def _row_stamp(row) -> Tuple[Any, ...]:
+    return (row.config_version, row.synced_from_yaml_at)
+
+
+class SnapshotCache:
+    """
+    Per-process snapshots, recompiled when a tenant's TenantConfig row changes.
+
+    The version check queries the database outside the lock, so a slow
+    database delays only the request thread that runs the check; the others
+    keep using the compiled snapshots. Until the first check has completed,
+    every caller runs it, so no request sees the code config in place of a
+    synced row.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, TenantSnapshot] = {}
+        self._rows: Dict[str, Any] = {}
+        self._stamps: Dict[str, Tuple[Any, ...]] = {}
+        self._checked_at: Optional[float] = None
+        self._loaded = False
+        # Bumped whenever the stamps change; results of checks started before are discarded
+        self._generation = 0
+
+    @staticmethod
+    def _reload_seconds() -> float:
+        return (getattr(settings, 'TENANT_CONFIG', {}) or {}).get('RELOAD_SECONDS', DEFAULT_RELOAD_SECONDS)
+
+    def get(self, config) -> TenantSnapshot:
+        """Current snapshot of a tenant (config is its BaseTenantConfig)."""
+        with self._lock:
+            now = time.monotonic()
+            due = self._checked_at is None or now - self._checked_at >= self._reload_seconds()
+            if due:
+                # Claim the check so other threads keep serving compiled snapshots meanwhile
+                self._checked_at = now
+            check = due or not self._loaded
+            stamps, generation = self._stamps, self._generation
+
+        if check:
+            versions = self._read_versions(stamps)
+            with self._lock:
+                if versions is None:
+                    # Nothing to wait for until the next check
+                    self._loaded = True
+                elif generation == self._generation:
+                    self._apply_versions(*versions)
+
+        with self._lock:
+            snapshot = self._snapshots.get(config.tenant_id)
+            if snapshot is None:
+                snapshot = self._snapshots[config.tenant_id] = compile_snapshot(
+                    config, self._rows.get(config.tenant_id)
+                )
+                logger.info(f"Compiled tenant config {config.tenant_id} v{snapshot.config_version}")
+            return snapshot
+
+    @staticmethod
+    def _read_versions(known_stamps: Dict[str, Tuple[Any, ...]]):
+        """
+        One query for all version stamps, and one for the rows that changed.
+
+        Returns:
+            (stamps, changed tenant IDs, changed rows by tenant ID), or None
+            when the database cannot be read
+        """
+        from api.models import TenantConfig
+
+        try:
+            stamps = {
+                row['tenant_id']: (row['config_version'], row['synced_from_yaml_at'])
+                for row in TenantConfig.objects.values('tenant_id', 'config_version', 'synced_from_yaml_at')
+            }
+            changed = {
+                tenant_id for tenant_id in stamps.keys() | known_stamps.keys()
+                if stamps.get(tenant_id) != known_stamps.get(tenant_id)
+            }
+            rows = {row.tenant_id: row for row in TenantConfig.objects.filter(tenant_id__in=changed)} if changed else {}
+        except Exception as e:
+            # No table yet, or no database access here: keep what is compiled
+            logger.debug(f"Could not check tenant config versions: {e}")
+            return None
+        return stamps, changed, rows
+
+    def _apply_versions(self, stamps, changed, rows):
+        """Swap in the result of _read_versions; drops snapshots whose row changed (lock held)."""
+        for tenant_id in changed:
+            if tenant_id in rows:
+                self._rows[tenant_id] = rows[tenant_id]
+            else:
+                self._rows.pop(tenant_id, None)
+            self._snapshots.pop(tenant_id, None)
+        self._stamps = stamps
+        self._loaded = True
+        if changed:
+            self._generation += 1
+
+    def invalidate(self):
+        """Recompile every tenant on next access, re-reading the version stamps."""
+        with self._lock:
+            self._snapshots.clear()
+            self._rows.clear()
+            self._stamps = {}
+            self._checked_at = None
+            self._loaded = False
+            self._generation += 1
+
+
+# Global instance
+snapshot_cache = SnapshotCache()
+
+
+def get_snapshot(config) -> TenantSnapshot:
+    """Current snapshot of a tenant; see BaseTenantConfig.snapshot."""
+    return snapshot_cache.get(config)
+
+
+def invalidate_snapshots():
+    """Drop all compiled snapshots in this process (e.g. after a sync)."""
+    snapshot_cache.invalidate()
@@ -0,0 +1,115 @@
+"""
+Tests for api/visualizer/artifacts.py
+"""
+import os
+import queue
+import tempfile
+import zipfile
+from unittest.mock import Mock
+
+from PIL import Image
+
+from api.visualizer.artifacts import DebugArtifactWriter
+
+
+def make_writer(root, **overrides):
+    options = {
+        'ENABLED': True,
+        'SAMPLE_RATE': 1.0,
+        'MAX_QUEUE_SIZE': 16,
+        'MAX_DIR_BYTES': 10 * 1024 * 1024,
+        'BUNDLE_PER_JOB': False,
+        'BUNDLE_DIR': 'pipeline_bundles',
+    }
+    options.update(overrides)
+    return DebugArtifactWriter(root=root, options=options)
+
+
+class TestSampling:
+    """Tests for per-tenant sampling."""
+
+    def test_disabled_never_samples(self):
+        writer = make_writer('/tmp', ENABLED=False)
+        assert writer.should_sample() is False
+
+    def test_tenant_rate_overrides_default(self):
+        writer = make_writer('/tmp', SAMPLE_RATE=1.0)
+        tenant = Mock()
+        tenant.get_debug_artifact_sample_rate.return_value = 0.0
+        assert writer.should_sample(tenant) is False
+
+    def test_tenant_without_rate_uses_default(self):
+        writer = make_writer('/tmp', SAMPLE_RATE=0.0)
+        tenant = Mock()
+        tenant.get_debug_artifact_sample_rate.return_value = None
+        assert writer.should_sample(tenant) is False
+
+
+class TestWriting:
+    """Tests for background writes, retention and bundles."""
+
+    def test_writes_image_and_text(self):
+        with tempfile.TemporaryDirectory() as root:
+            writer = make_writer(root)
+            writer.submit_image(Image.new('RGBA', (10, 10)), 'pipeline_steps', 'step.jpg')
+            writer.submit_text('thinking', 'thinking_logs', 'log.txt')
+            writer.flush(timeout=5)
+
+            assert os.path.exists(os.path.join(root, 'pipeline_steps', 'step.jpg'))
+            with open(os.path.join(root, 'thinking_logs', 'log.txt')) as f:
+                assert f.read() == 'thinking'
+
+    def test_appended_text_grows_one_file(self):
+        with tempfile.TemporaryDirectory() as root:
+            writer = make_writer(root, BUNDLE_PER_JOB=True)
+            writer.append_text('first ', 'thinking_logs', 'log.txt', job_id='7')
+            writer.append_text('second', 'thinking_logs', 'log.txt', job_id='7')
+            writer.flush(timeout=5)
+
+            with open(os.path.join(root, 'thinking_logs', 'log.txt')) as f:
+                assert f.read() == 'first second'
+            assert writer._job_files['7'] == {os.path.join(root, 'thinking_logs', 'log.txt')}
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        writer = make_writer('/tmp', MAX_QUEUE_SIZE=1)
+        writer._ensure_started = Mock()  # No worker, so the queue never drains
+        writer._queue = queue.Queue(maxsize=1)
+
+        assert writer.submit_text('a', 'thinking_logs', 'a.txt') is True
+        assert writer.submit_text('b', 'thinking_logs', 'b.txt') is False
+        assert writer.dropped_count == 1
+
+    def test_prunes_oldest_files_over_budget(self):
+        with tempfile.TemporaryDirectory() as root:
+            writer = make_writer(root, MAX_DIR_BYTES=250)
+            for i in range(5):
+                writer.submit_text('x' * 100, 'thinking_logs', f'log_{i}.txt')
+                writer.flush(timeout=5)
+
+            remaining = sorted(os.listdir(os.path.join(root, 'thinking_logs')))
+            assert 'log_4.txt' in remaining
+            assert 'log_0.txt' not in remaining
+            assert len(remaining) <= 2
+
+    def test_bundle_per_job(self):
+        with tempfile.TemporaryDirectory() as root:
+            writer = make_writer(root, BUNDLE_PER_JOB=True)
+            writer.submit_text('a', 'thinking_logs', 'a.txt', job_id='42')
+            writer.submit_image(Image.new('RGB', (10, 10)), 'pipeline_steps', 'b.jpg', job_id='42')
+            writer.finalize_job('42')
+            writer.flush(timeout=5)
+
+            bundles = os.listdir(os.path.join(root, 'pipeline_bundles'))
+            assert len(bundles) == 1
+            with zipfile.ZipFile(os.path.join(root, 'pipeline_bundles', bundles[0])) as bundle:
+                assert sorted(bundle.namelist()) == ['pipeline_steps/b.jpg', 'thinking_logs/a.txt']
+            assert not os.path.exists(os.path.join(root, 'thinking_logs', 'a.txt'))
+
+    def test_job_files_are_released_without_bundles(self):
+        with tempfile.TemporaryDirectory() as root:
+            writer = make_writer(root)
+            writer.submit_text('a', 'thinking_logs', 'a.txt', job_id='42')
+            writer.flush(timeout=5)
+            writer.finalize_job('42')
+
+            assert '42' not in writer._job_files
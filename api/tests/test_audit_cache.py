@@ -0,0 +1,102 @@
+"""
+Tests for the audit result cache in AuditService.perform_audit.
+"""
+import io
+import os
+from dataclasses import replace
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.ai_services.structured_output import AuditFindings, Vulnerability
+from api.audit.models import AuditReport
+from api.audit.services import AuditService
+from api.models import VisualizationRequest
+
+AUDIT_RESULT = AuditFindings(
+    has_ground_level_access=True,
+    has_concealment=False,
+    has_glass_proximity=True,
+    has_hardware_weakness=False,
+    vulnerabilities=[Vulnerability('Ground Level Window', 'Reachable from the yard', 'High', 'Left window')],
+    analysis_summary='Two ground floor windows are reachable from the yard.',
+)
+
+
+def upload(color='tan', size=(1600, 1200)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile('house.png', buffer.getvalue(), content_type='image/png')
+
+
+class AuditCacheTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='pw')
+        with patch('api.audit.services.genai.Client'):
+            self.service = AuditService(api_key='fake_key')
+        self.service._call_gemini_json = MagicMock(return_value=AUDIT_RESULT)
+
+    def create_request(self, color='tan'):
+        return VisualizationRequest.objects.create(user=self.user, original_image=upload(color))
+
+    def test_audit_input_is_downsized(self):
+        report = self.service.perform_audit(self.create_request())
+
+        image = self.service._call_gemini_json.call_args.args[0]
+        self.assertEqual(image.size, (1024, 768))
+        self.assertTrue(report.has_ground_level_access)
+        self.assertEqual(len(report.input_digest), 64)
+
+    def test_identical_image_reuses_earlier_audit(self):
+        first = self.service.perform_audit(self.create_request())
+
+        second = self.service.perform_audit(self.create_request())
+
+        self.service._call_gemini_json.assert_called_once()
+        self.assertNotEqual(second.id, first.id)
+        self.assertEqual(second.vulnerabilities, first.vulnerabilities)
+        self.assertEqual(second.input_digest, first.input_digest)
+
+    def test_different_image_is_audited(self):
+        self.service.perform_audit(self.create_request())
+        self.service.perform_audit(self.create_request('navy'))
+        self.assertEqual(self.service._call_gemini_json.call_count, 2)
+
+    @override_settings(AUDIT={'CACHE': False})
+    def test_cache_can_be_disabled(self):
+        self.service.perform_audit(self.create_request())
+        self.service.perform_audit(self.create_request())
+        self.assertEqual(self.service._call_gemini_json.call_count, 2)
+
+    def test_refresh_reruns_and_overwrites_report(self):
+        request = self.create_request()
+        first = self.service.perform_audit(request)
+        self.service._call_gemini_json.return_value = replace(AUDIT_RESULT, has_concealment=True)
+
+        request.refresh_from_db()
+        refreshed = self.service.perform_audit(request, refresh=True)
+
+        self.assertEqual(self.service._call_gemini_json.call_count, 2)
+        self.assertEqual(refreshed.id, first.id)
+        self.assertTrue(refreshed.has_concealment)
+        self.assertEqual(AuditReport.objects.count(), 1)
+
+    def test_refresh_flag_on_generate_endpoint(self):
+        request = self.create_request()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with patch.dict(os.environ, {'GOOGLE_API_KEY': 'fake_key'}), \
+                patch('api.audit.services.genai.Client'), \
+                patch.object(AuditService, '_call_gemini_json', return_value=AUDIT_RESULT) as call:
+            client.post(f'/api/audit/{request.id}/generate/')
+            client.post(f'/api/audit/{request.id}/generate/')
+            response = client.post(f'/api/audit/{request.id}/generate/', {'refresh': True}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(call.call_count, 2)
@@ -0,0 +1,167 @@
+"""
+Tests for bulk submission (VisualizationBatch) and api/services/job_dispatcher.py.
+"""
+import io
+import json
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.models import VisualizationBatch, VisualizationRequest
+from api.services.job_dispatcher import JobDispatcher
+
+
+def png_upload(name='house.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'gray').save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class JobDispatcherTest(TestCase):
+
+    def test_workers_run_jobs(self):
+        done = []
+        waits = []
+        finished = threading.Event()
+
+        def runner(request_id, queue_wait_seconds):
+            done.append(request_id)
+            waits.append(queue_wait_seconds)
+            if len(done) == 3:
+                finished.set()
+
+        dispatcher = JobDispatcher(runner=runner, max_workers=2)
+        dispatcher.submit_many([1, 2, 3], user_id=1, tenant_id='boss')
+
+        self.assertTrue(finished.wait(5))
+        self.assertEqual(sorted(done), [1, 2, 3])
+        self.assertTrue(all(0 <= wait < 5 for wait in waits))
+
+
+class BatchEndpointTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='portfolio', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, data, format='multipart'):
+        with patch('api.views.job_dispatcher') as dispatcher:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/batches/', data, format=format)
+        return response, dispatcher
+
+    def test_multipart_batch(self):
+        response, dispatcher = self.post({
+            'name': 'Maple St portfolio',
+            'images': [png_upload(), png_upload(), png_upload()],
+            'defaults': json.dumps({'frame_color': 'white', 'screen_categories': ['Window']}),
+            'items': json.dumps([{}, {'frame_color': 'black'}, {}]),
+        })
+
+        self.assertEqual(response.status_code, 201, response.data)
+        batch = VisualizationBatch.objects.get(id=response.data['id'])
+        requests = list(batch.requests.order_by('id'))
+        self.assertEqual(len(requests), 3)
+        self.assertEqual([r.frame_color for r in requests], ['white', 'black', 'white'])
+        self.assertTrue(all(r.original_image.name.startswith(f'originals/{self.user.id}/') for r in requests))
+
+        dispatcher.submit_many.assert_called_once_with(
+            [r.id for r in requests], user_id=self.user.id, tenant_id='boss', lane='bulk'
+        )
+        self.assertEqual(response.data['progress']['pending'], 3)
+
+    def test_manifest_batch(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48)).save(buffer, format='JPEG')
+        key = default_storage.save(f'batch_uploads/{self.user.id}/house1.jpg', ContentFile(buffer.getvalue()))
+
+        response, _ = self.post({'items': [{'storage_key': key, 'mesh_choice': '10x10_standard'}]}, format='json')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        request = VisualizationRequest.objects.get(batch_id=response.data['id'])
+        self.assertEqual(request.original_image.name, key)
+        self.assertEqual(request.mesh_choice, '10x10_standard')
+
+    def test_errors_are_reported_per_item(self):
+        response, dispatcher = self.post({
+            'items': [
+                {'storage_key': f'batch_uploads/{self.user.id}/missing.jpg'},
+                {'storage_key': 'originals/1/someone_else.jpg'},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['items']), {0, 1})
+        self.assertFalse(VisualizationBatch.objects.exists())
+        dispatcher.submit_many.assert_not_called()
+
+    def test_stored_files_are_validated_like_uploads(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (9000, 10)).save(buffer, format='PNG')
+        oversized = default_storage.save(f'batch_uploads/{self.user.id}/wide.png', ContentFile(buffer.getvalue()))
+        not_an_image = default_storage.save(f'batch_uploads/{self.user.id}/notes.jpg', ContentFile(b'not an image'))
+
+        response, _ = self.post({'items': [{'storage_key': oversized}, {'storage_key': not_an_image}]}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('dimensions too large', str(response.data['items'][0]))
+        self.assertIn('Invalid image file', str(response.data['items'][1]))
+        self.assertFalse(VisualizationBatch.objects.exists())
+
+    def test_invalid_option_rejects_whole_batch(self):
+        response, _ = self.post({
+            'images': [png_upload(), png_upload()],
+            'items': json.dumps([{}, {'frame_color': 'neon'}]),
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('frame_color', str(response.data['items']))
+        self.assertFalse(VisualizationRequest.objects.exists())
+
+    def test_image_count_must_match_items(self):
+        response, _ = self.post({'images': [png_upload()], 'items': json.dumps([{}, {}])})
+        self.assertEqual(response.status_code, 400)
+
+    def test_progress(self):
+        batch = VisualizationBatch.objects.create(user=self.user, total_count=4)
+        for status, progress in [('complete', 100), ('failed', 0), ('processing', 50), ('pending', 0)]:
+            VisualizationRequest.objects.create(
+                user=self.user, batch=batch, status=status, progress_percentage=progress,
+                original_image=SimpleUploadedFile('test.jpg', b'fake', content_type='image/jpeg'),
+            )
+
+        response = self.client.get(f'/api/batches/{batch.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        progress = response.data['progress']
+        self.assertEqual((progress['complete'], progress['failed'], progress['processing']), (1, 1, 1))
+        self.assertEqual(progress['progress_percentage'], 62)
+        self.assertFalse(progress['is_finished'])
+
+    def test_other_users_batches_are_hidden(self):
+        other = User.objects.create_user(username='other', password='pw')
+        batch = VisualizationBatch.objects.create(user=other, total_count=0)
+        self.assertEqual(self.client.get(f'/api/batches/{batch.id}/').status_code, 404)
+
+
+class SingleRequestDispatchTest(TestCase):
+
+    def test_create_queues_job_on_commit(self):
+        user = User.objects.create_user(username='single', password='pw')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with patch('api.views.job_dispatcher') as dispatcher:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post('/api/visualizations/', {'original_image': png_upload()}, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        dispatcher.submit.assert_called_once_with(response.data['id'], user_id=user.id, tenant_id='boss')
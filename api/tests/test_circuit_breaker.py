@@ -0,0 +1,184 @@
+"""
+Tests for api/ai_services/circuit_breaker.py
+"""
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from api.ai_services.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    circuit_breakers,
+)
+from api.ai_services.routing import ModelRouter
+
+PRO = 'gemini-3-pro-image-preview'
+
+
+class APIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} error")
+        self.code = code
+
+
+@pytest.fixture(autouse=True)
+def reset_breakers():
+    circuit_breakers.reset()
+    yield
+    circuit_breakers.reset()
+
+
+class TestCircuitBreaker:
+    """Tests for breaker state transitions."""
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker('gemini/test', failure_threshold=3)
+        for _ in range(2):
+            breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.allow_request() is False
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker('gemini/test', failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.CLOSED
+
+    @patch('api.ai_services.circuit_breaker.time.monotonic')
+    def test_half_open_admits_single_trial(self, mock_time):
+        mock_time.return_value = 100.0
+        breaker = CircuitBreaker('gemini/test', failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+
+        mock_time.return_value = 131.0
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow_request() is True
+        assert breaker.allow_request() is False
+
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+
+    @patch('api.ai_services.circuit_breaker.time.monotonic')
+    def test_failed_trial_reopens(self, mock_time):
+        mock_time.return_value = 100.0
+        breaker = CircuitBreaker('gemini/test', failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+
+        mock_time.return_value = 131.0
+        assert breaker.allow_request() is True
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.get_status()['retry_in_seconds'] == 30
+
+    @patch('api.ai_services.circuit_breaker.time.monotonic')
+    def test_lost_trial_times_out(self, mock_time):
+        mock_time.return_value = 100.0
+        breaker = CircuitBreaker('gemini/test', failure_threshold=1, recovery_timeout=30, trial_timeout=60)
+        breaker.record_failure()
+
+        mock_time.return_value = 131.0
+        assert breaker.allow_request() is True
+        mock_time.return_value = 190.0
+        assert breaker.allow_request() is False
+        mock_time.return_value = 191.0
+        assert breaker.allow_request() is True
+
+    def test_provider_open_only_when_all_models_open(self):
+        for _ in range(circuit_breakers.failure_threshold):
+            circuit_breakers.get('gemini', PRO).record_failure()
+        circuit_breakers.get('gemini', 'gemini-2.5-flash')
+
+        assert circuit_breakers.is_open('gemini', PRO) is True
+        assert circuit_breakers.is_open('gemini') is False
+
+    def test_open_circuit_degrades_route(self):
+        router = ModelRouter()
+        for _ in range(circuit_breakers.failure_threshold):
+            circuit_breakers.get('gemini', PRO).record_failure()
+        assert router.is_degraded('gemini', PRO) is True
+
+
+class TestVisualizerBreaker:
+    """Tests for breaker checks around Gemini calls."""
+
+    def make_visualizer(self):
+        from api.visualizer.services import ScreenVisualizer
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        return visualizer
+
+    def test_rejects_call_when_open(self):
+        visualizer = self.make_visualizer()
+        for _ in range(circuit_breakers.failure_threshold):
+            circuit_breakers.get('gemini', PRO).record_failure()
+
+        with pytest.raises(CircuitOpenError):
+            visualizer._generate_with_retries(PRO, [], None, MagicMock(), max_retries=3)
+        visualizer.client.models.generate_content.assert_not_called()
+
+    @patch('api.visualizer.services.time.sleep')
+    def test_rate_limits_stop_retrying_once_open(self, mock_sleep):
+        visualizer = self.make_visualizer()
+        visualizer.client.models.generate_content.side_effect = APIError(429)
+
+        with pytest.raises(Exception):
+            visualizer._generate_with_retries(PRO, [], None, MagicMock(), max_retries=10)
+        assert visualizer.client.models.generate_content.call_count == circuit_breakers.failure_threshold
+
+    def test_client_errors_do_not_trip_breaker(self):
+        visualizer = self.make_visualizer()
+        visualizer.client.models.generate_content.side_effect = APIError(400)
+
+        for _ in range(circuit_breakers.failure_threshold):
+            with pytest.raises(Exception):
+                visualizer._generate_with_retries(PRO, [], None, MagicMock(), max_retries=1)
+        assert circuit_breakers.get('gemini', PRO).state == CircuitState.CLOSED
+
+    @patch('api.ai_services.circuit_breaker.time.monotonic')
+    def test_client_error_during_half_open_trial_releases_it(self, mock_time):
+        visualizer = self.make_visualizer()
+        mock_time.return_value = 100.0
+        breaker = circuit_breakers.get('gemini', PRO)
+        for _ in range(circuit_breakers.failure_threshold):
+            breaker.record_failure()
+        mock_time.return_value = 100.0 + breaker.recovery_timeout
+        visualizer.client.models.generate_content.side_effect = APIError(400)
+
+        with pytest.raises(APIError):
+            visualizer._generate_with_retries(PRO, [], None, MagicMock(), max_retries=1)
+
+        assert breaker.state == CircuitState.HALF_OPEN
+        visualizer.client.models.generate_content.side_effect = None
+        visualizer._generate_with_retries(PRO, [], None, MagicMock(), max_retries=1)
+        assert breaker.state == CircuitState.CLOSED
+
+
+class TestProviderHealth:
+    """Tests for GeminiProvider.get_service_health."""
+
+    def test_status_reflects_circuits(self):
+        from api.ai_services.providers.gemini_provider import GeminiProvider
+
+        provider = GeminiProvider()
+        provider.probe = MagicMock(return_value={'ok': True})
+        circuit_breakers.get('gemini', PRO)
+        assert provider.get_service_health()['status'] == 'healthy'
+
+        for _ in range(circuit_breakers.failure_threshold):
+            circuit_breakers.get('gemini', PRO).record_failure()
+        health = provider.get_service_health()
+        assert health['status'] == 'unhealthy'
+        assert health['circuits'][PRO]['state'] == 'open'
+
+    def test_failed_probe_is_unhealthy(self):
+        from api.ai_services.providers.gemini_provider import GeminiProvider
+
+        provider = GeminiProvider()
+        provider.probe = MagicMock(return_value={'ok': False, 'error': 'timeout'})
+        assert provider.get_service_health()['status'] == 'unhealthy'
@@ -0,0 +1,144 @@
+"""
+Tests for api/visualizer/compositing.py and the recolor/preview endpoints.
+"""
+import io
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.models import GeneratedImage, VisualizationRequest
+from api.tenants import get_tenant_config
+from api.visualizer import compositing
+from api.visualizer.compositing import ScreenCompositor, cached_compositor, parse_hex, resolve_color
+
+BLACK = parse_hex('#1c1c1c')
+WHITE = parse_hex('#f1f1ef')
+BRONZE = parse_hex('#5a4632')
+
+
+def make_scene():
+    """Clean wall with a gradient, and the same wall with a black framed, black mesh screen."""
+    ramp = np.linspace(150, 220, 120, dtype=np.float32)
+    clean = np.stack([np.tile(ramp, (80, 1))] * 3, axis=2)
+
+    generated = clean.copy()
+    generated[20:60, 30:90] = 0.5 * np.array(BLACK) + 0.5 * clean[20:60, 30:90]  # mesh
+    generated[20:60, 30:36] = BLACK  # frame, left and right
+    generated[20:60, 84:90] = BLACK
+    generated[20:26, 30:90] = BLACK  # frame, top and bottom
+    generated[54:60, 30:90] = BLACK
+
+    def to_image(array):
+        return Image.fromarray(array.astype(np.uint8), 'RGB')
+
+    return to_image(generated), to_image(clean)
+
+
+class CompositorTest(TestCase):
+
+    def setUp(self):
+        generated, clean = make_scene()
+        self.generated = np.asarray(generated, dtype=np.float32)
+        self.clean = np.asarray(clean, dtype=np.float32)
+        self.compositor = ScreenCompositor(generated, clean, frame_color=BLACK, mesh_color=BLACK)
+
+    def test_recolors_frame_only(self):
+        result = np.asarray(self.compositor.render(frame_color=WHITE), dtype=np.float32)
+
+        np.testing.assert_allclose(result[40, 32], WHITE, atol=3)
+        np.testing.assert_allclose(result[40, 60], self.generated[40, 60], atol=1)
+        np.testing.assert_allclose(result[5, 5], self.clean[5, 5], atol=1)
+
+    def test_recolors_mesh_only(self):
+        result = np.asarray(self.compositor.render(mesh_color=BRONZE), dtype=np.float32)
+
+        expected = 0.5 * np.array(BRONZE) + 0.5 * self.clean[40, 60]
+        np.testing.assert_allclose(result[40, 60], expected, atol=3)
+        np.testing.assert_allclose(result[40, 32], self.generated[40, 32], atol=1)
+
+    def test_mask_covers_screen(self):
+        self.assertGreater(self.compositor.mask[40, 60], 0.9)
+        self.assertEqual(self.compositor.mask[5, 5], 0.0)
+
+    def test_compositor_can_work_at_preview_size(self):
+        generated, clean = make_scene()
+        small = ScreenCompositor(generated, clean, frame_color=BLACK, mesh_color=BLACK, max_size=60)
+
+        self.assertEqual(small.render(frame_color=WHITE).size, (60, 40))
+        self.assertEqual(small.nbytes * 4, self.compositor.nbytes)
+
+    def test_cache_is_bounded_by_bytes(self):
+        compositing._cache.clear()
+        budget = compositing.CACHE_MAX_BYTES
+        compositing.CACHE_MAX_BYTES = self.compositor.nbytes * 2
+        try:
+            for key in range(3):
+                cached_compositor(('bytes', key), lambda: self.compositor)
+            self.assertEqual(list(compositing._cache), [('bytes', 1), ('bytes', 2)])
+        finally:
+            compositing.CACHE_MAX_BYTES = budget
+            compositing._cache.clear()
+
+    def test_resolve_color_by_value_or_label(self):
+        tenant_config = get_tenant_config()
+        self.assertEqual(resolve_color(tenant_config, 'frame_color', 'dark_bronze'), parse_hex('#3d3128'))
+        self.assertEqual(resolve_color(tenant_config, 'frame_color', 'Dark Bronze'), parse_hex('#3d3128'))
+        with self.assertRaises(ValueError):
+            resolve_color(tenant_config, 'frame_color', 'neon')
+
+
+class RecolorEndpointTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='recolor', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        generated, clean = make_scene()
+        self.request = VisualizationRequest.objects.create(
+            user=self.user,
+            original_image=SimpleUploadedFile('test.png', b'fake', content_type='image/png'),
+        )
+        self.request.clean_image.save('clean.png', ContentFile(self._png(clean)), save=True)
+        self.result = GeneratedImage(request=self.request, metadata={'quality_score': 0.9})
+        self.result.generated_image.save('result.png', ContentFile(self._png(generated)), save=True)
+
+    @staticmethod
+    def _png(image):
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def test_preview_returns_jpeg(self):
+        response = self.client.get(f'/api/visualizations/{self.request.id}/preview/', {'frame_color': 'white'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_preview_rejects_invalid_max_size(self):
+        for max_size in ('0', '-5', '10000', 'big'):
+            with self.subTest(max_size=max_size):
+                response = self.client.get(
+                    f'/api/visualizations/{self.request.id}/preview/', {'frame_color': 'white', 'max_size': max_size}
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_preview_rejects_unknown_color(self):
+        response = self.client.get(f'/api/visualizations/{self.request.id}/preview/', {'frame_color': 'neon'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_recolor_saves_new_result(self):
+        response = self.client.post(
+            f'/api/visualizations/{self.request.id}/recolor/', {'frame_color': 'white'}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 201)
+        recolored = GeneratedImage.objects.get(id=response.data['id'])
+        self.assertEqual(recolored.metadata['source_result_id'], self.result.id)
+        self.assertEqual(recolored.metadata['frame_color'], 'white')
+        self.assertEqual(recolored.metadata['mesh_color'], 'black')
@@ -0,0 +1,92 @@
+"""Tests for the cost ledger (api/services/cost_ledger.py)."""
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.utils import timezone
+
+from api.ai_services.utils.performance_utils import calculate_token_cost
+from api.models import CostRollup, ModelUsageRecord, VisualizationRequest
+from api.services.cost_ledger import (
+    extract_usage,
+    get_request_cost,
+    ledger_context,
+    record_model_usage,
+)
+
+
+def make_usage(prompt=1000, candidates=1500, thoughts=200, image=1120):
+    return SimpleNamespace(
+        prompt_token_count=prompt,
+        candidates_token_count=candidates,
+        thoughts_token_count=thoughts,
+        total_token_count=prompt + candidates + thoughts,
+        candidates_tokens_details=[
+            SimpleNamespace(modality=SimpleNamespace(value='IMAGE'), token_count=image),
+            SimpleNamespace(modality=SimpleNamespace(value='TEXT'), token_count=candidates - image),
+        ],
+    )
+
+
+class ExtractUsageTest(TestCase):
+
+    def test_splits_image_output_tokens(self):
+        usage = extract_usage(make_usage())
+        self.assertEqual(usage['prompt_tokens'], 1000)
+        self.assertEqual(usage['thinking_tokens'], 200)
+        self.assertEqual(usage['image_output_tokens'], 1120)
+        self.assertEqual(usage['output_tokens'], 380)
+        self.assertEqual(usage['total_tokens'], 2700)
+
+    def test_token_cost_uses_model_rates(self):
+        # 1M input tokens at $2.00, 1M image tokens at $120.00
+        cost = calculate_token_cost('gemini-3-pro-image-preview', prompt_tokens=1_000_000,
+                                    image_output_tokens=1_000_000)
+        self.assertAlmostEqual(cost, 122.0)
+
+
+class RecordModelUsageTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='ledger', password='pw')
+        self.request = VisualizationRequest.objects.create(
+            user=user,
+            original_image=SimpleUploadedFile('test.jpg', b'fake', content_type='image/jpeg'),
+        )
+
+    def test_records_and_rolls_up(self):
+        with ledger_context(request=self.request):
+            first = record_model_usage(make_usage(), 'gemini-3-pro-image-preview', 'cleanup', tenant_id='boss')
+            record_model_usage(make_usage(), 'gemini-3-pro-image-preview', 'windows', tenant_id='boss')
+
+        self.assertEqual(first.request, self.request)
+        self.assertEqual(ModelUsageRecord.objects.count(), 2)
+
+        rollup = CostRollup.objects.get()
+        self.assertEqual(rollup.call_count, 2)
+        self.assertEqual(rollup.image_output_tokens, 2240)
+        self.assertEqual(rollup.cost_usd, first.cost_usd * 2)
+        self.assertAlmostEqual(get_request_cost(self.request), float(first.cost_usd) * 2)
+
+    def test_request_cost_since_run_start(self):
+        with ledger_context(request=self.request):
+            earlier = record_model_usage(make_usage(), 'gemini-3-pro-image-preview', 'cleanup', tenant_id='boss')
+            run_started_at = timezone.now()
+            record_model_usage(make_usage(image=0), 'gemini-2.0-flash', 'quality_check', tenant_id='boss')
+
+        latest = ModelUsageRecord.objects.get(step_name='quality_check')
+        self.assertAlmostEqual(get_request_cost(self.request, since=run_started_at), float(latest.cost_usd))
+        self.assertAlmostEqual(get_request_cost(self.request), float(earlier.cost_usd + latest.cost_usd))
+
+    def test_separate_rollup_per_model(self):
+        record_model_usage(make_usage(), 'gemini-3-pro-image-preview', 'cleanup', tenant_id='boss')
+        record_model_usage(make_usage(image=0), 'gemini-2.0-flash', 'audit', tenant_id='boss')
+
+        self.assertEqual(CostRollup.objects.count(), 2)
+        self.assertIsNone(ModelUsageRecord.objects.get(step_name='audit').request)
+
+    def test_missing_usage_records_zero_cost(self):
+        record = record_model_usage(None, 'gemini-2.0-flash', 'audit', tenant_id='boss')
+        self.assertEqual(record.cost_usd, Decimal('0'))
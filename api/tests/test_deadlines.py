@@ -0,0 +1,157 @@
+"""
+Tests for api/visualizer/deadlines.py
+"""
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from api.ai_services.circuit_breaker import circuit_breakers
+from api.ai_services.routing import ModelRoute
+from api.visualizer.deadlines import Deadline, DeadlineExceededError, run_with_deadline
+
+PRO = 'gemini-3-pro-image-preview'
+
+
+class TestDeadline:
+    """Tests for deadline arithmetic."""
+
+    def test_no_deadline(self):
+        deadline = Deadline()
+        assert deadline.remaining() is None
+        assert deadline.expired() is False
+
+    def test_narrow_keeps_earlier_expiry(self):
+        job = Deadline(10)
+        assert job.narrow(60).expires_at == job.expires_at
+        assert job.narrow(1).remaining() <= 1
+        assert job.narrow(None).expires_at == job.expires_at
+        assert Deadline().narrow(5).remaining() <= 5
+
+
+class TestRunWithDeadline:
+    """Tests for bounded and hedged calls."""
+
+    def test_returns_result(self):
+        assert run_with_deadline(lambda: 'ok', Deadline(1)) == 'ok'
+
+    def test_raises_when_deadline_passes(self):
+        release = threading.Event()
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            run_with_deadline(lambda: release.wait(5), Deadline(0.1))
+        assert time.monotonic() - started < 1
+        release.set()
+
+    def test_propagates_call_error(self):
+        def fail():
+            raise ValueError('boom')
+
+        with pytest.raises(ValueError):
+            run_with_deadline(fail, Deadline(1))
+
+    def test_hedge_wins_over_stalled_call(self):
+        release = threading.Event()
+        calls = []
+        discarded = []
+
+        def call():
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(5)
+                return 'slow'
+            return 'fast'
+
+        span = MagicMock()
+        result = run_with_deadline(call, Deadline(2), hedge_after=0.05, span=span, on_discarded=discarded.append)
+        assert result == 'fast'
+        span.set_attribute.assert_any_call('hedge_won', True)
+
+        release.set()
+        for _ in range(50):
+            if discarded:
+                break
+            time.sleep(0.01)
+        assert discarded == ['slow']
+
+    def test_poll_runs_on_caller_thread_until_deadline(self):
+        polled = []
+        release = threading.Event()
+
+        with pytest.raises(DeadlineExceededError):
+            run_with_deadline(lambda: release.wait(5), Deadline(0.6), poll=lambda: polled.append(threading.get_ident()))
+        release.set()
+        count = len(polled)
+        time.sleep(0.3)
+
+        assert count >= 1 and len(polled) == count
+        assert set(polled) == {threading.get_ident()}
+
+    def test_no_hedge_when_call_is_fast(self):
+        fn = MagicMock(return_value='ok')
+        assert run_with_deadline(fn, Deadline(2), hedge_after=0.5) == 'ok'
+        assert fn.call_count == 1
+
+
+class TestVisualizerDeadlines:
+    """Tests for deadlines applied to Gemini calls."""
+
+    @pytest.fixture(autouse=True)
+    def reset_breakers(self):
+        circuit_breakers.reset()
+        yield
+        circuit_breakers.reset()
+
+    def make_visualizer(self):
+        from api.visualizer.services import ScreenVisualizer
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key', timeout_seconds=60)
+        return visualizer
+
+    def test_call_gets_sdk_timeout(self):
+        from google.genai import types
+
+        visualizer = self.make_visualizer()
+        visualizer._generate_with_retries(
+            PRO, [], types.GenerateContentConfig(), MagicMock(), max_retries=1, deadline=Deadline(30)
+        )
+        config = visualizer.client.models.generate_content.call_args.kwargs['config']
+        assert 0 < config.http_options.timeout <= 30000
+
+    def test_hung_call_times_out(self):
+        from google.genai import types
+
+        visualizer = self.make_visualizer()
+        release = threading.Event()
+        visualizer.client.models.generate_content.side_effect = lambda **kwargs: release.wait(5)
+
+        with pytest.raises(DeadlineExceededError):
+            visualizer._generate_with_retries(
+                PRO, [], types.GenerateContentConfig(), MagicMock(), max_retries=3, deadline=Deadline(0.1)
+            )
+        release.set()
+        assert visualizer.client.models.generate_content.call_count == 1
+
+    def test_expired_job_deadline_stops_failover(self):
+        from api.visualizer.services import ScreenVisualizerError
+
+        visualizer = self.make_visualizer()
+        visualizer._deadline = Deadline(0)
+        visualizer._call_gemini_edit = MagicMock()
+
+        with pytest.raises(ScreenVisualizerError, match='deadline'):
+            visualizer._run_edit_step(Image.new('RGB', (10, 10)), 'prompt', 'cleanup', [ModelRoute('gemini', PRO)])
+        visualizer._call_gemini_edit.assert_not_called()
+
+    def test_step_timeout_narrows_job_deadline(self):
+        visualizer = self.make_visualizer()
+        visualizer._deadline = Deadline(600)
+        visualizer._call_gemini_edit = MagicMock(return_value=Image.new('RGB', (10, 10)))
+
+        visualizer._run_edit_step(
+            Image.new('RGB', (10, 10)), 'prompt', 'cleanup', [ModelRoute('gemini', PRO)], timeout_seconds=90
+        )
+        assert visualizer._call_gemini_edit.call_args.kwargs['deadline'].remaining() <= 90
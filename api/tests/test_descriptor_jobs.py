@@ -0,0 +1,102 @@
+"""
+Tests for descriptor batch jobs (api/services/descriptor_jobs.py) and the
+compute_embeddings command.
+"""
+import io
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from api.models import ReferenceImage, VisualizationRequest
+from api.services.descriptor_jobs import describe_pending, describe_upload
+from api.services.reference_index import reference_index
+from api.visualizer.descriptors import DESCRIPTOR_DIM, DESCRIPTOR_VERSION, compute_descriptor
+
+
+def png_upload(color='tan', name='image.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class DescriptorJobTest(TestCase):
+
+    def setUp(self):
+        self.settings_override = override_settings(REFERENCE_INDEX={'DIR': tempfile.mkdtemp()})
+        self.settings_override.enable()
+        self.references = [
+            ReferenceImage.objects.create(tenant_id='boss', category='frame_color', option_value=color,
+                                          image=png_upload(color))
+            for color in ('black', 'white', 'tan')
+        ]
+
+    def tearDown(self):
+        self.settings_override.disable()
+
+    def test_references_are_described_and_indexed(self):
+        totals = describe_pending(ReferenceImage, batch_size=2, workers=1)
+
+        self.assertEqual(totals, {'described': 3, 'failed': 0})
+        for reference in ReferenceImage.objects.all():
+            self.assertEqual(reference.embedding_version, DESCRIPTOR_VERSION)
+            self.assertEqual(len(reference.embedding), DESCRIPTOR_DIM)
+        self.assertEqual(reference_index.size('boss'), 3)
+
+        best = reference_index.search('boss', compute_descriptor(Image.new('RGB', (64, 48), 'white')), k=1)
+        self.assertEqual(best[0].option_value, 'white')
+
+    def test_run_resumes_where_it_left_off(self):
+        self.assertEqual(describe_pending(ReferenceImage, workers=1, limit=2)['described'], 2)
+        self.assertEqual(describe_pending(ReferenceImage, workers=1)['described'], 1)
+        self.assertEqual(describe_pending(ReferenceImage, workers=1)['described'], 0)
+        self.assertEqual(reference_index.size('boss'), 3)
+
+    def test_outdated_descriptors_are_recomputed(self):
+        describe_pending(ReferenceImage, workers=1)
+        ReferenceImage.objects.filter(id=self.references[0].id).update(embedding_version=DESCRIPTOR_VERSION - 1)
+
+        self.assertEqual(describe_pending(ReferenceImage, workers=1)['described'], 1)
+
+    def test_unreadable_image_is_skipped(self):
+        broken = self.references[1]
+        with open(broken.image.path, 'wb') as f:
+            f.write(b'not an image')
+
+        totals = describe_pending(ReferenceImage, batch_size=1, workers=1)
+
+        self.assertEqual(totals, {'described': 2, 'failed': 1})
+        broken.refresh_from_db()
+        self.assertIsNone(broken.embedding_version)
+
+    def test_process_pool(self):
+        self.assertEqual(describe_pending(ReferenceImage, workers=2)['described'], 3)
+        self.assertEqual(reference_index.size('boss'), 3)
+
+    def test_command(self):
+        user = User.objects.create_user(username='describer', password='pw')
+        request = VisualizationRequest.objects.create(user=user, original_image=png_upload())
+        out = io.StringIO()
+
+        call_command('compute_embeddings', '--originals', '--workers', '1', '--rebuild-index', stdout=out)
+
+        request.refresh_from_db()
+        self.assertEqual(request.embedding_version, DESCRIPTOR_VERSION)
+        self.assertIn('Rebuilt boss reference index (3 references)', out.getvalue())
+
+
+class DescribeUploadTest(TestCase):
+
+    def test_descriptor_is_stored_once(self):
+        user = User.objects.create_user(username='uploader', password='pw')
+        request = VisualizationRequest.objects.create(user=user, original_image=png_upload())
+        image = Image.open(request.original_image.path)
+
+        self.assertTrue(describe_upload(request, image))
+        self.assertFalse(describe_upload(request, image))
+
+        request.refresh_from_db()
+        self.assertEqual(len(request.embedding), DESCRIPTOR_DIM)
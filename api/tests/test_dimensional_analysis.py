@@ -0,0 +1,134 @@
+"""
+Tests for patio dimensional analysis (api/visualizer/dimensional_analysis.py).
+"""
+import io
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from PIL import Image
+
+from api.ai_enhanced_processor import AIEnhancedImageProcessor
+from api.ai_services.structured_output import QualityVerdict
+from api.models import VisualizationRequest
+from api.utils.pdf_generator import PRICING, calculate_quote
+from api.visualizer.dimensional_analysis import parse_dimensional_analysis
+from api.visualizer.services import ScreenVisualizer
+
+PATIO_RESPONSE = """The opening spans most of the back wall; judging by the door height it is wide.
+OPENING WIDTH: [X] feet was requested, so I will measure carefully.
+
+**OPENING WIDTH:** 18 feet
+**MULLION COUNT:** 3
+**POSITIONS:** [4.5 ft, 9 ft, 13.5 ft]"""
+
+
+class ParseDimensionalAnalysisTest(TestCase):
+
+    def test_stated_values_are_extracted(self):
+        self.assertEqual(parse_dimensional_analysis(PATIO_RESPONSE), {
+            'opening_width_ft': 18.0,
+            'mullion_count': 3,
+            'mullion_positions_ft': [4.5, 9.0, 13.5],
+        })
+
+    def test_units_and_ranges_are_converted_to_feet(self):
+        cases = [
+            ('OPENING WIDTH: approximately 18-20 feet', 19.0),
+            ('OPENING WIDTH: 6 m', 19.69),
+            ("- OPENING WIDTH: 16' 6\"", 16.5),
+            ('OPENING WIDTH: approximately 180 inches (15 feet)', 15.0),
+            ('OPENING WIDTH: 198"', 16.5),
+        ]
+        for text, width in cases:
+            with self.subTest(text=text):
+                self.assertEqual(parse_dimensional_analysis(text)['opening_width_ft'], width)
+
+    def test_count_in_words_or_from_positions(self):
+        self.assertEqual(parse_dimensional_analysis('MULLION COUNT: three')['mullion_count'], 3)
+        self.assertEqual(parse_dimensional_analysis('POSITIONS: 5 ft, 10 ft')['mullion_count'], 2)
+
+    def test_missing_or_implausible_values(self):
+        self.assertIsNone(parse_dimensional_analysis('The screens look great.'))
+        self.assertIsNone(parse_dimensional_analysis('OPENING WIDTH: [X] feet\nPOSITIONS: [list]'))
+        analysis = parse_dimensional_analysis('OPENING WIDTH: 900 feet\nMULLION COUNT: 2')
+        self.assertIsNone(analysis['opening_width_ft'])
+        self.assertEqual(analysis['mullion_count'], 2)
+
+    def test_numbers_without_units_are_not_lengths(self):
+        self.assertIsNone(parse_dimensional_analysis('OPENING WIDTH: 18'))
+        self.assertIsNone(parse_dimensional_analysis('POSITIONS: at 1/4, 1/2 and 3/4'))
+        analysis = parse_dimensional_analysis('MULLION COUNT: 2\nPOSITIONS: 1/3 (6 ft), 2/3 (12 ft)')
+        self.assertEqual(analysis['mullion_positions_ft'], [6.0, 12.0])
+
+
+class PipelineDimensionalAnalysisTest(TestCase):
+
+    def setUp(self):
+        with patch('google.genai.Client'):
+            self.visualizer = ScreenVisualizer(api_key='fake_key')
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.9, reason='ok'))
+
+    def test_patio_step_response_is_parsed(self):
+        def edit(image, prompt, **kwargs):
+            result = Image.new('RGB', (10, 10))
+            if kwargs['step_name'] == 'patio':
+                result.info['response_text'] = PATIO_RESPONSE
+            return result
+
+        self.visualizer._call_gemini_edit = MagicMock(side_effect=edit)
+
+        _, results = self.visualizer.process_variations(
+            Image.new('RGB', (10, 10)), {'patio': True, 'windows': True}, [{'color': 'Black'}]
+        )
+
+        self.assertEqual(results[0]['dimensional_analysis']['opening_width_ft'], 18.0)
+
+    def test_response_text_is_kept_with_the_image(self):
+        output = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(output, format='PNG')
+        text_part = MagicMock(text=PATIO_RESPONSE, inline_data=None)
+        image_part = MagicMock(text=None)
+        image_part.inline_data.data = output.getvalue()
+        response = MagicMock(usage_metadata=None)
+        response.candidates[0].content.parts = [text_part, image_part]
+        self.visualizer.client.models.generate_content.return_value = response
+        self.visualizer._capture_artifacts = False
+
+        result = self.visualizer._call_gemini_edit(Image.new('RGB', (8, 8)), 'prompt', step_name='patio')
+
+        self.assertEqual(result.info['response_text'], PATIO_RESPONSE)
+
+
+class DimensionalAnalysisPersistenceTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='estimator', password='pw')
+        buffer = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+        self.request = VisualizationRequest.objects.create(
+            user=user, patio_enclosure=True,
+            original_image=SimpleUploadedFile('house.jpg', buffer.getvalue(), content_type='image/jpeg')
+        )
+
+    def test_first_variation_with_analysis_is_stored(self):
+        analysis = parse_dimensional_analysis(PATIO_RESPONSE)
+        metadata = {'variations': [{'dimensional_analysis': None}, {'dimensional_analysis': analysis}]}
+
+        AIEnhancedImageProcessor()._save_dimensional_analysis(self.request, metadata)
+
+        self.request.refresh_from_db()
+        self.assertEqual(self.request.dimensional_analysis, analysis)
+        self.assertEqual(
+            VisualizationRequest.objects.filter(dimensional_analysis__opening_width_ft__gte=15).count(), 1
+        )
+
+    def test_quote_prices_patio_by_measured_span(self):
+        self.assertEqual(calculate_quote(self.request)['total'], PRICING['patio_enclosure'])
+
+        self.request.dimensional_analysis = {'opening_width_ft': 18.4, 'mullion_count': 3}
+        quote = calculate_quote(self.request)
+
+        self.assertEqual(quote['items'][0]['qty'], 19)
+        self.assertEqual(quote['total'], 19 * PRICING['patio_enclosure_per_foot'])
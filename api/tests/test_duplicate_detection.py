@@ -0,0 +1,153 @@
+"""
+Tests for near-duplicate upload detection (api/services/duplicate_detector.py).
+"""
+import io
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image, ImageDraw
+from rest_framework.test import APIClient
+
+from api.audit.models import AuditReport
+from api.audit.services import AuditService
+from api.models import VisualizationRequest
+from api.visualizer.descriptors import hash_distance, perceptual_hash
+from api.visualizer.services import ScreenVisualizer
+
+
+def house(color='tan'):
+    image = Image.new('RGB', (400, 300), color)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((150, 100, 250, 300), fill='brown')
+    draw.rectangle((25, 25, 100, 100), fill='white')
+    draw.ellipse((300, 25, 375, 100), fill='navy')
+    return image
+
+
+def upload(image, name='house.jpg', quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class PerceptualHashTest(TestCase):
+
+    def test_recompressed_and_cropped_copies_are_close(self):
+        original = perceptual_hash(house())
+        recompressed = perceptual_hash(Image.open(upload(house(), quality=30)))
+        cropped = perceptual_hash(house().crop((8, 6, 394, 296)).resize((320, 240)))
+        other = Image.new('RGB', (400, 300), 'gray')
+        ImageDraw.Draw(other).rectangle((0, 150, 400, 300), fill='green')
+
+        self.assertEqual(len(original), 16)
+        self.assertLessEqual(hash_distance(original, recompressed), 2)
+        self.assertLessEqual(hash_distance(original, cropped), 6)
+        self.assertGreater(hash_distance(original, perceptual_hash(other)), 20)
+
+
+class DuplicateUploadTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='rep', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, image, **data):
+        with patch('api.views.job_dispatcher'):
+            response = self.client.post('/api/visualizations/', {'original_image': image, **data}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return VisualizationRequest.objects.get(id=response.data['id'])
+
+    def processed(self, image):
+        first = self.post(upload(image))
+        first.clean_image.save('clean.jpg', ContentFile(upload(image).read()), save=True)
+        return first
+
+    def test_reupload_is_linked_to_earlier_request(self):
+        first = self.processed(house())
+
+        second = self.post(upload(house().resize((320, 240)), quality=40))
+
+        self.assertTrue(second.phash)
+        self.assertEqual(second.duplicate_of, first)
+
+    def test_different_photo_is_not_a_duplicate(self):
+        self.processed(house())
+        self.assertIsNone(self.post(upload(Image.new('RGB', (400, 300), 'gray'))).duplicate_of)
+
+    def test_hash_match_with_other_aspect_ratio_is_not_reused(self):
+        self.processed(house())
+        stretched = house().resize((400, 200))
+        self.assertEqual(hash_distance(perceptual_hash(house()), perceptual_hash(stretched)), 0)
+        self.assertIsNone(self.post(upload(stretched)).duplicate_of)
+
+    def test_hash_match_with_other_colors_is_not_reused(self):
+        self.processed(house())
+        repainted = house('white')
+        self.assertLessEqual(hash_distance(perceptual_hash(house()), perceptual_hash(repainted)), 6)
+        self.assertIsNone(self.post(upload(repainted)).duplicate_of)
+
+    def test_uploads_without_clean_image_are_not_reused(self):
+        self.post(upload(house()))
+        self.assertIsNone(self.post(upload(house())).duplicate_of)
+
+    def test_other_users_uploads_are_not_matched(self):
+        self.processed(house())
+        self.client.force_authenticate(User.objects.create_user(username='other', password='pw'))
+        self.assertIsNone(self.post(upload(house())).duplicate_of)
+
+    def test_reuse_can_be_declined(self):
+        self.processed(house())
+        self.assertIsNone(self.post(upload(house()), reuse_duplicate='false').duplicate_of)
+
+    @override_settings(DUPLICATE_DETECTION={'AUTO_REUSE': False})
+    def test_reuse_can_be_requested_when_not_automatic(self):
+        first = self.processed(house())
+        self.assertIsNone(self.post(upload(house())).duplicate_of)
+        self.assertEqual(self.post(upload(house()), reuse_duplicate='true').duplicate_of, first)
+
+
+class DuplicateReuseTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reuser', password='pw')
+        self.first = VisualizationRequest.objects.create(user=self.user, original_image=upload(house()))
+        self.second = VisualizationRequest.objects.create(
+            user=self.user, original_image=upload(house()), duplicate_of=self.first
+        )
+
+    def test_pipeline_starts_from_reused_clean_image(self):
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        visualizer._call_gemini_edit = MagicMock(side_effect=lambda image, prompt, **kwargs: image)
+        visualizer._check_quality = MagicMock(return_value={'score': 0.95, 'reason': 'ok', 'tier': 'local'})
+        clean = house('white')
+
+        returned, _ = visualizer.process_variations(
+            house(), {'windows': True}, [{'color': 'Black', 'mesh_type': '12x12'}], clean_image=clean
+        )
+
+        self.assertIs(returned, clean)
+        steps = [call.kwargs['step_name'] for call in visualizer._call_gemini_edit.call_args_list]
+        self.assertNotIn('cleanup', steps)
+        self.assertIn('windows', steps)
+
+    def test_audit_is_copied_without_model_call(self):
+        AuditReport.objects.create(
+            request=self.first, has_concealment=True, vulnerabilities=[{'type': 'concealment'}],
+            analysis_summary='Hedges hide the side windows.'
+        )
+        with patch('api.audit.services.genai.Client'):
+            service = AuditService(api_key='fake_key')
+        service._call_gemini_json = MagicMock()
+
+        report = service.perform_audit(self.second)
+
+        service._call_gemini_json.assert_not_called()
+        self.assertEqual(report.request, self.second)
+        self.assertTrue(report.has_concealment)
+        self.assertEqual(report.vulnerabilities, [{'type': 'concealment'}])
+        self.assertEqual(AuditReport.objects.count(), 2)
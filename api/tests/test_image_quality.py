@@ -0,0 +1,83 @@
+"""
+Tests for the local image quality metrics and the pre-model quality gate.
+"""
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from django.test import override_settings
+from PIL import Image, ImageFilter
+
+from api.ai_services.utils.image_utils import (
+    QUALITY_SAMPLE_SIZE,
+    downsample_for_quality,
+    assess_image_quality,
+    calculate_image_quality_score,
+    check_image_quality,
+)
+
+
+def textured(size=(1200, 800), seed=0):
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(40, 220, (size[1], size[0], 3), dtype=np.uint8))
+
+
+class TestQualityMetrics:
+    """Tests for assess_image_quality and calculate_image_quality_score."""
+
+    def test_sample_is_bounded(self):
+        sample = downsample_for_quality(textured((7680, 4320)))
+        assert max(sample.size) == QUALITY_SAMPLE_SIZE
+        assert sample.size[0] / sample.size[1] == pytest.approx(7680 / 4320, rel=0.01)
+
+    @pytest.mark.parametrize('mode', ['P', '1', 'I;16', 'RGBA'])
+    def test_large_images_in_any_mode_are_sampled(self, mode):
+        sample = downsample_for_quality(Image.new(mode, (2100, 1400)))
+        assert sample.mode == 'RGB'
+        assert max(sample.size) == QUALITY_SAMPLE_SIZE
+
+    def test_metrics_report_original_size(self):
+        metrics = assess_image_quality(textured((3000, 2000)))
+        assert (metrics['width'], metrics['height']) == (3000, 2000)
+        assert 0.0 < metrics['brightness'] < 1.0
+
+    def test_blur_lowers_sharpness(self):
+        image = textured()
+        blurred = image.filter(ImageFilter.GaussianBlur(8))
+        assert assess_image_quality(blurred)['sharpness'] < assess_image_quality(image)['sharpness']
+
+    def test_color_cast_lowers_balance(self):
+        assert assess_image_quality(Image.new('RGB', (200, 200), (200, 60, 60)))['color_balance'] < 0.9
+        assert assess_image_quality(Image.new('RGB', (200, 200), (128, 128, 128)))['color_balance'] == 1.0
+
+    def test_score_in_range(self):
+        assert 0.0 <= calculate_image_quality_score(textured()) <= 1.0
+
+
+class TestQualityGate:
+    """Tests for check_image_quality and its use in ScreenVisualizer."""
+
+    def test_passes_sharp_image(self):
+        passed, reason, _ = check_image_quality(textured())
+        assert passed and reason == ''
+
+    def test_rejects_blurry_image(self):
+        passed, reason, _ = check_image_quality(textured().filter(ImageFilter.GaussianBlur(12)))
+        assert not passed and 'blurry' in reason
+
+    def test_rejects_dark_image(self):
+        dark = Image.fromarray((np.asarray(textured()) * 0.05).astype(np.uint8))
+        passed, reason, _ = check_image_quality(dark, min_sharpness=0)
+        assert not passed and 'dark' in reason
+
+    @override_settings(QUALITY_GATE={'ENABLED': True})
+    def test_pipeline_rejects_before_model_call(self):
+        from api.visualizer.services import ImageQualityError, ScreenVisualizer
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        visualizer._call_gemini_edit = MagicMock()
+
+        with pytest.raises(ImageQualityError):
+            visualizer.process_pipeline(Image.new('RGB', (400, 300), 'white'), scope={'windows': True}, options={})
+        visualizer._call_gemini_edit.assert_not_called()
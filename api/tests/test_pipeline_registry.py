@@ -190,11 +190,12 @@ class TestQualityCheckHandler:
     """Tests for quality_check_handler."""
 
     def test_quality_check_returns_score_and_reason(self):
-        """Should return score and reason from Gemini JSON response."""
+        """Should return score, reason and deciding tier from the quality cascade."""
         mock_visualizer = Mock()
-        mock_visualizer._call_gemini_json.return_value = {
+        mock_visualizer._check_quality.return_value = {
             'score': 0.95,
-            'reason': 'Quality looks good'
+            'reason': 'Quality looks good',
+            'tier': 'model'
         }
 
         mock_prompts = Mock()
@@ -215,4 +216,5 @@ class TestQualityCheckHandler:
 
         assert result['score'] == 0.95
         assert result['reason'] == 'Quality looks good'
-        mock_visualizer._call_gemini_json.assert_called_once()
+        assert result['quality_tier'] == 'model'
+        mock_visualizer._check_quality.assert_called_once()
@@ -0,0 +1,149 @@
+"""
+Tests for api/monitoring/production_monitor.py and the /metrics endpoint
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from api.monitoring.production_monitor import (
+    LatencyHistogram,
+    ProductionMonitor,
+    RING_MINUTES,
+)
+
+
+def make_monitor(**overrides):
+    options = {'SHARED_DIR': None, 'FLUSH_INTERVAL_SECONDS': 0}
+    options.update(overrides)
+    return ProductionMonitor(options=options)
+
+
+def record(monitor, success=True, processing_time=10.0, quality_score=0.9, cost=0.1):
+    monitor.record_request_metrics({
+        'success': success,
+        'processing_time': processing_time,
+        'quality_score': quality_score,
+        'cost': cost,
+        'cache_hit': True,
+        'model_used': 'gemini',
+    })
+
+
+class TestLatencyHistogram:
+    """Tests for the log-bucket histogram."""
+
+    def test_percentile_within_bucket_precision(self):
+        histogram = LatencyHistogram()
+        for seconds in range(1, 101):
+            histogram.record(float(seconds))
+
+        assert histogram.count == 100
+        assert 95 <= histogram.percentile(0.95) <= 95 * 1.2
+        assert histogram.sum == sum(range(1, 101))
+
+    def test_merge_adds_counts(self):
+        a, b = LatencyHistogram(), LatencyHistogram()
+        a.record(1.0)
+        b.record(1.0)
+        a.merge(b)
+        assert a.count == 2
+
+
+class TestProductionMonitor:
+    """Tests for windowed health and multi-process aggregation."""
+
+    def test_health_from_last_hour(self):
+        monitor = make_monitor()
+        record(monitor)
+        record(monitor, success=False, processing_time=30.0, quality_score=0.0)
+
+        health = monitor.get_system_health()
+        assert health['metrics']['total_requests'] == 2
+        assert health['metrics']['error_rate'] == 0.5
+        assert health['metrics']['avg_response_time'] == 20.0
+        assert health['metrics']['avg_quality_score'] == 0.9
+        assert health['status'] == 'degraded'
+
+    def test_old_minutes_leave_the_window(self):
+        monitor = make_monitor()
+        with patch('api.monitoring.production_monitor.time.time', return_value=1_000_000.0):
+            record(monitor)
+
+        assert monitor.get_system_health()['status'] == 'stale'
+
+    def test_ring_reuses_slots(self):
+        monitor = make_monitor()
+        with patch('api.monitoring.production_monitor.time.time', return_value=60.0):
+            record(monitor)
+        with patch('api.monitoring.production_monitor.time.time', return_value=60.0 + RING_MINUTES * 60):
+            record(monitor)
+
+        assert sum(1 for bucket in monitor._state.ring if bucket is not None) == 1
+
+    def test_merges_snapshots_from_other_workers(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            worker_a = make_monitor(SHARED_DIR=shared_dir)
+            worker_b = make_monitor(SHARED_DIR=shared_dir)
+            record(worker_a)
+            # Simulate a second process by writing its snapshot under another pid
+            with patch('api.monitoring.production_monitor.os.getpid', return_value=os.getpid() + 1):
+                record(worker_b)
+
+            health = worker_a.get_system_health()
+            assert health['metrics']['total_requests'] == 2
+            assert len(os.listdir(shared_dir)) == 2
+
+    def test_snapshots_are_read_at_most_once_per_interval(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            worker = make_monitor(SHARED_DIR=shared_dir, FLUSH_INTERVAL_SECONDS=60)
+            other = make_monitor(SHARED_DIR=shared_dir)
+            with patch('api.monitoring.production_monitor.os.getpid', return_value=os.getpid() + 1):
+                record(other)
+
+            with patch('api.monitoring.production_monitor.os.scandir', wraps=os.scandir) as scandir:
+                for _ in range(3):
+                    worker.get_system_health()
+                    worker.export_prometheus()
+                record(worker)
+                health = worker.get_system_health()
+
+            assert scandir.call_count == 1
+            # This worker's own requests are read live, not from its snapshot
+            assert health['metrics']['total_requests'] == 2
+
+    def test_prometheus_exposition(self):
+        monitor = make_monitor()
+        record(monitor, processing_time=2.0)
+        monitor.record_step_latency('cleanup', 1.5)
+
+        text = monitor.export_prometheus()
+        assert 'visualizer_requests_total{model="gemini",outcome="success"} 1' in text
+        assert 'visualizer_request_duration_seconds_bucket{le="+Inf"} 1' in text
+        assert 'visualizer_step_duration_seconds_count{step="cleanup"} 1' in text
+        assert 'visualizer_cache_hits_total 1' in text
+
+
+class MetricsEndpointTest(TestCase):
+
+    def test_metrics_endpoint_is_closed_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(PRODUCTION_MONITOR={'SHARED_DIR': None, 'ALLOWED_IPS': ['127.0.0.1']})
+    def test_metrics_endpoint(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'# TYPE visualizer_request_duration_seconds histogram', response.content)
+
+    @override_settings(PRODUCTION_MONITOR={'SHARED_DIR': None, 'AUTH_TOKEN': 'secret'})
+    def test_metrics_endpoint_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PRODUCTION_MONITOR={'SHARED_DIR': None, 'ALLOWED_IPS': ['10.0.0.5']})
+    def test_metrics_endpoint_allowed_address(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.6').status_code, 403)
@@ -0,0 +1,105 @@
+"""
+Tests for api/visualizer/quality.py and the quality_check cascade.
+"""
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.test import TestCase
+from PIL import Image
+
+from api.ai_services.structured_output import QualityVerdict
+from api.visualizer.quality import assess_result_quality
+from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
+
+
+def textured(seed=0, size=(256, 192)):
+    """A wall-like scene: smooth random texture in mid tones."""
+    noise = np.random.default_rng(seed).integers(60, 200, (24, 32, 3), dtype=np.uint8)
+    return Image.fromarray(noise, 'RGB').resize(size, Image.Resampling.BILINEAR)
+
+
+def with_screen(image):
+    """The scene with a dark, half transparent screen over one window-sized area."""
+    array = np.asarray(image, dtype=np.float32).copy()
+    array[40:140, 60:160] = 0.5 * array[40:140, 60:160] + 0.5 * 20
+    return Image.fromarray(array.astype(np.uint8), 'RGB')
+
+
+class AssessResultQualityTest(TestCase):
+
+    def test_clean_insertion_passes_locally(self):
+        clean = textured()
+        assessment = assess_result_quality(clean, with_screen(clean))
+
+        self.assertTrue(assessment.confident)
+        self.assertGreater(assessment.score, 0.8)
+        self.assertAlmostEqual(assessment.metrics['change_ratio'], 100 * 100 / (256 * 192), delta=0.05)
+
+    def test_regenerated_scene_fails_locally(self):
+        assessment = assess_result_quality(textured(0), textured(1))
+
+        self.assertTrue(assessment.confident)
+        self.assertLessEqual(assessment.score, 0.4)
+
+    def test_flat_image_escalates(self):
+        flat = Image.new('RGB', (256, 192), 'white')
+        self.assertFalse(assess_result_quality(flat, with_screen(flat)).confident)
+
+    def test_no_change_escalates(self):
+        clean = textured()
+        self.assertFalse(assess_result_quality(clean, clean.copy()).confident)
+
+    def test_result_size_may_differ(self):
+        clean = textured()
+        result = with_screen(clean).resize((512, 384), Image.Resampling.BILINEAR)
+        self.assertTrue(assess_result_quality(clean, result).confident)
+
+    def test_threshold_overrides(self):
+        clean = textured()
+        assessment = assess_result_quality(clean, with_screen(clean), {'pass_ssim': 1.01})
+        self.assertFalse(assessment.confident)
+
+
+class QualityCascadeTest(TestCase):
+
+    def setUp(self):
+        with patch('google.genai.Client'):
+            self.visualizer = ScreenVisualizer(api_key='fake_key')
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.7, reason='Door added'))
+        self.clean = textured()
+
+    def test_confident_result_skips_model(self):
+        span = MagicMock()
+        result = self.visualizer._check_quality(self.clean, with_screen(self.clean), 'prompt', span=span)
+
+        self.assertEqual(result['tier'], 'local')
+        self.visualizer._call_gemini_json.assert_not_called()
+        span.set_attribute.assert_any_call('quality.tier', 'local')
+
+    def test_inconclusive_result_asks_model(self):
+        result = self.visualizer._check_quality(self.clean, self.clean.copy(), 'prompt')
+
+        self.assertEqual(result, {'score': 0.7, 'reason': 'Door added', 'tier': 'model'})
+        self.assertEqual(len(self.visualizer._call_gemini_json.call_args.args[0]), 2)
+
+    def test_model_failure_keeps_local_score(self):
+        self.visualizer._call_gemini_json.side_effect = ScreenVisualizerError('Model returned no parseable JSON.')
+        result = self.visualizer._check_quality(self.clean, self.clean.copy(), 'prompt')
+
+        self.assertEqual(result['tier'], 'local_fallback')
+        self.assertNotEqual(result['score'], 0.9)
+
+    def test_step_config_can_always_escalate(self):
+        result = self.visualizer._check_quality(
+            self.clean, with_screen(self.clean), 'prompt', step_config={'escalate': 'always'}
+        )
+        self.assertEqual(result['tier'], 'model')
+
+    def test_unparseable_model_response_raises(self):
+        chunk = MagicMock(usage_metadata=None)
+        chunk.candidates[0].content.parts = [MagicMock(text='The image looks fine.', thought=False)]
+        del self.visualizer._call_gemini_json
+        self.visualizer.client.models.generate_content_stream.return_value = iter([chunk])
+
+        with self.assertRaises(ScreenVisualizerError):
+            self.visualizer._call_gemini_json([self.clean], 'prompt')
@@ -0,0 +1,148 @@
+"""
+Tests for api/visualizer/descriptors.py and api/services/reference_index.py.
+"""
+import io
+import json
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image, ImageDraw
+
+from api.models import ReferenceImage
+from api.services.reference_index import ReferenceIndex
+from api.visualizer.descriptors import DESCRIPTOR_DIM, DESCRIPTOR_VERSION, compute_descriptor
+from api.visualizer.services import REFERENCE_NOTE, ScreenVisualizer
+
+
+def house(color='tan', door=(40, 30, 60, 64)):
+    image = Image.new('RGB', (96, 64), color)
+    ImageDraw.Draw(image).rectangle(door, fill='brown')
+    return image
+
+
+def png_upload(image, name='reference.png'):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class DescriptorTest(TestCase):
+
+    def test_descriptor_is_unit_length(self):
+        descriptor = compute_descriptor(house())
+        self.assertEqual(descriptor.shape, (DESCRIPTOR_DIM,))
+        self.assertEqual(descriptor.dtype, np.float32)
+        self.assertAlmostEqual(float(np.linalg.norm(descriptor)), 1.0, places=5)
+
+    def test_similar_images_score_higher(self):
+        query = compute_descriptor(house())
+        resized = compute_descriptor(house().resize((192, 128)))
+        other = compute_descriptor(house('navy', door=(5, 5, 20, 20)))
+
+        self.assertGreater(float(query @ resized), 0.98)
+        self.assertGreater(float(query @ resized), float(query @ other))
+
+
+class ReferenceIndexTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = ReferenceIndex(self.directory)
+
+    def create_reference(self, image, category='windows', option_value='black', embed=True):
+        return ReferenceImage.objects.create(
+            tenant_id='boss', category=category, option_value=option_value, image=png_upload(image),
+            embedding=compute_descriptor(image).tolist() if embed else None,
+            embedding_version=DESCRIPTOR_VERSION if embed else None,
+        )
+
+    def test_build_and_search(self):
+        tan = self.create_reference(house())
+        navy = self.create_reference(house('navy', door=(5, 5, 20, 20)), category='doors')
+        self.create_reference(house(), option_value='white', embed=False)
+
+        self.assertEqual(self.index.build('boss'), 2)
+
+        matches = self.index.search('boss', compute_descriptor(house()), k=5)
+        self.assertEqual([m.reference_id for m in matches], [tan.id, navy.id])
+        self.assertGreater(matches[0].score, 0.99)
+        self.assertEqual(matches[0].category, 'windows')
+
+        doors = self.index.search('boss', compute_descriptor(house()), k=5, category='doors')
+        self.assertEqual([m.reference_id for m in doors], [navy.id])
+
+    def test_missing_index_finds_nothing(self):
+        self.assertEqual(self.index.search('pools', np.ones(DESCRIPTOR_DIM), k=3), [])
+        self.assertEqual(self.index.size('pools'), 0)
+
+    def test_add_appends_and_is_picked_up_by_readers(self):
+        reader = ReferenceIndex(self.directory)
+        descriptor = compute_descriptor(house())
+
+        self.assertEqual(self.index.add('boss', [(1, 'windows', 'black', descriptor)]), 1)
+        self.assertEqual(reader.size('boss'), 1)
+
+        self.assertEqual(self.index.add('boss', [(1, 'windows', 'black', descriptor),
+                                                 (2, 'doors', 'white', descriptor)]), 1)
+        # Appends move the file's mtime, so the reader maps the index again
+        os.utime(os.path.join(self.directory, 'boss.json'), (1, 1))
+        self.assertEqual([m.reference_id for m in reader.search('boss', descriptor, k=5)], [1, 2])
+
+    def test_index_of_another_descriptor_version_is_ignored(self):
+        self.index.add('boss', [(1, 'windows', 'black', compute_descriptor(house()))])
+        meta_path = os.path.join(self.directory, 'boss.json')
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with open(meta_path, 'w') as f:
+            json.dump({**meta, 'version': 0}, f)
+
+        self.assertEqual(ReferenceIndex(self.directory).size('boss'), 0)
+
+
+class PipelineReferenceTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with patch('google.genai.Client'):
+            self.visualizer = ScreenVisualizer(api_key='fake_key')
+        self.visualizer._call_gemini_edit = MagicMock(side_effect=lambda image, prompt, **kwargs: house())
+        self.visualizer._check_quality = MagicMock(return_value={'score': 0.95, 'reason': 'ok', 'tier': 'local'})
+
+    def run_pipeline(self):
+        scope = {'windows': True, 'doors': False, 'patio': False}
+        with override_settings(REFERENCE_INDEX={'DIR': self.directory, 'MIN_SCORE': 0.5, 'ATTACH_TO_PROMPTS': True}):
+            self.visualizer.process_variations(house(), scope, [{'color': 'Black', 'mesh_type': '12x12'}])
+        return {call.kwargs['step_name']: call for call in self.visualizer._call_gemini_edit.call_args_list}
+
+    def test_best_reference_is_attached_to_insertion(self):
+        ReferenceImage.objects.create(
+            tenant_id='boss', category='windows', option_value='black', image=png_upload(house()),
+            embedding=compute_descriptor(house()).tolist(), embedding_version=DESCRIPTOR_VERSION,
+        )
+        ReferenceIndex(self.directory).build('boss')
+
+        calls = self.run_pipeline()
+
+        self.assertNotIn('reference', calls['cleanup'].kwargs)
+        windows = calls['windows']
+        self.assertEqual(windows.kwargs['reference'].mode, 'RGB')
+        self.assertEqual(windows.kwargs['reference'].size, (96, 64))
+        self.assertTrue(windows.args[1].endswith(REFERENCE_NOTE))
+
+    def test_failed_match_continues_without_reference(self):
+        with patch('api.visualizer.services.reference_index') as index:
+            index.size.return_value = 1
+            index.search.side_effect = OSError('index file truncated')
+            calls = self.run_pipeline()
+
+        self.assertIn('windows', calls)
+        self.assertNotIn('reference', calls['windows'].kwargs)
+
+    def test_no_index_sends_no_reference(self):
+        calls = self.run_pipeline()
+        self.assertNotIn('reference', calls['windows'].kwargs)
+        self.assertNotIn(REFERENCE_NOTE, calls['windows'].args[1])
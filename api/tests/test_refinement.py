@@ -0,0 +1,127 @@
+"""
+Tests for api/visualizer/refinement.py and quality recovery in the pipeline.
+"""
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from api.ai_services.structured_output import QualityVerdict
+from api.visualizer.refinement import AttemptCache, RefinementBudget, refine_prompt
+from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
+
+POLICY = {'ENABLED': True, 'MIN_SCORE': 0.7, 'TARGET_SCORE': 0.9, 'MAX_ATTEMPTS': 2, 'MAX_EXTRA_CALLS': 2}
+
+
+def verdict(score, reason='ok'):
+    return {'score': score, 'reason': reason, 'tier': 'model'}
+
+
+class RefinementHelpersTest(TestCase):
+
+    def test_budget_is_all_or_nothing(self):
+        budget = RefinementBudget(3)
+        self.assertTrue(budget.try_spend(2))
+        self.assertFalse(budget.try_spend(2))
+        self.assertEqual(budget.remaining, 1)
+
+    def test_cache_key_covers_prompt_and_image(self):
+        image = Image.new('RGB', (4, 4))
+        key = AttemptCache.key('windows', image, 'a')
+        self.assertEqual(key, AttemptCache.key('windows', image.copy(), 'a'))
+        self.assertNotEqual(key, AttemptCache.key('windows', image, 'b'))
+        self.assertNotEqual(key, AttemptCache.key('windows', Image.new('RGB', (4, 4), 'white'), 'a'))
+
+    def test_refine_prompt_passes_on_reason(self):
+        prompt = refine_prompt('Add screens', 0.5, 0.9, attempt=1, reason='Door was added')
+        self.assertIn('Add screens', prompt)
+        self.assertIn('Door was added', prompt)
+        self.assertNotEqual(prompt, refine_prompt('Add screens', 0.5, 0.9, attempt=2, reason='Door was added'))
+
+
+@override_settings(QUALITY_REFINEMENT=POLICY)
+class PipelineRefinementTest(TestCase):
+
+    def setUp(self):
+        with patch('google.genai.Client'):
+            self.visualizer = ScreenVisualizer(api_key='fake_key')
+        self.prompts = []
+
+        def edit(image, prompt, **kwargs):
+            self.prompts.append((kwargs['step_name'], prompt))
+            return Image.new('RGB', (10, 10))
+
+        self.visualizer._call_gemini_edit = MagicMock(side_effect=edit)
+        self.visualizer._check_quality = MagicMock()
+        self.scope = {'windows': True, 'doors': False, 'patio': False}
+        self.options = {'color': 'Black', 'mesh_type': '12x12'}
+
+    def run_pipeline(self):
+        _, results = self.visualizer.process_variations(Image.new('RGB', (10, 10)), self.scope, [self.options])
+        return results[0]
+
+    def test_good_score_is_not_refined(self):
+        self.visualizer._check_quality.return_value = verdict(0.95)
+        result = self.run_pipeline()
+
+        self.assertEqual(result['refinement_attempts'], 0)
+        self.assertEqual(self.visualizer._call_gemini_edit.call_count, 2)
+
+    def test_low_score_reruns_insertion_with_refined_prompt(self):
+        self.visualizer._check_quality.side_effect = [verdict(0.4, 'Frame is warped'), verdict(0.85, 'Fixed')]
+        result = self.run_pipeline()
+
+        self.assertEqual(result['score'], 0.85)
+        self.assertEqual(result['refinement_attempts'], 1)
+        steps = [step for step, _ in self.prompts]
+        self.assertEqual(steps, ['cleanup', 'windows', 'windows'])
+        self.assertIn('Frame is warped', self.prompts[-1][1])
+
+    def test_budget_caps_extra_calls(self):
+        self.visualizer._check_quality.return_value = verdict(0.4)
+        with override_settings(QUALITY_REFINEMENT={**POLICY, 'MAX_ATTEMPTS': 5, 'MAX_EXTRA_CALLS': 1}):
+            result = self.run_pipeline()
+
+        self.assertEqual(result['refinement_attempts'], 1)
+        self.assertEqual(self.visualizer._call_gemini_edit.call_count, 3)
+
+    def test_worse_refinement_keeps_original(self):
+        self.visualizer._check_quality.side_effect = [verdict(0.5, 'first'), verdict(0.3), verdict(0.2)]
+        result = self.run_pipeline()
+
+        self.assertEqual(result['score'], 0.5)
+        self.assertEqual(result['reason'], 'first')
+        self.assertEqual(result['refinement_attempts'], 2)
+
+    def test_failed_refinement_keeps_original(self):
+        self.visualizer._check_quality.return_value = verdict(0.4)
+
+        def edit(image, prompt, **kwargs):
+            if 'quality control' in prompt:
+                raise ScreenVisualizerError('503')
+            return Image.new('RGB', (10, 10))
+
+        self.visualizer._call_gemini_edit.side_effect = edit
+        result = self.run_pipeline()
+
+        self.assertIsNone(result['error'])
+        self.assertEqual(result['score'], 0.4)
+
+    def test_disabled_for_tenant(self):
+        self.visualizer._check_quality.return_value = verdict(0.4)
+        with patch('api.tenants.boss.config.BossTenantConfig.get_refinement_policy', return_value={'ENABLED': False}):
+            self.run_pipeline()
+
+        self.assertEqual(self.visualizer._call_gemini_edit.call_count, 2)
+
+    @override_settings(QUALITY_CASCADE={'ESCALATE': 'always'})
+    def test_model_quality_checks_are_charged_to_the_budget(self):
+        del self.visualizer._check_quality
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.4, reason='warped'))
+        with override_settings(QUALITY_REFINEMENT={**POLICY, 'MAX_ATTEMPTS': 5, 'MAX_EXTRA_CALLS': 2}):
+            result = self.run_pipeline()
+
+        # The first check is part of the pipeline; the refined edit and its check use up the budget
+        self.assertEqual(result['refinement_attempts'], 1)
+        self.assertEqual(self.visualizer._call_gemini_edit.call_count, 3)
+        self.assertEqual(self.visualizer._call_gemini_json.call_count, 2)
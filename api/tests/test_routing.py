@@ -0,0 +1,151 @@
+"""
+Tests for api/ai_services/routing.py
+"""
+from unittest.mock import MagicMock, patch
+
+import pytest
+from django.test import override_settings
+from PIL import Image
+
+from api.ai_services.routing import (
+    DYNAMIC_THINKING_BUDGET,
+    MIN_SAMPLES,
+    MIN_THINKING_BUDGETS,
+    ModelRoute,
+    ModelRouter,
+    clamp_thinking_budget,
+)
+from api.tenants import get_tenant_config
+
+FLASH = 'gemini-2.5-flash-image'
+PRO = 'gemini-3-pro-image-preview'
+
+
+@pytest.fixture
+def router():
+    return ModelRouter()
+
+
+class TestModelRouter:
+    """Tests for rolling stats and route ordering."""
+
+    def test_policy_order_when_healthy(self, router):
+        routes = router.get_routes('cleanup', {'type': 'cleanup'}, get_tenant_config())
+        assert [r.model for r in routes] == [FLASH, PRO]
+        assert routes[0].include_thoughts is False
+
+    def test_step_config_models_override_policy(self, router):
+        step_config = {'type': 'cleanup', 'models': [{'model': PRO}]}
+        assert router.get_routes('cleanup', step_config, get_tenant_config()) == [ModelRoute('gemini', PRO)]
+
+    def test_degraded_route_moves_last(self, router):
+        for _ in range(MIN_SAMPLES):
+            router.record_outcome('gemini', FLASH, 1.0, success=False)
+
+        routes = router.get_routes('cleanup', {'type': 'cleanup'}, get_tenant_config())
+        assert [r.model for r in routes] == [PRO, FLASH]
+
+    def test_too_few_samples_is_not_degraded(self, router):
+        router.record_outcome('gemini', FLASH, 1.0, success=False)
+        assert router.is_degraded('gemini', FLASH) is False
+
+    def test_thinking_stats_are_kept_per_budget(self, router):
+        router.record_thinking('gemini', PRO, 'patio', None, 1200, 40.0)
+        router.record_thinking('gemini', PRO, 'patio', None, 800, 30.0)
+        router.record_thinking('gemini', PRO, 'patio', 512, 400, 20.0)
+
+        unbounded = router.get_thinking_stats('gemini', PRO, 'patio', None)
+        assert unbounded['samples'] == 2
+        assert unbounded['avg_thinking_tokens'] == 1000
+        assert unbounded['avg_latency'] == 35.0
+        assert router.get_thinking_stats('gemini', PRO, 'patio', 512)['avg_thinking_tokens'] == 400
+        assert router.get_thinking_stats('gemini', PRO, 'cleanup', None)['samples'] == 0
+
+    def test_rank_providers_by_cost(self, router):
+        router.record_cost('expensive', 'a', 0.20)
+        router.record_cost('cheap', 'b', 0.02)
+        assert router.rank_providers(['expensive', 'cheap'], optimize_for='cost') == ['cheap', 'expensive']
+        assert router.rank_providers(['expensive', 'cheap']) == ['expensive', 'cheap']
+
+    def test_rank_providers_skips_degraded(self, router):
+        for _ in range(MIN_SAMPLES):
+            router.record_outcome('first', 'a', 1.0, success=False)
+        assert router.rank_providers(['first', 'second']) == ['second', 'first']
+
+
+class TestPipelineFailover:
+    """Tests for per-step failover in ScreenVisualizer."""
+
+    def test_fails_over_to_next_route(self):
+        from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        image = Image.new('RGB', (10, 10))
+        visualizer._call_gemini_edit = MagicMock(side_effect=[ScreenVisualizerError('503'), image])
+
+        routes = [ModelRoute('gemini', FLASH), ModelRoute('gemini', PRO)]
+        assert visualizer._run_edit_step(image, 'prompt', 'cleanup', routes) is image
+        assert visualizer._call_gemini_edit.call_args_list[1].kwargs['model_name'] == PRO
+
+    def test_step_thinking_settings_apply_to_thinking_routes_only(self):
+        from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        image = Image.new('RGB', (10, 10))
+        visualizer._call_gemini_edit = MagicMock(side_effect=[ScreenVisualizerError('503'), image])
+
+        routes = [ModelRoute('gemini', FLASH, include_thoughts=False), ModelRoute('gemini', PRO)]
+        visualizer._run_edit_step(
+            image, 'prompt', 'cleanup', routes, thinking={'thinking_budget': 0, 'include_thoughts': False}
+        )
+
+        flash, pro = [call.kwargs for call in visualizer._call_gemini_edit.call_args_list]
+        assert flash['include_thoughts'] is False and 'thinking_budget' not in flash
+        # Pro models cannot turn thinking off; the budget is raised to their minimum
+        assert pro['include_thoughts'] is False and pro['thinking_budget'] == MIN_THINKING_BUDGETS['gemini-3-pro']
+
+    def test_thinking_budget_is_clamped_per_model(self):
+        assert clamp_thinking_budget(FLASH, 0) == 0
+        assert clamp_thinking_budget(PRO, 0) == 128
+        assert clamp_thinking_budget(PRO, 4096) == 4096
+        assert clamp_thinking_budget(PRO, None) is None
+        assert clamp_thinking_budget(PRO, DYNAMIC_THINKING_BUDGET) == DYNAMIC_THINKING_BUDGET
+
+    @override_settings(GEMINI_THINKING={'BASELINE_SAMPLE_RATE': 1.0})
+    def test_sampled_calls_run_unbounded_for_the_baseline(self):
+        from api.visualizer.services import ScreenVisualizer
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        image = Image.new('RGB', (10, 10))
+        visualizer._call_gemini_edit = MagicMock(return_value=image)
+
+        visualizer._run_edit_step(
+            image, 'prompt', 'patio', [ModelRoute('gemini', PRO)], thinking={'thinking_budget': 4096}
+        )
+
+        assert visualizer._call_gemini_edit.call_args.kwargs['thinking_budget'] == DYNAMIC_THINKING_BUDGET
+
+    def test_dynamic_budget_calls_are_the_unbounded_baseline(self, router):
+        from api.visualizer.services import ScreenVisualizer
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        span = MagicMock()
+        with patch('api.visualizer.services.model_router', router):
+            visualizer._record_thinking(span, 'patio', PRO, DYNAMIC_THINKING_BUDGET, 900, 30.0)
+
+        span.set_attribute.assert_called_once_with('thinking.budget', DYNAMIC_THINKING_BUDGET)
+        assert router.get_thinking_stats('gemini', PRO, 'patio', None)['samples'] == 1
+
+    def test_raises_when_all_routes_fail(self):
+        from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
+
+        with patch('google.genai.Client'):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+        visualizer._call_gemini_edit = MagicMock(side_effect=ScreenVisualizerError('503'))
+
+        with pytest.raises(ScreenVisualizerError):
+            visualizer._run_edit_step(Image.new('RGB', (10, 10)), 'prompt', 'cleanup', [ModelRoute('gemini', PRO)])
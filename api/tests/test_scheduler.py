@@ -0,0 +1,116 @@
+"""
+Tests for api/services/scheduler.py
+"""
+from collections import Counter
+from unittest.mock import MagicMock
+
+import pytest
+
+from api.services.scheduler import BULK, INTERACTIVE, FairScheduler, Job, get_tenant_policy
+
+
+def make_scheduler(policies=None, spend=None):
+    policies = policies or {}
+    spend = spend or {}
+    return FairScheduler(
+        policy_for=lambda tenant_id: {'WEIGHT': 1.0, 'MAX_CONCURRENT': None, 'DAILY_BUDGET_USD': None,
+                                      **policies.get(tenant_id, {})},
+        spend_for=lambda tenant_id: spend.get(tenant_id, 0.0),
+    )
+
+
+def drain(scheduler, count):
+    jobs = []
+    for _ in range(count):
+        job = scheduler.pop()
+        if job is None:
+            break
+        scheduler.finish(job)
+        jobs.append(job)
+    return jobs
+
+
+class TestFairScheduler:
+    """Tests for lanes, weights, caps and budgets."""
+
+    def test_interactive_jumps_ahead_of_bulk(self):
+        scheduler = make_scheduler()
+        for request_id in range(100):
+            scheduler.push(Job(request_id, user_id=1, tenant_id='pools', lane=BULK))
+        scheduler.push(Job(1000, user_id=2, tenant_id='boss', lane=INTERACTIVE))
+
+        assert scheduler.pop().request_id == 1000
+
+    def test_tenants_share_by_weight(self):
+        scheduler = make_scheduler({'boss': {'WEIGHT': 3}})
+        for request_id in range(100):
+            scheduler.push(Job(request_id, user_id=1, tenant_id='boss', lane=BULK))
+            scheduler.push(Job(1000 + request_id, user_id=2, tenant_id='pools', lane=BULK))
+
+        served = Counter(job.tenant_id for job in drain(scheduler, 40))
+        assert served == {'boss': 30, 'pools': 10}
+
+    def test_users_share_a_tenant(self):
+        scheduler = make_scheduler()
+        for request_id in range(50):
+            scheduler.push(Job(request_id, user_id=1, tenant_id='boss', lane=BULK))
+        scheduler.push(Job(100, user_id=2, tenant_id='boss', lane=BULK))
+
+        order = [job.request_id for job in drain(scheduler, 3)]
+        assert 100 in order[:2]
+
+    def test_idle_tenant_gets_no_saved_credit(self):
+        scheduler = make_scheduler()
+        for request_id in range(10):
+            scheduler.push(Job(request_id, user_id=1, tenant_id='boss', lane=BULK))
+        drain(scheduler, 6)
+        for request_id in range(10):
+            scheduler.push(Job(100 + request_id, user_id=2, tenant_id='pools', lane=BULK))
+
+        served = Counter(job.tenant_id for job in drain(scheduler, 6))
+        assert served == {'boss': 3, 'pools': 3}
+
+    def test_concurrency_cap(self):
+        scheduler = make_scheduler({'boss': {'MAX_CONCURRENT': 1}})
+        scheduler.push(Job(1, user_id=1, tenant_id='boss'))
+        scheduler.push(Job(2, user_id=1, tenant_id='boss'))
+        scheduler.push(Job(3, user_id=2, tenant_id='pools', lane=BULK))
+
+        first = scheduler.pop()
+        assert first.request_id == 1
+        # boss is at its cap, so pools' bulk job runs before boss' interactive one
+        assert scheduler.pop().request_id == 3
+        assert scheduler.pop() is None
+
+        scheduler.finish(first)
+        assert scheduler.pop().request_id == 2
+
+    def test_budget_exhausted_tenant_waits(self):
+        scheduler = make_scheduler({'boss': {'DAILY_BUDGET_USD': 5.0}}, spend={'boss': 5.5})
+        scheduler.push(Job(1, user_id=1, tenant_id='boss'))
+        scheduler.push(Job(2, user_id=2, tenant_id='pools', lane=BULK))
+
+        assert scheduler.pop().request_id == 2
+        assert scheduler.pop() is None
+        assert scheduler.get_status()['boss']['queued'][INTERACTIVE] == 1
+
+    def test_pop_uses_refreshed_policy_and_spend(self):
+        policy_for = MagicMock(return_value={'WEIGHT': 1.0, 'MAX_CONCURRENT': None, 'DAILY_BUDGET_USD': 5.0})
+        spend_for = MagicMock(return_value=1.0)
+        scheduler = FairScheduler(policy_for=policy_for, spend_for=spend_for)
+        scheduler.push(Job(1, user_id=1, tenant_id='boss'))
+        scheduler.push(Job(2, user_id=1, tenant_id='boss'))
+
+        scheduler.refresh(scheduler.tenant_ids())
+        scheduler.refresh(scheduler.tenant_ids())
+        assert (policy_for.call_count, spend_for.call_count) == (1, 1)
+
+        assert [job.request_id for job in drain(scheduler, 2)] == [1, 2]
+        assert (policy_for.call_count, spend_for.call_count) == (1, 1)
+
+
+@pytest.mark.django_db
+def test_tenant_policy_defaults():
+    policy = get_tenant_policy('boss')
+    assert policy['WEIGHT'] == 1.0
+    assert policy['MAX_CONCURRENT'] is None
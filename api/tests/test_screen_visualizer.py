@@ -19,6 +19,7 @@ if not settings.configured:
         DEBUG=True
     )
 
+from api.ai_services.structured_output import QualityVerdict
 from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
 from api.visualizer.prompts import get_quality_check_prompt
 
@@ -40,7 +41,7 @@ class TestScreenVisualizer(unittest.TestCase):
     def test_pipeline_success(self):
         # Mock the internal methods to avoid API calls
         self.visualizer._call_gemini_edit = MagicMock(return_value=self.mock_image)
-        self.visualizer._call_gemini_json = MagicMock(return_value={'score': 0.95, 'reason': 'Test reason'})
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.95, reason='Test reason'))
         self.visualizer._save_debug_image = MagicMock()
 
         scope = {'windows': True, 'doors': False, 'patio': False}
@@ -65,7 +66,7 @@ class TestScreenVisualizer(unittest.TestCase):
     def test_gatekeeper_patio(self):
         # Test that patio prompt is sent when patio is selected
         self.visualizer._call_gemini_edit = MagicMock(return_value=self.mock_image)
-        self.visualizer._call_gemini_json = MagicMock(return_value={'score': 0.95, 'reason': 'Test reason'})
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.95, reason='Test reason'))
         self.visualizer._save_debug_image = MagicMock()
 
         scope = {'windows': False, 'doors': False, 'patio': True}
@@ -83,7 +84,7 @@ class TestScreenVisualizer(unittest.TestCase):
     def test_gatekeeper_all(self):
         # Test that all steps are executed when all selected
         self.visualizer._call_gemini_edit = MagicMock(return_value=self.mock_image)
-        self.visualizer._call_gemini_json = MagicMock(return_value={'score': 0.95, 'reason': 'Test reason'})
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.95, reason='Test reason'))
         self.visualizer._save_debug_image = MagicMock()
 
         scope = {'windows': True, 'doors': True, 'patio': True}
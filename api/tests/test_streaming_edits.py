@@ -0,0 +1,164 @@
+"""
+Tests for streamed image edits (api/visualizer/streaming.py).
+"""
+import io
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from api.ai_services.structured_output import QualityVerdict
+from api.visualizer.services import ScreenVisualizer
+from api.visualizer.streaming import EditStreamReader, ProgressRelay
+
+
+def png_bytes(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def usage(output_tokens):
+    return MagicMock(prompt_token_count=100, candidates_token_count=output_tokens,
+                     thoughts_token_count=0, total_token_count=100 + output_tokens)
+
+
+def text_chunk(text, output_tokens=None):
+    chunk = MagicMock(usage_metadata=usage(output_tokens) if output_tokens is not None else None)
+    chunk.candidates[0].content.parts = [MagicMock(text=text, inline_data=None)]
+    return chunk
+
+
+def image_chunk(data, output_tokens=None):
+    chunk = MagicMock(usage_metadata=usage(output_tokens) if output_tokens is not None else None)
+    part = MagicMock(text=None)
+    part.inline_data.data = data
+    chunk.candidates[0].content.parts = [part]
+    return chunk
+
+
+class EditStreamReaderTest(TestCase):
+
+    def test_chunks_are_handled_as_they_arrive(self):
+        events = []
+        reader = EditStreamReader(
+            on_thought=lambda text: events.append(('thought', text)),
+            on_progress=lambda fraction, tokens: events.append(('progress', fraction, tokens)),
+            expected_tokens=1000,
+        )
+
+        def stream():
+            yield text_chunk('Removing the hose', 250)
+            events.append(('received', 'thought'))
+            yield image_chunk(png_bytes(), 1250)
+            events.append(('received', 'image'))
+            yield text_chunk('Done.', 1260)
+
+        edit = reader(stream())
+
+        self.assertEqual(events[:3], [
+            ('thought', 'Removing the hose'), ('progress', 0.25, 250), ('received', 'thought'),
+        ])
+        self.assertEqual(events[3], ('progress', 1.0, 1250))
+        self.assertEqual(edit.image.size, (8, 8))
+        self.assertEqual(edit.thinking_text, ['Removing the hose', 'Done.'])
+        self.assertEqual(edit.usage_metadata.candidates_token_count, 1260)
+        self.assertEqual(edit.chunks, 3)
+        self.assertIsNotNone(edit.image_ready_s)
+
+    def test_progress_is_estimated_without_usage_metadata(self):
+        fractions = []
+        reader = EditStreamReader(on_progress=lambda fraction, tokens: fractions.append(fraction), expected_tokens=10)
+
+        reader(iter([text_chunk('x' * 20), text_chunk('x' * 200)]))
+
+        self.assertEqual(fractions, [0.5, 0.99])
+
+    def test_failing_callback_does_not_abort_the_stream(self):
+        reader = EditStreamReader(on_thought=MagicMock(side_effect=OSError('disk full')))
+        edit = reader(iter([text_chunk('thinking'), image_chunk(png_bytes())]))
+        self.assertIsNotNone(edit.image)
+
+
+class ProgressRelayTest(TestCase):
+
+    def test_worker_updates_wait_for_the_owner_thread(self):
+        reported = []
+        relay = ProgressRelay(lambda fraction, tokens: reported.append((fraction, tokens, threading.get_ident())))
+
+        workers = [threading.Thread(target=relay, args=args) for args in [(0.4, 400), (0.6, 600), (0.5, 500)]]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(reported, [])
+
+        relay.drain()
+        self.assertEqual(reported, [(0.6, 600, threading.get_ident())])
+
+        relay(0.8, 800)
+        self.assertEqual(reported[-1][:2], (0.8, 800))
+
+
+class StreamedGeminiEditTest(TestCase):
+
+    def setUp(self):
+        self.client = MagicMock()
+        with patch('google.genai.Client', return_value=self.client):
+            self.visualizer = ScreenVisualizer(api_key='fake_key')
+        self.visualizer._capture_artifacts = True
+
+    def test_streamed_edit_logs_thoughts_incrementally(self):
+        self.client.models.generate_content_stream.return_value = iter([
+            text_chunk('Plan the frame', 100), text_chunk('Check the mesh', 200), image_chunk(png_bytes(), 1400),
+        ])
+
+        with patch('api.visualizer.services.debug_artifact_writer') as writer:
+            result = self.visualizer._call_gemini_edit(
+                Image.new('RGB', (8, 8)), 'prompt', step_name='cleanup', stream=True
+            )
+
+        self.assertEqual(result.size, (8, 8))
+        self.client.models.generate_content.assert_not_called()
+        writer.submit_text.assert_not_called()
+        appended = [call.args[0] for call in writer.append_text.call_args_list]
+        self.assertEqual(len(appended), 2)
+        self.assertIn('--- PROMPT ---', appended[0])
+        self.assertTrue(appended[1].startswith('\n[Part 2]\nCheck the mesh'))
+        self.assertEqual(len({call.args[2] for call in writer.append_text.call_args_list}), 1)
+
+    def test_thinking_log_names_job_and_variation(self):
+        self.visualizer._job_id = '42'
+        filename, header = self.visualizer._thinking_log_header('windows', 'prompt', '_v2')
+        self.assertTrue(filename.endswith('_42_windows_v2.txt'))
+        self.assertIn('Step: windows_v2', header)
+
+    def test_debug_image_names_job_and_variation(self):
+        self.visualizer._job_id = '42'
+        with patch('api.visualizer.services.debug_artifact_writer') as writer:
+            self.visualizer._save_debug_image(Image.new('RGB', (8, 8)), '2_windows', '_v2')
+
+        filename = writer.submit_image.call_args.args[2]
+        self.assertTrue(filename.endswith('_42_2_windows_v2.jpg'))
+        self.assertEqual(writer.submit_image.call_args.kwargs['job_id'], '42')
+
+    @override_settings(GEMINI_STREAMING={'ENABLED': True, 'EXPECTED_OUTPUT_TOKENS': 1000})
+    def test_pipeline_reports_progress_between_steps(self):
+        def edit(image, prompt, **kwargs):
+            kwargs['on_progress'](0.5, 500)
+            kwargs['on_progress'](0.5, 510)
+            return Image.new('RGB', (10, 10))
+
+        self.visualizer._call_gemini_edit = MagicMock(side_effect=edit)
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.9, reason='ok'))
+        progress = MagicMock()
+
+        self.visualizer.process_pipeline(
+            Image.new('RGB', (10, 10)), {'windows': True}, {'color': 'Black'}, progress_callback=progress
+        )
+
+        self.assertTrue(self.visualizer._call_gemini_edit.call_args.kwargs['stream'])
+        percents = [call.args[0] for call in progress.call_args_list]
+        # Cleaning starts at 30 and doors at 70: halfway through cleanup is 49
+        self.assertEqual(percents[:3], [10, 30, 49])
@@ -0,0 +1,187 @@
+"""
+Tests for schema-constrained model responses (api/ai_services/structured_output.py).
+"""
+import io
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from PIL import Image
+
+from api.ai_services.structured_output import (
+    AuditFindings,
+    MalformedOutputError,
+    QualityVerdict,
+    StreamingJSONParser,
+    StructuredOutputError,
+    from_data,
+    generate_structured,
+    read_structured,
+    response_schema,
+)
+from api.audit.models import AuditReport
+from api.audit.services import AuditService, AuditServiceError
+from api.models import VisualizationRequest
+
+AUDIT_JSON = (
+    '{"has_ground_level_access": true, "has_concealment": false, "has_glass_proximity": false, '
+    '"has_hardware_weakness": true, "vulnerabilities": [{"type": "Fly Screen", '
+    '"description": "Standard {mesh} screens", "severity": "Medium", "location": "Back window"}], '
+    '"analysis_summary": "Screens are easily cut."}'
+)
+
+
+def chunk(text, usage=None):
+    response = MagicMock(usage_metadata=usage)
+    response.candidates[0].content.parts = [MagicMock(text=text, thought=False)]
+    return response
+
+
+def split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class SchemaTest(TestCase):
+
+    def test_schema_lists_required_fields_and_constraints(self):
+        schema = response_schema(AuditFindings)
+
+        self.assertEqual(schema['required'], schema['propertyOrdering'])
+        self.assertEqual(schema['properties']['has_concealment'], {'type': 'boolean'})
+        severity = schema['properties']['vulnerabilities']['items']['properties']['severity']
+        self.assertEqual(severity['enum'], ['High', 'Medium', 'Low'])
+        self.assertEqual(response_schema(QualityVerdict)['properties']['score']['maximum'], 1.0)
+
+    def test_valid_data_becomes_dataclasses(self):
+        verdict = from_data(QualityVerdict, {'score': 1, 'reason': 'Clean install', 'extra': 'ignored'})
+        self.assertEqual(verdict, QualityVerdict(score=1.0, reason='Clean install'))
+        self.assertIsInstance(verdict.score, float)
+
+    def test_invalid_data_is_rejected(self):
+        cases = [
+            {'reason': 'no score'},
+            {'score': 'high', 'reason': 'wrong type'},
+            {'score': True, 'reason': 'bool is not a number'},
+            {'score': 1.5, 'reason': 'out of range'},
+        ]
+        for data in cases:
+            with self.subTest(data=data), self.assertRaises(StructuredOutputError):
+                from_data(QualityVerdict, data)
+
+        with self.assertRaisesRegex(StructuredOutputError, r'vulnerabilities\[0\]\.severity'):
+            from_data(AuditFindings, {
+                'has_ground_level_access': True, 'has_concealment': False, 'has_glass_proximity': False,
+                'has_hardware_weakness': False, 'analysis_summary': 'x',
+                'vulnerabilities': [{'type': 't', 'description': 'd', 'severity': 'Critical', 'location': 'l'}],
+            })
+
+
+class StreamingParserTest(TestCase):
+
+    def test_object_split_across_chunks(self):
+        parser = StreamingJSONParser()
+        done = [parser.feed(part) for part in split(AUDIT_JSON, 7)]
+
+        self.assertTrue(done[-1])
+        self.assertFalse(any(done[:-1]))
+        self.assertEqual(parser.result()['vulnerabilities'][0]['description'], 'Standard {mesh} screens')
+
+    def test_malformed_output_fails_at_first_bad_character(self):
+        cases = [
+            'Sure! Here is the analysis: {',
+            '```json\n{"score": 1}',
+            '{"score": 1]',
+            '{"score": 1} and more',
+            '{"score": @}',
+        ]
+        for text in cases:
+            with self.subTest(text=text), self.assertRaises(MalformedOutputError):
+                StreamingJSONParser().feed(text)
+
+    def test_incomplete_object_is_rejected(self):
+        parser = StreamingJSONParser()
+        parser.feed('{"score": 0.8, "reason": "cut')
+        with self.assertRaises(MalformedOutputError):
+            parser.result()
+
+    def test_runaway_output_is_abandoned(self):
+        parser = StreamingJSONParser(max_chars=10)
+        with self.assertRaises(MalformedOutputError):
+            parser.feed('{"reason": "' + 'a' * 20)
+
+
+class ReadStructuredTest(TestCase):
+
+    def test_stream_is_validated(self):
+        usage = MagicMock(total_token_count=42)
+        stream = [chunk(part) for part in split('{"score": 0.8, "reason": "Frames aligned"}', 9)]
+        stream[-1].usage_metadata = usage
+
+        response = read_structured(iter(stream), QualityVerdict)
+
+        self.assertEqual(response.value, QualityVerdict(score=0.8, reason='Frames aligned'))
+        self.assertIs(response.usage_metadata, usage)
+
+    def test_malformed_stream_is_closed_early(self):
+        consumed = []
+        usage = MagicMock(total_token_count=12)
+
+        def stream():
+            for text in ['I think the', ' image looks', ' great overall.']:
+                consumed.append(text)
+                yield chunk(text, usage)
+
+        generator = stream()
+        with self.assertRaises(MalformedOutputError) as caught:
+            read_structured(generator, QualityVerdict)
+
+        self.assertEqual(consumed, ['I think the'])
+        self.assertIs(caught.exception.usage_metadata, usage)
+        with self.assertRaises(StopIteration):
+            next(generator)
+
+    def test_thoughts_are_not_part_of_the_answer(self):
+        thought = chunk('Considering {the frame')
+        thought.candidates[0].content.parts[0].thought = True
+        response = read_structured(iter([thought, chunk('{"score": 0.5, "reason": "ok"}')]), QualityVerdict)
+        self.assertEqual(response.value.score, 0.5)
+
+    def test_generate_structured_requests_json_schema(self):
+        client = MagicMock()
+        client.models.generate_content_stream.return_value = iter([chunk('{"score": 0.9, "reason": "ok"}')])
+
+        generate_structured(client, 'gemini-2.0-flash', ['prompt'], QualityVerdict)
+
+        config = client.models.generate_content_stream.call_args.kwargs['config']
+        self.assertEqual(config.response_mime_type, 'application/json')
+        self.assertEqual(config.response_schema, response_schema(QualityVerdict))
+
+
+class AuditStructuredOutputTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='structured', password='pw')
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), 'tan').save(buffer, format='PNG')
+        upload = SimpleUploadedFile('house.png', buffer.getvalue(), content_type='image/png')
+        self.request = VisualizationRequest.objects.create(user=user, original_image=upload)
+        with patch('api.audit.services.genai.Client'):
+            self.service = AuditService(api_key='fake_key')
+
+    def test_findings_are_stored(self):
+        self.service.client.models.generate_content_stream.return_value = iter(
+            [chunk(part) for part in split(AUDIT_JSON, 50)]
+        )
+
+        report = self.service.perform_audit(self.request)
+
+        self.assertTrue(report.has_hardware_weakness)
+        self.assertEqual(report.vulnerabilities[0]['severity'], 'Medium')
+
+    def test_malformed_audit_is_an_error_not_a_default_report(self):
+        self.service.client.models.generate_content_stream.return_value = iter([chunk('No JSON today.')])
+
+        with self.assertRaises(AuditServiceError):
+            self.service.perform_audit(self.request)
+        self.assertFalse(AuditReport.objects.exists())
@@ -1,7 +1,10 @@
 """Tests for tenant config API endpoint."""
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 
+from api.models import TenantConfig
+from api.tenants import clear_cache, get_tenant_config
+
 
 class TenantConfigAPITest(TestCase):
     
@@ -23,3 +26,53 @@ class TenantConfigAPITest(TestCase):
         self.assertIn('choices', data)
         self.assertIn('mesh', data['choices'])
         self.assertIn('frame_color', data['choices'])
+
+
+class TenantConfigCachingTest(TestCase):
+
+    def setUp(self):
+        clear_cache()
+        self.addCleanup(clear_cache)
+        self.client = APIClient()
+
+    def test_etag_and_cache_headers(self):
+        response = self.client.get('/api/config/')
+
+        self.assertTrue(response['ETag'].startswith('"boss-0-'))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.assertIn('Host', response['Vary'])
+
+    def test_not_modified(self):
+        etag = self.client.get('/api/tenant/schema/')['ETag']
+
+        response = self.client.get('/api/tenant/schema/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.assertEqual(self.client.get('/api/tenant/schema/', HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+        self.assertEqual(self.client.get('/api/tenant/schema/', HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_schema_matches_tenant_config(self):
+        data = self.client.get('/api/tenant/schema/').json()
+        self.assertEqual(data['product_categories'], get_tenant_config().get_product_schema())
+        self.assertEqual(data['config_version'], 0)
+
+    @override_settings(TENANT_CONFIG={'RELOAD_SECONDS': 0})
+    def test_new_config_version_changes_etag(self):
+        etag = self.client.get('/api/config/')['ETag']
+        TenantConfig.objects.create(
+            tenant_id='boss', display_name='Boss West', config_version=2,
+            product_categories=get_tenant_config().get_product_schema(),
+            pipeline_steps=get_tenant_config().get_pipeline_steps(),
+        )
+
+        response = self.client.get('/api/config/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['display_name'], 'Boss West')
+
+    def test_expired_token_is_ignored(self):
+        response = self.client.get('/api/config/', HTTP_AUTHORIZATION='Bearer expired')
+        self.assertEqual(response.status_code, 200)
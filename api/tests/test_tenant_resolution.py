@@ -0,0 +1,176 @@
+"""
+Tests for per-request tenant resolution (api/tenants/middleware.py).
+"""
+import io
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import VisualizationRequest
+from api.tenants import clear_cache, get_tenant_config, tenant_context
+from api.tenants.middleware import resolve_tenant_id
+
+RESOLUTION = {
+    'HOSTS': {'pools.example.com': 'pools', 'windows.example.com': 'windows'},
+    'API_KEYS': {'roofs-key': 'roofs', 'stale-key': 'retired'},
+    'JWT_CLAIM': 'tenant',
+}
+
+
+def png_upload(name='house.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'gray').save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class TenantContextTest(TestCase):
+
+    def setUp(self):
+        clear_cache()
+
+    def test_context_overrides_default(self):
+        with tenant_context('pools'):
+            self.assertEqual(get_tenant_config().tenant_id, 'pools')
+        self.assertEqual(get_tenant_config().tenant_id, 'boss')
+
+    def test_contexts_are_isolated_per_thread(self):
+        seen = {}
+
+        def run(tenant_id):
+            with tenant_context(tenant_id):
+                seen[tenant_id] = get_tenant_config().tenant_id
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in ('pools', 'roofs')]
+        with tenant_context('windows'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(get_tenant_config().tenant_id, 'windows')
+
+        self.assertEqual(seen, {'pools': 'pools', 'roofs': 'roofs'})
+
+    def test_unknown_tenant_raises(self):
+        with self.assertRaises(ValueError):
+            with tenant_context('nonexistent'):
+                pass
+
+
+@override_settings(TENANT_RESOLUTION=RESOLUTION)
+class ResolveTenantTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username='resolver', password='pw')
+
+    def bearer(self, tenant_id):
+        token = AccessToken.for_user(self.user)
+        token['tenant'] = tenant_id
+        return f'Bearer {token}'
+
+    def test_host(self):
+        request = self.factory.get('/', HTTP_HOST='pools.example.com:8000')
+        self.assertEqual(resolve_tenant_id(request), 'pools')
+
+    def test_api_key_wins_over_host(self):
+        request = self.factory.get('/', HTTP_HOST='pools.example.com', HTTP_X_API_KEY='roofs-key')
+        self.assertEqual(resolve_tenant_id(request), 'roofs')
+
+    def test_jwt_claim_wins_over_host(self):
+        request = self.factory.get('/', HTTP_HOST='pools.example.com', HTTP_AUTHORIZATION=self.bearer('windows'))
+        self.assertEqual(resolve_tenant_id(request), 'windows')
+
+    def test_invalid_token_is_ignored(self):
+        request = self.factory.get('/', HTTP_HOST='pools.example.com', HTTP_AUTHORIZATION='Bearer not-a-jwt')
+        self.assertEqual(resolve_tenant_id(request), 'pools')
+
+    def test_unknown_tenant_falls_through(self):
+        request = self.factory.get('/', HTTP_HOST='windows.example.com', HTTP_X_API_KEY='stale-key')
+        self.assertEqual(resolve_tenant_id(request), 'windows')
+
+    def test_unmatched_request_uses_default(self):
+        self.assertIsNone(resolve_tenant_id(self.factory.get('/', HTTP_HOST='other.example.com')))
+
+
+@override_settings(TENANT_RESOLUTION=RESOLUTION)
+class TenantRequestTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tenant-user', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, data, host):
+        with patch('api.views.job_dispatcher') as dispatcher:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/visualizations/', data, format='multipart', HTTP_HOST=host)
+        return response, dispatcher
+
+    def test_request_is_created_and_queued_under_resolved_tenant(self):
+        response, dispatcher = self.post({'original_image': png_upload(), 'frame_color': 'white'}, 'windows.example.com')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(VisualizationRequest.objects.get(id=response.data['id']).tenant_id, 'windows')
+        dispatcher.submit.assert_called_once_with(response.data['id'], user_id=self.user.id, tenant_id='windows')
+
+    def test_options_are_validated_against_resolved_tenant(self):
+        # Dark bronze is a Boss frame color; the windows tenant does not offer it
+        response, _ = self.post({'original_image': png_upload(), 'frame_color': 'dark_bronze'}, 'windows.example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('frame_color', response.data)
+
+        response, _ = self.post({'original_image': png_upload(), 'frame_color': 'dark_bronze'}, 'localhost')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_tenant_config_endpoint_follows_host(self):
+        response = self.client.get('/api/config/', HTTP_HOST='pools.example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['tenant_id'], 'pools')
+
+    def test_tenant_config_endpoint_ignores_token_tenant(self):
+        token = AccessToken.for_user(self.user)
+        token['tenant'] = 'windows'
+        client = APIClient()
+
+        response = client.get('/api/config/', HTTP_HOST='pools.example.com', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.json()['tenant_id'], 'pools')
+        self.assertNotIn('Authorization', response['Vary'])
+
+        response = client.get('/api/tenant/schema/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.json()['tenant_id'], 'boss')
+        response = client.get('/api/tenant/schema/', HTTP_X_API_KEY='roofs-key', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.json()['tenant_id'], 'roofs')
+
+    def test_login_token_carries_tenant_claim(self):
+        from api.auth_views import CustomTokenObtainPairSerializer
+
+        with tenant_context('roofs'):
+            token = CustomTokenObtainPairSerializer.get_token(self.user)
+        self.assertEqual(token['tenant'], 'roofs')
+        self.assertEqual(token.access_token['tenant'], 'roofs')
+
+
+class TenantJobTest(TestCase):
+
+    def test_processing_runs_as_request_tenant(self):
+        from api.ai_enhanced_processor import AIEnhancedImageProcessor
+
+        user = User.objects.create_user(username='job-user', password='pw')
+        with tenant_context('pools'):
+            request = VisualizationRequest.objects.create(user=user, original_image=png_upload())
+        self.assertEqual(request.tenant_id, 'pools')
+
+        seen = []
+        with patch('google.genai.Client'):
+            processor = AIEnhancedImageProcessor()
+        with patch.object(processor, '_process_image', side_effect=lambda r: seen.append(get_tenant_config().tenant_id) or []):
+            processor.process_image(request)
+
+        self.assertEqual(seen, ['pools'])
+        self.assertEqual(get_tenant_config().tenant_id, 'boss')
@@ -0,0 +1,136 @@
+"""
+Tests for compiled tenant snapshots (api/tenants/snapshot.py).
+"""
+import threading
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from api.models import TenantConfig
+from api.serializers import VisualizationRequestCreateSerializer
+from api.tenants import clear_cache, get_tenant_config
+from api.tenants.snapshot import SnapshotCache, compile_snapshot
+
+
+def boss_row(**overrides):
+    mesh_type, _, mesh_color = get_tenant_config('boss').get_product_schema()
+    fields = {
+        'tenant_id': 'boss',
+        'display_name': 'Boss Screens West',
+        'product_categories': [
+            mesh_type,
+            {'key': 'frame_color', 'label': 'Frame Color', 'type': 'select',
+             'options': [{'value': 'black', 'label': 'Black', 'hex': '#1c1c1c'},
+                         {'value': 'charcoal', 'label': 'Charcoal', 'hex': '#36454f'}]},
+            mesh_color,
+        ],
+        'pipeline_steps': ['cleanup', 'windows', 'quality_check'],
+        'step_configs': {'windows': {'description': 'Fitting Windows'}},
+        **overrides,
+    }
+    return TenantConfig.objects.create(**fields)
+
+
+class CompileSnapshotTest(TestCase):
+
+    def test_code_config(self):
+        config = get_tenant_config('boss')
+        snapshot = compile_snapshot(config)
+
+        self.assertEqual(snapshot.config_version, 0)
+        self.assertEqual(snapshot.pipeline_steps, tuple(config.get_pipeline_steps()))
+        self.assertEqual(dict(snapshot.get_step_config('windows')), config.get_step_config('windows'))
+        self.assertEqual(snapshot.get_step_config('missing'), {})
+        self.assertEqual(list(snapshot.get_options('mesh_type')), config.get_options_for_category('mesh_type'))
+        self.assertTrue(snapshot.is_valid_choice('frame_color', 'dark_bronze'))
+        self.assertFalse(snapshot.is_valid_choice('frame_color', 'neon'))
+        self.assertFalse(snapshot.is_valid_choice('no_such_category', 'black'))
+
+    def test_snapshot_is_read_only(self):
+        snapshot = compile_snapshot(get_tenant_config('boss'))
+        with self.assertRaises(TypeError):
+            snapshot.get_step_config('windows')['timeout_seconds'] = 1
+        with self.assertRaises(AttributeError):
+            snapshot.config_version = 2
+
+    def test_row_overrides_code(self):
+        snapshot = compile_snapshot(get_tenant_config('boss'), boss_row(config_version=4))
+
+        self.assertEqual(snapshot.display_name, 'Boss Screens West')
+        self.assertEqual(snapshot.config_version, 4)
+        self.assertEqual(snapshot.pipeline_steps, ('cleanup', 'windows', 'quality_check'))
+        self.assertTrue(snapshot.is_valid_choice('frame_color', 'charcoal'))
+        self.assertFalse(snapshot.is_valid_choice('frame_color', 'dark_bronze'))
+        # Row step configs are merged over the code ones
+        windows = snapshot.get_step_config('windows')
+        self.assertEqual(windows['description'], 'Fitting Windows')
+        self.assertEqual(windows['timeout_seconds'], 120)
+
+
+class SnapshotReloadTest(TestCase):
+
+    def setUp(self):
+        clear_cache()
+        self.addCleanup(clear_cache)
+
+    @override_settings(TENANT_CONFIG={'RELOAD_SECONDS': 0})
+    def test_row_changes_are_picked_up(self):
+        config = get_tenant_config('boss')
+        self.assertEqual(config.snapshot.config_version, 0)
+
+        row = boss_row()
+        self.assertEqual(config.snapshot.config_version, 1)
+        self.assertEqual(config.snapshot.display_name, 'Boss Screens West')
+
+        row.display_name = 'Boss Screens East'
+        row.config_version = 2
+        row.save()
+        self.assertEqual(config.snapshot.display_name, 'Boss Screens East')
+
+        row.delete()
+        self.assertEqual(config.snapshot.config_version, 0)
+
+    @override_settings(TENANT_CONFIG={'RELOAD_SECONDS': 3600})
+    def test_snapshot_is_reused_between_checks(self):
+        config = get_tenant_config('boss')
+        first = config.snapshot
+        boss_row()
+
+        with self.assertNumQueries(0):
+            self.assertIs(config.snapshot, first)
+
+    @override_settings(TENANT_CONFIG={'RELOAD_SECONDS': 0})
+    def test_validation_uses_current_options(self):
+        serializer = VisualizationRequestCreateSerializer()
+        boss_row()
+
+        self.assertEqual(serializer.validate_frame_color('charcoal'), 'charcoal')
+        with self.assertRaisesMessage(Exception, "Valid options: ['black', 'charcoal']"):
+            serializer.validate_frame_color('dark_bronze')
+
+    @override_settings(TENANT_CONFIG={'RELOAD_SECONDS': 0})
+    def test_version_check_does_not_block_other_threads(self):
+        cache = SnapshotCache()
+        config = get_tenant_config('boss')
+        first = cache.get(config)
+        started, release = threading.Event(), threading.Event()
+
+        def slow_read(known_stamps):
+            started.set()
+            release.wait(5)
+            return None
+
+        with patch.object(SnapshotCache, '_read_versions', side_effect=slow_read):
+            checker = threading.Thread(target=cache.get, args=(config,))
+            checker.start()
+            self.assertTrue(started.wait(5))
+            served = []
+            with override_settings(TENANT_CONFIG={'RELOAD_SECONDS': 3600}):
+                reader = threading.Thread(target=lambda: served.append(cache.get(config)))
+                reader.start()
+                reader.join(2)
+            # Served from the compiled snapshot while the check is still running
+            self.assertEqual(served, [first])
+            release.set()
+            checker.join(5)
+            reader.join(5)
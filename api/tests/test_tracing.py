@@ -0,0 +1,207 @@
+"""
+Tests for api/monitoring/tracing.py
+"""
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from api.monitoring.tracing import (
+    FileSpanSink,
+    InMemorySpanSink,
+    LogSpanSink,
+    OTLPSpanSink,
+    PipelineTracer,
+)
+
+
+@pytest.fixture
+def sink():
+    return InMemorySpanSink()
+
+
+@pytest.fixture
+def tracer(sink):
+    return PipelineTracer(sink=sink)
+
+
+class TestPipelineTracer:
+    """Tests for span nesting and export."""
+
+    def test_nested_spans_share_trace(self, tracer, sink):
+        with tracer.span('job') as job:
+            with tracer.span('step', step='cleanup') as step:
+                tracer.add_to_current('retries', 1)
+                tracer.add_to_current('retries', 1)
+
+        assert [s.name for s in sink.spans] == ['step', 'job']
+        assert step.trace_id == job.trace_id
+        assert step.parent_id == job.span_id
+        assert step.attributes == {'step': 'cleanup', 'retries': 2}
+        assert job.duration_ms >= step.duration_ms
+
+    def test_exports_only_when_root_closes(self, tracer, sink):
+        with tracer.span('job'):
+            with tracer.span('step'):
+                pass
+            assert sink.spans == []
+        assert len(sink.spans) == 2
+
+    def test_error_marks_span(self, tracer, sink):
+        with pytest.raises(ValueError):
+            with tracer.span('job'):
+                raise ValueError('boom')
+
+        assert sink.spans[0].status == 'error'
+        assert sink.spans[0].error == 'ValueError: boom'
+
+    def test_no_current_span_is_noop(self, tracer):
+        tracer.set_on_current('key', 'value')
+        assert tracer.current_span() is None
+
+
+class TestSinks:
+    """Tests for the file and OTLP sinks."""
+
+    def test_file_sink_writes_json_lines(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'traces', 'spans.jsonl')
+            sink = FileSpanSink(path)
+            tracer = PipelineTracer(sink=sink)
+            with tracer.span('job', request_id=1):
+                with tracer.span('step'):
+                    pass
+            sink.flush(timeout=5)
+
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+            assert [r['name'] for r in records] == ['step', 'job']
+            assert records[1]['attributes'] == {'request_id': 1}
+
+    def test_file_sink_rotates(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'spans.jsonl')
+            sink = FileSpanSink(path, max_bytes=1, backup_count=2)
+            tracer = PipelineTracer(sink=sink)
+            for index in range(4):
+                with tracer.span('job', index=index):
+                    pass
+            sink.flush(timeout=5)
+
+            assert sorted(os.listdir(root)) == ['spans.jsonl', 'spans.jsonl.1', 'spans.jsonl.2']
+            with open(path) as f:
+                assert json.loads(f.read())['attributes'] == {'index': 3}
+
+    def test_full_export_queue_drops_traces(self):
+        blocked = threading.Event()
+        sink = OTLPSpanSink('http://collector/v1/traces', max_queue_size=1)
+        tracer = PipelineTracer(sink=sink)
+
+        with patch.object(sink, '_post', side_effect=lambda payload: blocked.wait(5)) as post:
+            for index in range(4):
+                with tracer.span('job', index=index):
+                    pass
+            blocked.set()
+            sink.flush(timeout=5)
+
+        # One trace in flight, one queued, the rest dropped
+        assert sink.dropped_count >= 2
+        assert post.call_count == 4 - sink.dropped_count
+
+    def test_log_sink_logs_one_line_per_trace(self, caplog):
+        tracer = PipelineTracer(sink=LogSpanSink())
+        with caplog.at_level(logging.INFO, logger='api.monitoring.traces'):
+            with tracer.span('job'):
+                with tracer.span('step'):
+                    pass
+
+        records = [r for r in caplog.records if r.name == 'api.monitoring.traces']
+        assert len(records) == 1
+        assert [span['name'] for span in json.loads(records[0].getMessage())] == ['step', 'job']
+
+    def test_otlp_payload(self, tracer, sink):
+        with tracer.span('job'):
+            with tracer.span('step', tokens=10, ratio=0.5, cached=False):
+                pass
+
+        payload = OTLPSpanSink('http://collector/v1/traces', service_name='test').build_payload(sink.spans)
+        spans = payload['resourceSpans'][0]['scopeSpans'][0]['spans']
+        step = spans[0]
+        assert step['parentSpanId'] == spans[1]['spanId']
+        assert {'key': 'tokens', 'value': {'intValue': '10'}} in step['attributes']
+        assert {'key': 'ratio', 'value': {'doubleValue': 0.5}} in step['attributes']
+        assert {'key': 'cached', 'value': {'boolValue': False}} in step['attributes']
+
+
+class TestGeminiEditInstrumentation:
+    """Tests for spans recorded by ScreenVisualizer._call_gemini_edit."""
+
+    def test_records_prep_model_and_decode(self, tracer, sink):
+        from api.visualizer.services import ScreenVisualizer
+
+        output = io.BytesIO()
+        Image.new('RGB', (8, 8), color='red').save(output, format='PNG')
+        part = MagicMock(text=None)
+        part.inline_data.data = output.getvalue()
+        response = MagicMock()
+        response.candidates[0].content.parts = [part]
+        response.usage_metadata = MagicMock(
+            prompt_token_count=100, candidates_token_count=50, thoughts_token_count=20, total_token_count=170
+        )
+
+        client = MagicMock()
+        client.models.generate_content.side_effect = [Exception('429 Too Many Requests'), response]
+        with patch('google.genai.Client', return_value=client):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+
+        with patch('api.visualizer.services.pipeline_tracer', tracer), patch('api.visualizer.services.time.sleep'):
+            with tracer.span('step'):
+                result = visualizer._call_gemini_edit(Image.new('RGB', (8, 8)), 'prompt', step_name='cleanup')
+
+        assert result.size == (8, 8)
+        spans = {s.name: s for s in sink.spans}
+        assert spans['gemini.image_prep'].attributes['bytes_in'] > 0
+        assert spans['gemini.generate_content'].attributes['retries'] == 1
+        assert spans['gemini.generate_content'].attributes['tokens.total'] == 170
+        assert spans['gemini.decode'].attributes['bytes_out'] == len(output.getvalue())
+
+    def test_thinking_budget_is_sent_and_compared_to_unbounded_calls(self, tracer, sink):
+        from api.ai_services.routing import MIN_SAMPLES, ModelRouter
+        from api.visualizer.services import ScreenVisualizer
+
+        output = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(output, format='PNG')
+        part = MagicMock(text=None)
+        part.inline_data.data = output.getvalue()
+        response = MagicMock()
+        response.candidates[0].content.parts = [part]
+        response.usage_metadata = MagicMock(
+            prompt_token_count=100, candidates_token_count=50, thoughts_token_count=300, total_token_count=450
+        )
+
+        client = MagicMock()
+        client.models.generate_content.return_value = response
+        with patch('google.genai.Client', return_value=client):
+            visualizer = ScreenVisualizer(api_key='fake_key')
+
+        router = ModelRouter()
+        for _ in range(MIN_SAMPLES):
+            router.record_thinking('gemini', visualizer.model_name, 'patio', None, 1300, 600.0)
+
+        with patch('api.visualizer.services.pipeline_tracer', tracer), \
+                patch('api.visualizer.services.model_router', router):
+            visualizer._call_gemini_edit(Image.new('RGB', (8, 8)), 'prompt', step_name='patio', thinking_budget=512)
+
+        config = client.models.generate_content.call_args.kwargs['config']
+        assert config.thinking_config.thinking_budget == 512
+        call = {s.name: s for s in sink.spans}['gemini.generate_content']
+        assert call.attributes['thinking.budget'] == 512
+        assert call.attributes['thinking.tokens_delta'] == -1000
+        assert call.attributes['thinking.latency_delta_ms'] < 0
+        assert router.get_thinking_stats('gemini', visualizer.model_name, 'patio', 512)['samples'] == 1
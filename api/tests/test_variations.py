@@ -0,0 +1,135 @@
+"""
+Tests for multi-variation generation (shared cleanup, fan-out insertions).
+"""
+import io
+import threading
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from PIL import Image
+
+from api.ai_services.structured_output import QualityVerdict
+from api.models import GeneratedImage, VisualizationRequest
+from api.serializers import VisualizationRequestCreateSerializer
+from api.visualizer.services import ScreenVisualizer, ScreenVisualizerError
+
+
+def jpeg_bytes(size=(20, 10)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class ProcessVariationsTest(TestCase):
+
+    def setUp(self):
+        with patch('google.genai.Client'):
+            self.visualizer = ScreenVisualizer(api_key='fake_key')
+        self.image = Image.new('RGB', (10, 10))
+        self.visualizer._call_gemini_json = MagicMock(return_value=QualityVerdict(score=0.9, reason='ok'))
+        self.scope = {'windows': True, 'doors': False, 'patio': False}
+        self.variations = [{'color': 'Black', 'mesh_type': '12x12'}, {'color': 'White', 'mesh_type': '12x12'}]
+
+    def test_cleanup_runs_once(self):
+        prompts = []
+        lock = threading.Lock()
+
+        def edit(image, prompt, **kwargs):
+            with lock:
+                prompts.append((kwargs['step_name'], prompt))
+            return Image.new('RGB', (10, 10))
+
+        self.visualizer._call_gemini_edit = MagicMock(side_effect=edit)
+        clean_image, results = self.visualizer.process_variations(self.image, self.scope, self.variations)
+
+        steps = [step for step, _ in prompts]
+        self.assertEqual(steps.count('cleanup'), 1)
+        self.assertEqual(steps.count('windows'), 2)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[1]['options']['color'], 'White')
+        self.assertTrue(any('White' in prompt for step, prompt in prompts if step == 'windows'))
+        self.assertEqual(self.visualizer._call_gemini_json.call_count, 2)
+
+    def test_failed_variation_is_reported(self):
+        def edit(image, prompt, **kwargs):
+            if kwargs['step_name'] == 'windows' and 'White' in prompt:
+                raise ScreenVisualizerError('503')
+            return Image.new('RGB', (10, 10))
+
+        self.visualizer._call_gemini_edit = MagicMock(side_effect=edit)
+        _, results = self.visualizer.process_variations(self.image, self.scope, self.variations)
+
+        self.assertIsNone(results[0]['error'])
+        self.assertIsInstance(results[1]['error'], ScreenVisualizerError)
+        self.assertIsNone(results[1]['image'])
+
+    def test_all_variations_failing_raises(self):
+        def edit(image, prompt, **kwargs):
+            if kwargs['step_name'] == 'windows':
+                raise ScreenVisualizerError('503')
+            return Image.new('RGB', (10, 10))
+
+        self.visualizer._call_gemini_edit = MagicMock(side_effect=edit)
+        with self.assertRaises(ScreenVisualizerError):
+            self.visualizer.process_variations(self.image, self.scope, self.variations)
+
+
+class VariationsSerializerTest(TestCase):
+
+    def validate(self, variations):
+        return VisualizationRequestCreateSerializer().validate_variations(variations)
+
+    def test_accepts_tenant_options(self):
+        self.assertEqual(self.validate([{'frame_color': 'white'}]), [{'frame_color': 'white'}])
+        self.assertEqual(self.validate(None), [])
+
+    def test_rejects_unknown_color(self):
+        from rest_framework.exceptions import ValidationError
+
+        with self.assertRaises(ValidationError):
+            self.validate([{'frame_color': 'neon'}])
+
+    def test_rejects_names_unsafe_in_filenames(self):
+        from rest_framework.exceptions import ValidationError
+
+        self.assertEqual(self.validate([{'name': 'Black-v2_a'}]), [{'name': 'Black-v2_a'}])
+        for name in ['../etc/passwd', 'a b', '', 'x' * 41, 7]:
+            with self.subTest(name=name), self.assertRaises(ValidationError):
+                self.validate([{'name': name}])
+
+    def test_rejects_too_many(self):
+        from rest_framework.exceptions import ValidationError
+
+        with self.assertRaises(ValidationError):
+            self.validate([{'frame_color': 'white'}] * 20)
+
+
+class SaveGeneratedImagesTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='variations', password='pw')
+        self.request = VisualizationRequest.objects.create(
+            user=user,
+            original_image=SimpleUploadedFile('test.jpg', b'fake', content_type='image/jpeg'),
+        )
+
+    def test_bulk_saves_variations(self):
+        from api.ai_enhanced_processor import AIEnhancedImageProcessor
+
+        processor = AIEnhancedImageProcessor()
+        entries = processor._variation_entries('window_fixed', [
+            {'options': {'color': 'Black'}, 'generated_image_data': jpeg_bytes(), 'quality_score': 0.9},
+            {'options': {'color': 'White'}, 'generated_image_data': None, 'error': '503'},
+            {'options': {'color': 'Dark Bronze'}, 'generated_image_data': jpeg_bytes(), 'quality_score': 0.8},
+        ])
+        self.assertEqual([name for name, _, _ in entries], ['window_fixed_1_black', 'window_fixed_3_dark_bronze'])
+
+        saved = processor._save_generated_images(self.request, entries)
+
+        self.assertEqual(len(saved), 2)
+        self.assertEqual(GeneratedImage.objects.filter(request=self.request).count(), 2)
+        image = GeneratedImage.objects.get(request=self.request, metadata__variation_index=3)
+        self.assertEqual((image.image_width, image.image_height), (20, 10))
+        self.assertNotIn('generated_image_data', image.metadata)
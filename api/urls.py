@@ -18,6 +18,7 @@ from .views_config import TenantConfigView, TenantSchemaView
 router = DefaultRouter()
 
 router.register(r'visualizations', views.VisualizationRequestViewSet, basename='visualizationrequest')
+router.register(r'batches', views.VisualizationBatchViewSet, basename='visualizationbatch')
 router.register(r'generated-images', views.GeneratedImageViewSet, basename='generatedimage')
 router.register(r'profile', views.UserProfileViewSet, basename='userprofile')
 router.register(r'ai-services', views.AIServiceViewSet, basename='aiservice')
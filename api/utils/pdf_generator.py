@@ -1,4 +1,5 @@
 import io
+import math
 import os
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
@@ -8,6 +9,8 @@ from reportlab.lib.units import inch
 from django.conf import settings
 from PIL import Image as PILImage
 
+from api.tenants import get_tenant_config
+
 # Mock pricing engine - will be replaced with real pricing from Phase 2
 PRICING = {
     'window': 1000,
@@ -15,11 +18,15 @@ PRICING = {
     'door_french_door': 4000,
     'door_sliding_door': 4800,
     'patio_enclosure': 8000,
+    'patio_enclosure_per_foot': 400,
 }
 
 def calculate_quote(visualization_request):
     """
     Calculate quote based on model fields or scope fallback.
+
+    Patio enclosures are priced per foot of the opening width measured by the
+    model (dimensional_analysis), or at the flat rate when it is unknown.
     """
     scope = visualization_request.scope or {}
     items = []
@@ -67,7 +74,19 @@ def calculate_quote(visualization_request):
 
     # Patio enclosure - use model field, fallback to scope
     has_patio = visualization_request.patio_enclosure or scope.get('patio')
-    if has_patio:
+    span_ft = (visualization_request.dimensional_analysis or {}).get('opening_width_ft')
+    if has_patio and span_ft:
+        # Whole feet of opening, rounded up
+        feet = math.ceil(span_ft)
+        subtotal = feet * PRICING['patio_enclosure_per_foot']
+        items.append({
+            'name': 'Patio Enclosure System (per ft of opening)',
+            'qty': feet,
+            'unit_price': PRICING['patio_enclosure_per_foot'],
+            'subtotal': subtotal
+        })
+        total += subtotal
+    elif has_patio:
         subtotal = PRICING['patio_enclosure']
         items.append({
             'name': 'Patio Enclosure System',
@@ -89,7 +108,10 @@ def generate_visualization_pdf(visualization_request):
     3. The Solution (After + Heat Map)
     4. The Investment (Quote)
     5. The Guarantee
+
+    Branded for the tenant the request was made under.
     """
+    company_name = get_tenant_config(visualization_request.tenant_id).snapshot.display_name
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(
         buffer,
@@ -130,7 +152,7 @@ def generate_visualization_pdf(visualization_request):
         logo_path = os.path.join(settings.BASE_DIR, 'frontend', 'public', 'logo512.png')
         if os.path.exists(logo_path):
             return RLImage(logo_path, width=1.5*inch, height=1.5*inch)
-        return Paragraph("BOSS SECURITY SCREENS", title_style)
+        return Paragraph(company_name.upper(), title_style)
 
     # --- Page 1: The Assessment ---
     elements.append(get_logo())
@@ -154,7 +176,7 @@ def generate_visualization_pdf(visualization_request):
             elements.append(img)
             
     elements.append(Spacer(1, 0.5*inch))
-    elements.append(Paragraph("Prepared by Boss Security Screens", subtitle_style))
+    elements.append(Paragraph(f"Prepared by {company_name}", subtitle_style))
     elements.append(PageBreak())
     
     # --- Page 2: The Vulnerability Map ---
@@ -209,7 +231,7 @@ def generate_visualization_pdf(visualization_request):
     elements.append(PageBreak())
     
     # --- Page 3: The Solution ---
-    elements.append(Paragraph("The Boss Solution", title_style))
+    elements.append(Paragraph(f"The {company_name} Solution", title_style))
     
     # After Image
     generated_result = visualization_request.results.first()
@@ -218,7 +240,7 @@ def generate_visualization_pdf(visualization_request):
         if os.path.exists(img_path):
             img = _get_resized_image(img_path, width=6*inch, height=4*inch)
             elements.append(img)
-            elements.append(Paragraph("Protected with Boss Security Screens", subtitle_style))
+            elements.append(Paragraph(f"Protected with {company_name}", subtitle_style))
     
     elements.append(Spacer(1, 0.2*inch))
     
@@ -286,7 +308,7 @@ def generate_visualization_pdf(visualization_request):
     # --- Page 5: The Guarantee ---
     elements.append(Paragraph("Our Promise", title_style))
     
-    elements.append(Paragraph("The Boss 'No Break-In' Guarantee", subtitle_style))
+    elements.append(Paragraph(f"The {company_name} 'No Break-In' Guarantee", subtitle_style))
     elements.append(Paragraph("""
     We are so confident in our product that if a burglar manages to break through our screen, 
     we will replace the screen and pay your insurance deductible up to $3,000.
@@ -1,28 +1,44 @@
+import io
 import logging
 import time
+from PIL import Image
+from django.core.files.base import ContentFile
 from django.db import transaction
+from django.http import HttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from django.core.cache import cache
-from rest_framework import viewsets, permissions, status, filters
+from rest_framework import mixins, viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import VisualizationRequest, GeneratedImage, UserProfile, Lead
+from .models import VisualizationBatch, VisualizationRequest, GeneratedImage, UserProfile, Lead
 from .serializers import (
     VisualizationRequestListSerializer,
     VisualizationRequestDetailSerializer,
     VisualizationRequestCreateSerializer,
+    VisualizationBatchSerializer,
+    VisualizationBatchCreateSerializer,
     GeneratedImageSerializer,
     UserProfileSerializer,
     LeadSerializer
 )
+from .services.duplicate_detector import detect_duplicate
+from .services.job_dispatcher import job_dispatcher
+from .services.scheduler import BULK
+from .tenants import get_tenant_config
+from .visualizer.compositing import ScreenCompositor, cached_compositor, resolve_color
 # from .tasks import process_image_request # Import later if using Celery
 
 logger = logging.getLogger(__name__)
 
+# Longest side (px) of recolor previews
+PREVIEW_DEFAULT_SIZE = 1024
+PREVIEW_MIN_SIZE = 64
+PREVIEW_MAX_SIZE = 4096
+
 
 class StandardResultsSetPagination(PageNumberPagination):
     """Standard pagination class for API responses."""
@@ -111,11 +127,16 @@ class VisualizationRequestViewSet(viewsets.ModelViewSet):
         Create a new visualization request with proper error handling.
         """
         try:
+            reuse_duplicate = serializer.validated_data.pop('reuse_duplicate', None)
+
             # Save the instance with the current user
             instance = serializer.save(user=self.request.user, status='pending')
 
             logger.info(f"VisualizationRequest created: ID={instance.id}, User={self.request.user.username}")
 
+            # Re-uploads of the same photo can start from the earlier cleanup
+            detect_duplicate(instance, reuse=reuse_duplicate)
+
             # Trigger AI processing
             self._trigger_ai_processing(instance)
 
@@ -187,6 +208,114 @@ class VisualizationRequestViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """
+        Recolored JPEG preview of a result, composited locally without a model call.
+
+        Query params: frame_color, mesh_color (tenant palette values),
+        result_id (defaults to the latest result), max_size (longest side, px,
+        PREVIEW_MIN_SIZE to PREVIEW_MAX_SIZE).
+        """
+        instance = self.get_object()
+        try:
+            max_size = int(request.query_params.get('max_size', PREVIEW_DEFAULT_SIZE))
+        except ValueError:
+            max_size = None
+        if max_size is None or not PREVIEW_MIN_SIZE <= max_size <= PREVIEW_MAX_SIZE:
+            return Response(
+                {'error': f'max_size must be an integer from {PREVIEW_MIN_SIZE} to {PREVIEW_MAX_SIZE}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            # Previews are composited at preview size, not full resolution
+            compositor, _ = self._get_compositor(instance, request.query_params.get('result_id'), max_size=max_size)
+            image = compositor.render(**self._get_recolor_targets(instance, request.query_params))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=80)
+        return HttpResponse(buffer.getvalue(), content_type='image/jpeg')
+
+    @action(detail=True, methods=['post'])
+    def recolor(self, request, pk=None):
+        """
+        Save a recolored copy of a result as a new result, without a model call.
+
+        Body: frame_color and/or mesh_color (tenant palette values), optional result_id.
+        """
+        instance = self.get_object()
+        try:
+            compositor, source = self._get_compositor(instance, request.data.get('result_id'))
+            targets = self._get_recolor_targets(instance, request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not targets:
+            return Response({'error': 'Provide frame_color and/or mesh_color.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        buffer = io.BytesIO()
+        compositor.render(**targets).save(buffer, format='JPEG', quality=85)
+
+        source_metadata = source.metadata or {}
+        current_frame_color, current_mesh_color = self._get_result_colors(instance, source)
+        frame_color = request.data.get('frame_color') or current_frame_color
+        mesh_color = request.data.get('mesh_color') or current_mesh_color
+        result = GeneratedImage(request=instance, metadata={
+            'composited': True,
+            'source_result_id': source.id,
+            'frame_color': frame_color,
+            'mesh_color': mesh_color,
+            'quality_score': source_metadata.get('quality_score'),
+        })
+        result.generated_image.save(
+            f"recolor_{instance.id}_{frame_color}_{mesh_color}.jpg", ContentFile(buffer.getvalue()), save=True
+        )
+        logger.info(f"VisualizationRequest recolor: ID={instance.id}, source={source.id}")
+
+        serializer = GeneratedImageSerializer(result, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def _get_result_colors(self, instance, result):
+        """Frame and mesh colors a result was rendered with."""
+        metadata = result.metadata or {}
+        frame_color = (
+            metadata.get('frame_color')
+            or (metadata.get('options') or {}).get('color')
+            or instance.frame_color
+        )
+        return frame_color, metadata.get('mesh_color') or instance.mesh_color
+
+    def _get_compositor(self, instance, result_id=None, max_size=None):
+        """Compositor for one of the request's results (the latest by default), optionally downscaled."""
+        if not instance.clean_image:
+            raise ValueError("This visualization has no clean image to composite against.")
+        result = instance.results.filter(id=result_id).first() if result_id else instance.results.first()
+        if result is None:
+            raise ValueError("No generated result found.")
+
+        tenant_config = get_tenant_config(instance.tenant_id)
+        frame_color, mesh_color = self._get_result_colors(instance, result)
+
+        def build():
+            with Image.open(result.generated_image) as generated, Image.open(instance.clean_image) as clean:
+                return ScreenCompositor(
+                    generated, clean,
+                    frame_color=resolve_color(tenant_config, 'frame_color', frame_color),
+                    mesh_color=resolve_color(tenant_config, 'mesh_color', mesh_color),
+                    max_size=max_size
+                )
+
+        return cached_compositor((result.id, frame_color, mesh_color, max_size), build), result
+
+    def _get_recolor_targets(self, instance, params):
+        """Resolve requested frame/mesh colors to RGB render arguments."""
+        tenant_config = get_tenant_config(instance.tenant_id)
+        return {
+            category: resolve_color(tenant_config, category, params[category])
+            for category in ('frame_color', 'mesh_color') if params.get(category)
+        }
+
     @action(detail=True, methods=['get'])
     def pdf(self, request, pk=None):
         """Generate PDF report."""
@@ -219,28 +348,51 @@ class VisualizationRequestViewSet(viewsets.ModelViewSet):
 
     def _trigger_ai_processing(self, instance):
         """
-        Trigger AI-enhanced processing for the visualization request.
+        Queue the request for AI-enhanced processing once the current transaction commits.
         """
-        from .ai_enhanced_processor import AIEnhancedImageProcessor
-        import threading
+        transaction.on_commit(lambda: job_dispatcher.submit(
+            instance.id, user_id=instance.user_id, tenant_id=instance.tenant_id
+        ))
+        logger.info(f"AI-enhanced processing queued for request {instance.id}")
+
 
-        def process_in_background():
-            """Process the image in a background thread using AI services."""
-            try:
-                # Use AI-enhanced processor (Gemini)
-                processor = AIEnhancedImageProcessor()
-                generated_images = processor.process_image(instance)
-                logger.info(f"Successfully processed request {instance.id} with AI enhancement, generated {len(generated_images)} images")
-            except Exception as e:
-                logger.error(f"Error in AI processing for request {instance.id}: {str(e)}")
-                instance.mark_as_failed(str(e))
+class VisualizationBatchViewSet(mixins.CreateModelMixin,
+                                mixins.RetrieveModelMixin,
+                                mixins.ListModelMixin,
+                                viewsets.GenericViewSet):
+    """
+    API endpoint for bulk submission of visualization requests.
+
+    POST takes a multipart batch of images and/or a manifest of storage keys
+    (see VisualizationBatchCreateSerializer); GET returns the batch with its
+    aggregate progress.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        return VisualizationBatch.objects.filter(user=self.request.user)
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return VisualizationBatchCreateSerializer
+        return VisualizationBatchSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            logger.error(f"Batch validation failed: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # Start processing in background thread
-        thread = threading.Thread(target=process_in_background)
-        thread.daemon = True
-        thread.start()
+        batch = serializer.save()
+        request_ids = list(batch.requests.order_by('id').values_list('id', flat=True))
+        # Batch jobs run in the bulk lane, behind interactive single requests
+        transaction.on_commit(lambda: job_dispatcher.submit_many(
+            request_ids, user_id=request.user.id, tenant_id=request.tenant.tenant_id, lane=BULK
+        ))
+        logger.info(f"VisualizationBatch created: ID={batch.id}, {len(request_ids)} requests, User={request.user.username}")
 
-        logger.info(f"AI-enhanced processing started for request {instance.id}")
+        return Response(VisualizationBatchSerializer(batch).data, status=status.HTTP_201_CREATED)
 
 
 class GeneratedImageViewSet(viewsets.ReadOnlyModelViewSet):
@@ -323,6 +475,7 @@ class AIServiceViewSet(viewsets.ViewSet):
             status_info = {
                 'registry_status': ai_service_registry.get_registry_status(),
                 'factory_status': AIServiceFactory.get_factory_status(),
+                'job_queue': job_dispatcher.get_status(),
                 'timestamp': time.time()
             }
 
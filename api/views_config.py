@@ -1,62 +1,151 @@
 """Tenant configuration API views."""
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, Tuple
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions, status
 
-from api.tenants import get_tenant_config
+from api.tenants import get_default_tenant_config, get_tenant_config
+from api.tenants.middleware import PUBLIC_TENANT_HEADERS, resolve_public_tenant_id
+
+# Cache-Control max-age / stale-while-revalidate when settings.TENANT_CONFIG sets none
+DEFAULT_CACHE_MAX_AGE = 60
+DEFAULT_STALE_WHILE_REVALIDATE = 600
 
 
-class TenantConfigView(APIView):
+class ConfigDocumentCache:
     """
-    API endpoint for tenant configuration.
+    Serialized config documents with their ETags, per tenant snapshot version.
+
+    A document is built once per (document, tenant, version stamp); a new
+    config_version of the tenant makes its old documents unreachable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents: Dict[Tuple, Tuple[bytes, str]] = {}
+
+    def get(self, name: str, snapshot, build: Callable[[object], dict]) -> Tuple[bytes, str]:
+        """(JSON body, strong ETag) of a document for a snapshot."""
+        key = (name, snapshot.tenant_id, snapshot.config_version, snapshot.stamp)
+        document = self._documents.get(key)
+        if document is None:
+            body = json.dumps(build(snapshot), separators=(',', ':'), ensure_ascii=False, default=dict).encode('utf-8')
+            etag = f'"{snapshot.tenant_id}-{snapshot.config_version}-{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+            with self._lock:
+                # Drop documents of older versions of this tenant
+                for stale in [k for k in self._documents if k[:2] == key[:2]]:
+                    del self._documents[stale]
+                document = self._documents[key] = (body, etag)
+        return document
+
 
-    Returns product choices and display options for the active tenant.
+# Global instance
+config_documents = ConfigDocumentCache()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as If-None-Match requires."""
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in candidates]
+
+
+class CachedConfigView(APIView):
     """
-    permission_classes = [permissions.AllowAny]  # Config is public
+    Public, read-only view of a tenant config document.
+
+    Responses carry a strong ETag and a shared Cache-Control so CDNs and
+    browsers can cache them; a matching If-None-Match gets 304 Not Modified.
+    The tenant comes from the Host or X-API-Key header only, never from an
+    Authorization token, so the response varies on just those headers.
+    Subclasses set document_name and build the payload from a TenantSnapshot.
+    """
+    permission_classes = [permissions.AllowAny]
+    # Public documents; a stale or foreign token must not turn them into a 401
+    authentication_classes = []
+    document_name = ''
+    error_message = 'Failed to load tenant config'
+
+    def build(self, snapshot) -> dict:
+        raise NotImplementedError
 
     def get(self, request):
         try:
-            config = get_tenant_config()
-
-            return Response({
-                'tenant_id': config.tenant_id,
-                'display_name': config.display_name,
-                'choices': {
-                    'mesh': config.get_mesh_choices(),
-                    'frame_color': config.get_frame_color_choices(),
-                    'mesh_color': config.get_mesh_color_choices(),
-                    'opacity': config.get_opacity_choices(),
-                },
-                'pipeline_steps': config.get_pipeline_steps(),
-            })
+            body, etag = config_documents.get(self.document_name, self._tenant_config(request).snapshot, self.build)
         except Exception as e:
             return Response(
-                {'error': f'Failed to load tenant config: {str(e)}'},
+                {'error': f'{self.error_message}: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        if _etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = self._cache_control()
+        patch_vary_headers(response, PUBLIC_TENANT_HEADERS)
+        return response
+
+    @staticmethod
+    def _tenant_config(request):
+        tenant_id = resolve_public_tenant_id(request)
+        return get_tenant_config(tenant_id) if tenant_id else get_default_tenant_config()
 
-class TenantSchemaView(APIView):
+    @staticmethod
+    def _cache_control() -> str:
+        config = getattr(settings, 'TENANT_CONFIG', {}) or {}
+        max_age = config.get('CACHE_MAX_AGE', DEFAULT_CACHE_MAX_AGE)
+        stale = config.get('CACHE_STALE_WHILE_REVALIDATE', DEFAULT_STALE_WHILE_REVALIDATE)
+        return f'public, max-age={max_age}, stale-while-revalidate={stale}'
+
+
+class TenantConfigView(CachedConfigView):
+    """
+    API endpoint for tenant configuration.
+
+    Returns product choices and display options for the request's tenant.
+    """
+    document_name = 'config'
+
+    def build(self, snapshot) -> dict:
+        return {
+            'tenant_id': snapshot.tenant_id,
+            'display_name': snapshot.display_name,
+            'config_version': snapshot.config_version,
+            'choices': {
+                'mesh': snapshot.get_options('mesh_type'),
+                'frame_color': snapshot.get_options('frame_color'),
+                'mesh_color': snapshot.get_options('mesh_color'),
+                'opacity': snapshot.get_options('opacity'),
+            },
+            'pipeline_steps': snapshot.pipeline_steps,
+        }
+
+
+class TenantSchemaView(CachedConfigView):
     """
     API endpoint for tenant product schema.
 
     Returns the product_categories schema for dynamic form rendering.
     GET /api/tenant/schema/
     """
-    permission_classes = [permissions.AllowAny]  # Schema is public
+    document_name = 'schema'
+    error_message = 'Failed to load tenant schema'
 
-    def get(self, request):
-        try:
-            config = get_tenant_config()
-
-            return Response({
-                'tenant_id': config.tenant_id,
-                'display_name': config.display_name,
-                'product_categories': config.get_product_schema(),
-                'pipeline_steps': config.get_pipeline_steps(),
-            })
-        except Exception as e:
-            return Response(
-                {'error': f'Failed to load tenant schema: {str(e)}'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+    def build(self, snapshot) -> dict:
+        return {
+            'tenant_id': snapshot.tenant_id,
+            'display_name': snapshot.display_name,
+            'config_version': snapshot.config_version,
+            'product_categories': snapshot.product_schema,
+            'pipeline_steps': snapshot.pipeline_steps,
+        }
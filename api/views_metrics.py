@@ -0,0 +1,31 @@
+"""Prometheus metrics endpoint."""
+import hmac
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from api.monitoring.production_monitor import production_monitor, get_monitor_settings
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Expose ProductionMonitor metrics, merged across worker processes, for scraping.
+
+    The metrics include per-tenant cost and error series, so the endpoint is
+    closed by default. A request is served when it sends
+    settings.PRODUCTION_MONITOR['AUTH_TOKEN'] as a Bearer token, or comes
+    from an address in ALLOWED_IPS. Otherwise it gets 401 when a token is
+    configured and 403 when none is.
+    """
+    options = get_monitor_settings()
+    token = options.get('AUTH_TOKEN')
+    if request.META.get('REMOTE_ADDR') not in (options.get('ALLOWED_IPS') or ()):
+        if not token:
+            return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+
+    return HttpResponse(production_monitor.export_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,308 @@
+"""
+Debug Artifact Writer
+---------------------
+Background writer for pipeline debug artifacts (step images and thinking logs).
+
+The pipeline used to encode a JPEG and write a text file into MEDIA_ROOT on
+every step of every job. Artifacts are now handed to a single daemon thread
+through a bounded queue, sampled per tenant, pruned by total directory size,
+and optionally zipped into one bundle per job.
+
+Usage:
+    from api.visualizer.artifacts import debug_artifact_writer
+
+    if debug_artifact_writer.should_sample(tenant_config):
+        debug_artifact_writer.submit_image(image, "pipeline_steps", filename, job_id=job_id)
+"""
+
+import io
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through settings.DEBUG_ARTIFACTS
+DEFAULT_ARTIFACT_SETTINGS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+    'MAX_QUEUE_SIZE': 64,
+    'MAX_DIR_BYTES': 512 * 1024 * 1024,  # Per artifact directory
+    'BUNDLE_PER_JOB': False,
+    'BUNDLE_DIR': 'pipeline_bundles',
+}
+
+# Prune down to this fraction of MAX_DIR_BYTES so we don't prune on every write
+PRUNE_LOW_WATER_MARK = 0.9
+
+
+def get_artifact_settings() -> Dict:
+    """Merge settings.DEBUG_ARTIFACTS over the defaults."""
+    merged = dict(DEFAULT_ARTIFACT_SETTINGS)
+    merged.update(getattr(settings, 'DEBUG_ARTIFACTS', {}) or {})
+    return merged
+
+
+class DebugArtifactWriter:
+    """
+    Asynchronous, sampled writer for pipeline debug artifacts.
+
+    All disk I/O (including JPEG encoding) happens on one daemon thread.
+    When the queue is full, new artifacts are dropped rather than blocking
+    the pipeline.
+    """
+
+    def __init__(self, root: Optional[str] = None, options: Optional[Dict] = None):
+        self._root = root
+        self._options = options
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._dir_usage: Dict[str, int] = {}
+        # Files written per job, kept only while BUNDLE_PER_JOB needs them
+        self._job_files: Dict[str, Set[str]] = defaultdict(set)
+        self.dropped_count = 0
+        self.written_count = 0
+
+    # =========================================================================
+    # Configuration
+    # =========================================================================
+
+    @property
+    def options(self) -> Dict:
+        if self._options is None:
+            return get_artifact_settings()
+        return self._options
+
+    @property
+    def root(self) -> str:
+        return self._root or str(settings.MEDIA_ROOT)
+
+    def should_sample(self, tenant_config=None) -> bool:
+        """
+        Decide whether a job should capture debug artifacts.
+
+        The rate comes from the tenant config when it defines one, otherwise
+        from settings.DEBUG_ARTIFACTS['SAMPLE_RATE'].
+        """
+        if not self.options.get('ENABLED', True):
+            return False
+
+        rate = None
+        if tenant_config is not None and hasattr(tenant_config, 'get_debug_artifact_sample_rate'):
+            rate = tenant_config.get_debug_artifact_sample_rate()
+        if rate is None:
+            rate = self.options.get('SAMPLE_RATE', 1.0)
+
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        return random.random() < rate
+
+    # =========================================================================
+    # Public API (called from the pipeline thread, never blocks)
+    # =========================================================================
+
+    def submit_image(self, image, subdir: str, filename: str, job_id: Optional[str] = None) -> bool:
+        """Queue an image to be encoded and written as JPEG."""
+        return self._submit(('image', subdir, filename, image, job_id))
+
+    def submit_text(self, text: str, subdir: str, filename: str, job_id: Optional[str] = None) -> bool:
+        """Queue a text file to be written."""
+        return self._submit(('text', subdir, filename, text, job_id))
+
+    def append_text(self, text: str, subdir: str, filename: str, job_id: Optional[str] = None) -> bool:
+        """Queue text to be appended to a file, creating it on first use (for logs written as they grow)."""
+        return self._submit(('append', subdir, filename, text, job_id))
+
+    def finalize_job(self, job_id: Optional[str]) -> bool:
+        """
+        Mark a job as finished.
+
+        When BUNDLE_PER_JOB is enabled, the job's artifacts are zipped into a
+        single bundle and the loose files are removed. Either way the job's
+        file list is released.
+        """
+        if not job_id:
+            return False
+        if not self.options.get('BUNDLE_PER_JOB'):
+            self._job_files.pop(job_id, None)
+            return False
+        if self._submit(('bundle', None, None, None, job_id)):
+            return True
+        self._job_files.pop(job_id, None)
+        return False
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until all queued artifacts are written (mainly for tests)."""
+        if self._queue is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+
+        # Queue.join() has no timeout, so poll unfinished_tasks instead
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Get writer counters for monitoring."""
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'written': self.written_count,
+            'dropped': self.dropped_count,
+        }
+
+    # =========================================================================
+    # Worker
+    # =========================================================================
+
+    def _submit(self, item) -> bool:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            logger.warning(f"Debug artifact queue full, dropping {item[0]} artifact {item[2] or item[4]}")
+            return False
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=self.options.get('MAX_QUEUE_SIZE', 64))
+            self._thread = threading.Thread(
+                target=self._run, name='debug-artifact-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                kind, subdir, filename, payload, job_id = item
+                if kind == 'bundle':
+                    self._write_bundle(job_id)
+                else:
+                    self._write_artifact(kind, subdir, filename, payload, job_id)
+            except Exception as e:
+                logger.error(f"Failed to write debug artifact: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_artifact(self, kind: str, subdir: str, filename: str, payload, job_id: Optional[str]) -> None:
+        directory = os.path.join(self.root, subdir)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+
+        if kind == 'image':
+            image = payload
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=85)
+            data = buffer.getvalue()
+        else:
+            data = payload.encode('utf-8')
+
+        with open(path, 'ab' if kind == 'append' else 'wb') as f:
+            f.write(data)
+
+        self.written_count += 1
+        if job_id and self.options.get('BUNDLE_PER_JOB'):
+            self._job_files[job_id].add(path)
+
+        self._account(directory, len(data))
+        logger.debug(f"Saved debug artifact: {path}")
+
+    def _write_bundle(self, job_id: str) -> None:
+        paths = sorted(p for p in self._job_files.pop(job_id, ()) if os.path.exists(p))
+        if not paths:
+            return
+
+        bundle_dir = os.path.join(self.root, self.options.get('BUNDLE_DIR', 'pipeline_bundles'))
+        os.makedirs(bundle_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        bundle_path = os.path.join(bundle_dir, f"job_{timestamp}_{job_id}.zip")
+
+        with zipfile.ZipFile(bundle_path, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+            for path in paths:
+                arcname = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+                bundle.write(path, arcname=arcname)
+
+        for path in paths:
+            size = os.path.getsize(path)
+            os.remove(path)
+            directory = os.path.dirname(path)
+            if directory in self._dir_usage:
+                self._dir_usage[directory] -= size
+
+        self._account(bundle_dir, os.path.getsize(bundle_path))
+        logger.info(f"Bundled {len(paths)} debug artifacts for job {job_id}: {bundle_path}")
+
+    # =========================================================================
+    # Retention
+    # =========================================================================
+
+    def _account(self, directory: str, added_bytes: int) -> None:
+        """Track directory usage incrementally and prune when over budget."""
+        if directory not in self._dir_usage:
+            self._dir_usage[directory] = self._scan_usage(directory)
+        else:
+            self._dir_usage[directory] += added_bytes
+
+        max_bytes = self.options.get('MAX_DIR_BYTES')
+        if max_bytes and self._dir_usage[directory] > max_bytes:
+            self._prune(directory, int(max_bytes * PRUNE_LOW_WATER_MARK))
+
+    def _scan_usage(self, directory: str) -> int:
+        total = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total
+
+    def _prune(self, directory: str, target_bytes: int) -> None:
+        """Delete the oldest files in a directory until it fits target_bytes."""
+        with os.scandir(directory) as entries:
+            files = [
+                (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                for entry in entries if entry.is_file()
+            ]
+        files.sort()
+
+        usage = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if usage <= target_bytes:
+                break
+            try:
+                os.remove(path)
+                usage -= size
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Failed to prune debug artifact {path}: {e}")
+
+        self._dir_usage[directory] = usage
+        if removed:
+            logger.info(f"Pruned {removed} debug artifacts from {directory}")
+
+
+# Global writer instance
+debug_artifact_writer = DebugArtifactWriter()
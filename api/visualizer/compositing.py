@@ -0,0 +1,190 @@
+"""
+Compositing
+-----------
+Local recoloring of generated screens, without a model round trip.
+
+The screen is found by differencing the generated image against the clean
+(pre-insertion) image. Each screen pixel is modelled as its current color
+blended over the clean background:
+
+    generated = alpha * old_color + (1 - alpha) * clean + residual
+
+The residual carries shading and texture. Swapping old_color for a new color
+only needs alpha:
+
+    recolored = generated + alpha * (new_color - old_color)
+
+Solid, fully covering pixels are treated as frame and the rest of the screen
+as mesh, so frame and mesh colors change independently. All of the work is
+done once in ScreenCompositor(); each render() is a couple of array
+multiply-adds. Previews build their compositor at preview size (max_size),
+and the cache is bounded by the bytes its arrays hold.
+
+Usage:
+    from api.visualizer.compositing import ScreenCompositor, resolve_color
+
+    compositor = ScreenCompositor(generated, clean,
+                                  frame_color=resolve_color(tenant, 'frame_color', 'black'),
+                                  mesh_color=resolve_color(tenant, 'mesh_color', 'black'))
+    preview = compositor.render(frame_color=resolve_color(tenant, 'frame_color', 'white'))
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+logger = logging.getLogger(__name__)
+
+RGB = Tuple[int, int, int]
+
+# Per-channel difference (0-255) above which a pixel counts as changed
+DIFF_THRESHOLD = 24
+
+# Pixels at least this covered by the frame color are frame, not mesh
+FRAME_COVERAGE = 0.85
+
+# Compositors kept in memory, so previewing a whole palette decodes each result once
+CACHE_SIZE = 8
+
+# ... and at most this many bytes of arrays between them (a 12MP compositor holds ~290MB)
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def parse_hex(value: str) -> RGB:
+    """'#rrggbb' -> (r, g, b)."""
+    value = value.lstrip('#')
+    if len(value) != 6:
+        raise ValueError(f"Invalid hex color: {value}")
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def resolve_color(tenant_config, category: str, value: str) -> RGB:
+    """
+    Look up a palette entry of a product schema category.
+
+    Accepts the option value or its label; the option must define a 'hex' color.
+
+    Raises:
+        ValueError: Unknown option, or no color known for it
+    """
+    key = value.strip().lower().replace(' ', '_')
+    category_schema = tenant_config.snapshot.get_category(category) or {}
+    for option in category_schema.get('options', ()):
+        if key in (option['value'].lower(), option['label'].lower().replace(' ', '_')):
+            if option.get('hex'):
+                return parse_hex(option['hex'])
+            raise ValueError(f"No color defined for {category} '{value}'")
+    raise ValueError(f"Unknown {category} '{value}'")
+
+
+def derive_screen_mask(generated: np.ndarray, clean: np.ndarray, threshold: float = DIFF_THRESHOLD) -> np.ndarray:
+    """
+    Soft mask (0.0-1.0) of where the generated image differs from the clean one.
+
+    Args:
+        generated: HxWx3 float32 array
+        clean: HxWx3 float32 array of the same shape
+    """
+    changed = (np.abs(generated - clean).max(axis=2) > threshold).astype(np.uint8) * 255
+    mask = Image.fromarray(changed, 'L')
+    # Open to drop isolated noise (model drift, JPEG), then close to fill mesh gaps
+    mask = mask.filter(ImageFilter.MinFilter(3)).filter(ImageFilter.MaxFilter(3))
+    mask = mask.filter(ImageFilter.MaxFilter(5)).filter(ImageFilter.MinFilter(5))
+    mask = mask.filter(ImageFilter.GaussianBlur(1))
+    return np.asarray(mask, dtype=np.float32) / 255.0
+
+
+def _coverage(generated: np.ndarray, clean: np.ndarray, color: np.ndarray) -> np.ndarray:
+    """Per-pixel blend weight of color over the clean background (least squares, clipped to 0-1)."""
+    direction = color - clean
+    denominator = np.maximum((direction * direction).sum(axis=2), 1.0)
+    return np.clip(((generated - clean) * direction).sum(axis=2) / denominator, 0.0, 1.0)
+
+
+class ScreenCompositor:
+    """Precomputed screen mask and coverage for fast recolor previews of one result."""
+
+    def __init__(self, generated: Image.Image, clean: Image.Image, frame_color: RGB, mesh_color: RGB,
+                 max_size: Optional[int] = None):
+        """
+        Args:
+            generated: Image with the screens inserted
+            clean: The cleaned image the screens were inserted into
+            frame_color: Current frame color in the generated image
+            mesh_color: Current mesh color in the generated image
+            max_size: Work at most at this longest side (px); renders come out that size
+        """
+        generated = generated.convert('RGB')
+        if max_size is not None and max(generated.size) > max_size:
+            generated.thumbnail((max_size, max_size), Image.Resampling.BILINEAR)
+        if clean.size != generated.size:
+            clean = clean.resize(generated.size, Image.Resampling.BILINEAR)
+
+        self.size = generated.size
+        self.frame_color = np.array(frame_color, dtype=np.float32)
+        self.mesh_color = np.array(mesh_color, dtype=np.float32)
+
+        self._generated = np.asarray(generated, dtype=np.float32)
+        clean_array = np.asarray(clean.convert('RGB'), dtype=np.float32)
+
+        self.mask = derive_screen_mask(self._generated, clean_array)
+        frame_coverage = _coverage(self._generated, clean_array, self.frame_color)
+        mesh_coverage = _coverage(self._generated, clean_array, self.mesh_color)
+
+        is_frame = (frame_coverage >= FRAME_COVERAGE).astype(np.float32)
+        self._frame_weight = (self.mask * is_frame * frame_coverage)[..., None]
+        self._mesh_weight = (self.mask * (1.0 - is_frame) * mesh_coverage)[..., None]
+
+        if self.mask_coverage > 0.6:
+            logger.warning(
+                f"Screen mask covers {self.mask_coverage:.0%} of the image; the generated scene may have drifted"
+            )
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the precomputed arrays."""
+        return self._generated.nbytes + self.mask.nbytes + self._frame_weight.nbytes + self._mesh_weight.nbytes
+
+    @property
+    def mask_coverage(self) -> float:
+        """Fraction of the image taken up by the screen mask."""
+        return float(self.mask.mean())
+
+    def render(self, frame_color: Optional[RGB] = None, mesh_color: Optional[RGB] = None) -> Image.Image:
+        """Render the result with new frame and/or mesh colors (unchanged when None)."""
+        output = self._generated.copy()
+        if frame_color is not None:
+            output += self._frame_weight * (np.array(frame_color, dtype=np.float32) - self.frame_color)
+        if mesh_color is not None:
+            output += self._mesh_weight * (np.array(mesh_color, dtype=np.float32) - self.mesh_color)
+        return Image.fromarray(np.clip(output, 0, 255).astype(np.uint8), 'RGB')
+
+
+_cache: 'OrderedDict[Any, ScreenCompositor]' = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cached_compositor(key: Any, build: Callable[[], ScreenCompositor]) -> ScreenCompositor:
+    """
+    Get a compositor from the LRU cache, building it on a miss.
+
+    The least recently used entries are evicted beyond CACHE_SIZE entries or
+    CACHE_MAX_BYTES; a compositor larger than that on its own is not cached.
+    """
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    compositor = build()
+    with _cache_lock:
+        _cache[key] = compositor
+        cached_bytes = sum(entry.nbytes for entry in _cache.values())
+        while _cache and (len(_cache) > CACHE_SIZE or cached_bytes > CACHE_MAX_BYTES):
+            _, evicted = _cache.popitem(last=False)
+            cached_bytes -= evicted.nbytes
+    return compositor
@@ -0,0 +1,172 @@
+"""
+Deadlines
+---------
+Time budgets for pipeline jobs and model calls.
+
+A job gets a deadline from the tenant's SLA, and each model call gets the
+step's timeout narrowed to whatever is left of the job deadline. Calls run
+on a bounded worker pool so the caller can stop waiting at the deadline.
+The HTTP timeout given to the SDK makes the abandoned request end as well.
+
+In hedged mode a second identical request starts once the first has run for
+longer than the model's p95 latency. The first answer to arrive wins; the
+loser's result is handed to a callback (e.g. to record its cost).
+
+While it waits, the caller can have poll() run every POLL_INTERVAL_SECONDS
+on its own thread, e.g. to forward progress reported by the call.
+
+Usage:
+    from api.visualizer.deadlines import Deadline, run_with_deadline
+
+    deadline = Deadline(120)
+    response = run_with_deadline(call, deadline, hedge_after=p95_seconds)
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# How often run_with_deadline calls poll() while it waits
+POLL_INTERVAL_SECONDS = 0.25
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a job or model call runs out of its time budget."""
+    pass
+
+
+class Deadline:
+    """A point in time (monotonic clock) after which work should stop."""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None for no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def narrow(self, seconds: Optional[float]) -> 'Deadline':
+        """A deadline at most `seconds` from now, and no later than this one."""
+        child = Deadline(seconds)
+        if child.expires_at is None or (self.expires_at is not None and self.expires_at < child.expires_at):
+            child.expires_at = self.expires_at
+        return child
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = getattr(settings, 'PIPELINE_DEADLINES', {}).get('MAX_CONCURRENT_CALLS', 16)
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-call')
+    return _executor
+
+
+def _submit(fn: Callable[[], Any]) -> Future:
+    # Each call runs in its own copy of the caller's context (tracing, cost ledger)
+    return _get_executor().submit(contextvars.copy_context().run, fn)
+
+
+def _wait(futures, timeout: Optional[float], poll: Optional[Callable[[], None]]):
+    """wait(FIRST_COMPLETED), calling poll() on this thread every POLL_INTERVAL_SECONDS meanwhile."""
+    if poll is None:
+        return wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+    ends_at = None if timeout is None else time.monotonic() + timeout
+    while True:
+        interval = POLL_INTERVAL_SECONDS if ends_at is None else min(
+            POLL_INTERVAL_SECONDS, max(0.0, ends_at - time.monotonic())
+        )
+        done, pending = wait(futures, timeout=interval, return_when=FIRST_COMPLETED)
+        if ends_at is not None and time.monotonic() >= ends_at:
+            return done, pending
+        try:
+            poll()
+        except Exception as e:
+            logger.warning(f"Deadline poll failed (non-fatal): {e}")
+        if done:
+            return done, pending
+
+
+def run_with_deadline(fn: Callable[[], Any], deadline: Deadline, hedge_after: Optional[float] = None,
+                      span=None, on_discarded: Optional[Callable[[Any], None]] = None,
+                      poll: Optional[Callable[[], None]] = None) -> Any:
+    """
+    Run fn() on the worker pool and wait for it until the deadline.
+
+    Args:
+        fn: The call to make; must be safe to run twice when hedging
+        deadline: When to stop waiting
+        hedge_after: Start a second fn() if the first has not finished after
+            this many seconds (None disables hedging)
+        span: Optional tracing span for hedge attributes
+        on_discarded: Called with the result of a hedged call that lost
+        poll: Called on the caller's thread while it waits (never after the deadline)
+
+    Raises:
+        DeadlineExceededError: No call finished before the deadline
+        Exception: The error of the last call to fail, if all calls failed
+    """
+    futures: List[Future] = [_submit(fn)]
+
+    remaining = deadline.remaining()
+    if hedge_after is not None and (remaining is None or hedge_after < remaining):
+        done, _ = _wait(futures, hedge_after, poll)
+        if not done:
+            logger.info(f"Hedging model call after {hedge_after:.1f}s")
+            futures.append(_submit(fn))
+            if span is not None:
+                span.set_attribute('hedged', True)
+
+    pending = set(futures)
+    last_error = None
+    while pending:
+        done, pending = _wait(pending, deadline.remaining(), poll)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is not None:
+                last_error = future.exception()
+                continue
+            if span is not None and len(futures) > 1:
+                span.set_attribute('hedge_won', future is futures[1])
+            _discard(pending, on_discarded)
+            return future.result()
+
+    if last_error is not None and not pending:
+        raise last_error
+    _discard(pending, on_discarded)
+    raise DeadlineExceededError("Model call did not finish within its deadline")
+
+
+def _discard(futures, on_discarded: Optional[Callable[[Any], None]]) -> None:
+    """Stop waiting on calls; they end on their own HTTP timeout."""
+    for future in futures:
+        if future.cancel() or on_discarded is None:
+            continue
+        context = contextvars.copy_context()
+
+        def callback(f, context=context):
+            if not f.cancelled() and f.exception() is None:
+                try:
+                    context.run(on_discarded, f.result())
+                except Exception as e:
+                    logger.warning(f"Discarded call callback failed: {e}")
+
+        future.add_done_callback(callback)
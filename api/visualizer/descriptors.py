@@ -0,0 +1,104 @@
+"""
+Image Descriptors
+-----------------
+Compact, CPU-only descriptors for finding visually similar photos.
+
+A descriptor is a unit-length float32 vector of two equally weighted parts:
+
+    color      HSV histogram (8 hue x 4 saturation x 4 value bins), square-rooted
+               so the dot product of two histograms is their Bhattacharyya coefficient
+    structure  low-frequency 2D DCT of a 32x32 grayscale thumbnail (8x8 block
+               without the DC term), which captures the layout of the scene
+
+The dot product of two descriptors is their cosine similarity (1.0 = identical).
+Bump DESCRIPTOR_VERSION whenever the recipe changes; stored descriptors of
+another version are recomputed.
+
+perceptual_hash() is a 64-bit DCT hash for spotting the same photo again
+after resizing, recompression or a light crop; hashes a few bits apart are
+near-duplicates.
+
+Usage:
+    from api.visualizer.descriptors import compute_descriptor, hash_distance, perceptual_hash
+
+    vector = compute_descriptor(image)  # np.ndarray, shape (DESCRIPTOR_DIM,)
+    hash_distance(perceptual_hash(a), perceptual_hash(b))  # 0..64 differing bits
+"""
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+from api.ai_services.utils.image_utils import downsample_for_quality
+
+DESCRIPTOR_VERSION = 1
+
+HIST_BINS = (8, 4, 4)
+DCT_SIZE = 32
+DCT_BLOCK = 8
+DESCRIPTOR_DIM = HIST_BINS[0] * HIST_BINS[1] * HIST_BINS[2] + DCT_BLOCK * DCT_BLOCK - 1
+
+# Share of the (squared) descriptor length given to color; the rest is structure
+COLOR_WEIGHT = 0.5
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(size: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, so the 2D transform is D @ X @ D.T."""
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+def color_histogram(sample: Image.Image) -> np.ndarray:
+    """Square-rooted, L1-normalized HSV histogram (unit L2 length) of an RGB image."""
+    hsv = np.asarray(sample.convert('HSV'), dtype=np.uint16)
+    h_bins, s_bins, v_bins = HIST_BINS
+    index = (
+        (hsv[..., 0] * h_bins >> 8) * (s_bins * v_bins)
+        + (hsv[..., 1] * s_bins >> 8) * v_bins
+        + (hsv[..., 2] * v_bins >> 8)
+    )
+    hist = np.bincount(index.ravel(), minlength=h_bins * s_bins * v_bins).astype(np.float32)
+    return np.sqrt(hist / max(hist.sum(), 1.0))
+
+
+def structure_signature(sample: Image.Image) -> np.ndarray:
+    """Unit-length low-frequency DCT coefficients of an image in grayscale."""
+    gray = np.asarray(sample.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.Resampling.BOX), dtype=np.float32)
+    basis = _dct_matrix(DCT_SIZE)
+    coefficients = (basis @ gray @ basis.T)[:DCT_BLOCK, :DCT_BLOCK].ravel()[1:]
+    norm = float(np.linalg.norm(coefficients))
+    return coefficients / norm if norm > 0 else coefficients
+
+
+def compute_descriptor(image: Image.Image) -> np.ndarray:
+    """Unit-length float32 descriptor of an image; see the module docstring."""
+    sample = downsample_for_quality(image)
+    descriptor = np.concatenate([
+        np.sqrt(COLOR_WEIGHT) * color_histogram(sample),
+        np.sqrt(1.0 - COLOR_WEIGHT) * structure_signature(sample),
+    ]).astype(np.float32)
+    norm = float(np.linalg.norm(descriptor))
+    return descriptor / norm if norm > 0 else descriptor
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """
+    64-bit perceptual hash of an image as 16 hex digits.
+
+    Each bit says whether one of the 8x8 lowest-frequency DCT coefficients of
+    a 32x32 grayscale thumbnail is above their median.
+    """
+    gray = np.asarray(image.convert('L').resize((DCT_SIZE, DCT_SIZE), Image.Resampling.BOX), dtype=np.float32)
+    basis = _dct_matrix(DCT_SIZE)
+    block = (basis @ gray @ basis.T)[:DCT_BLOCK, :DCT_BLOCK].ravel()
+    # The DC term only reflects overall brightness, so it is left out of the median
+    bits = block > np.median(block[1:])
+    return f"{int(''.join('1' if bit else '0' for bit in bits), 2):016x}"
+
+
+def hash_distance(a: str, b: str) -> int:
+    """Number of differing bits between two perceptual hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
@@ -0,0 +1,141 @@
+"""
+Dimensional Analysis
+--------------------
+Structured patio measurements from Gemini's patio insertion response.
+
+The patio enclosure prompt asks the model to state, in its text response:
+
+    - OPENING WIDTH: [X] feet
+    - MULLION COUNT: [Y]
+    - POSITIONS: [list]
+
+Those lines used to end up only in thinking logs. parse_dimensional_analysis()
+extracts them so they can be stored on the request
+(VisualizationRequest.dimensional_analysis), used to price the enclosure by
+span and queried without reading log files.
+
+Usage:
+    from api.visualizer.dimensional_analysis import parse_dimensional_analysis
+
+    analysis = parse_dimensional_analysis(response_text)
+    if analysis and analysis['opening_width_ft']:
+        ...
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FEET_PER_METER = 3.28084
+
+# Widths outside this range (feet) are misreadings, not patio openings
+MIN_OPENING_WIDTH_FT = 2.0
+MAX_OPENING_WIDTH_FT = 200.0
+
+MAX_MULLION_COUNT = 100
+
+# "OPENING WIDTH: ...", tolerating markdown emphasis and bullets around the label
+_FIELD = r"^[\s*\-•#]*{label}[\s*]*[:=][\s*]*(?P<value>.*)$"
+_WIDTH = re.compile(_FIELD.format(label=r"OPENING\s+WIDTH"), re.IGNORECASE | re.MULTILINE)
+_COUNT = re.compile(_FIELD.format(label=r"MULLION\s+COUNT"), re.IGNORECASE | re.MULTILINE)
+_POSITIONS = re.compile(_FIELD.format(label=r"(?:MULLION\s+)?POSITIONS"), re.IGNORECASE | re.MULTILINE)
+
+_NUMBER = r"\d+(?:\.\d+)?"
+_UNIT = r"'|ft\b|feet|foot|\"|inch(?:es)?|in\b|m\b|meters?\b|metres?\b"
+_FEET_INCHES = re.compile(rf"({_NUMBER})\s*(?:'|ft\.?|feet|foot)\s*({_NUMBER})\s*(?:\"|in\b\.?|inch(?:es)?)", re.IGNORECASE)
+# Relative positions ("at 1/4 and 3/4 of the span") are not lengths
+_FRACTION = re.compile(rf"{_NUMBER}\s*/\s*{_NUMBER}")
+# A length must carry a unit; "18-20 feet" is a range that takes its unit from the upper bound
+_MEASUREMENT = re.compile(
+    rf"(?P<value>{_NUMBER})(?:\s*(?:-|–|to)\s*(?P<upper>{_NUMBER}))?\s*(?P<unit>{_UNIT})", re.IGNORECASE
+)
+
+FEET_PER_UNIT = {'m': FEET_PER_METER, 'i': 1 / 12, '"': 1 / 12}
+
+_NUMBER_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+}
+
+
+def parse_dimensional_analysis(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract the patio opening width, mullion count and mullion positions.
+
+    Thought summaries come before the answer, so the last statement of each
+    value wins. Lengths are converted to feet; values stated without a
+    unit are ignored.
+
+    Returns:
+        dict with opening_width_ft (float), mullion_count (int) and
+        mullion_positions_ft (list of float), each None when not stated;
+        None if the text states none of them
+    """
+    if not text:
+        return None
+
+    width = _last_value(_WIDTH, text)
+    count = _last_value(_COUNT, text)
+    positions = _last_value(_POSITIONS, text)
+
+    analysis = {
+        'opening_width_ft': _parse_width(width) if width else None,
+        'mullion_count': _parse_count(count) if count else None,
+        'mullion_positions_ft': (_measurements(positions) or None) if positions else None,
+    }
+    if analysis['mullion_count'] is None and analysis['mullion_positions_ft']:
+        analysis['mullion_count'] = len(analysis['mullion_positions_ft'])
+
+    if all(value is None for value in analysis.values()):
+        return None
+    return analysis
+
+
+def _last_value(pattern: re.Pattern, text: str) -> Optional[str]:
+    matches = pattern.findall(text)
+    return matches[-1].strip() if matches else None
+
+
+def _measurements(value: str) -> List[float]:
+    """
+    Lengths in a line, in feet; a range gives its midpoint.
+
+    Meters, inches and feet-and-inches are converted. Numbers without a unit
+    and fractions are skipped rather than guessed to be feet.
+    """
+    value = _FEET_INCHES.sub(lambda m: f"{float(m[1]) + float(m[2]) / 12:.4f} ft", value)
+    value = _FRACTION.sub(' ', value)
+    lengths = []
+    for match in _MEASUREMENT.finditer(value):
+        length = float(match['value'])
+        if match['upper']:
+            length = (length + float(match['upper'])) / 2
+        length *= FEET_PER_UNIT.get(match['unit'][0].lower(), 1.0)
+        lengths.append(round(length, 2))
+    return lengths
+
+
+def _parse_width(value: str) -> Optional[float]:
+    """Opening width in feet: the first length stated."""
+    lengths = _measurements(value)
+    if not lengths:
+        return None
+    width = lengths[0]
+    if not MIN_OPENING_WIDTH_FT <= width <= MAX_OPENING_WIDTH_FT:
+        logger.warning(f"Ignoring implausible patio opening width: {value!r}")
+        return None
+    return width
+
+
+def _parse_count(value: str) -> Optional[int]:
+    match = re.search(r"\d+", value)
+    if match:
+        count = int(match.group())
+    else:
+        words = [_NUMBER_WORDS[word] for word in re.findall(r"[a-z]+", value.lower()) if word in _NUMBER_WORDS]
+        if not words:
+            return None
+        count = words[0]
+    return count if count <= MAX_MULLION_COUNT else None
@@ -0,0 +1,174 @@
+"""
+Quality Cascade
+---------------
+Cheap local checks of a pipeline result, run before the Gemini quality_check call.
+
+The final image is compared with the clean (pre-insertion) image on a small
+downsample:
+
+    change_ratio    share of the image that changed (the inserted screens)
+    preserved_ssim  structural similarity outside the changed area; low values
+                    mean the model redrew the scene (hallucinated doors, walls)
+    artifacts       share of the changed area that is blown out or crushed
+
+Clear passes and clear failures are decided locally. Everything in between
+(low-texture references, no visible change, borderline similarity) is
+escalated to the model.
+
+Usage:
+    from api.visualizer.quality import assess_result_quality
+
+    assessment = assess_result_quality(clean_image, final_image)
+    if not assessment.confident:
+        ...  # ask the model
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+from api.ai_services.utils.image_utils import downsample_for_quality
+from api.visualizer.compositing import derive_screen_mask
+
+# Default decision thresholds; a quality_check step can override any of them
+# with a 'quality_thresholds' dict in its step config
+THRESHOLDS = {
+    'min_texture': 0.04,      # clean image contrast below which SSIM says little
+    'min_change': 0.005,      # less change than this looks like nothing was inserted
+    'max_change': 0.5,        # confident passes change at most this much of the image
+    'fail_change': 0.8,       # more change than this means the scene was regenerated
+    'pass_ssim': 0.85,        # preserved_ssim needed for a local pass
+    'fail_ssim': 0.5,         # preserved_ssim below this is a local failure
+    'max_artifacts': 0.02,    # artifacts allowed in a local pass
+    'fail_artifacts': 0.15,   # artifacts above this are a local failure
+}
+
+# SSIM window (px, on the downsample) and stabilising constants for 8-bit data
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+# Scores of local failures are capped here, below any local pass
+FAIL_SCORE_CAP = 0.4
+
+
+@dataclass
+class LocalQualityAssessment:
+    """Outcome of the local tier."""
+    score: float
+    reason: str
+    confident: bool
+    metrics: Dict[str, float] = field(default_factory=dict)
+
+
+def _box_mean(values: np.ndarray, size: int) -> np.ndarray:
+    """Mean over every size x size window (valid region only), via an integral image."""
+    integral = np.pad(values, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    return (integral[size:, size:] - integral[:-size, size:]
+            - integral[size:, :-size] + integral[:-size, :-size]) / (size * size)
+
+
+def ssim_map(a: np.ndarray, b: np.ndarray, window: int = SSIM_WINDOW) -> np.ndarray:
+    """
+    Local SSIM of two grayscale arrays.
+
+    Returns an array smaller by window - 1 in each dimension (one value per
+    full window).
+    """
+    a = a.astype(np.float64)
+    b = b.astype(np.float64)
+    mean_a, mean_b = _box_mean(a, window), _box_mean(b, window)
+    var_a = _box_mean(a * a, window) - mean_a ** 2
+    var_b = _box_mean(b * b, window) - mean_b ** 2
+    covariance = _box_mean(a * b, window) - mean_a * mean_b
+    return ((2 * mean_a * mean_b + SSIM_C1) * (2 * covariance + SSIM_C2)) / (
+        (mean_a ** 2 + mean_b ** 2 + SSIM_C1) * (var_a + var_b + SSIM_C2)
+    )
+
+
+def compute_quality_metrics(clean: Image.Image, final: Image.Image) -> Dict[str, float]:
+    """
+    Local comparison metrics of a result against its clean image.
+
+    Returns:
+        dict with change_ratio, preserved_ssim, artifacts and texture (clean
+        image grayscale std / 128), all 0-1
+    """
+    clean_sample = downsample_for_quality(clean)
+    final_sample = final.convert('RGB')
+    if final_sample.size != clean_sample.size:
+        final_sample = final_sample.resize(clean_sample.size, Image.Resampling.BILINEAR)
+
+    clean_rgb = np.asarray(clean_sample, dtype=np.float32)
+    final_rgb = np.asarray(final_sample, dtype=np.float32)
+    luma = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    clean_gray, final_gray = clean_rgb @ luma, final_rgb @ luma
+
+    mask = derive_screen_mask(final_rgb, clean_rgb)
+    changed = mask > 0.5
+
+    metrics = {
+        'change_ratio': float(changed.mean()),
+        'texture': float(clean_gray.std()) / 128,
+        'preserved_ssim': 0.0,
+        'artifacts': 0.0,
+    }
+
+    if min(clean_gray.shape) >= SSIM_WINDOW:
+        offset = SSIM_WINDOW // 2
+        similarity = ssim_map(clean_gray, final_gray)
+        untouched = mask[offset:offset + similarity.shape[0], offset:offset + similarity.shape[1]] < 0.05
+        if untouched.any():
+            metrics['preserved_ssim'] = float(similarity[untouched].mean())
+
+    if changed.any():
+        clipped = (final_gray <= 2) | (final_gray >= 253)
+        was_clipped = (clean_gray <= 2) | (clean_gray >= 253)
+        metrics['artifacts'] = float((clipped & ~was_clipped)[changed].mean())
+
+    return metrics
+
+
+def assess_result_quality(clean: Image.Image, final: Image.Image,
+                          thresholds: Optional[Dict[str, Any]] = None) -> LocalQualityAssessment:
+    """
+    Score a result locally and say whether the score can be trusted.
+
+    Args:
+        clean: Reference image before screen insertion
+        final: Image with the screens inserted
+        thresholds: Overrides for THRESHOLDS
+
+    Returns:
+        LocalQualityAssessment; confident is False when the model should decide
+    """
+    limits = {**THRESHOLDS, **(thresholds or {})}
+    metrics = compute_quality_metrics(clean, final)
+
+    score = float(np.clip(metrics['preserved_ssim'] - 2 * metrics['artifacts'], 0.0, 1.0))
+
+    def decide(reason: str, confident: bool, failed: bool = False) -> LocalQualityAssessment:
+        return LocalQualityAssessment(
+            score=round(min(score, FAIL_SCORE_CAP) if failed else score, 3),
+            reason=reason,
+            confident=confident,
+            metrics={key: round(value, 4) for key, value in metrics.items()},
+        )
+
+    if metrics['texture'] < limits['min_texture']:
+        return decide("Reference image has too little texture for a local check.", confident=False)
+    if metrics['change_ratio'] > limits['fail_change']:
+        return decide("Most of the image was regenerated, not just the screens.", confident=True, failed=True)
+    if metrics['change_ratio'] < limits['min_change']:
+        return decide("No visible change between the clean and final images.", confident=False)
+    if metrics['preserved_ssim'] < limits['fail_ssim']:
+        return decide("The scene changed outside the screen areas.", confident=True, failed=True)
+    if metrics['artifacts'] > limits['fail_artifacts']:
+        return decide("The inserted screens contain blown-out or crushed artifacts.", confident=True, failed=True)
+    if (metrics['preserved_ssim'] >= limits['pass_ssim']
+            and metrics['change_ratio'] <= limits['max_change']
+            and metrics['artifacts'] <= limits['max_artifacts']):
+        return decide("Scene preserved outside the screens; no artifacts found.", confident=True)
+    return decide("Local checks were inconclusive.", confident=False)
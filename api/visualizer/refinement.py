@@ -0,0 +1,101 @@
+"""
+Refinement
+----------
+Bounded retries of an insertion step whose result scored below the tenant's
+quality threshold.
+
+The step is re-run from its original input with an adjusted prompt (see
+improve_prompt_based_on_quality). What this may cost is explicit: every
+re-run edit, and every model quality check of a refined result, is paid
+for out of a per-job RefinementBudget, shared by all variations of the job. An AttemptCache makes sure the same step, input and
+prompt are never paid for twice in one job.
+
+Usage:
+    from api.visualizer.refinement import AttemptCache, RefinementBudget, refine_prompt
+
+    budget = RefinementBudget(2)
+    if budget.try_spend():
+        prompt = refine_prompt(prompt, score=0.5, target=0.9, attempt=1, reason="Frame is warped")
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from PIL import Image
+
+from api.ai_services.utils.prompt_utils import create_maximum_quality_prompt, improve_prompt_based_on_quality
+
+# Refined results kept per job
+CACHE_SIZE = 16
+
+
+class RefinementBudget:
+    """Extra model calls a job may spend on quality recovery (thread-safe)."""
+
+    def __init__(self, max_calls: int = 0):
+        self.max_calls = max(0, int(max_calls))
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            return self.max_calls - self.spent
+
+    def try_spend(self, calls: int = 1) -> bool:
+        """Reserve calls; False (and nothing reserved) when the budget cannot cover them."""
+        with self._lock:
+            if self.spent + calls > self.max_calls:
+                return False
+            self.spent += calls
+            return True
+
+
+class AttemptCache:
+    """Results of refinement edits in one job, keyed by step, input image and prompt (thread-safe)."""
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self._results: 'OrderedDict[str, Image.Image]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(step_name: str, image: Image.Image, prompt: str) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(step_name.encode())
+        digest.update(f"{image.mode}{image.size}".encode())
+        digest.update(image.tobytes())
+        digest.update(prompt.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        return None
+
+    def put(self, key: str, image: Image.Image):
+        with self._lock:
+            self._results[key] = image
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+
+def refine_prompt(prompt: str, score: float, target: float, attempt: int, reason: Optional[str] = None) -> str:
+    """
+    Adjust an insertion prompt after a low quality score.
+
+    The first attempt adds enhancements sized to the quality gap; later
+    attempts use the maximum quality prompt. The quality check's reason is
+    passed on so the model knows what to fix.
+    """
+    if attempt <= 1:
+        refined = improve_prompt_based_on_quality(prompt, score, target)
+    else:
+        refined = create_maximum_quality_prompt(prompt)
+    if reason:
+        refined += f"\n\nA previous attempt was rejected by quality control: {reason}\nFix this issue."
+    return refined
@@ -1,27 +1,75 @@
 # File: api/visualizer/services.py
 
+import contextvars
 import logging
 import os
+import random
 import time
-import json
-import re
-from typing import Optional, Dict, Any, Tuple, List
+import uuid
+from typing import Optional, Dict, Any, Callable, Iterable, Tuple, List
 from PIL import Image
 import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google import genai
 from google.genai import types
 from django.conf import settings
+from django.db import connections
 
-from api.tenants import get_tenant_config
+from api.tenants import get_tenant_config, tenant_context
+from api.visualizer.artifacts import debug_artifact_writer
+from api.monitoring.production_monitor import production_monitor
+from api.monitoring.tracing import pipeline_tracer
+from api.ai_services.routing import (
+    DYNAMIC_THINKING_BUDGET, MIN_SAMPLES, ModelRoute, clamp_thinking_budget, model_router
+)
+from api.ai_services.circuit_breaker import CircuitOpenError, CircuitState, circuit_breakers
+from api.ai_services.structured_output import QualityVerdict, StructuredOutputError, read_structured, structured_config
+from api.visualizer.deadlines import Deadline, DeadlineExceededError, run_with_deadline
+from api.visualizer.quality import assess_result_quality
+from api.visualizer.refinement import AttemptCache, RefinementBudget, refine_prompt
+from api.ai_services.utils.image_utils import MAX_CLIPPED, MIN_BRIGHTNESS, MIN_SHARPNESS, check_image_quality
+from api.services.reference_index import reference_index
+from api.visualizer.descriptors import compute_descriptor
+from api.visualizer.dimensional_analysis import parse_dimensional_analysis
+from api.visualizer.streaming import DEFAULT_EXPECTED_OUTPUT_TOKENS, EditStreamReader, ProgressRelay
 
 logger = logging.getLogger(__name__)
 
+# Appended to an insertion prompt sent with a matched reference photo
+REFERENCE_NOTE = (
+    "\n\nA second image is attached: a reference photo of a finished installation on a similar home. "
+    "Match its frame profile, mesh texture and proportions. Do not copy anything else from it; "
+    "edit only the first image."
+)
+
+# Longest side (px) of a reference photo sent with a prompt
+REFERENCE_MAX_SIZE = 1024
+
+# Progress reached when the last weighted step finishes (the processor saves results at 90)
+STREAM_PROGRESS_END = 90
+
 class ScreenVisualizerError(Exception):
     """Base exception for ScreenVisualizer errors."""
     pass
 
+
+class ImageQualityError(ScreenVisualizerError):
+    """Raised when an upload fails the local quality gate."""
+    pass
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    """Whether an API error reflects provider health (rate limits, 5xx, network) rather than a bad request."""
+    if isinstance(error, StructuredOutputError):
+        return False
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return code == 429
+    return True
+
+
 class ScreenVisualizer:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, timeout_seconds: Optional[float] = None):
         self.api_key = api_key or os.environ.get("GOOGLE_API_KEY")
         if not self.api_key:
             logger.error("GOOGLE_API_KEY not found. ScreenVisualizer cannot function.")
@@ -29,8 +77,20 @@ class ScreenVisualizer:
             
         self.client = genai.Client(api_key=self.api_key)
         self.model_name = "gemini-3-pro-image-preview"
+        # Default per-call budget when a step config sets no timeout_seconds
+        self.timeout_seconds = timeout_seconds
+
+        # Per-job debug artifact state (set by process_pipeline)
+        self._job_id: Optional[str] = None
+        self._capture_artifacts: Optional[bool] = None
+        self._deadline = Deadline()
+        self._refinement_budget = RefinementBudget()
+        self._attempts = AttemptCache()
+        # Reference photo matched to the clean image, per insertion step
+        self._references: Dict[str, Image.Image] = {}
 
-    def process_pipeline(self, original_image: Image.Image, scope: dict, options: dict, progress_callback=None) -> Tuple[Image.Image, Image.Image, float, str]:
+    def process_pipeline(self, original_image: Image.Image, scope: dict, options: dict, progress_callback=None, job_id: Optional[str] = None,
+                         tenant_id: Optional[str] = None) -> Tuple[Image.Image, Image.Image, float, str]:
         """
         Executes the visualization pipeline sequentially based on tenant configuration.
         
@@ -39,35 +99,238 @@ class ScreenVisualizer:
             scope (dict): {'windows': bool, 'doors': bool, 'patio': bool}
             options (dict): {'color': str, 'mesh_type': str}
             progress_callback (callable, optional): Function to update progress (percent, message).
+            job_id (str, optional): Identifier used to group this job's debug artifacts.
+            tenant_id (str, optional): Tenant whose pipeline and prompts to use (defaults to the current tenant).
         """
-        try:
-            tenant_config = get_tenant_config()
-            prompts = tenant_config.get_prompts_module()
-            
-            current_image = original_image
-            clean_image = original_image # Default if no cleanup
-            
-            score = 0.95
-            reason = "Pipeline completed successfully."
+        clean_image, results = self.process_variations(
+            original_image, scope, [options], progress_callback=progress_callback, job_id=job_id, tenant_id=tenant_id
+        )
+        result = results[0]
+        return clean_image, result['image'], result['score'], result['reason']
 
-            if progress_callback:
-                progress_callback(10, "Analyzing")
+    def process_variations(self, original_image: Image.Image, scope: dict, variations: List[dict],
+                           progress_callback=None, job_id: Optional[str] = None,
+                           tenant_id: Optional[str] = None,
+                           clean_image: Optional[Image.Image] = None) -> Tuple[Image.Image, List[Dict[str, Any]]]:
+        """
+        Runs the cleanup steps once, then the remaining steps once per option set.
+
+        A single variation runs inline with per-step progress updates. Several
+        variations run concurrently on the shared clean image, and progress is
+        reported as each one finishes.
+
+        Args:
+            original_image (Image): The source image.
+            scope (dict): {'windows': bool, 'doors': bool, 'patio': bool}
+            variations (list): Option dicts as for process_pipeline, one per variation.
+            progress_callback (callable, optional): Function to update progress (percent, message).
+            job_id (str, optional): Identifier used to group this job's debug artifacts.
+            tenant_id (str, optional): Tenant to run as (defaults to the current tenant). It is
+                made current for the job, so worker threads see it too.
+            clean_image (Image, optional): Cleanup result of an earlier upload of the same
+                photo; the quality gate and cleanup steps are skipped.
+
+        Returns:
+            Tuple of (clean image, one dict per variation with 'options',
+            'image', 'score', 'reason' and 'error'). A variation that failed
+            has its exception in 'error'; if every variation fails, the first
+            error is raised.
+        """
+        with tenant_context(tenant_id) as tenant_config:
+            try:
+                prompts = tenant_config.get_prompts_module()
+
+                # Decide once per job whether to capture debug artifacts
+                self._job_id = str(job_id) if job_id is not None else uuid.uuid4().hex[:12]
+                self._capture_artifacts = debug_artifact_writer.should_sample(tenant_config)
+
+                # Job-level SLA; every model call is also bounded by its step's timeout
+                self._deadline = Deadline(self._get_job_sla(tenant_config))
+
+                # Quality recovery re-runs are paid for out of one budget shared by all variations
+                self._refinement_budget = RefinementBudget(self._get_refinement_policy(tenant_config).get('MAX_EXTRA_CALLS', 0))
+                self._attempts = AttemptCache()
+                self._references = {}
+
+                # Reject unusable uploads before any paid model call
+                if clean_image is None:
+                    self._check_input_quality(original_image, tenant_config)
+
+                if progress_callback:
+                    progress_callback(10, "Analyzing")
+
+                # Cleanup does not depend on the options, so it is shared by all variations
+                snapshot = tenant_config.snapshot
+                steps = list(enumerate(snapshot.pipeline_steps))
+                shared_steps = [(i, name) for i, name in steps if snapshot.get_step_config(name).get('type') == 'cleanup']
+                variation_steps = [step for step in steps if step not in shared_steps]
+
+                if clean_image is None:
+                    shared = self._run_steps(
+                        shared_steps, tenant_config, prompts, original_image, scope, variations[0],
+                        self._new_state(original_image), progress_callback
+                    )
+                    clean_image = shared['clean']
+                else:
+                    logger.info("Reusing clean image of an earlier upload; skipping cleanup")
+                try:
+                    self._references = self._match_references(variation_steps, tenant_config, clean_image)
+                except Exception as e:
+                    # References only improve prompts; a broken index must not fail the job
+                    logger.warning(f"Reference matching failed, continuing without references (non-fatal): {e}")
+                    self._references = {}
+
+                if len(variations) == 1:
+                    state = self._run_steps(
+                        variation_steps, tenant_config, prompts, original_image, scope, variations[0],
+                        self._new_state(clean_image), progress_callback
+                    )
+                    return clean_image, [self._variation_result(variations[0], state)]
+
+                return clean_image, self._fan_out_variations(
+                    variation_steps, tenant_config, prompts, original_image, scope, variations,
+                    clean_image, progress_callback
+                )
+
+            except Exception as e:
+                logger.error(f"Pipeline failed: {e}")
+                raise
+            finally:
+                if self._capture_artifacts:
+                    debug_artifact_writer.finalize_job(self._job_id)
+
+    def _check_input_quality(self, image: Image.Image, tenant_config):
+        """Run the local quality gate; raises ImageQualityError for blurry, dark or blown-out images."""
+        gate = {**(getattr(settings, 'QUALITY_GATE', {}) or {}), **(tenant_config.get_quality_gate() or {})}
+        if not gate.get('ENABLED', True):
+            return
+
+        with pipeline_tracer.span('pipeline.quality_gate', job_id=self._job_id) as span:
+            passed, reason, metrics = check_image_quality(
+                image,
+                min_sharpness=gate.get('MIN_SHARPNESS', MIN_SHARPNESS),
+                min_brightness=gate.get('MIN_BRIGHTNESS', MIN_BRIGHTNESS),
+                max_clipped=gate.get('MAX_CLIPPED', MAX_CLIPPED)
+            )
+            for key in ('sharpness', 'brightness', 'clipped'):
+                span.set_attribute(f'quality.{key}', round(metrics[key], 3))
+            span.set_attribute('passed', passed)
+
+        if not passed:
+            logger.info(f"Upload rejected by quality gate: {reason} {metrics}")
+            raise ImageQualityError(reason)
+
+    def _match_references(self, steps: List[Tuple[int, str]], tenant_config,
+                          clean_image: Image.Image) -> Dict[str, Image.Image]:
+        """
+        Most similar reference photo per insertion step, from the tenant's reference index.
+
+        A step config can restrict matches with 'reference_category'. Steps
+        whose best match scores below REFERENCE_INDEX['MIN_SCORE'] get none.
+        Off unless REFERENCE_INDEX['ATTACH_TO_PROMPTS'] is set.
+        """
+        config = getattr(settings, 'REFERENCE_INDEX', {}) or {}
+        if not config.get('ATTACH_TO_PROMPTS', False) or not reference_index.size(tenant_config.tenant_id):
+            return {}
+
+        from api.models import ReferenceImage
+
+        with pipeline_tracer.span('pipeline.reference_match', job_id=self._job_id) as span:
+            descriptor = compute_descriptor(clean_image)
+            matches = {}
+            for _, step_name in steps:
+                step_config = tenant_config.snapshot.get_step_config(step_name)
+                if step_config.get('type') != 'insertion':
+                    continue
+                best = reference_index.search(
+                    tenant_config.tenant_id, descriptor, k=1, category=step_config.get('reference_category')
+                )
+                if best and best[0].score >= config.get('MIN_SCORE', 0.0):
+                    matches[step_name] = best[0]
+
+            references = {}
+            rows = ReferenceImage.objects.in_bulk([match.reference_id for match in matches.values()])
+            for step_name, match in matches.items():
+                row = rows.get(match.reference_id)
+                if row is None:
+                    continue
+                try:
+                    with row.image.open('rb') as f, Image.open(f) as source:
+                        reference = source.convert('RGB')
+                    reference.thumbnail((REFERENCE_MAX_SIZE, REFERENCE_MAX_SIZE))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not load reference image {match.reference_id}: {e}")
+                    continue
+                references[step_name] = reference
+                span.set_attribute(f'reference.{step_name}', match.reference_id)
+                span.set_attribute(f'reference.{step_name}.score', round(match.score, 3))
+        return references
+
+    @staticmethod
+    def _new_state(image: Image.Image) -> Dict[str, Any]:
+        return {
+            'clean': image,
+            'current': image,
+            'score': 0.95,
+            'reason': "Pipeline completed successfully.",
+            'quality_tier': None,
+            'refinement_attempts': 0,
+            # (step index, step name, input image, prompt) per insertion, for refinement re-runs
+            'insertions': [],
+            'dimensional_analysis': None,
+        }
+
+    @staticmethod
+    def _variation_result(options: dict, state: Optional[Dict[str, Any]], error: Optional[Exception] = None) -> Dict[str, Any]:
+        return {
+            'options': options,
+            'image': state['current'] if state else None,
+            'score': state['score'] if state else None,
+            'reason': state['reason'] if state else None,
+            'quality_tier': state['quality_tier'] if state else None,
+            'refinement_attempts': state['refinement_attempts'] if state else 0,
+            'dimensional_analysis': state['dimensional_analysis'] if state else None,
+            'error': error,
+        }
+
+    def _run_steps(self, steps: List[Tuple[int, str]], tenant_config, prompts, original_image: Image.Image,
+                   scope: dict, options: dict, state: Dict[str, Any], progress_callback=None,
+                   label: str = "") -> Dict[str, Any]:
+        """
+        Run pipeline steps in order, updating state ('clean', 'current', 'score', 'reason').
+
+        Args:
+            steps: (index, step name) pairs from the tenant's pipeline
+            label: Suffix for debug artifact names, to keep variations apart
+        """
+        for i, step_name in steps:
+            step_config = tenant_config.snapshot.get_step_config(step_name)
+            step_type = step_config.get('type')
+
+            # Update progress
+            if progress_callback and 'progress_weight' in step_config:
+                progress_callback(step_config['progress_weight'], step_config.get('description', 'Processing'))
+
+            routes = self._get_routes(step_name, step_config, tenant_config)
+            timeout_seconds = step_config.get('timeout_seconds', self.timeout_seconds)
+            hedge = step_config.get('hedge', self._deadline_settings().get('HEDGE', False))
+            stream = step_config.get('stream', self._streaming_settings().get('ENABLED', False))
+            thinking = self._thinking_settings(step_config)
+            on_progress = self._stream_progress(progress_callback, tenant_config, i, step_config) if stream else None
+
+            with pipeline_tracer.span('pipeline.step', step=step_name, step_type=step_type, job_id=self._job_id) as step_span:
+                if label:
+                    step_span.set_attribute('variation', label)
 
-            steps = tenant_config.get_pipeline_steps()
-            
-            for i, step_name in enumerate(steps):
-                step_config = tenant_config.get_step_config(step_name)
-                step_type = step_config.get('type')
-                
-                # Update progress
-                if progress_callback and 'progress_weight' in step_config:
-                    progress_callback(step_config['progress_weight'], step_config.get('description', 'Processing'))
-                
                 if step_type == 'cleanup':
                     cleanup_prompt = prompts.get_cleanup_prompt()
-                    clean_image = self._call_gemini_edit(original_image, cleanup_prompt, step_name=step_name)
-                    self._save_debug_image(clean_image, f"{i}_{step_name}")
-                    current_image = clean_image
+                    clean_image = self._run_edit_step(
+                        original_image, cleanup_prompt, step_name, routes,
+                        timeout_seconds=timeout_seconds, hedge=hedge, stream=stream, on_progress=on_progress,
+                        thinking=thinking, label=label
+                    )
+                    self._save_debug_image(clean_image, f"{i}_{step_name}", label)
+                    state['clean'] = state['current'] = clean_image
                     logger.info(f"Pipeline Step: {step_name} complete.")
 
                 elif step_type == 'insertion':
@@ -75,38 +338,398 @@ class ScreenVisualizer:
                     if scope_key and scope.get(scope_key, False):
                         feature_name = step_config.get('feature_name')
                         prompt = prompts.get_screen_insertion_prompt(feature_name, options)
-                        current_image = self._call_gemini_edit(current_image, prompt, step_name=step_name)
-                        self._save_debug_image(current_image, f"{i}_{step_name}")
-                        logger.info(f"Pipeline Step: {step_name} complete.")
-                        
+                        reference = self._references.get(step_name)
+                        if reference is not None:
+                            prompt += REFERENCE_NOTE
+                        state['insertions'].append((i, step_name, state['current'], prompt))
+                        state['current'] = self._run_edit_step(
+                            state['current'], prompt, step_name, routes,
+                            timeout_seconds=timeout_seconds, hedge=hedge, reference=reference,
+                            stream=stream, on_progress=on_progress, thinking=thinking, label=label
+                        )
+                        self._save_debug_image(state['current'], f"{i}_{step_name}", label)
+                        if step_config.get('dimensional_analysis'):
+                            state['dimensional_analysis'] = self._parse_dimensional_analysis(
+                                state['current'], step_name, step_span
+                            )
+                        logger.info(f"Pipeline Step: {step_name}{label} complete.")
+                    else:
+                        step_span.set_attribute('skipped', True)
+
                 elif step_type == 'quality_check':
                     quality_prompt = prompts.get_quality_check_prompt(scope)
-                    # Pass both clean (reference) and current (final) images
-                    quality_result = self._call_gemini_json([clean_image, current_image], quality_prompt)
-                    score = quality_result.get('score', 0.95)
-                    reason = quality_result.get('reason', 'AI quality check completed.')
-                    logger.info(f"Quality Check: Score={score}, Reason={reason}")
+                    quality_result = self._check_quality(
+                        state['clean'], state['current'], quality_prompt, step_name=step_name,
+                        step_config=step_config, model_name=routes[0].model,
+                        deadline=self._deadline.narrow(timeout_seconds), hedge=hedge, span=step_span
+                    )
+                    state['score'] = quality_result['score']
+                    state['reason'] = quality_result['reason']
+                    state['quality_tier'] = quality_result['tier']
+                    logger.info(
+                        f"Quality Check{label} ({state['quality_tier']}): "
+                        f"Score={state['score']}, Reason={state['reason']}"
+                    )
+                    self._refine_insertions(
+                        state, tenant_config, quality_prompt, step_name, step_config, routes[0].model,
+                        timeout_seconds, hedge, step_span, label
+                    )
 
-            return clean_image, current_image, score, reason
+            if not step_span.attributes.get('skipped'):
+                production_monitor.record_step_latency(step_name, step_span.duration_ms / 1000)
 
-        except Exception as e:
-            logger.error(f"Pipeline failed: {e}")
-            raise
+        return state
+
+    @staticmethod
+    def _parse_dimensional_analysis(image: Image.Image, step_name: str, span) -> Optional[Dict[str, Any]]:
+        """Measurements the model stated alongside an edit (see api/visualizer/dimensional_analysis.py)."""
+        analysis = parse_dimensional_analysis(image.info.get('response_text', ''))
+        if analysis is None:
+            logger.warning(f"No dimensional analysis in the {step_name} response")
+            return None
+        for key in ('opening_width_ft', 'mullion_count'):
+            if analysis[key] is not None:
+                span.set_attribute(f'analysis.{key}', analysis[key])
+        return analysis
+
+    def _fan_out_variations(self, steps: List[Tuple[int, str]], tenant_config, prompts, original_image: Image.Image,
+                            scope: dict, variations: List[dict], clean_image: Image.Image,
+                            progress_callback=None) -> List[Dict[str, Any]]:
+        """Run the per-variation steps for every option set concurrently."""
+        def run(index: int, options: dict) -> Dict[str, Any]:
+            try:
+                return self._run_steps(
+                    steps, tenant_config, prompts, original_image, scope, options,
+                    self._new_state(clean_image), label=f"_v{index + 1}"
+                )
+            finally:
+                # Worker threads get their own DB connections (cost ledger writes)
+                connections.close_all()
 
-    def _call_gemini_edit(self, image: Image.Image, prompt: str, step_name: str = "unknown") -> Image.Image:
+        results: List[Optional[Dict[str, Any]]] = [None] * len(variations)
+        with ThreadPoolExecutor(max_workers=len(variations), thread_name_prefix='variation') as executor:
+            # Each variation runs in a copy of this context so its spans join the job trace
+            futures = {
+                executor.submit(contextvars.copy_context().run, run, index, options): index
+                for index, options in enumerate(variations)
+            }
+            for finished, future in enumerate(as_completed(futures), start=1):
+                index = futures[future]
+                try:
+                    results[index] = self._variation_result(variations[index], future.result())
+                except Exception as e:
+                    logger.error(f"Variation {index + 1} failed: {e}")
+                    results[index] = self._variation_result(variations[index], None, error=e)
+                if progress_callback:
+                    progress_callback(
+                        30 + int(55 * finished / len(variations)),
+                        f"Rendered {finished} of {len(variations)} variations"
+                    )
+
+        if all(result['error'] is not None for result in results):
+            raise results[0]['error']
+        return results
+
+    def _check_quality(self, clean_image: Image.Image, final_image: Image.Image, prompt: str,
+                       step_name: str = "quality_check", step_config: Optional[dict] = None,
+                       model_name: Optional[str] = None, deadline: Optional[Deadline] = None,
+                       hedge: bool = False, span=None,
+                       budget: Optional[RefinementBudget] = None) -> Dict[str, Any]:
+        """
+        Score a result with local metrics, asking the model only when they are inconclusive.
+
+        The step config's 'escalate' ('auto', 'always' or 'never', default from
+        settings.QUALITY_CASCADE) controls when the model is called, and
+        'quality_thresholds' overrides the local thresholds. If the model call
+        fails, or a given budget cannot pay for it, the local score is kept.
+
+        Returns:
+            dict with score, reason and tier ('local', 'model' or 'local_fallback')
+        """
+        step_config = step_config or {}
+        escalate = step_config.get('escalate', self._cascade_settings().get('ESCALATE', 'auto'))
+
+        local = assess_result_quality(clean_image, final_image, step_config.get('quality_thresholds'))
+        if span is not None:
+            for key, value in local.metrics.items():
+                span.set_attribute(f'quality.{key}', value)
+            span.set_attribute('quality.local_confident', local.confident)
+
+        verdict = {'score': local.score, 'reason': local.reason, 'tier': 'local'}
+        escalated = escalate == 'always' or (escalate == 'auto' and not local.confident)
+        if escalated and budget is not None and not budget.try_spend():
+            logger.info(f"No budget left for a model quality check of {step_name}, keeping the local score")
+            verdict['tier'] = 'local_fallback'
+        elif escalated:
+            try:
+                # Pass both clean (reference) and current (final) images
+                result = self._call_gemini_json(
+                    [clean_image, final_image], prompt, schema=QualityVerdict, step_name=step_name,
+                    model_name=model_name, deadline=deadline, hedge=hedge
+                )
+                verdict = {
+                    'score': result.score,
+                    'reason': result.reason or 'AI quality check completed.',
+                    'tier': 'model',
+                }
+            except ScreenVisualizerError as e:
+                logger.warning(f"Model quality check unavailable, keeping local score: {e}")
+                verdict['tier'] = 'local_fallback'
+
+        if span is not None:
+            span.set_attribute('quality.tier', verdict['tier'])
+            span.set_attribute('quality.score', verdict['score'])
+        return verdict
+
+    def _refine_insertions(self, state: Dict[str, Any], tenant_config, quality_prompt: str, step_name: str,
+                           step_config: dict, quality_model: str, timeout_seconds: Optional[float],
+                           hedge: bool, span, label: str = ""):
+        """
+        Re-run the weakest insertion step with a refined prompt while the score is below the tenant threshold.
+
+        Insertion steps after it are replayed on the new image with their
+        original prompts. Every edit and model quality check is paid for out
+        of the job's refinement budget, and attempts stop when the budget cannot cover a full re-run,
+        the job deadline passes or the tenant's attempt limit is reached. The
+        best scoring result is kept.
+        """
+        policy = self._get_refinement_policy(tenant_config)
+        if not policy.get('ENABLED', True) or not state['insertions']:
+            return
+        min_score = policy.get('MIN_SCORE', 0.7)
+        if state['score'] >= min_score:
+            return
+
+        # Blame the insertion whose own change looks worst
+        failing = min(
+            range(len(state['insertions'])),
+            key=lambda n: assess_result_quality(
+                state['insertions'][n][2],
+                state['insertions'][n + 1][2] if n + 1 < len(state['insertions']) else state['current'],
+            ).score
+        )
+        step_index, failing_step, step_input, base_prompt = state['insertions'][failing]
+        replay = state['insertions'][failing + 1:]
+        span.set_attribute('refinement.step', failing_step)
+
+        best = dict(state)
+        for attempt in range(1, policy.get('MAX_ATTEMPTS', 2) + 1):
+            if self._deadline.expired():
+                break
+            prompt = refine_prompt(base_prompt, best['score'], policy.get('TARGET_SCORE', 0.9), attempt, best['reason'])
+            key = AttemptCache.key(failing_step, step_input, prompt)
+            image = self._attempts.get(key)
+            if image is None:
+                if not self._refinement_budget.try_spend(1 + len(replay)):
+                    span.set_attribute('refinement.budget_exhausted', True)
+                    break
+                try:
+                    image = self._refine_edit(step_input, prompt, failing_step, tenant_config, label)
+                    for _, replay_step, _, replay_prompt in replay:
+                        image = self._refine_edit(image, replay_prompt, replay_step, tenant_config, label)
+                except ScreenVisualizerError as e:
+                    # The unrefined result still stands
+                    logger.warning(f"Refinement of {failing_step}{label} failed: {e}")
+                    break
+                self._attempts.put(key, image)
+
+            self._save_debug_image(image, f"{step_index}_{failing_step}_refined{attempt}", label)
+            best['refinement_attempts'] = attempt
+            quality_result = self._check_quality(
+                state['clean'], image, quality_prompt, step_name=step_name, step_config=step_config,
+                model_name=quality_model, deadline=self._deadline.narrow(timeout_seconds), hedge=hedge,
+                budget=self._refinement_budget
+            )
+            logger.info(f"Refinement {attempt} of {failing_step}{label}: Score={quality_result['score']}")
+            if quality_result['score'] > best['score']:
+                best.update(current=image, score=quality_result['score'], reason=quality_result['reason'],
+                            quality_tier=quality_result['tier'])
+            if best['score'] >= min_score:
+                break
+
+        span.set_attribute('refinement.attempts', best['refinement_attempts'])
+        span.set_attribute('refinement.improved', best['score'] > state['score'])
+        span.set_attribute('quality.score', best['score'])
+        state.update(best)
+
+    def _refine_edit(self, image: Image.Image, prompt: str, step_name: str, tenant_config,
+                     label: str = "") -> Image.Image:
+        """One refinement edit, with the step's own routes, timeout and hedging."""
+        step_config = tenant_config.snapshot.get_step_config(step_name)
+        return self._run_edit_step(
+            image, prompt, step_name, self._get_routes(step_name, step_config, tenant_config),
+            timeout_seconds=step_config.get('timeout_seconds', self.timeout_seconds),
+            hedge=step_config.get('hedge', self._deadline_settings().get('HEDGE', False)),
+            reference=self._references.get(step_name),
+            stream=step_config.get('stream', self._streaming_settings().get('ENABLED', False)),
+            thinking=self._thinking_settings(step_config), label=label
+        )
+
+    def _get_refinement_policy(self, tenant_config) -> dict:
+        """settings.QUALITY_REFINEMENT with the tenant's overrides applied."""
+        return {
+            **(getattr(settings, 'QUALITY_REFINEMENT', {}) or {}),
+            **(tenant_config.get_refinement_policy() or {}),
+        }
+
+    @staticmethod
+    def _cascade_settings() -> dict:
+        return getattr(settings, 'QUALITY_CASCADE', {}) or {}
+
+    def _get_routes(self, step_name: str, step_config: dict, tenant_config) -> List[ModelRoute]:
+        """Gemini routes for a step from the tenant's model policy, defaulting to self.model_name."""
+        routes = [
+            route for route in model_router.get_routes(step_name, step_config, tenant_config)
+            if route.provider == 'gemini'
+        ]
+        return routes or [ModelRoute(provider='gemini', model=self.model_name)]
+
+    def _get_job_sla(self, tenant_config) -> Optional[float]:
+        """Job time budget in seconds from the tenant, else settings (None for no limit)."""
+        sla = tenant_config.get_job_sla_seconds()
+        return sla if sla is not None else self._deadline_settings().get('JOB_SLA_SECONDS')
+
+    @staticmethod
+    def _deadline_settings() -> dict:
+        return getattr(settings, 'PIPELINE_DEADLINES', {}) or {}
+
+    @staticmethod
+    def _thinking_settings(step_config: dict) -> Dict[str, Any]:
+        """The step's 'include_thoughts' and 'thinking_budget', where set."""
+        return {key: step_config[key] for key in ('include_thoughts', 'thinking_budget') if key in step_config}
+
+    @staticmethod
+    def _sample_thinking_baseline() -> bool:
+        """Whether a budgeted call should run unbounded, to keep a baseline for the budget."""
+        rate = (getattr(settings, 'GEMINI_THINKING', {}) or {}).get('BASELINE_SAMPLE_RATE', 0.0)
+        return rate > 0 and random.random() < rate
+
+    @staticmethod
+    def _streaming_settings() -> dict:
+        return getattr(settings, 'GEMINI_STREAMING', {}) or {}
+
+    @staticmethod
+    def _stream_progress(progress_callback, tenant_config, index: int,
+                         step_config: dict) -> Optional[ProgressRelay]:
+        """
+        Progress reporter for a streamed step, moving from the step's
+        progress_weight towards the next weighted step's as tokens arrive.
+
+        progress_callback saves to the database, so it only runs on the job
+        thread: the stream reports through a ProgressRelay that the job
+        thread drains while it waits for the model call.
+        """
+        if not progress_callback or 'progress_weight' not in step_config:
+            return None
+        snapshot = tenant_config.snapshot
+        start = step_config['progress_weight']
+        end = next(
+            (snapshot.get_step_config(name)['progress_weight'] for name in snapshot.pipeline_steps[index + 1:]
+             if 'progress_weight' in snapshot.get_step_config(name)),
+            STREAM_PROGRESS_END
+        )
+        description = step_config.get('description', 'Processing')
+        last = start
+
+        def report(fraction: float, tokens: int):
+            nonlocal last
+            # Stop short of the next step, and only save whole-percent changes
+            percent = start + int((end - start - 1) * fraction)
+            if percent > last:
+                last = percent
+                progress_callback(percent, description)
+
+        return ProgressRelay(report)
+
+    def _run_edit_step(self, image: Image.Image, prompt: str, step_name: str, routes: List[ModelRoute],
+                       timeout_seconds: Optional[float] = None, hedge: bool = False,
+                       reference: Optional[Image.Image] = None, stream: bool = False,
+                       on_progress: Optional[Callable[[float, int], None]] = None,
+                       thinking: Optional[Dict[str, Any]] = None, label: str = "") -> Image.Image:
+        """
+        Run an image edit, failing over to the next route when a model call fails.
+
+        Each route gets up to timeout_seconds, within what is left of the job deadline.
+        A reference photo, if given, is sent after the image being edited. With
+        stream set, the response is read as it arrives (see _call_gemini_edit).
+        The step's thinking settings ('include_thoughts', 'thinking_budget')
+        apply to routes that think; routes with include_thoughts off get none.
+        The budget is raised to the route model's minimum, and a sample of
+        budgeted calls (GEMINI_THINKING['BASELINE_SAMPLE_RATE']) runs with
+        dynamic thinking so the budget keeps an unbounded baseline to be
+        compared with.
+        label names the variation in the thinking log.
+        """
+        # Only pass the reference, streaming options and label when they are used
+        extra = {'reference': reference} if reference is not None else {}
+        if label:
+            extra['label'] = label
+        if stream:
+            extra.update(stream=True, on_progress=on_progress)
+        last_error = None
+        for route in routes:
+            if self._deadline.expired():
+                break
+            include_thoughts = route.include_thoughts
+            route_extra = dict(extra)
+            if include_thoughts and thinking:
+                include_thoughts = thinking.get('include_thoughts', True)
+                if thinking.get('thinking_budget') is not None:
+                    route_extra['thinking_budget'] = (
+                        DYNAMIC_THINKING_BUDGET if self._sample_thinking_baseline()
+                        else clamp_thinking_budget(route.model, thinking['thinking_budget'])
+                    )
+            try:
+                return self._call_gemini_edit(
+                    image, prompt, step_name=step_name,
+                    model_name=route.model, include_thoughts=include_thoughts,
+                    deadline=self._deadline.narrow(timeout_seconds), hedge=hedge, **route_extra
+                )
+            except ScreenVisualizerError as e:
+                last_error = e
+                logger.warning(f"Step {step_name} failed on {route.model}, trying next route: {e}")
+        if last_error is None or self._deadline.expired():
+            raise ScreenVisualizerError(f"Job deadline exceeded during step '{step_name}'") from last_error
+        raise last_error
+
+    def _call_gemini_edit(self, image: Image.Image, prompt: str, step_name: str = "unknown",
+                          model_name: Optional[str] = None, include_thoughts: bool = True,
+                          deadline: Optional[Deadline] = None, hedge: bool = False,
+                          reference: Optional[Image.Image] = None, stream: bool = False,
+                          on_progress: Optional[Callable[[float, int], None]] = None,
+                          thinking_budget: Optional[int] = None, label: str = "") -> Image.Image:
         """
         Helper method to handle the actual API call plumbing for image editing.
         Uses Thinking Mode for better reasoning on complex edits.
+
+        The call (including rate-limit retries) is abandoned once the deadline
+        passes. With hedge set, a duplicate request races slow calls. A
+        reference image is sent as a second image part.
+
+        thinking_budget caps the model's thinking tokens (0 turns thinking
+        off; None or DYNAMIC_THINKING_BUDGET leaves it to the model). Thought summaries are returned only
+        with include_thoughts. Tokens and latency of budgeted calls are traced
+        against the step's unbounded calls.
+
+        With stream set, the response is consumed chunk by chunk: thoughts are
+        appended to the thinking log as they arrive, the image is decoded as
+        soon as its part is complete, and on_progress gets (fraction, output
+        tokens) as tokens flow in.
         """
+        model_name = model_name or self.model_name
+        started = time.perf_counter()
         try:
             # Enable Thinking Mode - requires TEXT + IMAGE response modalities
             config_args = {
                 "response_modalities": ["TEXT", "IMAGE"],
             }
 
-            # Enable Thinking with include_thoughts=True (the original working config)
-            if hasattr(types, 'ThinkingConfig'):
-                config_args['thinking_config'] = types.ThinkingConfig(include_thoughts=True)
+            # Thinking summaries and/or a cap on thinking tokens
+            thinks = (include_thoughts or thinking_budget is not None) and hasattr(types, 'ThinkingConfig')
+            if thinks:
+                config_args['thinking_config'] = types.ThinkingConfig(
+                    include_thoughts=include_thoughts, thinking_budget=thinking_budget
+                )
 
             if hasattr(types, 'ImageGenerationConfig'):
                 config_args['image_generation_config'] = types.ImageGenerationConfig(
@@ -114,50 +737,86 @@ class ScreenVisualizer:
                     person_generation="dont_generate_people"
                 )
 
-            # Retry logic
-            max_retries = 4
-            for attempt in range(max_retries):
-                try:
-                    response = self.client.models.generate_content(
-                        model=self.model_name,
-                        contents=[image, prompt],
-                        config=types.GenerateContentConfig(**config_args)
+            # Encode once up front so retries reuse the same payload
+            with pipeline_tracer.span('gemini.image_prep', step=step_name) as prep_span:
+                image_part, bytes_in = self._encode_image_part(image)
+                contents = [image_part]
+                if reference is not None:
+                    reference_part, reference_bytes = self._encode_image_part(reference)
+                    contents.append(reference_part)
+                    bytes_in += reference_bytes
+                contents.append(prompt)
+                prep_span.set_attribute('bytes_in', bytes_in)
+
+            with pipeline_tracer.span('gemini.generate_content', step=step_name, model=model_name) as call_span:
+                consume = None
+                if stream:
+                    consume = EditStreamReader(
+                        on_thought=self._thinking_log_stream(step_name, prompt, label), on_progress=on_progress,
+                        expected_tokens=self._streaming_settings().get('EXPECTED_OUTPUT_TOKENS', DEFAULT_EXPECTED_OUTPUT_TOKENS)
                     )
-                    break
-                except Exception as e:
-                    if "429" in str(e) and attempt < max_retries - 1:
-                        wait_time = 10 * (attempt + 1)
-                        logger.warning(f"Rate limited, waiting {wait_time}s (attempt {attempt + 1})")
-                        time.sleep(wait_time)
-                    else:
-                        raise e
+                response = self._generate_with_retries(
+                    model_name, contents, types.GenerateContentConfig(**config_args),
+                    call_span, max_retries=4, step_name=step_name, deadline=deadline, hedge=hedge, consume=consume,
+                    poll=on_progress.drain if isinstance(on_progress, ProgressRelay) else None
+                )
+                if stream:
+                    call_span.set_attribute('stream.chunks', response.chunks)
+                    if response.first_chunk_s is not None:
+                        call_span.set_attribute('stream.first_chunk_ms', round(response.first_chunk_s * 1000, 1))
+                    if response.image_ready_s is not None:
+                        call_span.set_attribute('stream.image_ready_ms', round(response.image_ready_s * 1000, 1))
 
-            # Log thinking/token usage for monitoring
-            if hasattr(response, 'usage_metadata') and response.usage_metadata:
-                usage = response.usage_metadata
-                thinking_tokens = getattr(usage, 'thoughts_token_count', 0) or 0
-                total_tokens = getattr(usage, 'total_token_count', 0) or 0
-                logger.info(f"Gemini Usage [{step_name}] - Thinking: {thinking_tokens}, Total: {total_tokens}")
+                # Record token usage for monitoring
+                thinking_tokens = 0
+                if hasattr(response, 'usage_metadata') and response.usage_metadata:
+                    usage = response.usage_metadata
+                    thinking_tokens = getattr(usage, 'thoughts_token_count', 0) or 0
+                    total_tokens = getattr(usage, 'total_token_count', 0) or 0
+                    call_span.set_attribute('tokens.prompt', getattr(usage, 'prompt_token_count', 0) or 0)
+                    call_span.set_attribute('tokens.output', getattr(usage, 'candidates_token_count', 0) or 0)
+                    call_span.set_attribute('tokens.thinking', thinking_tokens)
+                    call_span.set_attribute('tokens.total', total_tokens)
+                    logger.info(f"Gemini Usage [{step_name}] - Thinking: {thinking_tokens}, Total: {total_tokens}")
+                    self._record_usage(usage, step_name, model_name, call_span)
 
-            # Extract and log thinking text, then extract image
+                if thinks:
+                    self._record_thinking(
+                        call_span, step_name, model_name, thinking_budget, thinking_tokens,
+                        time.perf_counter() - started
+                    )
+
+            # Extract thinking text, then decode the image
             result_image = None
             thinking_text = []
 
-            if response.candidates and response.candidates[0].content.parts:
-                for part in response.candidates[0].content.parts:
-                    # Capture thinking/reasoning text
-                    if hasattr(part, 'text') and part.text:
-                        thinking_text.append(part.text)
-                    # Capture image
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        from io import BytesIO
-                        result_image = Image.open(BytesIO(part.inline_data.data))
+            with pipeline_tracer.span('gemini.decode', step=step_name) as decode_span:
+                if stream:
+                    # Already decoded while the stream was read
+                    result_image, thinking_text = response.image, response.thinking_text
+                    decode_span.add('bytes_out', response.image_bytes)
+                    decode_span.set_attribute('streamed', True)
+                elif response.candidates and response.candidates[0].content.parts:
+                    for part in response.candidates[0].content.parts:
+                        # Capture thinking/reasoning text
+                        if hasattr(part, 'text') and part.text:
+                            thinking_text.append(part.text)
+                        # Capture image
+                        if hasattr(part, 'inline_data') and part.inline_data:
+                            decode_span.add('bytes_out', len(part.inline_data.data))
+                            result_image = Image.open(io.BytesIO(part.inline_data.data))
+                            # Force the decode here so its cost lands in this span
+                            result_image.load()
 
-            # Log thinking to file for debugging
-            if thinking_text:
-                self._log_thinking(step_name, prompt, thinking_text)
+            # Log thinking to file for debugging (streamed thoughts are already logged)
+            if thinking_text and not stream:
+                self._log_thinking(step_name, prompt, thinking_text, label)
 
             if result_image:
+                model_router.record_outcome('gemini', model_name, time.perf_counter() - started, success=True)
+                if thinking_text:
+                    # Keep the model's text with the image it describes, as PIL does for PNG text chunks
+                    result_image.info['response_text'] = "\n".join(thinking_text)
                 return result_image
 
             logger.error("No image data found in response.")
@@ -165,102 +824,281 @@ class ScreenVisualizer:
 
         except Exception as e:
             logger.error(f"Gemini call failed: {e}")
+            model_router.record_outcome('gemini', model_name, time.perf_counter() - started, success=False)
             raise ScreenVisualizerError(f"Gemini call failed: {e}") from e
 
-    def _log_thinking(self, step_name: str, prompt: str, thinking_text: List[str]):
-        """Log Gemini's thinking/reasoning to a file for debugging and analysis."""
+    def _generate_with_retries(self, model_name: str, contents: List[Any], config, call_span, max_retries: int,
+                               step_name: str = "unknown", deadline: Optional[Deadline] = None, hedge: bool = False,
+                               consume: Optional[Callable[[Iterable], Any]] = None,
+                               poll: Optional[Callable[[], None]] = None):
+        """
+        Call generate_content, retrying rate limits with linear backoff.
+
+        With consume, the response is streamed instead and consume(stream)
+        is returned; it must expose the stream's usage_metadata. poll runs
+        on this thread while it waits for the call (see run_with_deadline).
+
+        Every attempt goes through the model's circuit breaker: calls are
+        rejected immediately while the circuit is open, and retries stop as
+        soon as failures open it. Retries also stop when the backoff would
+        run past the deadline.
+        """
+        deadline = deadline or Deadline()
+        if deadline.remaining() is not None:
+            call_span.set_attribute('timeout_s', round(deadline.remaining(), 1))
+        breaker = circuit_breakers.get('gemini', model_name)
+        for attempt in range(max_retries):
+            if deadline.expired():
+                raise DeadlineExceededError(f"No time left to call gemini/{model_name}")
+            if not breaker.allow_request():
+                call_span.set_attribute('circuit', 'open')
+                raise CircuitOpenError(f"Circuit open for gemini/{model_name}")
+            try:
+                # Only hedge healthy models; a half-open circuit admits a single trial call
+                response = self._generate_once(
+                    model_name, contents, config, call_span, step_name, deadline,
+                    hedge=hedge and breaker.state == CircuitState.CLOSED, consume=consume, poll=poll
+                )
+                breaker.record_success()
+                return response
+            except Exception as e:
+                if _is_provider_failure(e):
+                    breaker.record_failure()
+                else:
+                    # A rejected request says nothing about the model; let the next call be the trial
+                    breaker.release_trial()
+                if isinstance(e, DeadlineExceededError):
+                    call_span.set_attribute('timed_out', True)
+                    raise e
+                remaining = deadline.remaining()
+                if ("429" in str(e) and attempt < max_retries - 1 and breaker.state == CircuitState.CLOSED
+                        and (remaining is None or 10 * (attempt + 1) < remaining)):
+                    wait_time = 10 * (attempt + 1)
+                    logger.warning(f"Rate limited, waiting {wait_time}s (attempt {attempt + 1})")
+                    call_span.add('retries', 1)
+                    call_span.add('retry_wait_ms', wait_time * 1000)
+                    time.sleep(wait_time)
+                else:
+                    raise e
+
+    def _generate_once(self, model_name: str, contents: List[Any], config, call_span, step_name: str,
+                       deadline: Deadline, hedge: bool = False, consume: Optional[Callable[[Iterable], Any]] = None,
+                       poll: Optional[Callable[[], None]] = None):
+        """One generate_content call (or consumed stream), bounded by the deadline and optionally hedged."""
+        def generate(config):
+            if consume is not None:
+                return consume(self.client.models.generate_content_stream(model=model_name, contents=contents, config=config))
+            return self.client.models.generate_content(model=model_name, contents=contents, config=config)
+
+        remaining = deadline.remaining()
+        if remaining is None and not hedge:
+            return generate(config)
+
+        if remaining is not None:
+            # The SDK timeout (ms) ends the HTTP request once we stop waiting for it
+            config = config.model_copy(update={
+                'http_options': types.HttpOptions(timeout=max(1, int(remaining * 1000)))
+            })
+
+        def call():
+            return generate(config)
+
+        def record_discarded(response):
+            # The losing hedge is billed too
+            if getattr(response, 'usage_metadata', None):
+                self._record_usage(response.usage_metadata, step_name, model_name)
+
+        return run_with_deadline(
+            call, deadline, hedge_after=self._hedge_delay(model_name) if hedge else None,
+            span=call_span, on_discarded=record_discarded, poll=poll
+        )
+
+    def _hedge_delay(self, model_name: str) -> Optional[float]:
+        """Hedge once a call outlives the model's recent p95 latency (None until there are enough samples)."""
+        stats = model_router.get_stats('gemini', model_name)
+        if stats['samples'] < MIN_SAMPLES:
+            return None
+        return stats['p95_latency']
+
+    def _record_thinking(self, span, step_name: str, model_name: str, budget: Optional[int],
+                         thinking_tokens: int, latency_seconds: float):
+        """
+        Trace a call's thinking budget, and its token and latency deltas
+        against the step's recent unbounded calls on the same model.
+
+        Calls without a budget or with the dynamic budget are the unbounded
+        baseline (see _sample_thinking_baseline).
+        """
+        if budget is not None and budget < 0:
+            budget = None
+        span.set_attribute('thinking.budget', budget if budget is not None else DYNAMIC_THINKING_BUDGET)
+        if budget is not None:
+            baseline = model_router.get_thinking_stats('gemini', model_name, step_name, None)
+            if baseline['samples'] >= MIN_SAMPLES:
+                span.set_attribute('thinking.tokens_delta', round(thinking_tokens - baseline['avg_thinking_tokens']))
+                span.set_attribute('thinking.latency_delta_ms', round((latency_seconds - baseline['avg_latency']) * 1000, 1))
+        model_router.record_thinking('gemini', model_name, step_name, budget, thinking_tokens, latency_seconds)
+
+    def _record_usage(self, usage_metadata: Any, step_name: str, model_name: str, span=None):
+        """Record a call's token usage and cost in the cost ledger."""
+        from api.services.cost_ledger import record_model_usage
+
+        record = record_model_usage(usage_metadata, model_name, step_name)
+        if record is not None:
+            model_router.record_cost('gemini', model_name, float(record.cost_usd))
+            if span is not None:
+                span.set_attribute('cost_usd', float(record.cost_usd))
+
+    def _encode_image_part(self, image: Image.Image) -> Tuple[Any, int]:
+        """
+        Encode an image into a request part, matching what the SDK does for PIL
+        inputs (PNG, or the original JPEG bytes for file-backed JPEGs).
+
+        Returns:
+            Tuple of (Part, encoded size in bytes)
+        """
+        image_format = 'PNG'
+        save_params = {}
+        if (image.format == 'JPEG' and getattr(image, 'filename', '')
+                and image.mode in ('1', 'L', 'RGB', 'RGBX', 'CMYK')):
+            image_format = 'JPEG'
+            save_params['quality'] = 'keep'
+
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, **save_params)
+        data = buffer.getvalue()
+        return types.Part.from_bytes(data=data, mime_type=f"image/{image_format.lower()}"), len(data)
+
+    def _log_thinking(self, step_name: str, prompt: str, thinking_text: List[str], label: str = ""):
+        """Queue Gemini's thinking/reasoning log for the background artifact writer."""
+        if not self._should_capture_artifacts():
+            return
         try:
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            log_dir = os.path.join(settings.MEDIA_ROOT, "thinking_logs")
-            os.makedirs(log_dir, exist_ok=True)
-
-            # Use _patio_analysis suffix for patio steps to highlight dimensional reasoning
-            log_suffix = "patio_analysis" if step_name == "patio" else step_name
-            log_file = os.path.join(log_dir, f"thinking_{timestamp}_{log_suffix}.txt")
-
-            with open(log_file, 'w') as f:
-                f.write(f"=== Gemini Thinking Log ===\n")
-                f.write(f"Timestamp: {datetime.now().isoformat()}\n")
-                f.write(f"Step: {step_name}\n")
-                f.write(f"\n--- PROMPT ---\n")
-                f.write(prompt)
-                f.write(f"\n\n--- THINKING ---\n")
-                for i, text in enumerate(thinking_text):
-                    f.write(f"\n[Part {i + 1}]\n{text}\n")
-
-            logger.info(f"Thinking logged to: {log_file}")
+            filename, header = self._thinking_log_header(step_name, prompt, label)
+            lines = [header]
+            for i, text in enumerate(thinking_text):
+                lines.append(f"\n[Part {i + 1}]\n{text}\n")
+
+            debug_artifact_writer.submit_text("".join(lines), "thinking_logs", filename, job_id=self._job_id)
         except Exception as e:
             logger.warning(f"Failed to log thinking: {e}")
 
-    def _call_gemini_json(self, contents: List[Any], prompt: str) -> dict:
+    def _thinking_log_stream(self, step_name: str, prompt: str, label: str = "") -> Optional[Callable[[str], None]]:
+        """
+        Writer that appends streamed thought text to the thinking log as it arrives.
+
+        Returns None when this job does not capture debug artifacts.
+        """
+        if not self._should_capture_artifacts():
+            return None
+        filename, header = self._thinking_log_header(step_name, prompt, label)
+        parts = 0
+
+        def write(text: str):
+            nonlocal parts
+            parts += 1
+            debug_artifact_writer.append_text(
+                (header if parts == 1 else "") + f"\n[Part {parts}]\n{text}\n",
+                "thinking_logs", filename, job_id=self._job_id
+            )
+
+        return write
+
+    def _thinking_log_header(self, step_name: str, prompt: str, label: str = "") -> Tuple[str, str]:
+        """
+        File name and header of a thinking log. The job ID and variation label
+        keep logs of concurrent jobs and variations written in the same second apart.
+        """
+        from datetime import datetime
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        # Use _patio_analysis suffix for patio steps to highlight dimensional reasoning
+        log_suffix = "patio_analysis" if step_name == "patio" else step_name
+        filename = f"thinking_{timestamp}_{self._job_id}_{log_suffix}{label}.txt"
+
+        header = "".join([
+            "=== Gemini Thinking Log ===\n",
+            f"Timestamp: {datetime.now().isoformat()}\n",
+            f"Job: {self._job_id}\n",
+            f"Step: {step_name}{label}\n",
+            "\n--- PROMPT ---\n",
+            prompt,
+            "\n\n--- THINKING ---\n",
+        ])
+        return filename, header
+
+    def _call_gemini_json(self, contents: List[Any], prompt: str, schema: type = QualityVerdict,
+                          step_name: str = "quality_check", model_name: Optional[str] = None,
+                          deadline: Optional[Deadline] = None, hedge: bool = False):
         """
-        Helper method to handle API call for JSON text response.
+        Call the model for a schema-constrained JSON response (api/ai_services/structured_output.py).
+
         Args:
             contents: List of images or other content parts.
             prompt: The text prompt.
+            schema: Response dataclass the JSON is constrained to and validated into.
+            step_name: Pipeline step name, used for tracing and cost attribution.
+            model_name: Model to call (defaults to self.model_name).
+            deadline: Time budget for the call.
+            hedge: Race a duplicate request against slow calls.
+
+        Returns:
+            An instance of schema
+
+        Raises:
+            ScreenVisualizerError: The call failed or the response did not match the schema
         """
+        model_name = model_name or self.model_name
+        started = time.perf_counter()
         try:
-            config_args = {
-                "response_modalities": ["TEXT"],
-            }
-            
+            config = structured_config(schema, types.GenerateContentConfig(response_modalities=["TEXT"]))
+
             # Combine contents and prompt
             full_contents = contents + [prompt]
 
-            # Retry logic
-            max_retries = 3
-            for attempt in range(max_retries):
+            with pipeline_tracer.span('gemini.generate_content', step=step_name, model=model_name, response='json') as call_span:
                 try:
-                    response = self.client.models.generate_content(
-                        model=self.model_name,
-                        contents=full_contents,
-                        config=types.GenerateContentConfig(**config_args)
+                    response = self._generate_with_retries(
+                        model_name, full_contents, config, call_span, max_retries=3, step_name=step_name,
+                        deadline=deadline, hedge=hedge, consume=lambda stream: read_structured(stream, schema)
                     )
-                    break
-                except Exception as e:
-                    if "429" in str(e) and attempt < max_retries - 1:
-                        time.sleep(10 * (attempt + 1))
-                    else:
-                        raise e
-            
-            # Extract text
-            text_response = ""
-            if response.candidates and response.candidates[0].content.parts:
-                for part in response.candidates[0].content.parts:
-                    if part.text:
-                        text_response += part.text
-            
-            # Parse JSON
-            try:
-                # Find JSON block if embedded in markdown
-                json_match = re.search(r'\{.*\}', text_response, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(0)
-                    return json.loads(json_str)
-                else:
-                    return json.loads(text_response)
-            except json.JSONDecodeError:
-                logger.warning(f"Failed to parse JSON from AI response: {text_response}")
-                return {'score': 0.9, 'reason': 'Failed to parse AI reasoning.'}
+                except StructuredOutputError as e:
+                    call_span.set_attribute('malformed', True)
+                    if e.usage_metadata is not None:
+                        self._record_usage(e.usage_metadata, step_name, model_name, call_span)
+                    raise
 
+                if getattr(response, 'usage_metadata', None):
+                    call_span.set_attribute('tokens.total', getattr(response.usage_metadata, 'total_token_count', 0) or 0)
+                    self._record_usage(response.usage_metadata, step_name, model_name, call_span)
+            model_router.record_outcome('gemini', model_name, time.perf_counter() - started, success=True)
+            return response.value
+
+        except StructuredOutputError as e:
+            model_router.record_outcome('gemini', model_name, time.perf_counter() - started, success=False)
+            raise ScreenVisualizerError(f"Model returned malformed {schema.__name__}: {e}") from e
         except Exception as e:
             logger.error(f"Gemini JSON call failed: {e}")
-            # Return safe default
-            return {'score': 0.9, 'reason': f"Quality check failed: {str(e)}"}
+            model_router.record_outcome('gemini', model_name, time.perf_counter() - started, success=False)
+            raise ScreenVisualizerError(f"Gemini JSON call failed: {e}") from e
 
-    def _save_debug_image(self, image: Image.Image, step_name: str):
-        """Save intermediate image for debugging."""
+    def _save_debug_image(self, image: Image.Image, step_name: str, label: str = ""):
+        """
+        Queue intermediate image for the background artifact writer. The job ID
+        and variation label keep images of concurrent jobs and variations apart.
+        """
+        if not self._should_capture_artifacts():
+            return
         try:
             from datetime import datetime
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"pipeline_{timestamp}_{step_name}.jpg"
-            save_path = os.path.join(settings.MEDIA_ROOT, "pipeline_steps", filename)
-            
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            
-            image.save(save_path)
-            logger.info(f"Saved debug image: {save_path}")
+            filename = f"pipeline_{timestamp}_{self._job_id}_{step_name}{label}.jpg"
+            debug_artifact_writer.submit_image(image, "pipeline_steps", filename, job_id=self._job_id)
         except Exception as e:
-            logger.error(f"Failed to save debug image {step_name}: {e}")
+            logger.error(f"Failed to queue debug image {step_name}: {e}")
+
+    def _should_capture_artifacts(self) -> bool:
+        """Outside process_pipeline (no sampling decision yet), sample on demand."""
+        if self._capture_artifacts is None:
+            self._capture_artifacts = debug_artifact_writer.should_sample(get_tenant_config())
+        return self._capture_artifacts
@@ -0,0 +1,170 @@
+"""
+Streaming Edits
+---------------
+Consume a streamed image edit (generate_content_stream) as it arrives.
+
+With a blocking generate_content call nothing happens until the whole
+response, thoughts and image, has been received. Reading the stream lets the
+pipeline act on each chunk instead: thought text is handed on as soon as it
+arrives (e.g. appended to the thinking log), the image part is decoded the
+moment it is complete, and progress is reported from the token counts of
+the chunks received so far.
+
+The stream is read on a model-call worker thread. ProgressRelay carries its
+progress back to the job thread, which saves it while it waits for the call.
+
+Usage:
+    from api.visualizer.streaming import EditStreamReader
+
+    reader = EditStreamReader(on_thought=log.write, on_progress=report)
+    edit = reader(client.models.generate_content_stream(model=model, contents=contents, config=config))
+    edit.image
+
+    relay = ProgressRelay(save_progress)      # on the job thread
+    EditStreamReader(on_progress=relay)       # relay(...) queues from any thread
+    run_with_deadline(call, deadline, poll=relay.drain)
+"""
+
+import io
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, List, Optional
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Output tokens of one generated image; progress is the share of these received
+DEFAULT_EXPECTED_OUTPUT_TOKENS = 1290
+
+# Rough characters per token, for chunks that carry no usage metadata
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class StreamedEdit:
+    """Result of a consumed edit stream, shaped like a generate_content response where it matters."""
+    image: Optional[Image.Image] = None
+    thinking_text: List[str] = field(default_factory=list)
+    usage_metadata: Any = None
+    chunks: int = 0
+    image_bytes: int = 0
+    # Seconds from the start of the stream
+    first_chunk_s: Optional[float] = None
+    image_ready_s: Optional[float] = None
+
+
+class ProgressRelay:
+    """
+    Stream progress handed from model-call threads to the job thread.
+
+    Called as on_progress from any thread (both legs of a hedged call
+    included), it only queues the update; drain() forwards the furthest
+    queued update to report on the thread that created the relay. Calls made
+    on that thread are forwarded at once. Updates still queued when the job
+    stops waiting for the call are never forwarded.
+    """
+
+    def __init__(self, report: Callable[[float, int], None]):
+        self._report = report
+        self._updates: queue.SimpleQueue = queue.SimpleQueue()
+        self._owner = threading.get_ident()
+
+    def __call__(self, fraction: float, tokens: int):
+        self._updates.put((fraction, tokens))
+        if threading.get_ident() == self._owner:
+            self.drain()
+
+    def drain(self):
+        furthest = None
+        while True:
+            try:
+                update = self._updates.get_nowait()
+            except queue.Empty:
+                break
+            furthest = update if furthest is None else max(furthest, update)
+        if furthest is not None:
+            self._report(*furthest)
+
+
+class EditStreamReader:
+    """
+    Callable consumer of an edit stream (see ScreenVisualizer._generate_with_retries).
+
+    Args:
+        on_thought: Called with each piece of thought text as it arrives
+        on_progress: Called with (fraction 0-1, output tokens so far) whenever
+            the fraction grows; 1.0 once the image is decoded
+        expected_tokens: Output tokens expected before the image is complete
+    """
+
+    def __init__(self, on_thought: Optional[Callable[[str], None]] = None,
+                 on_progress: Optional[Callable[[float, int], None]] = None,
+                 expected_tokens: int = DEFAULT_EXPECTED_OUTPUT_TOKENS):
+        self.on_thought = on_thought
+        self.on_progress = on_progress
+        self.expected_tokens = max(1, expected_tokens)
+
+    def __call__(self, stream: Iterable) -> StreamedEdit:
+        started = time.perf_counter()
+        edit = StreamedEdit()
+        reported = 0.0
+        text_chars = 0
+        try:
+            for chunk in stream:
+                edit.chunks += 1
+                if edit.first_chunk_s is None:
+                    edit.first_chunk_s = time.perf_counter() - started
+                edit.usage_metadata = getattr(chunk, 'usage_metadata', None) or edit.usage_metadata
+
+                for part in _chunk_parts(chunk):
+                    if getattr(part, 'text', None):
+                        text_chars += len(part.text)
+                        edit.thinking_text.append(part.text)
+                        self._emit(self.on_thought, part.text)
+                    inline_data = getattr(part, 'inline_data', None)
+                    if inline_data and inline_data.data:
+                        edit.image_bytes += len(inline_data.data)
+                        edit.image = Image.open(io.BytesIO(inline_data.data))
+                        # Decode now, while the rest of the stream is still arriving
+                        edit.image.load()
+                        edit.image_ready_s = time.perf_counter() - started
+
+                tokens = _output_tokens(edit.usage_metadata) or text_chars // CHARS_PER_TOKEN
+                fraction = 1.0 if edit.image is not None else min(tokens / self.expected_tokens, 0.99)
+                if fraction > reported:
+                    reported = fraction
+                    self._emit(self.on_progress, fraction, tokens)
+        finally:
+            close = getattr(stream, 'close', None)
+            if callable(close):
+                close()
+        return edit
+
+    @staticmethod
+    def _emit(callback, *args):
+        """Callbacks are best-effort; a failing one must not abort the stream."""
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.warning(f"Stream callback failed (non-fatal): {e}")
+
+
+def _chunk_parts(chunk) -> list:
+    candidates = getattr(chunk, 'candidates', None)
+    if not candidates or not candidates[0].content or not candidates[0].content.parts:
+        return []
+    return candidates[0].content.parts
+
+
+def _output_tokens(usage_metadata) -> int:
+    """Output tokens (answer and thoughts) reported so far."""
+    if usage_metadata is None:
+        return 0
+    return ((getattr(usage_metadata, 'candidates_token_count', 0) or 0)
+            + (getattr(usage_metadata, 'thoughts_token_count', 0) or 0))
@@ -65,6 +65,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.tenants.middleware.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -241,9 +242,155 @@ LOGGING = {
 # Tenant Configuration
 ACTIVE_TENANT = os.environ.get('ACTIVE_TENANT', 'boss')
 
+# Per-request tenant resolution (api/tenants/middleware.py); ACTIVE_TENANT is the fallback.
+# TENANT_HOSTS / TENANT_API_KEYS are comma-separated "name=tenant_id" pairs.
+TENANT_RESOLUTION = {
+    'HOSTS': dict(
+        pair.strip().lower().split('=', 1)
+        for pair in os.environ.get('TENANT_HOSTS', '').split(',') if '=' in pair
+    ),
+    'API_KEYS': dict(
+        pair.strip().split('=', 1)
+        for pair in os.environ.get('TENANT_API_KEYS', '').split(',') if '=' in pair
+    ),
+    'JWT_CLAIM': 'tenant',
+}
+
+# Reference photo similarity index (api/services/reference_index.py), kept in
+# MEDIA_ROOT/reference_index unless DIR is set. With ATTACH_TO_PROMPTS the best
+# match above MIN_SCORE (cosine similarity) is attached to insertion prompts; it
+# is off by default since it adds an image to every insertion call.
+REFERENCE_INDEX = {
+    'ATTACH_TO_PROMPTS': os.environ.get('REFERENCE_ATTACH_TO_PROMPTS', 'false').lower() == 'true',
+    'MIN_SCORE': float(os.environ.get('REFERENCE_MIN_SCORE', '0.6')),
+}
+
+# Near-duplicate uploads (api/services/duplicate_detector.py): an upload whose
+# perceptual hash is within MAX_DISTANCE bits of one of the user's last
+# LOOKBACK uploads reuses its clean image and audit when AUTO_REUSE is on,
+# provided the aspect ratios differ by at most MAX_ASPECT_DIFFERENCE and the
+# descriptors are at least MIN_SIMILARITY alike (cosine).
+DUPLICATE_DETECTION = {
+    'ENABLED': os.environ.get('DUPLICATE_DETECTION_ENABLED', 'true').lower() == 'true',
+    'AUTO_REUSE': os.environ.get('DUPLICATE_DETECTION_AUTO_REUSE', 'true').lower() == 'true',
+    'MAX_DISTANCE': int(os.environ.get('DUPLICATE_DETECTION_MAX_DISTANCE', '6')),
+    'LOOKBACK': int(os.environ.get('DUPLICATE_DETECTION_LOOKBACK', '500')),
+    'MIN_SIMILARITY': float(os.environ.get('DUPLICATE_DETECTION_MIN_SIMILARITY', '0.95')),
+    'MAX_ASPECT_DIFFERENCE': float(os.environ.get('DUPLICATE_DETECTION_MAX_ASPECT_DIFFERENCE', '0.03')),
+}
+
+# Security audit (api/audit/services.py): the original is downsized to
+# MAX_DIMENSION before the model call, and with CACHE a byte-identical image
+# reuses an earlier report instead of being audited again.
+AUDIT = {
+    'MAX_DIMENSION': int(os.environ.get('AUDIT_MAX_DIMENSION', '1024')),
+    'CACHE': os.environ.get('AUDIT_CACHE_ENABLED', 'true').lower() == 'true',
+}
+
+# Compiled tenant config snapshots (api/tenants/snapshot.py): how often each
+# process checks TenantConfig rows for a new config_version, and the
+# Cache-Control of the public config endpoints (api/views_config.py)
+TENANT_CONFIG = {
+    'RELOAD_SECONDS': float(os.environ.get('TENANT_CONFIG_RELOAD_SECONDS', '5')),
+    'CACHE_MAX_AGE': int(os.environ.get('TENANT_CONFIG_CACHE_MAX_AGE', '60')),
+    'CACHE_STALE_WHILE_REVALIDATE': 600,
+}
+
 # Feature flag for gradual rollout
 USE_TENANT_REGISTRY = os.environ.get('USE_TENANT_REGISTRY', 'true').lower() == 'true'
 
+# Pipeline debug artifacts (media/pipeline_steps, media/thinking_logs)
+DEBUG_ARTIFACTS = {
+    'ENABLED': os.environ.get('DEBUG_ARTIFACTS_ENABLED', 'true').lower() == 'true',
+    'SAMPLE_RATE': float(os.environ.get('DEBUG_ARTIFACTS_SAMPLE_RATE', '1.0')),
+    'MAX_QUEUE_SIZE': int(os.environ.get('DEBUG_ARTIFACTS_MAX_QUEUE_SIZE', '64')),
+    'MAX_DIR_BYTES': int(os.environ.get('DEBUG_ARTIFACTS_MAX_DIR_MB', '512')) * 1024 * 1024,
+    'BUNDLE_PER_JOB': os.environ.get('DEBUG_ARTIFACTS_BUNDLE_PER_JOB', 'false').lower() == 'true',
+}
+
+# Pipeline tracing (per-job and per-step spans, see api/monitoring/tracing.py)
+# SINK: 'none', 'log' (one JSON line per trace on the api.monitoring.traces logger),
+# 'file' (JSON lines, written in the background and rotated at FILE_MAX_BYTES)
+# or 'otlp' (OTLP/HTTP JSON collector)
+PIPELINE_TRACING = {
+    'SINK': os.environ.get('PIPELINE_TRACE_SINK', 'log'),
+    'FILE_PATH': os.environ.get('PIPELINE_TRACE_FILE', str(BASE_DIR / 'logs' / 'pipeline_traces.jsonl')),
+    'FILE_MAX_BYTES': int(os.environ.get('PIPELINE_TRACE_FILE_MAX_MB', '50')) * 1024 * 1024,
+    'FILE_BACKUP_COUNT': int(os.environ.get('PIPELINE_TRACE_FILE_BACKUPS', '3')),
+    # Traces queued for the 'file' and 'otlp' sinks; more are dropped and counted
+    'EXPORT_QUEUE_SIZE': int(os.environ.get('PIPELINE_TRACE_QUEUE_SIZE', '256')),
+    'OTLP_ENDPOINT': os.environ.get('PIPELINE_TRACE_OTLP_ENDPOINT', ''),
+    'SERVICE_NAME': os.environ.get('PIPELINE_TRACE_SERVICE_NAME', 'boss-visualizer'),
+}
+
+# Production metrics (see api/monitoring/production_monitor.py)
+# Each worker writes a snapshot into SHARED_DIR; /metrics merges them.
+# /metrics is refused unless the scraper sends AUTH_TOKEN as a Bearer token or
+# connects from one of ALLOWED_IPS (comma-separated); set METRICS_AUTH_TOKEN
+# in production.
+PRODUCTION_MONITOR = {
+    'SHARED_DIR': os.environ.get('METRICS_SHARED_DIR', str(BASE_DIR / 'logs' / 'metrics')),
+    'FLUSH_INTERVAL_SECONDS': float(os.environ.get('METRICS_FLUSH_INTERVAL_SECONDS', '5')),
+    'AUTH_TOKEN': os.environ.get('METRICS_AUTH_TOKEN', ''),
+    'ALLOWED_IPS': [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()],
+}
 
+# Local upload quality gate, run before any paid model call
+# (see check_image_quality in api/ai_services/utils/image_utils.py)
+QUALITY_GATE = {
+    'ENABLED': os.environ.get('QUALITY_GATE_ENABLED', 'true').lower() == 'true',
+    'MIN_SHARPNESS': float(os.environ.get('QUALITY_GATE_MIN_SHARPNESS', '15')),
+    'MIN_BRIGHTNESS': float(os.environ.get('QUALITY_GATE_MIN_BRIGHTNESS', '0.08')),
+    'MAX_CLIPPED': float(os.environ.get('QUALITY_GATE_MAX_CLIPPED', '0.6')),
+}
 
+# Result quality cascade (see api/visualizer/quality.py). ESCALATE decides when the
+# quality_check step calls the model: 'auto' (local metrics inconclusive), 'always' or 'never'.
+# Steps can override it with 'escalate' in their step config.
+QUALITY_CASCADE = {
+    'ESCALATE': os.environ.get('QUALITY_CASCADE_ESCALATE', 'auto'),
+}
 
+# Quality recovery (see api/visualizer/refinement.py): results scoring below MIN_SCORE get the
+# weakest insertion step re-run with a refined prompt, up to MAX_ATTEMPTS times, paid for out of
+# MAX_EXTRA_CALLS extra edit calls per job. Tenants can override any key.
+QUALITY_REFINEMENT = {
+    'ENABLED': os.environ.get('QUALITY_REFINEMENT_ENABLED', 'true').lower() == 'true',
+    'MIN_SCORE': float(os.environ.get('QUALITY_REFINEMENT_MIN_SCORE', '0.7')),
+    'TARGET_SCORE': float(os.environ.get('QUALITY_REFINEMENT_TARGET_SCORE', '0.9')),
+    'MAX_ATTEMPTS': int(os.environ.get('QUALITY_REFINEMENT_MAX_ATTEMPTS', '2')),
+    'MAX_EXTRA_CALLS': int(os.environ.get('QUALITY_REFINEMENT_MAX_EXTRA_CALLS', '2')),
+}
+
+# Background job workers and bulk submission (see api/services/job_dispatcher.py).
+# MAX_WORKERS (and each tenant's MAX_CONCURRENT) is per process: with several
+# gunicorn workers the effective limit is that value times the worker count.
+# Manifest items of a batch reference images already uploaded under MANIFEST_PREFIX.
+JOB_DISPATCH = {
+    'MAX_WORKERS': int(os.environ.get('JOB_DISPATCH_MAX_WORKERS', '4')),
+    'MAX_BATCH_SIZE': int(os.environ.get('JOB_DISPATCH_MAX_BATCH_SIZE', '1000')),
+    'MANIFEST_PREFIX': os.environ.get('JOB_DISPATCH_MANIFEST_PREFIX', 'batch_uploads/{user_id}/'),
+}
+
+# Model call deadlines (see api/visualizer/deadlines.py)
+# Tenants can override the job SLA; steps set timeout_seconds and hedge.
+PIPELINE_DEADLINES = {
+    'JOB_SLA_SECONDS': float(os.environ.get('PIPELINE_JOB_SLA_SECONDS', '600')),
+    'HEDGE': os.environ.get('PIPELINE_HEDGE_REQUESTS', 'false').lower() == 'true',
+    'MAX_CONCURRENT_CALLS': int(os.environ.get('PIPELINE_MAX_CONCURRENT_CALLS', '16')),
+}
+
+# Streamed image edits (see api/visualizer/streaming.py): thoughts are logged and the image
+# decoded as chunks arrive, and progress follows the output tokens received against
+# EXPECTED_OUTPUT_TOKENS. Steps can turn streaming on or off with 'stream'.
+GEMINI_STREAMING = {
+    'ENABLED': os.environ.get('GEMINI_STREAMING_ENABLED', 'false').lower() == 'true',
+    'EXPECTED_OUTPUT_TOKENS': int(os.environ.get('GEMINI_STREAMING_EXPECTED_OUTPUT_TOKENS', '1290')),
+}
+
+# Per-step thinking budgets ('thinking_budget' in a step config): this fraction of
+# budgeted calls runs with dynamic thinking instead, so the budget's token and latency
+# savings are traced against a live unbounded baseline.
+GEMINI_THINKING = {
+    'BASELINE_SAMPLE_RATE': float(os.environ.get('GEMINI_THINKING_BASELINE_SAMPLE_RATE', '0.05')),
+}
@@ -85,3 +85,15 @@ ALLOWED_HOSTS = ['*']
 
 # CORS settings for testing
 CORS_ALLOW_ALL_ORIGINS = True
+
+# Don't write pipeline traces during tests
+PIPELINE_TRACING = {'SINK': 'none'}
+
+# Keep production metrics in-process during tests
+PRODUCTION_MONITOR = {'SHARED_DIR': None}
+
+# Test images are flat synthetic fills; quality gate tests enable it explicitly
+QUALITY_GATE = {'ENABLED': False}
+
+# Budgeted thinking calls stay budgeted; baseline sampling tests enable it explicitly
+GEMINI_THINKING = {'BASELINE_SAMPLE_RATE': 0.0}
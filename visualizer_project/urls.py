@@ -20,15 +20,19 @@ from django.conf import settings # Import settings
 from django.conf.urls.static import static # Import static
 from django.views.generic import TemplateView
 
+from api.views_metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')), # Include your app's urls
     # Add Browsable API login/logout views for development
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
 
     # Serve React frontend
     re_path(r'^$', TemplateView.as_view(template_name='index.html')),
-    re_path(r'^(?!admin|api|api-auth|media|static).*$', TemplateView.as_view(template_name='index.html')),
+    re_path(r'^(?!admin|api|api-auth|media|static|metrics).*$', TemplateView.as_view(template_name='index.html')),
 ]
 
 # Add media file serving during development ONLY